@@ -11,6 +11,7 @@ from sqlalchemy import text
 # Importar configuración y módulos
 from database import engine
 import utils 
+import linea_negocio
 
 # Importar las vistas (¡AGREGAMOS OPCIONES AQUÍ!)
 from views import ventas, compras, productos, clientes, seguimiento, catalogo, facturacion, chats, campanas, diagnostico, opciones, estadisticas 
@@ -57,6 +58,10 @@ def ejecutar_migraciones():
             """))
             
             conn.commit()
+
+        # --- LÍNEA DE NEGOCIO PERSISTIDA (Pelucas / Lentes) ---
+        with engine.begin() as conn:
+            linea_negocio.preparar_columna(conn)
             
     except Exception as e:
         print(f"⚠️ Nota Mantenimiento DB: {e}")
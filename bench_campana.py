@@ -0,0 +1,158 @@
+import os
+import sys
+import time
+import argparse
+import statistics
+from sqlalchemy import create_engine, event, text
+
+import contactos_campana
+
+# ==============================================================================
+# ⏱️ BENCHMARK DE SELECCIÓN DE PROSPECTOS (TAREA 1 DEL BOT)
+# ==============================================================================
+# Compara las consultas antiguas sobre `mensajes` (NOT IN + fecha::date) con las
+# de contactos_campana, sobre datos sintéticos en un esquema aparte.
+#
+#   BENCH_DATABASE_URL=postgresql://... python bench_campana.py --mensajes 200000 --clientes 40000
+#
+# Necesita PostgreSQL (las consultas del bot usan INTERVAL, DISTINCT ON, date_trunc).
+# Todo se crea dentro del esquema `bench_campana`, que se borra al empezar.
+
+ESQUEMA = "bench_campana"
+
+CONSULTAS_ANTIGUAS = {
+    "prospectos": """
+        SELECT c.id_cliente, c.nombre_corto, c.nombre_ia, c.etiquetas, t.telefono
+        FROM clientes c
+        JOIN telefonoscliente t ON c.id_cliente = t.id_cliente
+        WHERE c.activo = TRUE AND c.estado = 'Sin empezar' AND COALESCE(c.excluir_publicidad, FALSE) = FALSE
+          AND t.activo = TRUE AND t.es_principal = TRUE AND length(t.telefono) > 6
+          AND t.telefono NOT IN (SELECT telefono FROM mensajes WHERE tipo = 'SALIENTE_BOT' AND fecha > NOW() - INTERVAL '60 days')
+        ORDER BY RANDOM()
+        LIMIT 50
+    """,
+    "cupo_diario": """
+        SELECT COUNT(*) FROM mensajes
+        WHERE tipo = 'SALIENTE_BOT' AND COALESCE(session_name, 'default') = 'default'
+          AND fecha::date = (NOW() - INTERVAL '5 hours')::date
+    """,
+    "cobertura": """
+        WITH enviados_recientes AS (
+            SELECT DISTINCT telefono FROM mensajes
+            WHERE tipo = 'SALIENTE_BOT' AND fecha > (NOW() - INTERVAL '60 days')
+        )
+        SELECT SUM(CASE WHEN er.telefono IS NOT NULL THEN 1 ELSE 0 END),
+               SUM(CASE WHEN er.telefono IS NULL THEN 1 ELSE 0 END)
+        FROM clientes c
+        JOIN telefonoscliente t ON c.id_cliente = t.id_cliente
+        LEFT JOIN enviados_recientes er ON t.telefono = er.telefono
+        WHERE c.activo = TRUE AND COALESCE(c.excluir_publicidad, FALSE) = FALSE
+          AND c.estado = 'Sin empezar'
+          AND t.activo = TRUE AND t.es_principal = TRUE AND length(t.telefono) > 6
+    """,
+}
+
+
+def sembrar(engine, n_clientes, n_mensajes, proporcion_bot):
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {ESQUEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {ESQUEMA}"))
+        conn.execute(text("""
+            CREATE TABLE clientes (
+                id_cliente SERIAL PRIMARY KEY, nombre_corto VARCHAR(100), nombre_ia VARCHAR(100),
+                etiquetas TEXT, activo BOOLEAN, estado VARCHAR(50), excluir_publicidad BOOLEAN
+            )
+        """))
+        conn.execute(text("""
+            CREATE TABLE telefonoscliente (
+                id SERIAL PRIMARY KEY, id_cliente INT, telefono VARCHAR(30), activo BOOLEAN, es_principal BOOLEAN
+            )
+        """))
+        conn.execute(text("""
+            CREATE TABLE mensajes (
+                id SERIAL PRIMARY KEY, id_cliente INT, telefono VARCHAR(30), tipo VARCHAR(30),
+                contenido TEXT, fecha TIMESTAMP, leido BOOLEAN, session_name VARCHAR(50)
+            )
+        """))
+        conn.execute(text("""
+            INSERT INTO clientes (nombre_corto, nombre_ia, etiquetas, activo, estado, excluir_publicidad)
+            SELECT 'Cliente ' || g, 'Cliente', '', g % 20 <> 0,
+                   CASE WHEN g % 10 < 7 THEN 'Sin empezar' ELSE 'Cliente' END, g % 50 = 0
+            FROM generate_series(1, :n) g
+        """), {"n": n_clientes})
+        conn.execute(text("""
+            INSERT INTO telefonoscliente (id_cliente, telefono, activo, es_principal)
+            SELECT g, (51900000000 + g)::text, TRUE, TRUE FROM generate_series(1, :n) g
+        """), {"n": n_clientes})
+        conn.execute(text("""
+            INSERT INTO mensajes (id_cliente, telefono, tipo, contenido, fecha, leido, session_name)
+            SELECT c, (51900000000 + c)::text,
+                   CASE WHEN random() < :p THEN 'SALIENTE_BOT' WHEN random() < 0.5 THEN 'ENTRANTE' ELSE 'SALIENTE' END,
+                   'Mensaje de prueba ' || g,
+                   NOW() - INTERVAL '5 hours' - (random() * INTERVAL '120 days'),
+                   TRUE,
+                   CASE WHEN g % 2 = 0 THEN 'principal' ELSE 'default' END
+            FROM (SELECT g, 1 + (random() * (:nc - 1))::int AS c FROM generate_series(1, :n) g) s
+        """), {"n": n_mensajes, "nc": n_clientes, "p": proporcion_bot})
+        conn.execute(text("ANALYZE"))
+
+
+def cronometrar(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de selección de prospectos del bot de marketing.")
+    parser.add_argument("--clientes", type=int, default=40000)
+    parser.add_argument("--mensajes", type=int, default=200000)
+    parser.add_argument("--proporcion-bot", type=float, default=0.3, help="Fracción de mensajes que son SALIENTE_BOT")
+    parser.add_argument("--repeticiones", type=int, default=15)
+    args = parser.parse_args()
+
+    url_db = os.getenv("BENCH_DATABASE_URL")
+    if not url_db or not url_db.startswith("postgres"):
+        sys.exit("❌ Define BENCH_DATABASE_URL apuntando a un PostgreSQL de pruebas.")
+    if url_db.startswith("postgres://"):
+        url_db = url_db.replace("postgres://", "postgresql://", 1)
+
+    engine = create_engine(url_db)
+
+    @event.listens_for(engine, "connect")
+    def _usar_esquema(dbapi_conn, _):
+        with dbapi_conn.cursor() as cur:
+            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {ESQUEMA}; SET search_path TO {ESQUEMA}")
+
+    print(f"🌱 Sembrando {args.clientes} clientes y {args.mensajes} mensajes...")
+    sembrar(engine, args.clientes, args.mensajes, args.proporcion_bot)
+
+    inicio = time.perf_counter()
+    with engine.begin() as conn:
+        contactos_campana.preparar_tabla(conn)
+        conn.execute(text("ANALYZE contactos_campana"))
+    seg_relleno = time.perf_counter() - inicio
+
+    resultados = []
+    with engine.connect() as conn:
+        for nombre, sql in CONSULTAS_ANTIGUAS.items():
+            resultados.append((nombre, "mensajes (antes)", cronometrar(lambda: conn.execute(text(sql)).fetchall(), args.repeticiones)))
+        resultados.append(("prospectos", "contactos_campana", cronometrar(lambda: contactos_campana.seleccionar_prospectos(conn), args.repeticiones)))
+        resultados.append(("cupo_diario", "contactos_campana", cronometrar(lambda: contactos_campana.enviados_hoy(conn, "default"), args.repeticiones)))
+        resultados.append(("cobertura", "contactos_campana", cronometrar(lambda: contactos_campana.resumen_cobertura(conn), args.repeticiones)))
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {ESQUEMA} CASCADE"))
+
+    print(f"\n📊 {args.clientes} clientes · {args.mensajes} mensajes · relleno inicial de contactos_campana: {seg_relleno:.2f}s")
+    print(f"{'Consulta':<14} {'Fuente':<20} {'Mediana (ms)':>13}")
+    print("-" * 49)
+    for nombre, fuente, ms in sorted(resultados):
+        print(f"{nombre:<14} {fuente:<20} {ms:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import sys
+import time
+import random
+import argparse
+import pandas as pd
+
+import utils
+
+# ==============================================================================
+# ⏱️ BENCHMARK Y VERIFICACIÓN DEL NOMBRE COMERCIAL (GRILLA DE INVENTARIO)
+# ==============================================================================
+# Compara generar_nombre_inteligente (apply fila por fila, lo que hacía la grilla)
+# con generar_nombres_inteligentes (por columnas) sobre un inventario sintético, y
+# verifica que ambas den exactamente el mismo texto en cada fila. Los casos borde
+# (nulos, 'nan', espacios, modelo que ya trae el prefijo, marcas genéricas, macro
+# sin clasificar) van siempre al principio.
+#
+#   python bench_nombres.py --variantes 50000
+#
+# Sale con código 1 si alguna fila difiere. No necesita base de datos.
+
+CASOS_BORDE = [
+    {"linea_negocio": "Pelucas", "categoria": "Estilo Natural", "marca": "Pelucat", "modelo": "Bob", "nombre": "Castaño", "sku": "WB-001"},
+    {"linea_negocio": "Pelucas", "categoria": "Estilo Natural", "marca": "Raquel", "modelo": "Raquel Lisa", "nombre": "Negro", "sku": "WB-002"},
+    {"linea_negocio": "Pelucas", "categoria": "Estilo Fantasía", "marca": "", "modelo": "peluca bob", "nombre": "Rosa", "sku": "WIG-3"},
+    {"linea_negocio": "Pelucas", "categoria": "Lace Front", "marca": None, "modelo": None, "nombre": None, "sku": None},
+    {"linea_negocio": "Pelucas", "categoria": "Accesorios Pelucas", "marca": "genérico", "modelo": "Redecilla", "nombre": "nan", "sku": "WB-9"},
+    {"linea_negocio": "Lentes", "categoria": "Estilo Natural", "marca": "  Hidrocor ", "modelo": "Hidrocor Mel", "nombre": " Ámbar ", "sku": " NL152D-0000 "},
+    {"linea_negocio": "Lentes", "categoria": "Estilo Fantasía", "marca": "KM", "modelo": "Lente Gato", "nombre": "", "sku": "FX-1"},
+    {"linea_negocio": "Lentes", "categoria": "estilo natural", "marca": "KM", "modelo": "", "nombre": "", "sku": ""},
+    {"linea_negocio": "Lentes", "categoria": "Accesorios", "marca": "", "modelo": "", "nombre": "", "sku": float("nan")},
+    {"linea_negocio": None, "macro_categoria": "Peluca sintética", "categoria": "Cosplay", "marca": "", "modelo": "Anime", "nombre": "Azul", "sku": "X-1"},
+    {"linea_negocio": "nan", "macro_categoria": None, "categoria": "Estilo Natural", "marca": "Pelucat", "modelo": "Corta", "nombre": "", "sku": "wig-77"},
+    {"linea_negocio": "", "macro_categoria": "Otros", "categoria": "Estilo Fantasía", "marca": "", "modelo": "Lentesito", "nombre": "Verde", "sku": "LX-1"},
+    {"linea_negocio": "Lentes", "categoria": "Estilo Natural", "marca": 123, "modelo": 123.0, "nombre": 7, "sku": 555},
+]
+
+CATEGORIAS = {
+    "Pelucas": ["Estilo Natural", "Estilo Fantasía", "Accesorios Pelucas", "Lace Front", "Cosplay"],
+    "Lentes": ["Estilo Natural", "Estilo Fantasía", "Accesorios"],
+}
+MARCAS = ["Pelucat", "Genérico", "Raquel", "Hidrocor", "KM", "Solotica", "", None]
+MODELOS = ["Bob", "Peluca Larga", "Hidrocor Mel", "Lente Gato", "Natural Colors", "", None]
+NOMBRES = ["Castaño", "Rubio", "Gris", "Ámbar", "nan", "", None]
+
+
+def generar_inventario(n, semilla=7):
+    azar = random.Random(semilla)
+    filas = list(CASOS_BORDE)
+    while len(filas) < n:
+        linea = azar.choice(["Pelucas", "Lentes"])
+        filas.append({
+            "linea_negocio": linea,
+            "categoria": azar.choice(CATEGORIAS[linea]),
+            "marca": azar.choice(MARCAS),
+            "modelo": azar.choice(MODELOS),
+            "nombre": azar.choice(NOMBRES),
+            "sku": f"{'WB' if linea == 'Pelucas' else 'NL'}-{len(filas):06d}",
+        })
+    return pd.DataFrame(filas[:n])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark y verificación del nombre comercial vectorizado.")
+    parser.add_argument("--variantes", type=int, default=50000)
+    args = parser.parse_args()
+
+    df = generar_inventario(max(args.variantes, len(CASOS_BORDE)))
+
+    t0 = time.perf_counter()
+    por_fila = df.apply(utils.generar_nombre_inteligente, axis=1)
+    t_fila = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    por_columna = utils.generar_nombres_inteligentes(df)
+    t_columna = time.perf_counter() - t0
+
+    print(f"📦 {len(df)} variantes")
+    print(f"   apply fila por fila : {t_fila * 1000:9.1f} ms")
+    print(f"   por columnas        : {t_columna * 1000:9.1f} ms  ({t_fila / max(t_columna, 1e-9):.0f}x)")
+
+    distintas = por_fila != por_columna
+    if distintas.any():
+        print(f"❌ {int(distintas.sum())} filas difieren. Primeras:")
+        for i in df.index[distintas][:10]:
+            print(f"   {df.loc[i].to_dict()}\n      fila   : {por_fila[i]!r}\n      columna: {por_columna[i]!r}")
+        sys.exit(1)
+    print("✅ Mismo nombre en todas las filas.")
+
+
+if __name__ == "__main__":
+    main()
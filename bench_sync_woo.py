@@ -0,0 +1,173 @@
+import os
+import gc
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+import requests
+
+# ==============================================================================
+# ⏱️ BENCHMARK OFFLINE DE LAS RUTAS DE SINCRONIZACIÓN WOOCOMMERCE
+# ==============================================================================
+# Levanta woo_falso.py en un proceso aparte (para no contaminar la medición de
+# memoria) y mide cada estrategia: peticiones emitidas, tiempo y pico de memoria.
+#
+#   python bench_sync_woo.py --simples 2000 --variables 300 --variaciones 8 --latencia-ms 50
+#
+# La base de datos es un SQLite desechable sembrado con el mismo catálogo. Para
+# medir contra PostgreSQL, apunta BENCH_DATABASE_URL a una base de pruebas vacía.
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def levantar_servidor(args, puerto):
+    proceso = subprocess.Popen([
+        sys.executable, os.path.join(RAIZ, "woo_falso.py"), "--puerto", str(puerto),
+        "--simples", str(args.simples), "--variables", str(args.variables),
+        "--variaciones", str(args.variaciones), "--latencia-ms", str(args.latencia_ms),
+        "--prob-429", str(args.prob_429)
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    url = f"http://127.0.0.1:{puerto}"
+    for _ in range(100):
+        try:
+            requests.get(f"{url}/__stats", timeout=1)
+            return proceso, url
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    proceso.kill()
+    raise RuntimeError("El servidor Woo falso no arrancó a tiempo.")
+
+
+def preparar_base_datos(ruta_db, skus_locales):
+    """Siembra Variantes y auditoria_skus_woo en la base desechable del benchmark."""
+    from sqlalchemy import create_engine, event, text
+
+    url_db = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{ruta_db}"
+    engine = create_engine(url_db)
+    if engine.dialect.name == "sqlite":
+        # Las consultas del panel usan NOW() de PostgreSQL
+        @event.listens_for(engine, "connect")
+        def _registrar_now(dbapi_conn, _):
+            dbapi_conn.create_function("NOW", 0, lambda: time.strftime("%Y-%m-%d %H:%M:%S"))
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS Variantes"))
+        conn.execute(text("DROP TABLE IF EXISTS auditoria_skus_woo"))
+        conn.execute(text("CREATE TABLE Variantes (sku VARCHAR(100) PRIMARY KEY, stock_interno INT, stock_externo INT, stock_transito INT)"))
+        conn.execute(text("""
+            CREATE TABLE auditoria_skus_woo (
+                id INTEGER PRIMARY KEY, tienda VARCHAR(50), tipo_error VARCHAR(50),
+                sku VARCHAR(100), detalle VARCHAR(255), fecha_deteccion TIMESTAMP
+            )
+        """))
+        conn.execute(text("INSERT INTO Variantes (sku, stock_interno, stock_externo, stock_transito) VALUES (:s, :i, 0, :t)"),
+                     [{"s": sku, "i": i % 7, "t": i % 3} for i, sku in enumerate(skus_locales)])
+    return engine, url_db
+
+
+def medir(nombre, funcion, url_servidor):
+    requests.post(f"{url_servidor}/__reset", timeout=5)
+    gc.collect()
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    error = ""
+    try:
+        funcion()
+    except Exception as e:
+        error = str(e)
+    duracion = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = requests.get(f"{url_servidor}/__stats", timeout=5).json()
+    return {
+        "estrategia": nombre, "peticiones": stats.get("_total", 0), "429": stats.get("_429", 0),
+        "segundos": duracion, "pico_mb": pico / 1024 / 1024, "error": error
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline de sincronización WooCommerce.")
+    parser.add_argument("--simples", type=int, default=2000)
+    parser.add_argument("--variables", type=int, default=300)
+    parser.add_argument("--variaciones", type=int, default=8)
+    parser.add_argument("--latencia-ms", type=int, default=50)
+    parser.add_argument("--prob-429", type=float, default=0.0)
+    parser.add_argument("--skus-tiempo-real", type=int, default=20, help="SKUs por llamada a sync_woo_background")
+    parser.add_argument("--rps", type=float, default=0, help="Tope de peticiones/seg del trabajo masivo (0 = sin tope)")
+    args = parser.parse_args()
+
+    from woo_falso import generar_catalogo
+    productos, variaciones = generar_catalogo(args.simples, args.variables, args.variaciones)
+    skus_web = [p["sku"] for p in productos.values() if p["type"] == "simple"]
+    skus_web += [v["sku"] for hijos in variaciones.values() for v in hijos.values()]
+    # Desajustes controlados: 2% de la web no existe en local y 50 SKUs locales no existen en la web
+    skus_locales = [s for i, s in enumerate(skus_web) if i % 50 != 0] + [f"LOCAL-{i:03d}" for i in range(50)]
+
+    directorio = tempfile.mkdtemp(prefix="bench_woo_")
+    puerto = _puerto_libre()
+    servidor, url = levantar_servidor(args, puerto)
+
+    try:
+        engine, url_db = preparar_base_datos(os.path.join(directorio, "bench.db"), skus_locales)
+
+        # utils.py y database.py leen estas variables al importarse
+        os.environ.update({"DATABASE_URL": url_db, "WOO_URL": url, "WOO_KEY": "ck_bench", "WOO_SECRET": "cs_bench"})
+        from woocommerce import API
+        import sync_woo
+        import utils
+        from woo_catalogo import actualizar_catalogo_por_lotes
+        from forzar_index import PARCHE_INDEX, _falta_indexar
+
+        if engine.dialect.name == "sqlite":
+            from sqlalchemy import event
+
+            @event.listens_for(utils.engine, "connect")
+            def _registrar_now(dbapi_conn, _):
+                dbapi_conn.create_function("NOW", 0, lambda: time.strftime("%Y-%m-%d %H:%M:%S"))
+
+        def nuevo_cliente():
+            return API(url=url, consumer_key="ck_bench", consumer_secret="cs_bench", version="wc/v3", timeout=60)
+
+        stock_local = {s: {"total": i % 7, "transito": i % 3, "nombre_ref": s} for i, s in enumerate(skus_locales)}
+
+        def auditoria_panel():
+            for paso in utils.ejecutar_auditoria_bidireccional_woo(url, "ck_bench", "cs_bench"):
+                if paso["estado"] == "error":
+                    raise RuntimeError(paso["msg"])
+
+        estrategias = [
+            ("sync_woo.sincronizar_tienda_woo", lambda: sync_woo.sincronizar_tienda_woo(engine, "bench", nuevo_cliente(), stock_local)),
+            ("utils.ejecutar_auditoria_bidireccional_woo", auditoria_panel),
+            (f"utils.sync_woo_background ({args.skus_tiempo_real} SKUs)", lambda: utils.sync_woo_background(skus_locales[:args.skus_tiempo_real])),
+            ("forzar_index (products/batch reanudable)", lambda: actualizar_catalogo_por_lotes(
+                nuevo_cliente(), PARCHE_INDEX, filtro=_falta_indexar, nombre_trabajo="bench",
+                archivo_estado=os.path.join(directorio, "estado_bench.json"), peticiones_por_segundo=args.rps, reiniciar=True
+            )),
+        ]
+
+        resultados = [medir(nombre, fn, url) for nombre, fn in estrategias]
+    finally:
+        servidor.terminate()
+        servidor.wait()
+
+    print(f"\n📊 Catálogo: {args.simples} simples + {args.variables} variables x {args.variaciones} variaciones · latencia {args.latencia_ms} ms · 429 {args.prob_429:.0%}")
+    print(f"{'Estrategia':<50} {'Peticiones':>10} {'429':>6} {'Tiempo (s)':>11} {'Pico (MB)':>10}")
+    print("-" * 91)
+    for r in resultados:
+        print(f"{r['estrategia']:<50} {r['peticiones']:>10} {r['429']:>6} {r['segundos']:>11.2f} {r['pico_mb']:>10.1f}")
+        if r["error"]:
+            print(f"   ⚠️ {r['error']}")
+
+
+if __name__ == "__main__":
+    main()
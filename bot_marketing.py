@@ -9,17 +9,17 @@ load_dotenv(ruta_env)
 # 2. Importamos los módulos de la infraestructura
 import requests
 import random
-import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from sqlalchemy import text
 from database import engine  
+from indice_productos import obtener_indice
+from ejecutor_campana import reclamar_turno, ejecutar_mensajes_multisesion
 
 from utils import (
-    normalizar_telefono_maestro, 
-    verificar_numero_waha, 
-    enviar_mensaje_whatsapp, 
     subir_estado_whatsapp,
     generar_texto_producto_ia,
+    pregenerar_copys_ia,
     publicar_en_facebook_via_webhook
 )
 
@@ -43,60 +43,23 @@ def log_mkt(mensaje):
 def buscar_producto_dinamico(conn, col_probabilidad):
     """
     Selecciona un producto con stock asegurando un doble candado.
+    El sorteo ponderado por subcategoría se resuelve sobre el índice en memoria.
     """
-    query_pesos = text(f"""
-        SELECT TRIM(s.macro_categoria) as macro, TRIM(s.subcategoria) as subcat, MAX(s.{col_probabilidad}) as prob
-        FROM Variantes v
-        JOIN Productos p ON v.id_producto = p.id_producto
-        JOIN Subcategorias_Sistema s ON TRIM(p.categoria) ILIKE TRIM(s.subcategoria) 
-                                    AND TRIM(p.macro_categoria) ILIKE TRIM(s.macro_categoria)
-        WHERE COALESCE(v.stock_interno, 0) > 0
-          AND p.url_imagen IS NOT NULL AND TRIM(p.url_imagen) != ''
-        GROUP BY TRIM(s.macro_categoria), TRIM(s.subcategoria)
-        HAVING COALESCE(MAX(s.{col_probabilidad}), 0) > 0
-    """)
-    
-    categorias_validas = conn.execute(query_pesos).fetchall()
-    if not categorias_validas:
-        return None 
-        
-    opciones = [(row.macro, row.subcat) for row in categorias_validas]
-    pesos = [row.prob for row in categorias_validas]
-    
-    eleccion = random.choices(opciones, weights=pesos, k=1)[0]
-    macro_elegida, cat_elegida = eleccion
-    
-    condicion_historial = ""
+    indice = obtener_indice(conn)
+
+    eleccion = indice.elegir_grupo(col_probabilidad)
+    if not eleccion:
+        return None
+
+    recientes = set()
     if 'est_' in col_probabilidad:
-        condicion_historial = "AND v.sku NOT IN (SELECT sku FROM Historial_Estados WHERE fecha_publicacion > NOW() - INTERVAL '14 days')"
-        
-    query_prod = text(f"""
-        SELECT 
-            p.id_producto, p.marca, p.modelo, p.nombre, p.categoria, p.color_principal,
-            p.url_imagen, p.url_tienda, v.sku, v.precio, p.macro_categoria,
-            s.descripcion_ia as enfoque_ia
-        FROM Variantes v
-        JOIN Productos p ON v.id_producto = p.id_producto
-        LEFT JOIN Subcategorias_Sistema s ON TRIM(p.categoria) ILIKE TRIM(s.subcategoria)
-        WHERE TRIM(p.categoria) ILIKE :cat
-          AND TRIM(p.macro_categoria) ILIKE :macro
-          AND COALESCE(v.stock_interno, 0) > 0
-          AND p.url_imagen IS NOT NULL AND TRIM(p.url_imagen) != ''
-          {condicion_historial}
-        ORDER BY RANDOM()
-        LIMIT 1
-    """)
-    
-    prod = conn.execute(query_prod, {"cat": cat_elegida, "macro": macro_elegida}).fetchone()
-    if not prod and 'est_' in col_probabilidad:
-        query_rescate = query_prod.text.replace(condicion_historial, "")
-        prod = conn.execute(text(query_rescate), {"cat": cat_elegida, "macro": macro_elegida}).fetchone()
-        
-    if prod:
-        producto_dict = dict(prod._mapping)
-        producto_dict['contexto_ia_extra'] = f"REGLA DE ORO: ESTE PRODUCTO ES UN/UNA {producto_dict.get('macro_categoria', '').upper()}. HABLA ESTRICTAMENTE DE ESA CATEGORÍA."
-        return producto_dict
-    return None
+        recientes = {r[0] for r in conn.execute(text("SELECT DISTINCT sku FROM Historial_Estados WHERE fecha_publicacion > NOW() - INTERVAL '14 days'"))}
+
+    prod = indice.elegir_en_grupo(eleccion, excluir=recientes)
+    if not prod and recientes:
+        prod = indice.elegir_en_grupo(eleccion)
+
+    return indice.ficha_marketing(prod) if prod else None
 
 
 # ==============================================================================
@@ -128,9 +91,14 @@ def ejecutar_francotirador():
         prob_fb  = obtener_probabilidad(getattr(config, 'intervalo_fb', '100'))
 
         if not es_modo_test:
-            retraso_minutos = random.randint(1, 25) 
-            log_mkt(f"⏳ Esperando {retraso_minutos} minutos (Retraso orgánico)...")
-            time.sleep(retraso_minutos * 60)
+            # 🗓️ Retraso orgánico por agenda con jitter (el cron llama cada pocos minutos)
+            with engine.begin() as conn:
+                es_mi_turno, proxima = reclamar_turno(conn)
+            if not es_mi_turno:
+                # El pool de copys lo llena el cron `--pregenerar`: el tick no se queda esperando a Ollama
+                log_mkt(f"⏳ Aún no toca disparar (próximo turno: {proxima:%H:%M}).")
+                return
+            log_mkt(f"🎯 Turno reclamado. El siguiente queda agendado para las {proxima:%H:%M}.")
 
         with engine.connect() as conn:
             query_tiempo = text("""
@@ -171,56 +139,8 @@ def ejecutar_francotirador():
                     {"sesion": "principal", "col_prob": "prob_msg_principal", "nombre_vis": "Principal"},
                     {"sesion": "default", "col_prob": "prob_msg_default", "nombre_vis": "Lentes"}
                 ]
-                
-                for obrero in obreros:
-                    with engine.connect() as conn:
-                        query_conteo = text("SELECT COUNT(*) FROM mensajes WHERE tipo = 'SALIENTE_BOT' AND COALESCE(session_name, 'default') = :sess AND fecha::date = (NOW() - INTERVAL '5 hours')::date")
-                        enviados_por_mi = conn.execute(query_conteo, {"sess": obrero["sesion"]}).scalar() or 0
-
-                        if enviados_por_mi >= config.max_mensajes_dia:
-                            continue
-
-                        prod_elegido = buscar_producto_dinamico(conn, obrero['col_prob'])
-                        if not prod_elegido: continue
-
-                        query_clientes = text("""
-                            SELECT c.id_cliente, c.nombre_corto, c.nombre_ia, c.etiquetas, t.telefono 
-                            FROM clientes c
-                            JOIN telefonoscliente t ON c.id_cliente = t.id_cliente
-                            WHERE c.activo = TRUE AND c.estado = 'Sin empezar' AND COALESCE(c.excluir_publicidad, FALSE) = FALSE 
-                              AND t.activo = TRUE AND t.es_principal = TRUE AND length(t.telefono) > 6
-                              AND t.telefono NOT IN (SELECT telefono FROM mensajes WHERE tipo = 'SALIENTE_BOT' AND fecha > NOW() - INTERVAL '60 days')
-                            ORDER BY RANDOM()
-                            LIMIT 50
-                        """)
-                        clientes_validos = conn.execute(query_clientes).fetchall()
-
-                    if not clientes_validos: continue
-                    prospectos = list(clientes_validos)
-
-                    for cliente in prospectos[:5]:
-                        norm = normalizar_telefono_maestro(cliente.telefono)
-                        if not norm: continue
-                        telefono_final = norm['db']
-                        
-                        if verificar_numero_waha(telefono_final) is True:
-                            saludo = random.choice(["Hola", "¡Hola!", "¡Qué tal", "Saludos", "Buen día"])
-                            nom_ia = cliente.nombre_ia.strip() if cliente.nombre_ia else ""
-                            cabecera = f"{saludo} {nom_ia} 👋" if nom_ia else "¡Hola! 👋"
-
-                            cuerpo_ia = generar_texto_producto_ia(prod_elegido, es_estado=False, cliente_info={"etiquetas": cliente.etiquetas or ""})
-                            mensaje_completo = f"{cabecera}\n\n{cuerpo_ia}"
-
-                            if enviar_mensaje_whatsapp(telefono_final, mensaje_completo, prod_elegido['url_imagen'], session=obrero['sesion']):
-                                with engine.begin() as conn_save:
-                                    conn_save.execute(text("INSERT INTO mensajes (id_cliente, telefono, tipo, contenido, fecha, leido, session_name) VALUES (:idc, :t, 'SALIENTE_BOT', :c, NOW() - INTERVAL '5 hours', TRUE, :sess)"), 
-                                                      {"idc": cliente.id_cliente, "t": telefono_final, "c": mensaje_completo, "sess": obrero['sesion']})
-                                log_mkt(f"✅ Disparo a {telefono_final} ({obrero['nombre_vis']})!")
-                                break 
-                        else:
-                            log_mkt(f"⚠️ El número {telefono_final} no tiene WhatsApp. Purgando del embudo para siempre...")
-                            with engine.begin() as conn_purge:
-                                conn_purge.execute(text("UPDATE clientes SET excluir_publicidad = TRUE WHERE id_cliente = :idc"), {"idc": cliente.id_cliente})
+                # 🏭 Ambas sesiones a la vez, cada una con su tubería verificación → copy → envío
+                ejecutar_mensajes_multisesion(obreros, config, buscar_producto_dinamico, log_mkt)
             else:
                 log_mkt(f"🎲 TAREA 1 SALTADA: El dado cayó en {dado_msg} (Requerido: <= {prob_msg}%).")
 
@@ -242,7 +162,8 @@ def ejecutar_francotirador():
                     {"sesion": "principal", "col_prob": "prob_est_principal"},
                     {"sesion": "default", "col_prob": "prob_est_default"}
                 ]
-                for cuenta in cuentas_estados:
+
+                def publicar_estado(cuenta):
                     log_mkt(f" 🔍 [TRACE] Evaluando sesión '{cuenta['sesion']}'...")
                     with engine.connect() as conn:
                         prod_est = buscar_producto_dinamico(conn, cuenta['col_prob'])
@@ -267,6 +188,10 @@ def ejecutar_francotirador():
                             log_mkt(f" ❌ [TRACE ERROR] Fallo en la subida a WAHA ({cuenta['sesion']}): {msg_api}")
                     else:
                         log_mkt(f" ⚠️ [TRACE] No se encontró producto para '{cuenta['sesion']}' (Stock cero o probabilidad 0%).")
+
+                # Las dos sesiones publican en paralelo (la subida a WAHA tarda por la encriptación)
+                with ThreadPoolExecutor(max_workers=len(cuentas_estados)) as pool:
+                    list(pool.map(publicar_estado, cuentas_estados))
             else:
                 log_mkt(f"🎲 TAREA 2 SALTADA: El dado cayó en {dado_est} (Requerido: <= {prob_est}%).")
 
@@ -322,4 +247,8 @@ def ejecutar_francotirador():
         log_mkt(f"🔥 Error catastrófico: {e}")
 
 if __name__ == "__main__":
-    ejecutar_francotirador()
\ No newline at end of file
+    if "--pregenerar" in sys.argv:
+        # Cron de horas valle: solo llena el pool de copys, sin enviar nada
+        pregenerar_copys_ia(cantidad=int(os.getenv("COPY_IA_PREGENERAR", "40")))
+    else:
+        ejecutar_francotirador()
\ No newline at end of file
@@ -0,0 +1,174 @@
+import os
+import sys
+import json
+import time
+import base64
+import hashlib
+import threading
+from io import BytesIO
+from integraciones import imagenes
+
+# ==============================================================================
+# 🖼️ CACHÉ EN DISCO DE IMÁGENES YA PREPARADAS PARA ESTADOS DE WHATSAPP
+# ==============================================================================
+# Las fotos de producto se descargan, se pasan a JPEG dentro de los límites de
+# WhatsApp y se guardan ya en base64, listas para el payload de WAHA. Publicar de
+# nuevo el mismo SKU no descarga ni transcodifica nada:
+#
+# - Si la entrada se validó hace menos de REVALIDAR_SEG se sirve directo.
+# - Si no, se hace un GET condicional (If-None-Match / If-Modified-Since); con
+#   un 304 se reutiliza y con un 200 se regenera (la foto cambió en la tienda).
+# - Si la tienda no responde, se sirve la copia que haya.
+#
+# Cada entrada son dos archivos: <huella>.b64 (payload) y <huella>.json (url,
+# ETag, Last-Modified, formato). La huella es (url, formato), así bot y panel
+# comparten la caché sin un índice común. Se desaloja por LRU (mtime del .b64)
+# cuando el total pasa de MAX_MB.
+
+DIRECTORIO = os.getenv("CACHE_IMAGENES_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_estados")
+MAX_MB = float(os.getenv("CACHE_IMAGENES_MB", "200"))
+REVALIDAR_SEG = 6 * 3600
+
+# Límites de imagen para estados: WhatsApp reescala por encima de ~1600 px y
+# rechaza archivos grandes; se baja la calidad hasta entrar en el límite.
+FORMATO = "jpeg-1600"
+MAX_LADO = 1600
+MAX_BYTES = 1024 * 1024
+CALIDADES = (90, 80, 70, 60)
+
+_lock = threading.Lock()
+
+
+def _rutas(url, formato):
+    huella = hashlib.sha1(f"{formato}|{url}".encode("utf-8")).hexdigest()
+    base = os.path.join(DIRECTORIO, huella)
+    return f"{base}.b64", f"{base}.json"
+
+
+def _leer(url, formato):
+    ruta_b64, ruta_meta = _rutas(url, formato)
+    try:
+        with open(ruta_meta, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("url") != url or meta.get("formato") != formato:
+            return None, None
+        with open(ruta_b64, encoding="ascii") as f:
+            return meta, f.read()
+    except (OSError, ValueError):
+        return None, None
+
+
+def _escribir(ruta, contenido):
+    # Escritura atómica: otro proceso nunca lee un archivo a medias
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)
+
+
+def _guardar(url, formato, meta, datos_b64):
+    os.makedirs(DIRECTORIO, exist_ok=True)
+    ruta_b64, ruta_meta = _rutas(url, formato)
+    _escribir(ruta_b64, datos_b64)
+    _escribir(ruta_meta, json.dumps(meta))
+    _desalojar()
+
+
+def _tocar(url, formato, meta):
+    """Marca la entrada como recién usada (LRU) y, si se revalidó, guarda la fecha."""
+    ruta_b64, ruta_meta = _rutas(url, formato)
+    try:
+        os.utime(ruta_b64)
+        _escribir(ruta_meta, json.dumps(meta))
+    except OSError:
+        pass
+
+
+def _desalojar():
+    """Borra las entradas menos usadas hasta quedar por debajo de MAX_MB."""
+    limite = MAX_MB * 1024 * 1024
+    with _lock:
+        entradas = []
+        total = 0
+        for nombre in os.listdir(DIRECTORIO):
+            if not nombre.endswith(".b64"):
+                continue
+            ruta = os.path.join(DIRECTORIO, nombre)
+            try:
+                estado = os.stat(ruta)
+            except OSError:
+                continue
+            entradas.append((estado.st_mtime, estado.st_size, ruta))
+            total += estado.st_size
+        for _, tamano, ruta in sorted(entradas):
+            if total <= limite:
+                break
+            for archivo in (ruta, ruta[:-4] + ".json"):
+                try:
+                    os.remove(archivo)
+                except OSError:
+                    pass
+            total -= tamano
+
+
+def _transcodificar(contenido):
+    """Cualquier formato que abra Pillow (WebP, PNG con transparencia...) -> JPEG RGB dentro de los límites."""
+    from PIL import Image
+
+    img = Image.open(BytesIO(contenido))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if max(img.size) > MAX_LADO:
+        img.thumbnail((MAX_LADO, MAX_LADO))
+
+    for calidad in CALIDADES:
+        buffer = BytesIO()
+        img.save(buffer, format="JPEG", quality=calidad, optimize=True)
+        if buffer.tell() <= MAX_BYTES:
+            break
+    return buffer.getvalue()
+
+
+def obtener_jpeg_b64(url, formato=FORMATO):
+    """
+    JPEG en base64 listo para el payload de estados de WAHA.
+    Lanza excepción solo si no hay ni descarga ni copia en caché.
+    """
+    meta, datos_b64 = _leer(url, formato)
+    if meta and time.time() - meta.get("validado", 0) < REVALIDAR_SEG:
+        _tocar(url, formato, meta)
+        return datos_b64
+
+    cabeceras = {}
+    if meta:
+        if meta.get("etag"):
+            cabeceras["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            cabeceras["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        resp = imagenes.get(url, headers=cabeceras, endpoint="GET imagen de producto")
+        if resp.status_code == 304 and meta:
+            meta["validado"] = time.time()
+            _tocar(url, formato, meta)
+            return datos_b64
+        resp.raise_for_status()
+    except Exception as e:
+        if meta:
+            print(f"⚠️ [CACHÉ IMÁGENES] Tienda sin respuesta ({e}); se usa la copia guardada.", file=sys.stderr)
+            return datos_b64
+        raise
+
+    datos_b64 = base64.b64encode(_transcodificar(resp.content)).decode("utf-8")
+    meta = {
+        "url": url,
+        "formato": formato,
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "validado": time.time(),
+    }
+    try:
+        _guardar(url, formato, meta, datos_b64)
+    except OSError as e:
+        print(f"⚠️ [CACHÉ IMÁGENES] No se pudo guardar en disco: {e}", file=sys.stderr)
+    return datos_b64
@@ -0,0 +1,120 @@
+import json
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from database import engine
+
+# ==============================================================================
+# 🗃️ CACHÉ PERSISTENTE DE CONSULTAS A WAHA (LID ↔ TELÉFONO, NOMBRES, numberExists)
+# ==============================================================================
+# Un LRU en memoria delante de la tabla `cache_waha`, compartida por el webhook,
+# el panel, sincronizar_lids.py y el bot de marketing. También se guardan las
+# respuestas negativas ("WAHA no lo conoce") con un TTL más corto, para no volver
+# a preguntar en cada mensaje. Los errores de red NUNCA se guardan.
+
+# TTL por tipo: (respuesta positiva, respuesta negativa)
+TTL = {
+    "lid":    (timedelta(days=30), timedelta(hours=12)),  # teléfono -> LID
+    "pn":     (timedelta(days=90), timedelta(hours=6)),   # LID -> teléfono (no cambia)
+    "nombre": (timedelta(days=7),  timedelta(days=1)),    # contacto -> nombre de WhatsApp
+    "existe": (timedelta(days=30), timedelta(days=3)),    # teléfono -> numberExists
+}
+MAX_MEMORIA = 5000
+
+_lock = threading.Lock()
+_memoria = OrderedDict()  # {(tipo, clave): (valor, expira)}
+_tabla_lista = False
+
+
+def _preparar_tabla(conn):
+    global _tabla_lista
+    if _tabla_lista:
+        return
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS cache_waha (
+            tipo VARCHAR(20),
+            clave VARCHAR(150),
+            valor TEXT,
+            expira TIMESTAMP,
+            PRIMARY KEY (tipo, clave)
+        )
+    """))
+    # Limpieza de lo caducado una vez por proceso
+    conn.execute(text("DELETE FROM cache_waha WHERE expira < NOW()"))
+    _tabla_lista = True
+
+
+def _recordar(llave, valor, expira):
+    with _lock:
+        _memoria[llave] = (valor, expira)
+        _memoria.move_to_end(llave)
+        while len(_memoria) > MAX_MEMORIA:
+            _memoria.popitem(last=False)
+
+
+def obtener(tipo, clave):
+    """
+    Devuelve (encontrado, valor). `encontrado` es True también para las respuestas
+    negativas guardadas (valor None/False): en ese caso no hay que volver a preguntar.
+    """
+    llave = (tipo, str(clave))
+    ahora = datetime.now()
+
+    with _lock:
+        if llave in _memoria:
+            valor, expira = _memoria[llave]
+            if expira > ahora:
+                _memoria.move_to_end(llave)
+                return True, valor
+            del _memoria[llave]
+
+    try:
+        with engine.begin() as conn:
+            _preparar_tabla(conn)
+            fila = conn.execute(
+                text("SELECT valor, expira FROM cache_waha WHERE tipo = :t AND clave = :c AND expira > NOW()"),
+                {"t": tipo, "c": llave[1]}
+            ).fetchone()
+    except Exception as e:
+        print(f"⚠️ [CACHE WAHA] No se pudo leer la caché: {e}", file=sys.stderr)
+        return False, None
+
+    if not fila:
+        return False, None
+    valor = json.loads(fila.valor)
+    expira = fila.expira if isinstance(fila.expira, datetime) else datetime.fromisoformat(str(fila.expira))
+    _recordar(llave, valor, expira)
+    return True, valor
+
+
+def guardar(tipo, clave, valor):
+    """Guarda la respuesta de WAHA. Un valor vacío (None/False/"") se guarda como negativo con TTL corto."""
+    ttl_positivo, ttl_negativo = TTL[tipo]
+    llave = (tipo, str(clave))
+    expira = datetime.now() + (ttl_positivo if valor else ttl_negativo)
+    _recordar(llave, valor, expira)
+
+    try:
+        with engine.begin() as conn:
+            _preparar_tabla(conn)
+            conn.execute(text("""
+                INSERT INTO cache_waha (tipo, clave, valor, expira) VALUES (:t, :c, :v, :e)
+                ON CONFLICT (tipo, clave) DO UPDATE SET valor = EXCLUDED.valor, expira = EXCLUDED.expira
+            """), {"t": tipo, "c": llave[1], "v": json.dumps(valor), "e": expira})
+    except Exception as e:
+        print(f"⚠️ [CACHE WAHA] No se pudo guardar en la caché: {e}", file=sys.stderr)
+
+
+def olvidar(tipo, clave):
+    """Invalida una entrada (p. ej. cuando el usuario corrige un dato a mano)."""
+    llave = (tipo, str(clave))
+    with _lock:
+        _memoria.pop(llave, None)
+    try:
+        with engine.begin() as conn:
+            _preparar_tabla(conn)
+            conn.execute(text("DELETE FROM cache_waha WHERE tipo = :t AND clave = :c"), {"t": tipo, "c": llave[1]})
+    except Exception as e:
+        print(f"⚠️ [CACHE WAHA] No se pudo invalidar la caché: {e}", file=sys.stderr)
@@ -0,0 +1,196 @@
+import json
+import sys
+import time
+import requests
+from sqlalchemy import text
+from database import engine
+from integraciones import ollama
+
+# ==============================================================================
+# 🧠 CLIENTE LLM (OLLAMA) CON STREAMING, VALIDACIÓN Y MÉTRICAS POR MODELO
+# ==============================================================================
+# - Pide /api/generate en streaming y corta la conexión apenas el texto acumulado
+#   ya es un objeto JSON completo (Ollama con format=json suele seguir emitiendo
+#   espacios hasta agotar el contexto).
+# - Valida el objeto contra el esquema del modo (estado / dm) y, si no cumple,
+#   reintenta una vez con un prompt de reparación en lugar de caer directo al
+#   texto de reserva.
+# - Guarda por modelo: tiempo al primer token, tokens/segundo y tasa de fallos
+#   (tabla `metricas_llm`), para elegir entre variantes de llama3.1 con datos.
+
+# Claves obligatorias y tipo esperado por modo
+ESQUEMAS = {
+    "estado": {"estado_whatsapp": str, "post_facebook": str},
+    "dm": {"mensaje": list},
+}
+
+_tabla_lista = False
+
+
+def validar(datos, modo):
+    """Lista de problemas del objeto frente al esquema del modo (vacía si es válido)."""
+    if not isinstance(datos, dict):
+        return ["la respuesta no es un objeto JSON"]
+    errores = []
+    for clave, tipo in ESQUEMAS[modo].items():
+        valor = datos.get(clave)
+        if not isinstance(valor, tipo):
+            errores.append(f"falta la clave '{clave}' o no es {'texto' if tipo is str else 'una lista'}")
+        elif tipo is str and len(valor.strip()) < 10:
+            errores.append(f"'{clave}' está vacío o es demasiado corto")
+        elif tipo is list and not [p for p in valor if isinstance(p, str) and p.strip()]:
+            errores.append(f"'{clave}' no contiene párrafos de texto")
+    return errores
+
+
+def _json_completo(texto):
+    """Devuelve el objeto si `texto` ya es un JSON cerrado; None si aún está a medias."""
+    texto = texto.strip()
+    if not texto.endswith("}"):
+        return None
+    try:
+        return json.loads(texto)
+    except json.JSONDecodeError:
+        return None
+
+
+def _generar_stream(modelo, prompt, timeout):
+    """
+    Una pasada de /api/generate en streaming.
+    Retorna (texto, datos_json o None, métricas de la pasada).
+    """
+    metricas = {"primer_token": None, "tokens": 0, "seg_generacion": 0.0}
+    inicio = time.perf_counter()
+    texto = ""
+    datos = None
+
+    resp = ollama.post("/api/generate", json={"model": modelo, "prompt": prompt, "stream": True, "format": "json"},
+                       timeout=timeout, stream=True, endpoint="POST /api/generate (stream)")
+    try:
+        if resp.status_code != 200:
+            raise requests.exceptions.HTTPError(f"Ollama respondió HTTP {resp.status_code}. Revisa si el modelo '{modelo}' existe.")
+
+        for linea in resp.iter_lines():
+            if not linea:
+                continue
+            trozo = json.loads(linea)
+            fragmento = trozo.get("response", "")
+            if fragmento:
+                if metricas["primer_token"] is None:
+                    metricas["primer_token"] = time.perf_counter() - inicio
+                metricas["tokens"] += 1
+                texto += fragmento
+
+            if trozo.get("done"):
+                # Ollama informa los contadores exactos al final
+                if trozo.get("eval_count"):
+                    metricas["tokens"] = trozo["eval_count"]
+                    metricas["seg_generacion"] = trozo.get("eval_duration", 0) / 1e9
+                datos = _json_completo(texto)
+                break
+
+            if fragmento.rstrip().endswith("}"):
+                datos = _json_completo(texto)
+                if datos is not None:
+                    break  # Corte anticipado: ya tenemos el objeto entero
+    finally:
+        resp.close()
+
+    if not metricas["seg_generacion"] and metricas["primer_token"] is not None:
+        metricas["seg_generacion"] = time.perf_counter() - inicio - metricas["primer_token"]
+    return texto, datos, metricas
+
+
+def _prompt_reparacion(prompt, texto, errores, modo):
+    claves = ", ".join(f'"{c}"' for c in ESQUEMAS[modo])
+    return f"""{prompt}
+
+    TU RESPUESTA ANTERIOR FUE RECHAZADA POR EL SISTEMA:
+    {texto[:1500]}
+
+    PROBLEMAS DETECTADOS: {'; '.join(errores)}.
+    Devuelve ÚNICAMENTE el objeto JSON corregido con las claves {claves}, sin texto adicional.
+    """
+
+
+def generar_json(modelo, prompt, modo, timeout=120, reparaciones=1):
+    """
+    Genera y valida el JSON del modo ('estado' o 'dm').
+    Devuelve el objeto válido o None (la llamada ya dejó registradas sus métricas).
+    """
+    resultado = {"llamadas": 1, "fallos_red": 0, "fallos_formato": 0, "reparaciones": 0,
+                 "tokens": 0, "seg_generacion": 0.0, "seg_primer_token": 0.0}
+    prompt_actual = prompt
+    datos = None
+
+    try:
+        for intento in range(reparaciones + 1):
+            texto, datos, metricas = _generar_stream(modelo, prompt_actual, timeout)
+            resultado["tokens"] += metricas["tokens"]
+            resultado["seg_generacion"] += metricas["seg_generacion"]
+            if intento == 0 and metricas["primer_token"] is not None:
+                resultado["seg_primer_token"] = metricas["primer_token"]
+
+            errores = validar(datos, modo) if datos is not None else ["no es un JSON válido"]
+            if not errores:
+                break
+            print(f"   ⚠️ [Aviso IA] Respuesta de '{modelo}' rechazada ({'; '.join(errores)}). Texto recibido: {texto[:300]}")
+            datos = None
+            if intento < reparaciones:
+                resultado["reparaciones"] += 1
+                prompt_actual = _prompt_reparacion(prompt, texto, errores, modo)
+        if datos is None:
+            resultado["fallos_formato"] = 1
+
+    except requests.exceptions.Timeout:
+        print(f"   ⚠️ [Aviso IA] TIMEOUT: Ollama tardó más de {timeout} segundos en redactar el mensaje.")
+        resultado["fallos_red"] = 1
+    except requests.exceptions.ConnectionError:
+        print(f"   ⚠️ [Aviso IA] CONEXIÓN RECHAZADA: Ollama está apagado. (Ejecuta 'systemctl start ollama')")
+        resultado["fallos_red"] = 1
+    except Exception as e:
+        print(f"   ⚠️ [Aviso IA] Error desconocido: {e}")
+        resultado["fallos_red"] = 1
+
+    registrar_metricas(modelo, modo, resultado)
+    return datos
+
+
+def registrar_metricas(modelo, modo, r):
+    """Acumula la llamada en `metricas_llm` (suma incremental: bot y panel escriben a la vez)."""
+    global _tabla_lista
+    try:
+        with engine.begin() as conn:
+            if not _tabla_lista:
+                conn.execute(text("""
+                    CREATE TABLE IF NOT EXISTS metricas_llm (
+                        modelo VARCHAR(80),
+                        modo VARCHAR(10),
+                        llamadas BIGINT DEFAULT 0,
+                        fallos_red BIGINT DEFAULT 0,
+                        fallos_formato BIGINT DEFAULT 0,
+                        reparaciones BIGINT DEFAULT 0,
+                        tokens BIGINT DEFAULT 0,
+                        seg_generacion DOUBLE PRECISION DEFAULT 0,
+                        seg_primer_token DOUBLE PRECISION DEFAULT 0,
+                        actualizado TIMESTAMP DEFAULT NOW(),
+                        PRIMARY KEY (modelo, modo)
+                    )
+                """))
+                _tabla_lista = True
+            conn.execute(text("""
+                INSERT INTO metricas_llm (modelo, modo, llamadas, fallos_red, fallos_formato, reparaciones, tokens, seg_generacion, seg_primer_token, actualizado)
+                VALUES (:mo, :md, :ll, :fr, :ff, :rp, :tk, :sg, :sp, NOW())
+                ON CONFLICT (modelo, modo) DO UPDATE SET
+                    llamadas = metricas_llm.llamadas + EXCLUDED.llamadas,
+                    fallos_red = metricas_llm.fallos_red + EXCLUDED.fallos_red,
+                    fallos_formato = metricas_llm.fallos_formato + EXCLUDED.fallos_formato,
+                    reparaciones = metricas_llm.reparaciones + EXCLUDED.reparaciones,
+                    tokens = metricas_llm.tokens + EXCLUDED.tokens,
+                    seg_generacion = metricas_llm.seg_generacion + EXCLUDED.seg_generacion,
+                    seg_primer_token = metricas_llm.seg_primer_token + EXCLUDED.seg_primer_token,
+                    actualizado = NOW()
+            """), {"mo": modelo[:80], "md": modo, "ll": r["llamadas"], "fr": r["fallos_red"], "ff": r["fallos_formato"],
+                   "rp": r["reparaciones"], "tk": r["tokens"], "sg": r["seg_generacion"], "sp": r["seg_primer_token"]})
+    except Exception as e:
+        print(f"⚠️ [LLM] No se pudieron guardar las métricas: {e}", file=sys.stderr)
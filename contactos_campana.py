@@ -0,0 +1,175 @@
+from sqlalchemy import text
+
+# ==============================================================================
+# 🎯 ELEGIBILIDAD DE PROSPECTOS PARA LA TAREA 1 DEL BOT (contactos_campana)
+# ==============================================================================
+# Una fila por teléfono con lo que el bot necesita saber para decidir si puede
+# escribirle: último envío del bot (y desde qué sesión), si quedó excluido y
+# el resultado de la verificación de WhatsApp. Se mantiene al enviar y al
+# excluir, así la selección y el cupo diario son búsquedas por índice en vez de
+# recorrer `mensajes` entero en cada tick.
+#
+# Las fechas siguen la convención de `mensajes`: hora de Perú (NOW() - 5 horas).
+
+DIAS_ENTRE_ENVIOS = 60
+# Vigencia de la verificación de WhatsApp: un "no tiene" se revisa antes por si lo instala
+DIAS_VIGENCIA_CON_WSP = 30
+DIAS_VIGENCIA_SIN_WSP = 7
+HORA_PERU = "(NOW() - INTERVAL '5 hours')"
+
+_tabla_lista = False
+
+
+def preparar_tabla(conn):
+    """Crea la tabla e índices; la primera vez la rellena con el historial de `mensajes`."""
+    global _tabla_lista
+    if _tabla_lista:
+        return
+    existia = conn.execute(text("SELECT to_regclass('contactos_campana') IS NOT NULL")).scalar()
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS contactos_campana (
+            telefono VARCHAR(30) PRIMARY KEY,
+            id_cliente INT,
+            ultimo_envio_bot TIMESTAMP,
+            session_name VARCHAR(50),
+            excluido BOOLEAN DEFAULT FALSE,
+            motivo_exclusion VARCHAR(100),
+            tiene_whatsapp BOOLEAN,
+            verificado_en TIMESTAMP
+        )
+    """))
+    # Errores transitorios de WAHA (timeouts, sesión caída): no son un "no tiene WhatsApp"
+    conn.execute(text("ALTER TABLE contactos_campana ADD COLUMN IF NOT EXISTS ultimo_error_verificacion TIMESTAMP"))
+    conn.execute(text("ALTER TABLE contactos_campana ADD COLUMN IF NOT EXISTS errores_verificacion INT DEFAULT 0"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_contactos_campana_envio ON contactos_campana (session_name, ultimo_envio_bot)"))
+    if not existia:
+        conn.execute(text("""
+            INSERT INTO contactos_campana (telefono, id_cliente, ultimo_envio_bot, session_name)
+            SELECT DISTINCT ON (telefono) telefono, id_cliente, fecha, COALESCE(session_name, 'default')
+            FROM mensajes
+            WHERE tipo = 'SALIENTE_BOT' AND telefono IS NOT NULL
+            ORDER BY telefono, fecha DESC
+            ON CONFLICT (telefono) DO NOTHING
+        """))
+    _tabla_lista = True
+
+
+def registrar_envio(conn, telefono, id_cliente, session):
+    preparar_tabla(conn)
+    conn.execute(text(f"""
+        INSERT INTO contactos_campana (telefono, id_cliente, ultimo_envio_bot, session_name)
+        VALUES (:t, :idc, {HORA_PERU}, :sess)
+        ON CONFLICT (telefono) DO UPDATE SET
+            id_cliente = EXCLUDED.id_cliente,
+            ultimo_envio_bot = EXCLUDED.ultimo_envio_bot,
+            session_name = EXCLUDED.session_name
+    """), {"t": telefono, "idc": id_cliente, "sess": session})
+
+
+def marcar_excluido(conn, telefono, id_cliente, motivo):
+    preparar_tabla(conn)
+    conn.execute(text("""
+        INSERT INTO contactos_campana (telefono, id_cliente, excluido, motivo_exclusion)
+        VALUES (:t, :idc, TRUE, :m)
+        ON CONFLICT (telefono) DO UPDATE SET excluido = TRUE, motivo_exclusion = EXCLUDED.motivo_exclusion
+    """), {"t": telefono, "idc": id_cliente, "m": motivo[:100]})
+
+
+# Verificación vigente según su resultado (SQL reutilizable en las consultas de abajo)
+VERIFICACION_VIGENTE = f"""(
+    cc.verificado_en IS NOT NULL AND cc.verificado_en > NOW() - CASE WHEN cc.tiene_whatsapp
+        THEN INTERVAL '{DIAS_VIGENCIA_CON_WSP} days' ELSE INTERVAL '{DIAS_VIGENCIA_SIN_WSP} days' END
+)"""
+
+
+def guardar_verificacion(conn, telefono, id_cliente, resultado):
+    """
+    Guarda el resultado de check-exists: True/False son respuestas reales de WhatsApp;
+    None es un error transitorio y solo se anota como tal (nunca como negativo).
+    """
+    preparar_tabla(conn)
+    if resultado is None:
+        conn.execute(text("""
+            INSERT INTO contactos_campana (telefono, id_cliente, ultimo_error_verificacion, errores_verificacion)
+            VALUES (:t, :idc, NOW(), 1)
+            ON CONFLICT (telefono) DO UPDATE SET
+                ultimo_error_verificacion = NOW(),
+                errores_verificacion = COALESCE(contactos_campana.errores_verificacion, 0) + 1
+        """), {"t": telefono, "idc": id_cliente})
+    else:
+        conn.execute(text("""
+            INSERT INTO contactos_campana (telefono, id_cliente, tiene_whatsapp, verificado_en, errores_verificacion)
+            VALUES (:t, :idc, :w, NOW(), 0)
+            ON CONFLICT (telefono) DO UPDATE SET
+                tiene_whatsapp = EXCLUDED.tiene_whatsapp,
+                verificado_en = NOW(),
+                errores_verificacion = 0
+        """), {"t": telefono, "idc": id_cliente, "w": bool(resultado)})
+
+
+def pendientes_de_verificar(conn, limite=200):
+    """Teléfonos activos sin verificación vigente; los que dieron error esperan 1 hora antes de reintentarse."""
+    preparar_tabla(conn)
+    return conn.execute(text(f"""
+        SELECT t.id_cliente, t.telefono
+        FROM telefonoscliente t
+        JOIN clientes c ON c.id_cliente = t.id_cliente
+        LEFT JOIN contactos_campana cc ON cc.telefono = t.telefono
+        WHERE t.activo = TRUE AND c.activo = TRUE AND length(t.telefono) > 6
+          AND NOT {VERIFICACION_VIGENTE}
+          AND (cc.ultimo_error_verificacion IS NULL OR cc.ultimo_error_verificacion < NOW() - INTERVAL '1 hour')
+        ORDER BY t.es_principal DESC, cc.verificado_en NULLS FIRST
+        LIMIT :lim
+    """), {"lim": limite}).fetchall()
+
+
+def enviados_hoy(conn, session):
+    """DMs del bot enviados hoy (hora de Perú) desde la sesión."""
+    preparar_tabla(conn)
+    return conn.execute(text(f"""
+        SELECT COUNT(*) FROM contactos_campana
+        WHERE session_name = :sess AND ultimo_envio_bot >= date_trunc('day', {HORA_PERU})
+    """), {"sess": session}).scalar() or 0
+
+
+def seleccionar_prospectos(conn, limite=50, solo_verificados=False):
+    """
+    Clientes 'Sin empezar' con teléfono principal a los que el bot puede escribir hoy.
+    Los que tienen un "sin WhatsApp" vigente nunca salen; con `solo_verificados` salen
+    únicamente los que tienen un "sí" vigente. `verificado` indica si se puede saltar
+    la verificación al enviar.
+    """
+    preparar_tabla(conn)
+    filtro_verificados = f"AND cc.tiene_whatsapp = TRUE AND {VERIFICACION_VIGENTE}" if solo_verificados else ""
+    return conn.execute(text(f"""
+        SELECT c.id_cliente, c.nombre_corto, c.nombre_ia, t.telefono,
+               COALESCE(cc.tiene_whatsapp = TRUE AND {VERIFICACION_VIGENTE}, FALSE) AS verificado
+        FROM clientes c
+        JOIN telefonoscliente t ON c.id_cliente = t.id_cliente
+        LEFT JOIN contactos_campana cc ON cc.telefono = t.telefono
+        WHERE c.activo = TRUE AND c.estado = 'Sin empezar' AND COALESCE(c.excluir_publicidad, FALSE) = FALSE
+          AND t.activo = TRUE AND t.es_principal = TRUE AND length(t.telefono) > 6
+          AND COALESCE(cc.excluido, FALSE) = FALSE
+          AND (cc.ultimo_envio_bot IS NULL OR cc.ultimo_envio_bot < {HORA_PERU} - INTERVAL '{DIAS_ENTRE_ENVIOS} days')
+          AND NOT (cc.tiene_whatsapp = FALSE AND {VERIFICACION_VIGENTE})
+          {filtro_verificados}
+        ORDER BY RANDOM()
+        LIMIT :lim
+    """), {"lim": limite}).fetchall()
+
+
+def resumen_cobertura(conn):
+    """(enviados en los últimos 60 días, pendientes) sobre la base habilitada para campañas."""
+    preparar_tabla(conn)
+    fila = conn.execute(text(f"""
+        SELECT
+            SUM(CASE WHEN cc.ultimo_envio_bot >= {HORA_PERU} - INTERVAL '{DIAS_ENTRE_ENVIOS} days' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN cc.ultimo_envio_bot >= {HORA_PERU} - INTERVAL '{DIAS_ENTRE_ENVIOS} days' THEN 0 ELSE 1 END)
+        FROM clientes c
+        JOIN telefonoscliente t ON c.id_cliente = t.id_cliente
+        LEFT JOIN contactos_campana cc ON cc.telefono = t.telefono
+        WHERE c.activo = TRUE AND COALESCE(c.excluir_publicidad, FALSE) = FALSE
+          AND c.estado = 'Sin empezar'
+          AND t.activo = TRUE AND t.es_principal = TRUE AND length(t.telefono) > 6
+    """)).fetchone()
+    return int(fila[0] or 0), int(fila[1] or 0)
@@ -0,0 +1,303 @@
+import os
+import sys
+import time
+from sqlalchemy import text
+from googleapiclient.errors import HttpError
+from database import engine
+from woo_catalogo import LimitadorTasa
+
+# ==============================================================================
+# 📒 ESPEJO LOCAL DE GOOGLE CONTACTS (google_contactos + syncToken)
+# ==============================================================================
+# Una fila por teléfono normalizado (formato 'db') con el contacto de Google que
+# lo tiene. La primera vez se descarga la agenda entera; después solo se piden
+# los cambios con el syncToken de la People API, así buscar un número es una
+# consulta por clave primaria en vez de searchContacts + recorrer `people/me`.
+#
+# Si Google invalida el token (HTTP 410, p. ej. tras 7 días sin usarlo) se vuelve
+# a descargar todo. La sincronización se reclama con un UPDATE condicional, así
+# webhook, panel y scripts no la repiten a la vez.
+
+CAMPOS = "names,phoneNumbers,metadata"
+SEGUNDOS_ENTRE_SYNC = 60
+
+# Escrituras: la People API admite hasta 200 contactos por batchCreate/batchUpdate
+# y pide que las mutaciones de un mismo usuario vayan en serie y espaciadas.
+LOTE_ESCRITURA = 200
+_limitador = LimitadorTasa(float(os.getenv("GOOGLE_ESCRITURAS_POR_SEGUNDO", "1")))
+
+_tabla_lista = False
+
+
+def _preparar_tabla(conn):
+    global _tabla_lista
+    if _tabla_lista:
+        return
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS google_contactos (
+            telefono VARCHAR(20) PRIMARY KEY,
+            resource_name VARCHAR(100),
+            nombre_completo VARCHAR(200),
+            telefono_google VARCHAR(50),
+            actualizado TIMESTAMP DEFAULT NOW()
+        )
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_google_contactos_resource ON google_contactos (resource_name)"))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS google_sync_estado (
+            id INT PRIMARY KEY,
+            sync_token TEXT,
+            revisado TIMESTAMP
+        )
+    """))
+    conn.execute(text("INSERT INTO google_sync_estado (id, revisado) VALUES (1, NOW() - INTERVAL '1 day') ON CONFLICT (id) DO NOTHING"))
+    _tabla_lista = True
+
+
+def _filas_de_persona(persona):
+    """(telefono_db, resource_name, nombre, telefono_google) por cada número normalizable del contacto."""
+    from utils import normalizar_telefono_maestro
+
+    nombres = persona.get('names', [])
+    nombre_completo = nombres[0].get('displayName', 'Sin Nombre') if nombres else "Sin Nombre"
+    filas = {}
+    for phone in persona.get('phoneNumbers', []):
+        val = phone.get('value', '')
+        norm = normalizar_telefono_maestro(val)
+        if norm:
+            filas.setdefault(norm['db'], (norm['db'], persona.get('resourceName'), nombre_completo[:200], val[:50]))
+    return list(filas.values())
+
+
+def _guardar_persona(conn, persona):
+    conn.execute(text("DELETE FROM google_contactos WHERE resource_name = :r"), {"r": persona.get('resourceName')})
+    if persona.get('metadata', {}).get('deleted'):
+        return
+    for tel, recurso, nombre, tel_google in _filas_de_persona(persona):
+        conn.execute(text("""
+            INSERT INTO google_contactos (telefono, resource_name, nombre_completo, telefono_google, actualizado)
+            VALUES (:t, :r, :n, :tg, NOW())
+            ON CONFLICT (telefono) DO UPDATE SET
+                resource_name = EXCLUDED.resource_name, nombre_completo = EXCLUDED.nombre_completo,
+                telefono_google = EXCLUDED.telefono_google, actualizado = NOW()
+        """), {"t": tel, "r": recurso, "n": nombre, "tg": tel_google})
+
+
+def _descargar(service, sync_token=None):
+    """Todas las páginas de people/me (o solo los cambios desde `sync_token`). Devuelve (personas, token nuevo)."""
+    personas = []
+    parametros = {"resourceName": "people/me", "personFields": CAMPOS, "pageSize": 1000, "requestSyncToken": True}
+    if sync_token:
+        parametros["syncToken"] = sync_token
+    request = service.people().connections().list(**parametros)
+    token_nuevo = None
+    while request is not None:
+        response = request.execute()
+        personas.extend(response.get('connections', []))
+        token_nuevo = response.get('nextSyncToken') or token_nuevo
+        request = service.people().connections().list_next(request, response)
+    return personas, token_nuevo
+
+
+def sincronizar(forzar=False):
+    """
+    Trae los cambios de Google al espejo. Sin `forzar`, no hace nada si otro proceso
+    sincronizó hace menos de SEGUNDOS_ENTRE_SYNC. Devuelve cuántos contactos se procesaron.
+    """
+    from utils import get_google_service
+
+    with engine.begin() as conn:
+        _preparar_tabla(conn)
+        fila = conn.execute(text(f"""
+            UPDATE google_sync_estado SET revisado = NOW()
+            WHERE id = 1 AND (:forzar OR revisado < NOW() - INTERVAL '{SEGUNDOS_ENTRE_SYNC} seconds')
+            RETURNING sync_token
+        """), {"forzar": forzar}).fetchone()
+    if not fila:
+        return 0
+
+    service = get_google_service()
+    if not service:
+        return 0
+
+    completa = not fila.sync_token
+    try:
+        try:
+            personas, token = _descargar(service, fila.sync_token)
+        except HttpError as e:
+            if e.resp.status != 410:
+                raise
+            print("🔄 [GOOGLE] syncToken vencido: descargando la agenda completa...", file=sys.stderr)
+            completa = True
+            personas, token = _descargar(service)
+
+        with engine.begin() as conn:
+            if completa:
+                conn.execute(text("DELETE FROM google_contactos"))
+            for persona in personas:
+                _guardar_persona(conn, persona)
+            conn.execute(text("UPDATE google_sync_estado SET sync_token = :t WHERE id = 1"), {"t": token})
+        return len(personas)
+    except Exception as e:
+        print(f"⚠️ [GOOGLE] No se pudo sincronizar el espejo de contactos: {e}", file=sys.stderr)
+        return 0
+
+
+def buscar(telefono_db):
+    """Fila del espejo para el teléfono normalizado, o None."""
+    with engine.begin() as conn:
+        _preparar_tabla(conn)
+        return conn.execute(text("""
+            SELECT resource_name, nombre_completo, telefono_google FROM google_contactos WHERE telefono = :t
+        """), {"t": telefono_db}).fetchone()
+
+
+def mapa_telefonos():
+    """{telefono_db: resource_name} del espejo completo, para cruces masivos."""
+    with engine.begin() as conn:
+        _preparar_tabla(conn)
+        return dict(conn.execute(text("SELECT telefono, resource_name FROM google_contactos")).fetchall())
+
+
+def registrar(persona):
+    """Refleja al instante un contacto recién creado/editado (sin esperar al próximo syncToken)."""
+    registrar_varios([persona])
+
+
+# ==============================================================================
+# ✍️ ESCRITURAS EN LOTE (batchCreateContacts / batchUpdateContacts)
+# ==============================================================================
+def _ejecutar(peticion, intentos=4):
+    """Ejecuta la petición respetando el ritmo de escrituras; reintenta 429/5xx con espera creciente."""
+    for intento in range(intentos):
+        _limitador.esperar()
+        try:
+            return peticion.execute()
+        except HttpError as e:
+            if e.resp.status in (429, 500, 503) and intento < intentos - 1:
+                espera = 5 * 2 ** intento
+                print(f"⏳ [GOOGLE] HTTP {e.resp.status}: reintentando en {espera}s...", file=sys.stderr)
+                time.sleep(espera)
+                continue
+            raise
+
+
+def _persona(nombre, apellido, telefono, email=None):
+    cuerpo = {
+        "names": [{"givenName": nombre or "", "familyName": apellido or ""}],
+        "phoneNumbers": [{"value": telefono, "type": "mobile"}],
+    }
+    if email:
+        cuerpo["emailAddresses"] = [{"value": email}]
+    return cuerpo
+
+
+def crear_en_lote(contactos):
+    """
+    Crea los contactos de a LOTE_ESCRITURA por llamada.
+    `contactos`: dicts con id_cliente, nombre, apellido, telefono (y email opcional).
+    Varios clientes con el mismo teléfono comparten un único contacto (el del primero).
+    Devuelve {id_cliente: resourceName} de los que Google creó; todos quedan en el espejo.
+    """
+    from utils import get_google_service, normalizar_telefono_maestro
+
+    service = get_google_service()
+    if not service or not contactos:
+        return {}
+
+    # Google no garantiza el orden de la respuesta: se empareja por teléfono, así que
+    # cada teléfono va una sola vez y su contacto se vincula a todos sus clientes
+    unicos, clientes_de = [], {}
+    for c in contactos:
+        norm = normalizar_telefono_maestro(c["telefono"])
+        tel = norm['db'] if norm else c["telefono"]
+        if tel not in clientes_de:
+            clientes_de[tel] = []
+            unicos.append(c)
+        clientes_de[tel].append(c["id_cliente"])
+
+    creados = {}
+    for i in range(0, len(unicos), LOTE_ESCRITURA):
+        lote = unicos[i:i + LOTE_ESCRITURA]
+        try:
+            resp = _ejecutar(service.people().batchCreateContacts(body={
+                "contacts": [{"contactPerson": _persona(c["nombre"], c.get("apellido"), c["telefono"], c.get("email"))} for c in lote],
+                "readMask": CAMPOS,
+            }))
+        except Exception as e:
+            print(f"❌ [GOOGLE] Falló la creación en lote ({len(lote)} contactos): {e}", file=sys.stderr)
+            continue
+
+        personas = [r["person"] for r in resp.get("createdPeople", []) if r.get("person")]
+        for persona in personas:
+            for tel, recurso, _, _ in _filas_de_persona(persona):
+                for id_cliente in clientes_de.get(tel, []):
+                    creados[id_cliente] = recurso
+        registrar_varios(personas)
+    return creados
+
+
+def actualizar_en_lote(contactos):
+    """
+    Actualiza nombre, apellido y teléfono de a LOTE_ESCRITURA por llamada.
+    `contactos`: dicts con google_id, nombre, apellido, telefono. Los etag se piden
+    con un solo people:batchGet por lote. Devuelve el set de resourceNames actualizados.
+    """
+    from utils import get_google_service
+
+    service = get_google_service()
+    if not service or not contactos:
+        return set()
+
+    actualizados = set()
+    for i in range(0, len(contactos), LOTE_ESCRITURA):
+        lote = {}
+        for c in contactos[i:i + LOTE_ESCRITURA]:
+            recurso = c["google_id"] if c["google_id"].startswith('people/') else f"people/{c['google_id']}"
+            lote[recurso] = c
+        try:
+            etags = _ejecutar(service.people().getBatchGet(resourceNames=list(lote), personFields="metadata"))
+            cuerpo = {}
+            for r in etags.get("responses", []):
+                persona = r.get("person") or {}
+                recurso = r.get("requestedResourceName") or persona.get("resourceName")
+                if recurso in lote and persona.get("etag"):
+                    c = lote[recurso]
+                    cuerpo[recurso] = {"etag": persona["etag"], **_persona(c["nombre"], c.get("apellido"), c["telefono"])}
+            if not cuerpo:
+                continue
+            resp = _ejecutar(service.people().batchUpdateContacts(body={
+                "contacts": cuerpo, "updateMask": "names,phoneNumbers", "readMask": CAMPOS,
+            }))
+        except Exception as e:
+            print(f"❌ [GOOGLE] Falló la actualización en lote ({len(lote)} contactos): {e}", file=sys.stderr)
+            continue
+
+        personas = [r["person"] for r in resp.get("updateResult", {}).values() if r.get("person")]
+        actualizados.update(p.get("resourceName") for p in personas)
+        registrar_varios(personas)
+    return actualizados
+
+
+def registrar_varios(personas):
+    """Guarda los contactos devueltos por Google en el espejo, en una sola transacción."""
+    if not personas:
+        return
+    try:
+        with engine.begin() as conn:
+            _preparar_tabla(conn)
+            for persona in personas:
+                _guardar_persona(conn, persona)
+    except Exception as e:
+        print(f"⚠️ [GOOGLE] No se pudo actualizar el espejo: {e}", file=sys.stderr)
+
+
+def vincular_clientes(conn, vinculos):
+    """Guarda {id_cliente: resourceName} en clientes.google_id con un único UPDATE."""
+    if not vinculos:
+        return 0
+    return conn.execute(text("""
+        UPDATE clientes c SET google_id = v.gid
+        FROM unnest(CAST(:ids AS INT[]), CAST(:gids AS TEXT[])) AS v(id_cliente, gid)
+        WHERE c.id_cliente = v.id_cliente
+    """), {"ids": [int(k) for k in vinculos], "gids": list(vinculos.values())}).rowcount
@@ -0,0 +1,111 @@
+import json
+import sys
+import random
+from sqlalchemy import text
+from database import engine
+
+# ==============================================================================
+# 📝 POOL DE COPYS GENERADOS POR IA (OLLAMA)
+# ==============================================================================
+# Cada copy se guarda con la llave (sku, versión del prompt, modo, festividad).
+# La versión es una huella de los modelos configurados (no del sorteado para
+# cada copy), el prompt del panel y los datos del producto: si cambian el precio, el enfoque o el prompt, la llave cambia y los
+# copys viejos dejan de servirse solos. Se sirven rotando (el menos usado
+# primero) y se retiran tras USOS_MAX envíos para no repetir demasiado el mismo texto.
+
+VARIANTES_POR_LLAVE = 3
+USOS_MAX = 4
+DIAS_VIGENCIA = 7
+
+_tabla_lista = False
+
+
+def _preparar_tabla(conn):
+    global _tabla_lista
+    if _tabla_lista:
+        return
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS copys_ia (
+            id SERIAL PRIMARY KEY,
+            sku VARCHAR(100),
+            version_prompt VARCHAR(32),
+            modo VARCHAR(10),
+            festividad VARCHAR(100) DEFAULT '',
+            contenido TEXT,
+            usos INT DEFAULT 0,
+            creado TIMESTAMP DEFAULT NOW()
+        )
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_copys_ia_llave ON copys_ia (sku, version_prompt, modo, festividad)"))
+    conn.execute(text(f"DELETE FROM copys_ia WHERE usos >= {USOS_MAX} OR creado < NOW() - INTERVAL '{DIAS_VIGENCIA} days'"))
+    _tabla_lista = True
+
+
+def tomar_copy(sku, version, modo, festividad=""):
+    """Entrega el copy menos usado de la llave (y lo marca como usado), o None si el pool está vacío."""
+    try:
+        with engine.begin() as conn:
+            _preparar_tabla(conn)
+            fila = conn.execute(text(f"""
+                SELECT id, contenido FROM copys_ia
+                WHERE sku = :sku AND version_prompt = :v AND modo = :m AND festividad = :f
+                  AND usos < {USOS_MAX} AND creado > NOW() - INTERVAL '{DIAS_VIGENCIA} days'
+                ORDER BY usos, RANDOM()
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            """), {"sku": sku, "v": version, "m": modo, "f": festividad}).fetchone()
+            if not fila:
+                return None
+            conn.execute(text("UPDATE copys_ia SET usos = usos + 1 WHERE id = :id"), {"id": fila.id})
+            return json.loads(fila.contenido)
+    except Exception as e:
+        print(f"⚠️ [COPYS IA] No se pudo leer el pool: {e}", file=sys.stderr)
+        return None
+
+
+def guardar_copy(sku, version, modo, festividad, contenido, usos=0):
+    try:
+        with engine.begin() as conn:
+            _preparar_tabla(conn)
+            conn.execute(text("""
+                INSERT INTO copys_ia (sku, version_prompt, modo, festividad, contenido, usos)
+                VALUES (:sku, :v, :m, :f, :c, :u)
+            """), {"sku": sku, "v": version, "m": modo, "f": festividad, "c": json.dumps(contenido, ensure_ascii=False), "u": usos})
+    except Exception as e:
+        print(f"⚠️ [COPYS IA] No se pudo guardar el copy: {e}", file=sys.stderr)
+
+
+def faltantes(sku, version, modo, festividad=""):
+    """Cuántas variantes vigentes faltan para completar el pool de esa llave."""
+    try:
+        with engine.begin() as conn:
+            _preparar_tabla(conn)
+            vigentes = conn.execute(text(f"""
+                SELECT COUNT(*) FROM copys_ia
+                WHERE sku = :sku AND version_prompt = :v AND modo = :m AND festividad = :f
+                  AND usos < {USOS_MAX} AND creado > NOW() - INTERVAL '{DIAS_VIGENCIA} days'
+            """), {"sku": sku, "v": version, "m": modo, "f": festividad}).scalar() or 0
+    except Exception as e:
+        print(f"⚠️ [COPYS IA] No se pudo contar el pool: {e}", file=sys.stderr)
+        return 0
+    return max(VARIANTES_POR_LLAVE - vigentes, 0)
+
+
+def muestrear_skus_probables(indice, columnas, cantidad):
+    """
+    SKUs que el bot probablemente elegirá pronto: se sortean con los mismos pesos
+    del índice de selección, así el pool se llena donde más se va a consumir.
+    """
+    elegidos = {}
+    for _ in range(cantidad * 3):
+        if len(elegidos) >= cantidad:
+            break
+        columna = random.choice(columnas)
+        grupo = indice.elegir_grupo(columna)
+        if not grupo:
+            continue
+        item = indice.elegir_en_grupo(grupo)
+        if item:
+            # Un mismo SKU puede necesitar copy de DM y de estado
+            elegidos.setdefault((item["sku"], "_msg_" in columna), (item, columna))
+    return list(elegidos.values())
@@ -0,0 +1,201 @@
+import os
+import sys
+import argparse
+from datetime import date
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+from database import engine
+
+# ==============================================================================
+# 📈 MODELO DE DEMANDA POR SKU (demanda_sku) PARA EL ASISTENTE DE COMPRAS
+# ==============================================================================
+# El asistente agregaba todo DetalleVenta ⋈ Ventas con CASE por año en cada
+# carga. Ahora lee `demanda_sku`, una fila por variante con:
+#   u30 / u90 / u365       unidades vendidas en los últimos 30/90/365 días
+#   u_anio_0/1/2           unidades del año `anio_base` y de los dos anteriores
+#                          (incluye HistorialAnual para los años previos al sistema)
+#   estacionalidad         cuánto se vendió en los próximos 90 días hace un año
+#                          frente a un trimestre promedio de ese año (1 = neutro)
+#   desv_mensual           desviación de las unidades de los últimos 12 meses de 30 días
+#   demanda_diaria         tasa anual (la mejor entre los últimos 365 días y el
+#                          último año cerrado) / 365 × estacionalidad
+#
+# Las ventanas se corren cada día, así que el cálculo completo se hace una vez
+# por día (cron nocturno o, si no corrió, la primera lectura del día). Entre
+# medio, triggers en DetalleVenta y Ventas anotan en `demanda_pendientes` los
+# SKUs tocados (venta nueva, anulación) y refrescar() recalcula solo esos.
+#
+#   python demanda_sku.py             # aplica lo pendiente (o el completo del día)
+#   python demanda_sku.py --completo  # cron nocturno: recalcula todas las variantes
+
+_CANDADO = 41042  # pg_try_advisory_xact_lock: un solo refresco a la vez
+ESTACIONALIDAD_MIN, ESTACIONALIDAD_MAX = 0.5, 3.0  # Con pocas ventas el índice se dispara
+VENTAS_MIN_ESTACIONALIDAD = 4  # Unidades mínimas del año anterior para calcular el índice
+Z_SERVICIO = {"90%": 1.28, "95%": 1.65, "98%": 2.05, "99%": 2.33}  # Nivel de servicio -> z del stock de seguridad
+
+
+def _historial(anio):
+    """HistorialAnual trae una columna por año (v2023, v2024, ...) hasta 2025; después todo está en Ventas."""
+    return f"COALESCE(h.v{anio}, 0)" if anio <= 2025 else "0"
+
+
+def _calculo(anio):
+    return f"""
+        INSERT INTO demanda_sku (sku, anio_base, u30, u90, u365, u_anio_0, u_anio_1, u_anio_2,
+                                 estacionalidad, desv_mensual, demanda_diaria, actualizado)
+        WITH base AS (
+            SELECT sku FROM Variantes
+            WHERE CAST(:skus AS TEXT[]) IS NULL OR sku = ANY(CAST(:skus AS TEXT[]))
+        ),
+        ventas AS (
+            SELECT d.sku, CAST(v.fecha_venta AS DATE) AS dia, d.cantidad
+            FROM DetalleVenta d
+            JOIN Ventas v ON v.id_venta = d.id_venta
+            WHERE v.anulado IS NOT TRUE
+              AND d.sku IN (SELECT sku FROM base)
+              AND v.fecha_venta >= LEAST(make_date(:anio - 2, 1, 1), CAST(:hoy AS DATE) - 730)
+        ),
+        agregado AS (
+            SELECT sku,
+                SUM(cantidad) FILTER (WHERE dia > CAST(:hoy AS DATE) - 30) AS u30,
+                SUM(cantidad) FILTER (WHERE dia > CAST(:hoy AS DATE) - 90) AS u90,
+                SUM(cantidad) FILTER (WHERE dia > CAST(:hoy AS DATE) - 365) AS u365,
+                SUM(cantidad) FILTER (WHERE EXTRACT(YEAR FROM dia) = :anio) AS a0,
+                SUM(cantidad) FILTER (WHERE EXTRACT(YEAR FROM dia) = :anio - 1) AS a1,
+                SUM(cantidad) FILTER (WHERE EXTRACT(YEAR FROM dia) = :anio - 2) AS a2,
+                SUM(cantidad) FILTER (WHERE dia > CAST(:hoy AS DATE) - 365 AND dia <= CAST(:hoy AS DATE) - 275) AS ventana_pasada,
+                SUM(cantidad) FILTER (WHERE dia > CAST(:hoy AS DATE) - 730 AND dia <= CAST(:hoy AS DATE) - 365) AS anio_pasado
+            FROM ventas
+            GROUP BY sku
+        ),
+        meses AS (
+            -- Bloques de 30 días hacia atrás (0 = el más reciente); los meses sin venta cuentan como 0
+            SELECT sku, (CAST(:hoy AS DATE) - dia) / 30 AS bloque, SUM(cantidad) AS u
+            FROM ventas WHERE dia > CAST(:hoy AS DATE) - 360
+            GROUP BY sku, bloque
+        ),
+        dispersion AS (
+            SELECT sku, SQRT(GREATEST(SUM(u * u) / 12.0 - POWER(SUM(u) / 12.0, 2), 0)) AS desv
+            FROM meses GROUP BY sku
+        ),
+        fila AS (
+            SELECT b.sku,
+                COALESCE(a.u30, 0) AS u30, COALESCE(a.u90, 0) AS u90, COALESCE(a.u365, 0) AS u365,
+                COALESCE(a.a0, 0) + {_historial(anio)} AS u_anio_0,
+                COALESCE(a.a1, 0) + {_historial(anio - 1)} AS u_anio_1,
+                COALESCE(a.a2, 0) + {_historial(anio - 2)} AS u_anio_2,
+                CASE WHEN COALESCE(a.anio_pasado, 0) >= {VENTAS_MIN_ESTACIONALIDAD}
+                     THEN LEAST(GREATEST(COALESCE(a.ventana_pasada, 0) * (365 / 90.0) / a.anio_pasado,
+                                         {ESTACIONALIDAD_MIN}), {ESTACIONALIDAD_MAX})
+                     ELSE 1 END AS estacionalidad,
+                COALESCE(ds.desv, 0) AS desv_mensual
+            FROM base b
+            LEFT JOIN agregado a ON a.sku = b.sku
+            LEFT JOIN dispersion ds ON ds.sku = b.sku
+            LEFT JOIN HistorialAnual h ON h.sku = b.sku
+        )
+        SELECT sku, :anio, u30, u90, u365, u_anio_0, u_anio_1, u_anio_2, estacionalidad, desv_mensual,
+               GREATEST(u365, u_anio_1) / 365.0 * estacionalidad, CURRENT_TIMESTAMP
+        FROM fila
+        ON CONFLICT (sku) DO UPDATE SET
+            anio_base = EXCLUDED.anio_base, u30 = EXCLUDED.u30, u90 = EXCLUDED.u90, u365 = EXCLUDED.u365,
+            u_anio_0 = EXCLUDED.u_anio_0, u_anio_1 = EXCLUDED.u_anio_1, u_anio_2 = EXCLUDED.u_anio_2,
+            estacionalidad = EXCLUDED.estacionalidad, desv_mensual = EXCLUDED.desv_mensual,
+            demanda_diaria = EXCLUDED.demanda_diaria, actualizado = EXCLUDED.actualizado
+    """
+
+
+_tablas_listas = False
+
+
+def preparar_tablas(conn):
+    """Tablas y triggers de SKUs pendientes."""
+    global _tablas_listas
+    if _tablas_listas:
+        return
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS demanda_sku (
+            sku VARCHAR(100) PRIMARY KEY REFERENCES Variantes(sku) ON UPDATE CASCADE ON DELETE CASCADE,
+            anio_base INT,
+            u30 BIGINT DEFAULT 0, u90 BIGINT DEFAULT 0, u365 BIGINT DEFAULT 0,
+            u_anio_0 BIGINT DEFAULT 0, u_anio_1 BIGINT DEFAULT 0, u_anio_2 BIGINT DEFAULT 0,
+            estacionalidad NUMERIC DEFAULT 1, desv_mensual NUMERIC DEFAULT 0, demanda_diaria NUMERIC DEFAULT 0,
+            actualizado TIMESTAMP
+        )
+    """))
+    conn.execute(text("CREATE TABLE IF NOT EXISTS demanda_pendientes (sku VARCHAR(100) PRIMARY KEY)"))
+    conn.execute(text("CREATE TABLE IF NOT EXISTS demanda_estado (id INT PRIMARY KEY, calculado DATE)"))
+    # El recálculo de unos pocos SKUs entra por aquí en vez de recorrer todo el detalle
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_detalleventa_sku ON DetalleVenta (sku)"))
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION fn_demanda_marcar() RETURNS trigger AS $$
+        BEGIN
+            IF TG_TABLE_NAME = 'detalleventa' THEN
+                INSERT INTO demanda_pendientes (sku)
+                SELECT s FROM unnest(ARRAY[
+                    CASE WHEN TG_OP <> 'DELETE' THEN NEW.sku END,
+                    CASE WHEN TG_OP <> 'INSERT' THEN OLD.sku END
+                ]) AS s WHERE s IS NOT NULL
+                ON CONFLICT DO NOTHING;
+            ELSE
+                -- Anular, cambiar la fecha o borrar una venta mueve la demanda de todo su detalle
+                INSERT INTO demanda_pendientes (sku)
+                SELECT DISTINCT sku FROM detalleventa
+                WHERE id_venta = OLD.id_venta AND sku IS NOT NULL
+                ON CONFLICT DO NOTHING;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """))
+    triggers = {
+        "trg_demanda_detalleventa": "AFTER INSERT OR DELETE OR UPDATE OF sku, cantidad, id_venta ON DetalleVenta FOR EACH ROW EXECUTE FUNCTION fn_demanda_marcar()",
+        "trg_demanda_ventas": "AFTER DELETE OR UPDATE OF anulado, fecha_venta ON Ventas FOR EACH ROW EXECUTE FUNCTION fn_demanda_marcar()",
+    }
+    existentes = {r[0] for r in conn.execute(text("SELECT tgname FROM pg_trigger WHERE tgname LIKE 'trg_demanda_%'"))}
+    for nombre, definicion in triggers.items():
+        if nombre not in existentes:
+            conn.execute(text(f"CREATE TRIGGER {nombre} {definicion}"))
+    _tablas_listas = True
+
+
+def refrescar(completo=False):
+    """
+    Recalcula todas las variantes si se pide o si hoy todavía no se hizo; si no,
+    solo los SKUs pendientes. Devuelve cuántas filas se recalcularon ("todas" en el
+    completo) o None si otro proceso ya está refrescando.
+    """
+    hoy = date.today()
+    with engine.begin() as conn:
+        preparar_tablas(conn)
+        if not conn.execute(text(f"SELECT pg_try_advisory_xact_lock({_CANDADO})")).scalar():
+            return None
+
+        calculado = conn.execute(text("SELECT calculado FROM demanda_estado WHERE id = 1")).scalar()
+        params = {"anio": hoy.year, "hoy": hoy}
+        if completo or calculado != hoy:
+            conn.execute(text("DELETE FROM demanda_pendientes"))
+            conn.execute(text(_calculo(hoy.year)), {**params, "skus": None})
+            conn.execute(text("""
+                INSERT INTO demanda_estado (id, calculado) VALUES (1, :hoy)
+                ON CONFLICT (id) DO UPDATE SET calculado = EXCLUDED.calculado
+            """), {"hoy": hoy})
+            return "todas"
+
+        skus = [r[0] for r in conn.execute(text("DELETE FROM demanda_pendientes RETURNING sku"))]
+        if skus:
+            conn.execute(text(_calculo(hoy.year)), {**params, "skus": skus})
+        return len(skus)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresca el modelo de demanda por SKU del asistente de compras.")
+    parser.add_argument("--completo", action="store_true", help="Recalcula todas las variantes (cron nocturno)")
+    args = parser.parse_args()
+    hechos = refrescar(completo=args.completo)
+    if hechos is None:
+        print("⏳ Otro proceso está refrescando la demanda. Saliendo...")
+        sys.exit(0)
+    print(f"✅ Demanda por SKU actualizada: {hechos} variantes")
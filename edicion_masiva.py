@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+# ==============================================================================
+# 💾 GUARDADO EN LOTE DE LAS GRILLAS EDITABLES (st.data_editor)
+# ==============================================================================
+# Los botones "Guardar" recorrían la grilla entera con un UPDATE por fila (o por
+# campo), y algunas tablas se vaciaban con DELETE y se volvían a insertar. Aquí
+# se compara la grilla original con la editada y se escribe solo lo que cambió,
+# con una sentencia por tabla:
+#
+#   UPDATE tabla t SET a = v.a, ... FROM unnest(CAST(:p0 AS INT[]), ...) AS v(id, a, ...)
+#   WHERE t.id = v.id
+#
+# (mismo patrón que contactos_google.vincular_clientes). Las funciones devuelven
+# cuántas filas tocaron para que la vista lo informe.
+#
+# `tipos` es {columna: tipo SQL} e incluye la clave; define el orden de las
+# columnas y el CAST de cada arreglo.
+
+
+def _valores(serie):
+    """Lista de valores nativos de Python (NaN/NaT -> None) lista para un arreglo de PostgreSQL."""
+    return [None if v is None or (not isinstance(v, (list, dict)) and pd.isna(v))
+            else v.item() if isinstance(v, np.generic) else v
+            for v in serie.astype(object)]
+
+
+def _arreglos(filas, tipos):
+    columnas = list(tipos)
+    origen = ", ".join(f"CAST(:p{i} AS {tipos[c]}[])" for i, c in enumerate(columnas))
+    params = {}
+    for i, c in enumerate(columnas):
+        valores = _valores(filas[c])
+        if tipos[c] in ("INT", "BIGINT"):  # Claves que pandas volvió float por un NaN (2.0 -> 2)
+            valores = [None if v is None else int(v) for v in valores]
+        params[f"p{i}"] = valores
+    return columnas, origen, params
+
+
+def _iguales(a, b):
+    try:
+        return (a == b) | (a.isna() & b.isna())
+    except TypeError:  # Tipos que no se pueden comparar (p. ej. fecha vs texto): se trata como cambio
+        return a.isna() & b.isna()
+
+
+def cambiadas(antes, despues, clave, columnas):
+    """
+    Filas de `despues` (con todas sus columnas) cuya clave ya existía en `antes` y que
+    difieren en alguna de `columnas`. Se empareja por la columna `clave`, no por el
+    índice, así que sirve igual si la grilla se filtró o reordenó.
+    """
+    despues = despues[despues[clave].notna()]
+    base = antes.drop_duplicates(clave).set_index(clave)
+    previas = base.reindex(despues[clave])
+    existe = despues[clave].isin(base.index).to_numpy()
+    distinta = np.zeros(len(despues), dtype=bool)
+    for col in columnas:
+        distinta |= ~_iguales(despues[col].reset_index(drop=True), previas[col].reset_index(drop=True)).to_numpy()
+    return despues[existe & distinta]
+
+
+def actualizar(conn, tabla, filas, clave, tipos):
+    """Un solo UPDATE ... FROM unnest(...) para todas las filas. Devuelve las filas afectadas."""
+    if filas is None or filas.empty:
+        return 0
+    columnas, origen, params = _arreglos(filas, tipos)
+    asignaciones = ", ".join(f"{c} = v.{c}" for c in columnas if c != clave)
+    return conn.execute(text(f"""
+        UPDATE {tabla} t SET {asignaciones}
+        FROM unnest({origen}) AS v({", ".join(columnas)})
+        WHERE t.{clave} = v.{clave}
+    """), params).rowcount
+
+
+def insertar(conn, tabla, filas, tipos):
+    """Un solo INSERT ... SELECT FROM unnest(...). Devuelve las filas insertadas."""
+    if filas is None or filas.empty:
+        return 0
+    columnas, origen, params = _arreglos(filas, tipos)
+    return conn.execute(text(f"""
+        INSERT INTO {tabla} ({", ".join(columnas)})
+        SELECT * FROM unnest({origen})
+    """), params).rowcount
+
+
+def borrar(conn, tabla, clave, tipo_clave, valores):
+    valores = _valores(pd.Series(valores, dtype=object))
+    if tipo_clave in ("INT", "BIGINT"):
+        valores = [int(v) for v in valores if v is not None]
+    if not valores:
+        return 0
+    return conn.execute(text(f"DELETE FROM {tabla} WHERE {clave} = ANY(CAST(:ids AS {tipo_clave}[]))"),
+                        {"ids": valores}).rowcount
+
+
+def sincronizar(conn, tabla, antes, despues, clave, tipos):
+    """
+    Para grillas con filas dinámicas (num_rows="dynamic"): borra las claves que ya no
+    están, inserta las filas sin clave y actualiza solo las que cambiaron.
+    Devuelve {"actualizadas", "insertadas", "borradas"}.
+    """
+    datos = [c for c in tipos if c != clave]
+    quitadas = antes.loc[~antes[clave].isin(despues[clave].dropna()), clave].tolist()
+    nuevas = despues[despues[clave].isna()]
+    return {
+        "borradas": borrar(conn, tabla, clave, tipos[clave], quitadas),
+        "insertadas": insertar(conn, tabla, nuevas, {c: tipos[c] for c in datos}),
+        "actualizadas": actualizar(conn, tabla, cambiadas(antes, despues, clave, datos), clave, tipos),
+    }
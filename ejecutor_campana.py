@@ -0,0 +1,247 @@
+import os
+import time
+import queue
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from database import engine
+
+import contactos_campana
+from utils import (
+    normalizar_telefono_maestro,
+    verificar_numero_waha,
+    enviar_mensaje_whatsapp,
+    generar_texto_producto_ia
+)
+
+# ==============================================================================
+# 🏭 EJECUTOR DE CAMPAÑAS: SESIONES EN PARALELO Y ETAPAS EN TUBERÍA
+# ==============================================================================
+# Cada sesión de WhatsApp corre en su propio hilo y dentro de ella los
+# prospectos pasan por tres etapas unidas por colas acotadas:
+#
+#   prospectos ──► verificación (WAHA) ──► copy (IA) ──► envío (WAHA)
+#
+# Mientras se envía a uno ya se está verificando al siguiente, y las colas
+# pequeñas evitan verificar o redactar de más. Las garantías anti-ban no cambian:
+# como mucho ENVIOS_POR_TICK DMs por sesión y tick, el cupo diario del panel y
+# los prospectos se reparten sin repetir entre sesiones.
+#
+# La agenda reemplaza al sleep orgánico: el cron llama al bot cada pocos minutos
+# (p. ej. */5) y solo dispara cuando vence `agenda_bot.proxima_ejecucion`, que se
+# reagenda con jitter en el mismo UPDATE que reclama el turno.
+
+ENVIOS_POR_TICK = 1
+INTENTOS_POR_TICK = 5  # Prospectos que se prueban por sesión antes de rendirse, como antes
+HILOS_VERIFICACION = 2
+TAM_COLA = 2
+INTERVALO_BASE_MIN = 30
+JITTER_MIN = (1, 25)
+# Escribir solo a números con WhatsApp ya confirmado por verificar_numeros.py
+SOLO_VERIFICADOS = os.getenv("CAMPANA_SOLO_VERIFICADOS", "0") == "1"
+
+_FIN = object()
+
+
+# ==============================================================================
+# 🗓️ AGENDA CON JITTER
+# ==============================================================================
+def reclamar_turno(conn):
+    """
+    Devuelve (True, próxima) si este proceso ganó el turno; (False, próxima) si aún no toca.
+    El UPDATE condicional evita que dos crons solapados disparen a la vez.
+    """
+    conn.execute(text("CREATE TABLE IF NOT EXISTS agenda_bot (id INT PRIMARY KEY, proxima_ejecucion TIMESTAMP)"))
+    conn.execute(text("INSERT INTO agenda_bot (id, proxima_ejecucion) VALUES (1, NOW()) ON CONFLICT (id) DO NOTHING"))
+
+    minutos = INTERVALO_BASE_MIN + random.randint(*JITTER_MIN)
+    fila = conn.execute(text("""
+        UPDATE agenda_bot SET proxima_ejecucion = NOW() + make_interval(mins => :m)
+        WHERE id = 1 AND proxima_ejecucion <= NOW()
+        RETURNING proxima_ejecucion
+    """), {"m": minutos}).fetchone()
+    if fila:
+        return True, fila.proxima_ejecucion
+    return False, conn.execute(text("SELECT proxima_ejecucion FROM agenda_bot WHERE id = 1")).scalar()
+
+
+# ==============================================================================
+# 📏 MÉTRICAS POR ETAPA
+# ==============================================================================
+class Etapa:
+    """Cuenta ítems y tiempo ocupado de una etapa para reportar su rendimiento."""
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.procesados = 0
+        self.segundos = 0.0
+        self._lock = threading.Lock()
+
+    def medir(self, funcion, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.procesados += 1
+                self.segundos += time.perf_counter() - inicio
+
+    def resumen(self):
+        ritmo = f"{self.procesados / self.segundos:.2f}/s" if self.segundos else "-"
+        return f"{self.nombre}: {self.procesados} en {self.segundos:.1f}s ({ritmo})"
+
+
+# ==============================================================================
+# 🔗 TUBERÍA DE UNA SESIÓN
+# ==============================================================================
+def _tuberia_sesion(obrero, producto, prospectos, log):
+    parar = threading.Event()
+    cola_verificar = queue.Queue(maxsize=TAM_COLA)
+    cola_copy = queue.Queue(maxsize=TAM_COLA)
+    cola_envio = queue.Queue(maxsize=1)
+    etapas = {n: Etapa(n) for n in ("verificación", "copy", "envío")}
+    enviados = []
+    verificadores_vivos = [HILOS_VERIFICACION]
+    lock_vivos = threading.Lock()
+
+    def poner(cola, item):
+        while not parar.is_set():
+            try:
+                cola.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def tomar(cola):
+        while not parar.is_set():
+            try:
+                return cola.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _FIN
+
+    def productor():
+        for cliente in prospectos:
+            if not poner(cola_verificar, cliente):
+                return
+        for _ in range(HILOS_VERIFICACION):
+            poner(cola_verificar, _FIN)
+
+    def verificador():
+        try:
+            while True:
+                cliente = tomar(cola_verificar)
+                if cliente is _FIN:
+                    break
+                try:
+                    norm = normalizar_telefono_maestro(cliente.telefono)
+                    if not norm:
+                        continue
+                    # Verificado hace poco por verificar_numeros.py: no se vuelve a consultar a WAHA
+                    existe = True if cliente.verificado else etapas["verificación"].medir(verificar_numero_waha, norm['db'])
+                    if existe is True:
+                        if not cliente.verificado:
+                            # El "sí" también queda vigente para la selección de los próximos ticks
+                            with engine.begin() as conn_ok:
+                                contactos_campana.guardar_verificacion(conn_ok, cliente.telefono, cliente.id_cliente, True)
+                        if not poner(cola_copy, (cliente, norm['db'])):
+                            break
+                    elif existe is False:
+                        log(f"⚠️ El número {norm['db']} no tiene WhatsApp. Purgando del embudo para siempre...")
+                        with engine.begin() as conn_purge:
+                            conn_purge.execute(text("UPDATE clientes SET excluir_publicidad = TRUE WHERE id_cliente = :idc"), {"idc": cliente.id_cliente})
+                            contactos_campana.guardar_verificacion(conn_purge, cliente.telefono, cliente.id_cliente, False)
+                            contactos_campana.marcar_excluido(conn_purge, cliente.telefono, cliente.id_cliente, "Sin WhatsApp")
+                    else:
+                        # Timeout o sesión caída: no es un "no tiene WhatsApp", se reintenta en otro tick
+                        log(f"⏳ [{obrero['nombre_vis']}] WAHA no pudo verificar {norm['db']}; se salta sin excluirlo.")
+                        with engine.begin() as conn_err:
+                            contactos_campana.guardar_verificacion(conn_err, cliente.telefono, cliente.id_cliente, None)
+                except Exception as e:
+                    log(f"🔥 [{obrero['nombre_vis']}] Error verificando {cliente.telefono}: {e}")
+        finally:
+            # El último verificador en salir avisa a la siguiente etapa
+            with lock_vivos:
+                verificadores_vivos[0] -= 1
+                ultimo = verificadores_vivos[0] == 0
+            if ultimo:
+                poner(cola_copy, _FIN)
+
+    def redactor():
+        try:
+            while True:
+                item = tomar(cola_copy)
+                if item is _FIN:
+                    break
+                cliente, telefono_final = item
+                saludo = random.choice(["Hola", "¡Hola!", "¡Qué tal", "Saludos", "Buen día"])
+                nom_ia = cliente.nombre_ia.strip() if cliente.nombre_ia else ""
+                cabecera = f"{saludo} {nom_ia} 👋" if nom_ia else "¡Hola! 👋"
+                try:
+                    cuerpo_ia = etapas["copy"].medir(generar_texto_producto_ia, producto, es_estado=False)
+                except Exception as e:
+                    log(f"🔥 [{obrero['nombre_vis']}] Error redactando el copy: {e}")
+                    continue
+                if not poner(cola_envio, (cliente, telefono_final, f"{cabecera}\n\n{cuerpo_ia}")):
+                    break
+        finally:
+            poner(cola_envio, _FIN)
+
+    def emisor():
+        try:
+            while len(enviados) < ENVIOS_POR_TICK:
+                item = tomar(cola_envio)
+                if item is _FIN:
+                    break
+                cliente, telefono_final, mensaje_completo = item
+                try:
+                    if etapas["envío"].medir(enviar_mensaje_whatsapp, telefono_final, mensaje_completo, producto['url_imagen'], session=obrero['sesion']):
+                        enviados.append(telefono_final)
+                        with engine.begin() as conn_save:
+                            conn_save.execute(text("INSERT INTO mensajes (id_cliente, telefono, tipo, contenido, fecha, leido, session_name) VALUES (:idc, :t, 'SALIENTE_BOT', :c, NOW() - INTERVAL '5 hours', TRUE, :sess)"),
+                                              {"idc": cliente.id_cliente, "t": telefono_final, "c": mensaje_completo, "sess": obrero['sesion']})
+                            contactos_campana.registrar_envio(conn_save, cliente.telefono, cliente.id_cliente, obrero['sesion'])
+                        log(f"✅ Disparo a {telefono_final} ({obrero['nombre_vis']})!")
+                except Exception as e:
+                    log(f"🔥 [{obrero['nombre_vis']}] Error enviando a {telefono_final}: {e}")
+        finally:
+            # Cupo del tick cumplido (o sin más prospectos): se detiene el resto de la tubería
+            parar.set()
+
+    hilos = [threading.Thread(target=productor), threading.Thread(target=redactor), threading.Thread(target=emisor)]
+    hilos += [threading.Thread(target=verificador) for _ in range(HILOS_VERIFICACION)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    log(f"📈 [{obrero['nombre_vis']}] " + " · ".join(e.resumen() for e in etapas.values()))
+    return enviados
+
+
+def ejecutar_mensajes_multisesion(obreros, config, buscar_producto, log):
+    """
+    TAREA 1 para todas las sesiones a la vez. `buscar_producto(conn, col_prob)` elige el
+    producto de cada sesión; `log` recibe las líneas de trazabilidad.
+    """
+    activos = []
+    with engine.begin() as conn:
+        for obrero in obreros:
+            if contactos_campana.enviados_hoy(conn, obrero["sesion"]) >= config.max_mensajes_dia:
+                log(f"🛑 [{obrero['nombre_vis']}] Cupo diario de {config.max_mensajes_dia} DMs alcanzado.")
+                continue
+            producto = buscar_producto(conn, obrero['col_prob'])
+            if producto:
+                activos.append((obrero, producto))
+        if not activos:
+            return {}
+        # Un solo sorteo repartido sin repetir: dos sesiones nunca escriben al mismo cliente
+        prospectos = list(contactos_campana.seleccionar_prospectos(conn, limite=50 * len(activos), solo_verificados=SOLO_VERIFICADOS))
+
+    reparto = {obrero['sesion']: prospectos[i::len(activos)][:INTENTOS_POR_TICK] for i, (obrero, _) in enumerate(activos)}
+    with ThreadPoolExecutor(max_workers=len(activos)) as pool:
+        futuros = {obrero['sesion']: pool.submit(_tuberia_sesion, obrero, producto, reparto[obrero['sesion']], log)
+                   for obrero, producto in activos}
+    return {sesion: futuro.result() for sesion, futuro in futuros.items()}
@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+import pandas as pd
+from sqlalchemy import text
+from database import engine
+
+# ==============================================================================
+# 📤 EXPORTACIONES EN STREAMING A DISCO (XLSX / CSV) CON CACHÉ POR VERSIÓN
+# ==============================================================================
+# Los botones de descarga armaban el DataFrame completo y luego el archivo
+# entero en un BytesIO en cada rerun, aunque nadie lo descargara. Aquí la
+# consulta se lee con cursor del servidor (stream_results) por trozos de TROZO
+# filas y cada trozo se escribe al archivo apenas llega: CSV incremental o XLSX
+# con openpyxl en modo write-only. La descarga se sirve desde el archivo.
+#
+# Cada archivo es <huella>.<formato> + <huella>.json (filas, columnas). La
+# huella es (consulta, parámetros, formato, `extra`, versión de los datos): si
+# la versión no cambió se reutiliza el archivo ya generado. Sin versión no se
+# cachea. Se desaloja por LRU (mtime) cuando el total pasa de MAX_MB, igual que
+# cache_imagenes.py.
+
+DIRECTORIO = os.getenv("CACHE_EXPORTACIONES_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_exportaciones")
+MAX_MB = float(os.getenv("CACHE_EXPORTACIONES_MB", "300"))
+TROZO = 5000
+
+MIME = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+_lock = threading.Lock()
+
+
+def version(consulta, params=None):
+    """
+    Versión de los datos para la huella (p. ej. el sello sello_inventario).
+    Devuelve None si no se puede leer: en ese caso la exportación no se cachea.
+    """
+    try:
+        with engine.connect() as conn:
+            return [str(v) for v in conn.execute(text(consulta), params or {}).fetchone()]
+    except Exception as e:
+        print(f"⚠️ [EXPORTACIONES] Sin versión de datos, se regenera el archivo: {e}", file=sys.stderr)
+        return None
+
+
+def _huella(consulta, params, formato, extra, version_datos):
+    clave = json.dumps([consulta, params, formato, extra, version_datos], sort_keys=True, default=str)
+    return hashlib.sha1(clave.encode("utf-8")).hexdigest()
+
+
+def _trozos(consulta, params, transformar):
+    """DataFrames de hasta TROZO filas leídos con cursor del servidor."""
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=TROZO) as conn:
+        resultado = conn.execute(text(consulta), params)
+        columnas = list(resultado.keys())
+        vacio = True
+        for filas in resultado.partitions(TROZO):
+            vacio = False
+            df = pd.DataFrame.from_records(filas, columns=columnas, coerce_float=True)  # Decimal -> float, como read_sql
+            yield transformar(df) if transformar else df
+        if vacio:  # Sin filas igual se escribe la cabecera
+            df = pd.DataFrame(columns=columnas)
+            yield transformar(df) if transformar else df
+
+
+def _escribir_csv(ruta, trozos):
+    filas, columnas = 0, []
+    with open(ruta, "w", encoding="utf-8", newline="") as f:
+        for i, df in enumerate(trozos):
+            df.to_csv(f, index=False, header=(i == 0))
+            filas, columnas = filas + len(df), list(df.columns)
+    return filas, columnas
+
+
+def _escribir_xlsx(ruta, trozos, hoja):
+    from openpyxl import Workbook
+
+    libro = Workbook(write_only=True)
+    pagina = libro.create_sheet(hoja)
+    filas, columnas = 0, []
+    for i, df in enumerate(trozos):
+        if i == 0:
+            columnas = list(df.columns)
+            pagina.append(columnas)
+        # Nulos de pandas (NaN, NaT, NA) -> celda vacía; numpy -> tipos nativos
+        for fila in df.astype(object).where(df.notna(), None).itertuples(index=False, name=None):
+            pagina.append([v.item() if hasattr(v, "item") else v for v in fila])
+        filas += len(df)
+    libro.save(ruta)
+    return filas, columnas
+
+
+def _desalojar():
+    """Borra los archivos menos usados hasta quedar por debajo de MAX_MB."""
+    limite = MAX_MB * 1024 * 1024
+    with _lock:
+        entradas = []
+        total = 0
+        for nombre in os.listdir(DIRECTORIO):
+            base, ext = os.path.splitext(nombre)
+            if ext.lstrip(".") not in MIME:
+                continue
+            ruta = os.path.join(DIRECTORIO, nombre)
+            try:
+                estado = os.stat(ruta)
+            except OSError:
+                continue
+            entradas.append((estado.st_mtime, estado.st_size, ruta))
+            total += estado.st_size
+        for _, tamano, ruta in sorted(entradas):
+            if total <= limite:
+                break
+            for archivo in (ruta, os.path.splitext(ruta)[0] + ".json"):
+                try:
+                    os.remove(archivo)
+                except OSError:
+                    pass
+            total -= tamano
+
+
+def exportar(consulta, params=None, formato="csv", version_datos=None, transformar=None, extra=None, hoja="Datos"):
+    """
+    Genera (o reutiliza) el archivo de la consulta y devuelve (ruta, meta) con
+    meta = {"filas", "columnas"}. `transformar(df)` se aplica a cada trozo (debe
+    trabajar fila a fila); `extra` entra en la huella para lo que use `transformar`.
+    """
+    if formato not in MIME:
+        raise ValueError(f"Formato de exportación no soportado: {formato}")
+    params = params or {}
+    os.makedirs(DIRECTORIO, exist_ok=True)
+    huella = _huella(consulta, params, formato, extra, version_datos)
+    ruta = os.path.join(DIRECTORIO, f"{huella}.{formato}")
+    ruta_meta = os.path.join(DIRECTORIO, f"{huella}.json")
+
+    if version_datos is not None:
+        try:
+            with open(ruta_meta, encoding="utf-8") as f:
+                meta = json.load(f)
+            os.utime(ruta)  # LRU
+            return ruta, meta
+        except (OSError, ValueError):
+            pass
+
+    # Escritura atómica: otro proceso nunca sirve un archivo a medias
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        trozos = _trozos(consulta, params, transformar)
+        if formato == "xlsx":
+            filas, columnas = _escribir_xlsx(temporal, trozos, hoja)
+        else:
+            filas, columnas = _escribir_csv(temporal, trozos)
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+    meta = {"filas": filas, "columnas": columnas}
+    temporal_meta = f"{ruta_meta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal_meta, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(temporal_meta, ruta_meta)
+    _desalojar()
+    return ruta, meta
@@ -1,8 +1,11 @@
 import os
+import sys
 import cloudscraper
 from requests.auth import HTTPBasicAuth
 from dotenv import load_dotenv
 
+from woo_catalogo import actualizar_catalogo_por_lotes
+
 load_dotenv()
 
 url_tienda = os.getenv("WOO_URL", "").strip()
@@ -12,79 +15,62 @@ secreto = os.getenv("WOO_CONSUMER_SECRET", "").strip()
 if url_tienda.endswith("/"):
     url_tienda = url_tienda[:-1]
 
-def indexar_todos_los_productos():
-    print(f"Conectando a: {url_tienda} saltando protección anti-bots...")
-    pagina = 1
-    productos_actualizados = 0
-
-    scraper = cloudscraper.create_scraper(
-        browser={
-            'browser': 'chrome',
-            'platform': 'windows',
-            'desktop': True
-        }
-    )
-    
-    # Formato de autenticación que exige WooCommerce
-    autenticacion = HTTPBasicAuth(clave, secreto)
-
-    while True:
-        print(f"Consultando página {pagina} de productos...")
-        endpoint_get = f"{url_tienda}/wp-json/wc/v3/products"
-        
-        # Petición GET con Auth Básica
-        respuesta = scraper.get(
-            endpoint_get, 
-            auth=autenticacion,
-            params={"per_page": 100, "page": pagina}, 
-            timeout=45
-        )
-        
-        try:
-            productos = respuesta.json()
-        except Exception:
-            print(f"\n❌ El servidor bloqueó la respuesta (No es JSON).")
-            print(f"Contenido: {respuesta.text[:300]}")
-            break
-
-        if isinstance(productos, dict) and "message" in productos:
-            print(f"\n❌ Error de WooCommerce: {productos['message']}")
-            break
-
-        if not productos:
-            break
-
-        for producto in productos:
-            producto_id = producto.get("id")
-            nombre = producto.get("name", "Desconocido")
-
-            data = {
-                "meta_data": [
-                    {
-                        "key": "rank_math_robots",
-                        "value": ["index"]
-                    }
-                ]
+PARCHE_INDEX = {"meta_data": [{"key": "rank_math_robots", "value": ["index"]}]}
+
+
+class ClienteScraperWoo:
+    """Imita la interfaz get/post de woocommerce.API, pero saltando la protección anti-bots."""
+
+    def __init__(self, url, consumer_key, consumer_secret, timeout=45):
+        self.base = f"{url}/wp-json/wc/v3"
+        # Formato de autenticación que exige WooCommerce
+        self.auth = HTTPBasicAuth(consumer_key, consumer_secret)
+        self.timeout = timeout
+        self.scraper = cloudscraper.create_scraper(
+            browser={
+                'browser': 'chrome',
+                'platform': 'windows',
+                'desktop': True
             }
+        )
 
-            endpoint_put = f"{url_tienda}/wp-json/wc/v3/products/{producto_id}"
-            
-            # Petición PUT con Auth Básica
-            actualizacion = scraper.put(
-                endpoint_put, 
-                auth=autenticacion,
-                json=data, 
-                timeout=45
-            )
+    def get(self, endpoint, params=None):
+        return self.scraper.get(f"{self.base}/{endpoint}", auth=self.auth, params=params, timeout=self.timeout)
+
+    def post(self, endpoint, data):
+        return self.scraper.post(f"{self.base}/{endpoint}", auth=self.auth, json=data, timeout=self.timeout)
+
+
+def _falta_indexar(producto):
+    """Solo tocamos los productos que aún no tienen rank_math_robots = ['index']."""
+    for meta in producto.get("meta_data", []):
+        if meta.get("key") == "rank_math_robots" and meta.get("value") == ["index"]:
+            return False
+    return True
+
+
+def indexar_todos_los_productos(reiniciar=False):
+    print(f"Conectando a: {url_tienda} saltando protección anti-bots...")
+    cliente = ClienteScraperWoo(url_tienda, clave, secreto)
+
+    resumen = actualizar_catalogo_por_lotes(
+        cliente,
+        PARCHE_INDEX,
+        filtro=_falta_indexar,
+        nombre_trabajo="forzar_index",
+        max_hilos=int(os.getenv("WOO_MASIVO_HILOS", "2")),
+        peticiones_por_segundo=float(os.getenv("WOO_MASIVO_RPS", "1")),
+        reiniciar=reiniciar
+    )
 
-            if actualizacion.status_code in [200, 201]:
-                print(f"✅ Producto [{producto_id}] -> INDEXADO")
-                productos_actualizados += 1
-            else:
-                print(f"❌ Error con producto [{producto_id}]: {actualizacion.text}")
+    for err in resumen["errores"]:
+        print(f"❌ Error con producto [{err['id']}]: {err['error']}")
 
-        pagina += 1
+    if resumen["terminado"]:
+        print(f"\n🚀 Proceso terminado. {resumen['actualizados']} productos actualizados de {resumen['revisados']} revisados.")
+    else:
+        print(f"\n⏸️ Proceso pausado tras la página {resumen['pagina_completada']} ({resumen['actualizados']} actualizados). Vuelve a ejecutar el script para continuar.")
 
-    print(f"\n🚀 Proceso terminado. {productos_actualizados} productos actualizados.")
 
-indexar_todos_los_productos()
\ No newline at end of file
+if __name__ == "__main__":
+    indexar_todos_los_productos(reiniciar="--reiniciar" in sys.argv)
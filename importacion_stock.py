@@ -0,0 +1,167 @@
+import io
+import pandas as pd
+from sqlalchemy import text
+from database import engine
+
+# ==============================================================================
+# 📥 IMPORTACIONES DE STOCK POR TABLA DE PASO (COPY + UPDATE ... FROM)
+# ==============================================================================
+# Stock de proveedor (CSV sku,stock) y recepción de mercadería ya no hacen un
+# UPDATE/INSERT por línea: el archivo se lee por trozos y se valida en pandas,
+# se copia con COPY a una tabla temporal y se aplica con sentencias por
+# conjunto (UPDATE ... FROM, INSERT ... SELECT) en una transacción corta.
+#
+# vista_previa_proveedor() hace lo mismo sin escribir nada: devuelve qué SKUs
+# cambian, de cuánto a cuánto, y cuáles del archivo no existen en Variantes.
+#
+# El stock externo no genera Movimientos: ese historial (y los resúmenes
+# mensuales) miden el stock interno; la recepción sí los registra en bloque.
+
+TROZO_CSV = 20000
+
+
+def leer_csv_proveedor(archivo):
+    """
+    Lee el CSV por trozos y devuelve (validas, rechazadas). `validas`: sku, stock
+    (entero >= 0), sin SKUs repetidos (vale la última línea). `rechazadas` trae
+    el número de línea y el motivo. Lanza ValueError si faltan las columnas.
+    """
+    validas, rechazadas = [], []
+    for trozo in pd.read_csv(archivo, chunksize=TROZO_CSV, dtype=str, skipinitialspace=True):
+        trozo.columns = trozo.columns.str.strip().str.lower()
+        if 'sku' not in trozo.columns or 'stock' not in trozo.columns:
+            raise ValueError("El archivo CSV debe contener las columnas 'sku' y 'stock'.")
+        df = pd.DataFrame({
+            'linea': trozo.index + 2,  # +1 por la cabecera, +1 porque el usuario cuenta desde 1
+            'sku': trozo['sku'].fillna('').str.strip(),
+            'stock': pd.to_numeric(trozo['stock'].str.strip(), errors='coerce'),
+        })
+        motivo = pd.Series('', index=df.index)
+        motivo[df['stock'].isna()] = 'stock no numérico'
+        motivo[df['stock'].notna() & ((df['stock'] < 0) | (df['stock'] % 1 != 0))] = 'stock debe ser entero >= 0'
+        motivo[df['sku'] == ''] = 'sku vacío'
+        rechazadas.append(df[motivo != ''].assign(motivo=motivo[motivo != '']))
+        validas.append(df[motivo == ''])
+
+    validas = pd.concat(validas) if validas else pd.DataFrame(columns=['linea', 'sku', 'stock'])
+    validas = validas.drop_duplicates('sku', keep='last').astype({'stock': 'int64'})
+    rechazadas = pd.concat(rechazadas) if rechazadas else pd.DataFrame(columns=['linea', 'sku', 'stock', 'motivo'])
+    return validas[['sku', 'stock']].reset_index(drop=True), rechazadas.reset_index(drop=True)
+
+
+def _copiar(conn, tabla, df, columnas):
+    """COPY del DataFrame a una tabla (temporal) de la misma transacción."""
+    buffer = io.StringIO()
+    # Nulos como \N: en CSV un campo vacío sin comillas sería NULL y los textos '' se perderían
+    df[columnas].to_csv(buffer, index=False, header=False, na_rep='\\N')
+    buffer.seek(0)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+    finally:
+        cursor.close()
+
+
+def _cargar_proveedor(conn, validas):
+    conn.execute(text("""
+        CREATE TEMP TABLE IF NOT EXISTS paso_stock_proveedor (sku TEXT PRIMARY KEY, stock INT)
+        ON COMMIT DROP
+    """))
+    _copiar(conn, "paso_stock_proveedor", validas, ['sku', 'stock'])
+
+
+def vista_previa_proveedor(validas):
+    """
+    Simulación sin escribir: (cambios, no_encontrados). `cambios`: sku, stock_externo
+    actual y nuevo de las variantes que cambiarían; `no_encontrados`: SKUs del archivo
+    que no existen en Variantes.
+    """
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            _cargar_proveedor(conn, validas)
+            cambios = pd.read_sql(text("""
+                SELECT v.sku, v.stock_externo AS actual, p.stock AS nuevo
+                FROM paso_stock_proveedor p
+                JOIN Variantes v ON v.sku = p.sku
+                WHERE v.stock_externo IS DISTINCT FROM p.stock
+                ORDER BY v.sku
+            """), conn)
+            no_encontrados = pd.read_sql(text("""
+                SELECT p.sku FROM paso_stock_proveedor p
+                WHERE NOT EXISTS (SELECT 1 FROM Variantes v WHERE v.sku = p.sku)
+                ORDER BY p.sku
+            """), conn)
+        finally:
+            trans.rollback()  # Simulación: ni la tabla de paso queda
+    return cambios, no_encontrados['sku'].tolist()
+
+
+def aplicar_proveedor(validas):
+    """Un solo UPDATE ... FROM la tabla de paso; solo toca las variantes cuyo stock externo cambia."""
+    with engine.begin() as conn:
+        _cargar_proveedor(conn, validas)
+        return conn.execute(text("""
+            UPDATE Variantes v SET stock_externo = p.stock
+            FROM paso_stock_proveedor p
+            WHERE v.sku = p.sku AND v.stock_externo IS DISTINCT FROM p.stock
+        """)).rowcount
+
+
+def recepcionar(conn, recepcion, todo_en_transito=False):
+    """
+    Ingresa mercadería en tránsito dentro de la transacción `conn`. `recepcion` es un
+    DataFrame con: sku, recibido, transito (lo que queda en camino), ubicacion
+    (antigua, texto), estante (nombre en Ubicaciones_Estandar o None) y nota.
+    Suma al stock interno, reparte al estante y registra los Movimientos en bloque.
+    Con `todo_en_transito` (recepción grupal) se ignoran recibido/transito/ubicacion:
+    entra lo que la BD tiene en tránsito al confirmar y la ubicación antigua no se toca.
+    Devuelve la cantidad de variantes actualizadas.
+    """
+    if recepcion.empty:
+        return 0
+    recepcion = recepcion.drop_duplicates('sku', keep='last').copy()
+    recepcion['recibido'] = recepcion['recibido'].fillna(0).astype('int64')
+    recepcion['transito'] = recepcion['transito'].fillna(0).astype('int64')
+    conn.execute(text("""
+        CREATE TEMP TABLE IF NOT EXISTS paso_recepcion (
+            sku TEXT PRIMARY KEY, recibido INT, transito INT, ubicacion TEXT, estante TEXT, nota TEXT
+        ) ON COMMIT DROP
+    """))
+    _copiar(conn, "paso_recepcion", recepcion, ['sku', 'recibido', 'transito', 'ubicacion', 'estante', 'nota'])
+    if todo_en_transito:
+        # Filas bloqueadas hasta el COMMIT: nadie mueve el tránsito entre esta lectura y el UPDATE
+        conn.execute(text("""
+            UPDATE paso_recepcion r SET recibido = COALESCE(v.stock_transito, 0), transito = 0, ubicacion = v.ubicacion
+            FROM (SELECT sku, stock_transito, ubicacion FROM Variantes
+                  WHERE sku IN (SELECT sku FROM paso_recepcion) FOR UPDATE) v
+            WHERE v.sku = r.sku
+        """))
+
+    # 1 y 3. Stock global + historial: el UPDATE devuelve el stock resultante de cada SKU
+    actualizadas = conn.execute(text("""
+        WITH ingresadas AS (
+            UPDATE Variantes v SET
+                stock_interno = COALESCE(v.stock_interno, 0) + r.recibido,
+                stock_transito = r.transito,
+                ubicacion = r.ubicacion
+            FROM paso_recepcion r
+            WHERE v.sku = r.sku
+            RETURNING v.sku, v.stock_interno AS stock_nuevo, r.recibido, r.nota
+        )
+        INSERT INTO Movimientos (sku, tipo_movimiento, cantidad, stock_anterior, stock_nuevo, nota)
+        SELECT sku, 'RECEPCION_IMPORT', recibido, stock_nuevo - recibido, stock_nuevo, nota FROM ingresadas
+    """)).rowcount
+
+    # 2. Reparto a estantes (solo lo que llegó y tiene estante elegido)
+    conn.execute(text("""
+        INSERT INTO Stock_Ubicaciones (sku, id_ubicacion, cantidad, fecha_actualizacion)
+        SELECT r.sku, u.id_ubicacion, r.recibido, CURRENT_TIMESTAMP
+        FROM paso_recepcion r
+        JOIN Ubicaciones_Estandar u ON u.nombre = r.estante
+        WHERE r.recibido > 0
+        ON CONFLICT (sku, id_ubicacion) DO UPDATE SET
+            cantidad = Stock_Ubicaciones.cantidad + EXCLUDED.cantidad,
+            fecha_actualizacion = CURRENT_TIMESTAMP
+    """))
+    return actualizadas
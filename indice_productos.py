@@ -0,0 +1,208 @@
+import os
+import sys
+import time
+import pickle
+import random
+import threading
+from bisect import bisect_right
+from itertools import accumulate
+from sqlalchemy import text
+from database import engine
+from version_datos import Sello, CacheVersionada, VIDA_MAXIMA
+
+# ==============================================================================
+# 🎯 ÍNDICE DE SELECCIÓN PONDERADA DE PRODUCTOS (BOT DE MARKETING Y ESTADOS)
+# ==============================================================================
+# Carga una sola vez las variantes con stock agrupadas por (macro, subcategoría)
+# y precalcula los pesos acumulados de cada columna de probabilidad de
+# Subcategorias_Sistema. Elegir producto pasa a ser un sorteo O(log n) en memoria
+# en lugar de un ILIKE + ORDER BY RANDOM() sobre todo el catálogo.
+#
+# Unos triggers suben el sello `sello_indice_productos` (version_datos.py) cuando
+# una variante entra o sale del stock, cambia una ficha o las probabilidades.
+# Cualquier proceso (panel, bot, webhook) compara ese sello y rehace su índice
+# solo cuando hace falta. El primero que lee un sello nuevo deja los datos en
+# disco, y los demás procesos los cargan de ahí sin volver a leer el catálogo.
+
+MAX_EDAD = 300  # Red de seguridad si los triggers no existen (BD sin permisos o no PostgreSQL)
+# Foto en disco por sello: los procesos cortos (cada tick del cron) no vuelven a leer el catálogo
+DIRECTORIO = os.getenv("CACHE_INDICE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_indice")
+
+# Solo cuenta lo que cambia el sorteo: que una variante entre o salga del stock, su ficha o
+# su foto; los pesos por stock de un mismo producto pueden quedar atrasados hasta VIDA_MAXIMA
+SELLO = Sello("sello_indice_productos", {
+    "Variantes": "(OLD.stock_interno > 0) IS DISTINCT FROM (NEW.stock_interno > 0) OR "
+                 "(OLD.sku, OLD.id_producto, OLD.url_imagen, OLD.id_grupo, OLD.precio) IS DISTINCT FROM "
+                 "(NEW.sku, NEW.id_producto, NEW.url_imagen, NEW.id_grupo, NEW.precio)",
+    "Productos": ["marca", "modelo", "nombre", "categoria", "color_principal", "url_imagen", "url_tienda", "macro_categoria"],
+    "Subcategorias_Sistema": None,
+    "Grupos_Productos": None,
+}, obsoletos=[
+    ("trg_indice_variantes", "Variantes"), ("trg_indice_productos", "Productos"),
+    ("trg_indice_subcategorias", "Subcategorias_Sistema"),
+], tabla_obsoleta="indice_productos_version")
+
+_cache = CacheVersionada(SELLO, MAX_EDAD, "INDICE")
+
+
+def _clave(macro, subcategoria):
+    return ((macro or "").strip().lower(), (subcategoria or "").strip().lower())
+
+
+class IndiceProductos:
+    """Foto en memoria del catálogo vendible, lista para sorteos ponderados."""
+
+    def __init__(self, filas, subcategorias):
+        self.grupos = {}
+        for item in filas:
+            item = dict(item)
+            grupo = self.grupos.setdefault(_clave(item["macro_categoria"], item["categoria"]), {"todos": [], "con_foto": []})
+            grupo["todos"].append(item)
+            if (item.get("url_imagen") or "").strip():
+                grupo["con_foto"].append(item)
+
+        for grupo in self.grupos.values():
+            grupo["acum_stock"] = list(accumulate(max(int(i["stock_interno"] or 0), 0) for i in grupo["todos"]))
+
+        self.subcategorias = {}
+        self._enfoque_por_subcat = {}
+        for fila in subcategorias:
+            self.subcategorias[_clave(fila["macro_categoria"], fila["subcategoria"])] = fila
+            self._enfoque_por_subcat.setdefault(_clave("", fila["subcategoria"])[1], fila.get("descripcion_ia"))
+
+        self._ruletas = {}
+
+    def enfoque_ia(self, macro, subcategoria):
+        clave = _clave(macro, subcategoria)
+        if clave in self.subcategorias:
+            return self.subcategorias[clave].get("descripcion_ia")
+        return self._enfoque_por_subcat.get(clave[1])
+
+    def ficha_marketing(self, item):
+        """Datos del producto tal como los consumen el bot y el generador de copys."""
+        ficha = {k: item[k] for k in ("id_producto", "marca", "modelo", "nombre", "categoria", "color_principal",
+                                       "url_imagen", "url_tienda", "sku", "precio", "macro_categoria")}
+        ficha['enfoque_ia'] = self.enfoque_ia(item['macro_categoria'], item['categoria'])
+        ficha['contexto_ia_extra'] = f"REGLA DE ORO: ESTE PRODUCTO ES UN/UNA {(ficha.get('macro_categoria') or '').upper()}. HABLA ESTRICTAMENTE DE ESA CATEGORÍA."
+        return ficha
+
+    def _ruleta(self, col_probabilidad):
+        """Pesos acumulados de los grupos con foto y probabilidad > 0 para una columna."""
+        if col_probabilidad not in self._ruletas:
+            claves, pesos = [], []
+            for clave, grupo in self.grupos.items():
+                prob = (self.subcategorias.get(clave) or {}).get(col_probabilidad) or 0
+                if grupo["con_foto"] and prob > 0:
+                    claves.append(clave)
+                    pesos.append(prob)
+            self._ruletas[col_probabilidad] = (claves, list(accumulate(pesos)))
+        return self._ruletas[col_probabilidad]
+
+    def elegir_grupo(self, col_probabilidad):
+        claves, acumulados = self._ruleta(col_probabilidad)
+        if not claves:
+            return None
+        return claves[bisect_right(acumulados, random.random() * acumulados[-1])]
+
+    def elegir_en_grupo(self, clave, excluir=(), con_foto=True, por_stock=False):
+        """Producto al azar del grupo (uniforme o ponderado por stock) evitando `excluir` si se puede."""
+        grupo = self.grupos.get(clave)
+        if not grupo:
+            return None
+        items = grupo["con_foto"] if con_foto else grupo["todos"]
+        if not items:
+            return None
+
+        def sortear(lista, acumulados=None):
+            if acumulados and acumulados[-1] > 0:
+                return lista[bisect_right(acumulados, random.random() * acumulados[-1])]
+            return random.choice(lista)
+
+        acumulados = grupo["acum_stock"] if por_stock and not con_foto else None
+        # Casi siempre el primer sorteo ya es válido; si no, filtramos el grupo
+        for _ in range(5):
+            item = sortear(items, acumulados)
+            if item["sku"] not in excluir:
+                return dict(item)
+        libres = [i for i in items if i["sku"] not in excluir]
+        if not libres:
+            return None
+        if acumulados:
+            return dict(sortear(libres, list(accumulate(max(int(i["stock_interno"] or 0), 0) for i in libres))))
+        return dict(random.choice(libres))
+
+
+def _leer(conn):
+    """Filas del catálogo vendible y de Subcategorias_Sistema como dicts (se guardan en disco tal cual)."""
+    filas = conn.execute(text("""
+        SELECT
+            p.id_producto, p.marca, p.modelo, p.nombre, p.categoria, p.color_principal,
+            p.url_imagen, p.url_tienda, v.sku, v.precio,
+            COALESCE(p.macro_categoria, 'Lentes') AS macro_categoria, v.stock_interno,
+            COALESCE(NULLIF(TRIM(v.url_imagen), ''), NULLIF(TRIM(p.url_imagen), '')) AS imagen,
+            g.nombre_grupo, g.descripcion AS descripcion_grupo
+        FROM Variantes v
+        JOIN Productos p ON v.id_producto = p.id_producto
+        LEFT JOIN Grupos_Productos g ON v.id_grupo = g.id_grupo
+        WHERE COALESCE(v.stock_interno, 0) > 0
+    """)).fetchall()
+    subcategorias = conn.execute(text("SELECT * FROM Subcategorias_Sistema")).fetchall()
+    return [dict(f._mapping) for f in filas], [dict(s._mapping) for s in subcategorias]
+
+
+def _ruta(version):
+    return os.path.join(DIRECTORIO, f"indice_{version}.pkl")
+
+
+def _desde_disco(version):
+    """Datos que otro proceso ya leyó para este sello, si no pasaron VIDA_MAXIMA."""
+    try:
+        if time.time() - os.path.getmtime(_ruta(version)) < VIDA_MAXIMA:
+            with open(_ruta(version), "rb") as f:
+                return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+    return None
+
+
+def _a_disco(version, datos):
+    try:
+        os.makedirs(DIRECTORIO, exist_ok=True)
+        temporal = f"{_ruta(version)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, "wb") as f:
+            pickle.dump(datos, f)
+        os.replace(temporal, _ruta(version))
+        # Solo vale la foto del sello vigente
+        for nombre in os.listdir(DIRECTORIO):
+            if nombre.startswith("indice_") and nombre != os.path.basename(_ruta(version)):
+                try:
+                    os.remove(os.path.join(DIRECTORIO, nombre))
+                except OSError:
+                    pass
+    except OSError as e:
+        print(f"⚠️ [INDICE] No se pudo guardar la foto en disco: {e}", file=sys.stderr)
+
+
+def obtener_indice(conn=None):
+    """
+    Devuelve el índice vigente. Si el sello de la BD cambió, lo toma de la foto en disco
+    de ese sello o, si nadie la armó aún, lee el catálogo y la deja en disco.
+    """
+    def construir(version):
+        datos = _desde_disco(version) if version is not None else None
+        if datos is None:
+            if conn is None:
+                with engine.connect() as conn_nueva:
+                    datos = _leer(conn_nueva)
+            else:
+                datos = _leer(conn)
+            if version is not None:
+                _a_disco(version, datos)
+        return IndiceProductos(*datos)
+
+    return _cache.obtener(None, construir)
+
+
+def invalidar():
+    """Fuerza la recarga en este proceso (los demás se enteran por el sello de la BD)."""
+    _cache.invalidar()
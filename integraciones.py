@@ -0,0 +1,239 @@
+import os
+import sys
+import time
+import atexit
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+# ==============================================================================
+# 🌐 CAPA ÚNICA DE CLIENTES HTTP (WAHA, OLLAMA, MAKE.COM)
+# ==============================================================================
+# Una sesión con pool de conexiones (keep-alive) por servicio, cabeceras por
+# defecto, reintentos con backoff, cortocircuito ante caídas y un histograma de
+# latencias por endpoint que se vuelca a la tabla `metricas_http` para que la
+# pestaña de Diagnóstico vea también lo que miden el webhook y el bot.
+
+# Límites superiores (segundos) de las cubetas del histograma; la última es "> 120s"
+CUBETAS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+INTERVALO_VOLCADO = 60
+
+_lock_metricas = threading.Lock()
+_acumulado = {}   # {(servicio, endpoint): [[conteo, errores, suma_seg], ...]}  -> desde que arrancó el proceso
+_sin_volcar = {}  # mismo formato, solo lo que aún no se guardó en la BD
+_hilo_volcado = None
+
+
+class CircuitoAbierto(requests.exceptions.ConnectionError):
+    """El servicio acumuló fallos seguidos: se corta sin tocar la red hasta que pase el enfriamiento."""
+
+
+def etiqueta_cubeta(indice):
+    return f"<= {CUBETAS[indice]}s" if indice < len(CUBETAS) else f"> {CUBETAS[-1]}s"
+
+
+def _indice_cubeta(segundos):
+    for i, limite in enumerate(CUBETAS):
+        if segundos <= limite:
+            return i
+    return len(CUBETAS)
+
+
+def _sumar(destino, clave, indice, errores, segundos):
+    cubetas = destino.setdefault(clave, [[0, 0, 0.0] for _ in range(len(CUBETAS) + 1)])
+    cubetas[indice][0] += 1
+    cubetas[indice][1] += errores
+    cubetas[indice][2] += segundos
+
+
+def registrar_latencia(servicio, endpoint, segundos, error=False):
+    global _hilo_volcado
+    clave = (servicio, endpoint)
+    indice = _indice_cubeta(segundos)
+    with _lock_metricas:
+        _sumar(_acumulado, clave, indice, int(error), segundos)
+        _sumar(_sin_volcar, clave, indice, int(error), segundos)
+        if _hilo_volcado is None:
+            _hilo_volcado = threading.Thread(target=_bucle_volcado, daemon=True)
+            _hilo_volcado.start()
+
+
+def metricas_locales():
+    """Copia del histograma de este proceso: {(servicio, endpoint): [[conteo, errores, suma_seg], ...]}."""
+    with _lock_metricas:
+        return {clave: [list(c) for c in cubetas] for clave, cubetas in _acumulado.items()}
+
+
+def volcar_metricas():
+    """Suma a `metricas_http` lo medido desde el último volcado (incremental: varios procesos pueden escribir)."""
+    with _lock_metricas:
+        pendientes = dict(_sin_volcar)
+        _sin_volcar.clear()
+    if not pendientes:
+        return
+
+    filas = []
+    for (servicio, endpoint), cubetas in pendientes.items():
+        for i, (conteo, errores, suma) in enumerate(cubetas):
+            if conteo:
+                filas.append({"sv": servicio, "ep": endpoint[:150], "cb": etiqueta_cubeta(i), "n": conteo, "e": errores, "s": suma})
+
+    try:
+        from sqlalchemy import text
+        from database import engine
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS metricas_http (
+                    servicio VARCHAR(30),
+                    endpoint VARCHAR(150),
+                    cubeta VARCHAR(10),
+                    conteo BIGINT DEFAULT 0,
+                    errores BIGINT DEFAULT 0,
+                    suma_seg DOUBLE PRECISION DEFAULT 0,
+                    actualizado TIMESTAMP DEFAULT NOW(),
+                    PRIMARY KEY (servicio, endpoint, cubeta)
+                )
+            """))
+            conn.execute(text("""
+                INSERT INTO metricas_http (servicio, endpoint, cubeta, conteo, errores, suma_seg, actualizado)
+                VALUES (:sv, :ep, :cb, :n, :e, :s, NOW())
+                ON CONFLICT (servicio, endpoint, cubeta) DO UPDATE SET
+                    conteo = metricas_http.conteo + EXCLUDED.conteo,
+                    errores = metricas_http.errores + EXCLUDED.errores,
+                    suma_seg = metricas_http.suma_seg + EXCLUDED.suma_seg,
+                    actualizado = NOW()
+            """), filas)
+    except Exception as e:
+        # Sin BD no perdemos lo medido: vuelve a la cola para el próximo volcado
+        with _lock_metricas:
+            for clave, cubetas in pendientes.items():
+                destino = _sin_volcar.setdefault(clave, [[0, 0, 0.0] for _ in range(len(CUBETAS) + 1)])
+                for i, (conteo, errores, suma) in enumerate(cubetas):
+                    destino[i][0] += conteo
+                    destino[i][1] += errores
+                    destino[i][2] += suma
+        print(f"⚠️ [HTTP] No se pudieron guardar las métricas de latencia: {e}", file=sys.stderr)
+
+
+def _bucle_volcado():
+    while True:
+        time.sleep(INTERVALO_VOLCADO)
+        volcar_metricas()
+
+
+atexit.register(volcar_metricas)
+
+
+# ==============================================================================
+# 🔌 CLIENTE POR SERVICIO
+# ==============================================================================
+class ClienteServicio:
+    """
+    Sesión HTTP compartida de un servicio externo.
+
+    - Solo GET/HEAD se reintentan por defecto: reenviar un POST podría duplicar un mensaje.
+    - Tras `umbral_fallos` errores seguidos (red, timeout o 5xx) el circuito se abre durante
+      `enfriamiento` segundos y las llamadas fallan al instante con CircuitoAbierto.
+    """
+
+    def __init__(self, nombre, url_base="", headers=None, timeout=15, reintentos=2, backoff=0.5,
+                 umbral_fallos=5, enfriamiento=30, tam_pool=10):
+        self.nombre = nombre
+        self.url_base = (url_base or "").rstrip('/')
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.backoff = backoff
+        self.umbral_fallos = umbral_fallos
+        self.enfriamiento = enfriamiento
+
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=tam_pool, pool_maxsize=tam_pool)
+        self.session.mount("http://", adaptador)
+        self.session.mount("https://", adaptador)
+        self.session.headers.update(headers or {})
+
+        self._lock = threading.Lock()
+        self._fallos_seguidos = 0
+        self._abierto_hasta = 0.0
+
+    @property
+    def configurado(self):
+        return bool(self.url_base)
+
+    @property
+    def circuito_abierto(self):
+        return time.monotonic() < self._abierto_hasta
+
+    def _anotar(self, fallo):
+        with self._lock:
+            if not fallo:
+                self._fallos_seguidos = 0
+                return
+            self._fallos_seguidos += 1
+            if self._fallos_seguidos >= self.umbral_fallos:
+                self._abierto_hasta = time.monotonic() + self.enfriamiento
+                print(f"🔌 [HTTP] Circuito '{self.nombre}' abierto {self.enfriamiento}s tras {self._fallos_seguidos} fallos seguidos.", file=sys.stderr)
+
+    def request(self, metodo, ruta, endpoint=None, timeout=None, reintentos=None, **kwargs):
+        """
+        `ruta` puede ser relativa a la URL base o una URL completa.
+        `endpoint` es la etiqueta del histograma: pásala cuando la ruta lleve IDs (chats, LIDs...).
+        """
+        metodo = metodo.upper()
+        url = ruta if ruta.startswith("http") else f"{self.url_base}/{ruta.lstrip('/')}"
+        etiqueta = endpoint or f"{metodo} {urlsplit(url).path}"
+        if reintentos is None:
+            reintentos = self.reintentos if metodo in ("GET", "HEAD") else 0
+
+        if self.circuito_abierto:
+            registrar_latencia(self.nombre, etiqueta, 0.0, error=True)
+            raise CircuitoAbierto(f"Servicio '{self.nombre}' en enfriamiento tras fallos seguidos.")
+
+        for intento in range(reintentos + 1):
+            inicio = time.perf_counter()
+            try:
+                resp = self.session.request(metodo, url, timeout=timeout or self.timeout, **kwargs)
+            except requests.exceptions.RequestException:
+                registrar_latencia(self.nombre, etiqueta, time.perf_counter() - inicio, error=True)
+                self._anotar(fallo=True)
+                if intento < reintentos:
+                    time.sleep(self.backoff * (2 ** intento))
+                    continue
+                raise
+
+            fallo = resp.status_code >= 500
+            registrar_latencia(self.nombre, etiqueta, time.perf_counter() - inicio, error=fallo)
+            self._anotar(fallo=fallo)
+            if (fallo or resp.status_code == 429) and intento < reintentos:
+                time.sleep(self.backoff * (2 ** intento))
+                continue
+            return resp
+
+    def get(self, ruta, **kwargs):
+        return self.request("GET", ruta, **kwargs)
+
+    def post(self, ruta, **kwargs):
+        return self.request("POST", ruta, **kwargs)
+
+
+# ==============================================================================
+# 🏭 CLIENTES COMPARTIDOS POR TODO EL SISTEMA
+# ==============================================================================
+def _headers_waha():
+    headers = {"Content-Type": "application/json"}
+    if os.getenv("WAHA_KEY"): headers["X-Api-Key"] = os.getenv("WAHA_KEY")
+    return headers
+
+
+_WAHA_URL = os.getenv("WAHA_URL") or ""
+
+waha = ClienteServicio("waha", _WAHA_URL, headers=_headers_waha(), timeout=15)
+# Los estados se publican por la instancia del puerto 3001 y su encriptación masiva tarda
+waha_estados = ClienteServicio("waha_estados", _WAHA_URL.replace("3000", "3001"), headers=_headers_waha(), timeout=120, reintentos=0)
+ollama = ClienteServicio("ollama", os.getenv("OLLAMA_URL", "http://localhost:11434"), timeout=120, reintentos=0, umbral_fallos=3, enfriamiento=120)
+make = ClienteServicio("make", timeout=10)
+# Descarga de fotos de producto (WordPress) para los estados
+imagenes = ClienteServicio("imagenes", timeout=15)
+
+CLIENTES = [waha, waha_estados, ollama, make, imagenes]
@@ -0,0 +1,78 @@
+import pandas as pd
+from sqlalchemy import text
+from database import engine
+from version_datos import Sello, CacheVersionada
+
+# ==============================================================================
+# 🗃️ FOTO COMPARTIDA DEL INVENTARIO (GRILLA DE vista_productos)
+# ==============================================================================
+# La grilla leía el inventario con dos subconsultas correlacionadas por variante
+# contra Stock_Ubicaciones (SUM y STRING_AGG) y guardaba el resultado en la
+# sesión de cada operador hasta que alguien la borrara. Ahora hay una sola foto
+# por proceso, armada con un único join agrupado, y se reconstruye cuando cambia
+# el sello `sello_inventario` (version_datos.py).
+#
+# Triggers en Variantes, Productos, Stock_Ubicaciones y Ubicaciones_Estandar
+# suben ese sello al confirmar cualquier venta, compra, ajuste o reubicación:
+# se ve en la siguiente lectura, para todos los operadores.
+
+MAX_EDAD = 120  # Red de seguridad si los triggers no existen (BD sin permisos o no PostgreSQL)
+
+CONSULTA = """
+    WITH por_sku AS (
+        SELECT su.sku,
+               SUM(su.cantidad) AS stock_asignado,
+               STRING_AGG(CASE WHEN su.cantidad > 0 THEN u.nombre || ' (' || su.cantidad || ' un.)' END, ' | ') AS ubicacion_nueva
+        FROM Stock_Ubicaciones su
+        LEFT JOIN Ubicaciones_Estandar u ON su.id_ubicacion = u.id_ubicacion
+        GROUP BY su.sku
+    )
+    SELECT
+        v.sku, v.id_producto,
+        v.linea_negocio AS macro_categoria,
+        p.categoria, p.marca, p.modelo, p.nombre,
+        p.color_principal, p.diametro, v.medida, v.stock_interno,
+        COALESCE(ps.stock_asignado, 0) AS stock_asignado,
+        ps.ubicacion_nueva,
+        v.stock_externo, v.stock_transito, v.ubicacion as ubicacion_antigua, p.importacion,
+        p.url_compra,
+        COALESCE(NULLIF(TRIM(v.url_imagen), ''), NULLIF(TRIM(p.url_imagen), '')) AS url_imagen
+    FROM Variantes v
+    JOIN Productos p ON v.id_producto = p.id_producto
+    LEFT JOIN por_sku ps ON ps.sku = v.sku
+    ORDER BY v.linea_negocio DESC, p.marca, p.modelo, v.sku ASC
+"""
+
+SELLO = Sello("sello_inventario", {
+    "Variantes": None, "Productos": None, "Stock_Ubicaciones": None, "Ubicaciones_Estandar": None,
+}, obsoletos=[
+    ("trg_inventario_variantes", "Variantes"), ("trg_inventario_productos", "Productos"),
+    ("trg_inventario_stock_ubicaciones", "Stock_Ubicaciones"), ("trg_inventario_ubicaciones", "Ubicaciones_Estandar"),
+], tabla_obsoleta="inventario_version")
+
+_cache = CacheVersionada(SELLO, MAX_EDAD, "INVENTARIO")
+
+
+def _construir(conn):
+    from utils import generar_nombres_inteligentes
+
+    df = pd.read_sql(text(CONSULTA), conn)
+    # Nombre comercial calculado una vez por foto, no en cada rerun de cada operador
+    df['nombre_completo'] = generar_nombres_inteligentes(df)
+    return df
+
+
+def obtener():
+    """
+    Foto vigente del inventario (DataFrame compartido: no modificarlo, usar .copy()).
+    Se reconstruye solo si el sello de la BD cambió desde la última carga.
+    """
+    def construir(_version):
+        with engine.connect() as conn:
+            return _construir(conn)
+    return _cache.obtener(None, construir)
+
+
+def invalidar():
+    """Fuerza la recarga en este proceso (los demás se enteran por el sello de la BD)."""
+    _cache.invalidar()
@@ -0,0 +1,102 @@
+import sys
+from sqlalchemy import text
+from database import engine
+
+# ==============================================================================
+# 🏷️ LÍNEA DE NEGOCIO PERSISTIDA (Productos.linea_negocio / Variantes.linea_negocio)
+# ==============================================================================
+# 'Pelucas' o 'Lentes' ya no se recalcula en cada consulta con
+# `macro_categoria ILIKE 'peluca%' OR sku ILIKE 'WB-%' OR sku ILIKE 'WIG-%'`:
+# queda guardada e indexada en la fila. Triggers BEFORE la calculan al insertar
+# o editar y, si cambia la macro de un producto, se propaga a sus variantes.
+# El reparto de tiendas Woo, el inventario y las estadísticas filtran y agrupan
+# directamente por la columna.
+
+PELUCAS = "Pelucas"
+LENTES = "Lentes"
+PREFIJOS_PELUCA = ("WB-", "WIG-")
+
+# Misma regla que clasificar(), en SQL (la usan los triggers)
+_REGLA_PRODUCTO = "CASE WHEN {macro} ILIKE 'peluca%' THEN 'Pelucas' ELSE 'Lentes' END"
+_REGLA_VARIANTE = "CASE WHEN {linea} = 'Pelucas' OR {sku} ILIKE 'WB-%' OR {sku} ILIKE 'WIG-%' THEN 'Pelucas' ELSE 'Lentes' END"
+
+_columna_lista = False
+
+
+def clasificar(macro_categoria=None, sku=None):
+    """Regla en Python para filas que no vienen de la BD (fichas armadas a mano, fallbacks)."""
+    macro = str(macro_categoria or "").strip().lower()
+    if macro.startswith("peluca") or str(sku or "").strip().upper().startswith(PREFIJOS_PELUCA):
+        return PELUCAS
+    return LENTES
+
+
+def preparar_columna(conn):
+    """Columnas, índices, triggers y el relleno inicial de las filas sin clasificar."""
+    global _columna_lista
+    if _columna_lista:
+        return
+    conn.execute(text("ALTER TABLE Productos ADD COLUMN IF NOT EXISTS linea_negocio VARCHAR(20)"))
+    conn.execute(text("ALTER TABLE Variantes ADD COLUMN IF NOT EXISTS linea_negocio VARCHAR(20)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_productos_linea_negocio ON Productos (linea_negocio)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_variantes_linea_negocio ON Variantes (linea_negocio)"))
+
+    conn.execute(text(f"""
+        CREATE OR REPLACE FUNCTION fn_linea_producto() RETURNS trigger AS $$
+        BEGIN
+            NEW.linea_negocio := {_REGLA_PRODUCTO.format(macro="NEW.macro_categoria")};
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """))
+    conn.execute(text(f"""
+        CREATE OR REPLACE FUNCTION fn_linea_variante() RETURNS trigger AS $$
+        DECLARE
+            linea_prod VARCHAR(20);
+        BEGIN
+            SELECT linea_negocio INTO linea_prod FROM productos WHERE id_producto = NEW.id_producto;
+            NEW.linea_negocio := {_REGLA_VARIANTE.format(linea="linea_prod", sku="NEW.sku")};
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """))
+    conn.execute(text(f"""
+        CREATE OR REPLACE FUNCTION fn_linea_propagar() RETURNS trigger AS $$
+        BEGIN
+            UPDATE variantes SET linea_negocio = {_REGLA_VARIANTE.format(linea="NEW.linea_negocio", sku="sku")}
+            WHERE id_producto = NEW.id_producto;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """))
+    triggers = {
+        "trg_linea_productos": "BEFORE INSERT OR UPDATE OF macro_categoria ON Productos FOR EACH ROW EXECUTE FUNCTION fn_linea_producto()",
+        "trg_linea_variantes": "BEFORE INSERT OR UPDATE OF sku, id_producto ON Variantes FOR EACH ROW EXECUTE FUNCTION fn_linea_variante()",
+        "trg_linea_propagar": ("AFTER UPDATE OF macro_categoria ON Productos FOR EACH ROW "
+                               "WHEN (OLD.linea_negocio IS DISTINCT FROM NEW.linea_negocio) EXECUTE FUNCTION fn_linea_propagar()"),
+    }
+    existentes = {r[0] for r in conn.execute(text("SELECT tgname FROM pg_trigger WHERE tgname LIKE 'trg_linea_%'"))}
+    for nombre, definicion in triggers.items():
+        if nombre not in existentes:
+            conn.execute(text(f"CREATE TRIGGER {nombre} {definicion}"))
+
+    # Relleno: solo toca filas sin clasificar (la primera vez, todas; luego, ninguna)
+    conn.execute(text(f"""
+        UPDATE Productos SET linea_negocio = {_REGLA_PRODUCTO.format(macro="macro_categoria")}
+        WHERE linea_negocio IS NULL
+    """))
+    conn.execute(text(f"""
+        UPDATE Variantes v SET linea_negocio = {_REGLA_VARIANTE.format(
+            linea="(SELECT p.linea_negocio FROM Productos p WHERE p.id_producto = v.id_producto)", sku="v.sku")}
+        WHERE v.linea_negocio IS NULL
+    """))
+    _columna_lista = True
+
+
+def asegurar_columna():
+    """Para procesos sueltos (scripts, cron) que leen la columna antes que el panel la cree."""
+    try:
+        with engine.begin() as conn:
+            preparar_columna(conn)
+    except Exception as e:
+        print(f"⚠️ [LINEA] No se pudo preparar linea_negocio: {e}", file=sys.stderr)
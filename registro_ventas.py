@@ -0,0 +1,132 @@
+import pandas as pd
+from sqlalchemy import text
+
+# ==============================================================================
+# 🧾 REGISTRO DE VENTAS Y SALIDAS EN UNA SOLA SENTENCIA
+# ==============================================================================
+# Confirmar una venta hacía, por cada ítem del carrito, un INSERT en DetalleVenta,
+# un UPDATE a Variantes ... RETURNING, el UPDATE del estante (o el de
+# `ubicacion = ''`) y un INSERT en Movimientos. Ahora el carrito viaja como
+# arreglos (unnest, igual que edicion_masiva.py) y una sola sentencia con CTEs
+# escribe cabecera, detalle, stock, estantes e historial.
+#
+# Bloqueos: antes de descontar, `bloqueo` toma FOR UPDATE las variantes del
+# carrito ORDENADAS POR SKU. Dos vendedores con los mismos productos esperan en
+# el mismo orden y no se cruzan (sin deadlocks); los estantes de esas variantes
+# quedan serializados por el mismo bloqueo.
+#
+# Si un SKU aparece en varias líneas (distintos estantes), Variantes se descuenta
+# una vez por el total y cada línea deja su Movimiento con el stock anterior /
+# nuevo acumulado en el orden del carrito, como antes.
+
+CARRITO = """
+    carrito AS (
+        SELECT * FROM unnest(
+            CAST(:orden AS INT[]), CAST(:sku AS TEXT[]), CAST(:descripcion AS TEXT[]),
+            CAST(:cantidad AS INT[]), CAST(:precio AS NUMERIC[]), CAST(:subtotal AS NUMERIC[]),
+            CAST(:es_inventario AS BOOLEAN[]), CAST(:macro AS TEXT[]), CAST(:id_ubicacion AS INT[]),
+            CAST(:nombre_ubicacion AS TEXT[])
+        ) AS c(orden, sku, descripcion, cantidad, precio_unitario, subtotal, es_inventario,
+               macro_categoria, id_ubicacion, nombre_ubicacion)
+    ),
+    bloqueo AS MATERIALIZED (
+        SELECT v.sku FROM Variantes v
+        WHERE v.sku IN (SELECT sku FROM carrito WHERE es_inventario)
+        ORDER BY v.sku
+        FOR UPDATE
+    ),
+    por_sku AS (
+        SELECT c.sku, SUM(c.cantidad) AS total, BOOL_OR(c.id_ubicacion IS NULL) AS sin_estante
+        FROM carrito c JOIN bloqueo b ON b.sku = c.sku
+        WHERE c.es_inventario
+        GROUP BY c.sku
+    ),
+    descontadas AS (
+        UPDATE Variantes v SET
+            stock_interno = v.stock_interno - p.total,
+            ubicacion = CASE WHEN p.sin_estante AND v.stock_interno - p.total <= 0 THEN '' ELSE v.ubicacion END
+        FROM por_sku p
+        WHERE v.sku = p.sku
+        RETURNING v.sku, v.stock_interno AS stock_final, p.total
+    ),
+    estantes AS (
+        UPDATE Stock_Ubicaciones su SET cantidad = su.cantidad - e.total
+        FROM (
+            SELECT sku, id_ubicacion, SUM(cantidad) AS total
+            FROM carrito WHERE es_inventario AND id_ubicacion IS NOT NULL
+            GROUP BY sku, id_ubicacion
+        ) e
+        WHERE su.sku = e.sku AND su.id_ubicacion = e.id_ubicacion
+    ),
+    lineas AS (
+        -- Stock después de cada línea, en el orden del carrito
+        SELECT c.*, d.stock_final + d.total - SUM(c.cantidad) OVER (PARTITION BY c.sku ORDER BY c.orden) AS stock_nuevo
+        FROM carrito c JOIN descontadas d ON d.sku = c.sku
+        WHERE c.es_inventario
+    )
+"""
+
+
+def _parametros(carrito):
+    """Carrito de st.session_state -> un arreglo por columna (tipos nativos; NaN -> None)."""
+    def entero(v):
+        return None if v is None or pd.isna(v) else int(v)
+
+    return {
+        "orden": list(range(len(carrito))),
+        "sku": [i['sku'] for i in carrito],
+        "descripcion": [i['descripcion'] for i in carrito],
+        "cantidad": [int(i['cantidad']) for i in carrito],
+        "precio": [float(i['precio']) for i in carrito],
+        "subtotal": [float(i['subtotal']) for i in carrito],
+        "es_inventario": [bool(i['es_inventario']) for i in carrito],
+        "macro": [i.get('macro_categoria', 'Otros') for i in carrito],
+        "id_ubicacion": [entero(i.get('id_ubicacion')) for i in carrito],
+        "nombre_ubicacion": [i.get('nombre_ubicacion') or None for i in carrito],
+    }
+
+
+def registrar_venta(conn, venta, carrito):
+    """
+    Inserta la venta (`venta`: id_cliente, tipo_envio, costo_envio, total_venta, nota,
+    clave_seguridad, pendiente_pago), su detalle, descuenta stock y estantes y registra
+    los Movimientos 'VENTA', todo en una sentencia. Devuelve el id_venta.
+    """
+    return conn.execute(text(f"""
+        WITH {CARRITO},
+        venta AS (
+            INSERT INTO Ventas (id_cliente, tipo_envio, costo_envio, total_venta, nota, clave_seguridad, pendiente_pago)
+            VALUES (:id_cliente, :tipo_envio, :costo_envio, :total_venta, :nota, :clave_seguridad, :pendiente_pago)
+            RETURNING id_venta
+        ),
+        detalle AS (
+            INSERT INTO DetalleVenta (id_venta, sku, descripcion, cantidad, precio_unitario, subtotal, es_inventario, macro_categoria, id_ubicacion)
+            SELECT venta.id_venta, c.sku, c.descripcion, c.cantidad, c.precio_unitario, c.subtotal, c.es_inventario, c.macro_categoria, c.id_ubicacion
+            FROM carrito c CROSS JOIN venta
+            ORDER BY c.orden
+        ),
+        historial AS (
+            INSERT INTO Movimientos (sku, tipo_movimiento, cantidad, stock_anterior, stock_nuevo, nota, id_cliente)
+            SELECT l.sku, 'VENTA', l.cantidad, l.stock_nuevo + l.cantidad, l.stock_nuevo,
+                   'Venta #' || venta.id_venta || COALESCE(' (' || l.nombre_ubicacion || ')', ''), :id_cliente
+            FROM lineas l CROSS JOIN venta
+            ORDER BY l.orden
+        )
+        SELECT id_venta FROM venta
+    """), {**_parametros(carrito), **venta}).scalar()
+
+
+def registrar_salida(conn, carrito, nota):
+    """
+    Salida sin cobro (merma, regalo, ajuste): descuenta stock y estantes de los ítems
+    de inventario y registra los Movimientos 'SALIDA' con `nota` (+ el estante).
+    Devuelve cuántas líneas de inventario se procesaron.
+    """
+    return conn.execute(text(f"""
+        WITH {CARRITO}
+        INSERT INTO Movimientos (sku, tipo_movimiento, cantidad, stock_anterior, stock_nuevo, nota)
+        SELECT l.sku, 'SALIDA', l.cantidad, l.stock_nuevo + l.cantidad, l.stock_nuevo,
+               :nota || COALESCE(' (Estante: ' || l.nombre_ubicacion || ')', '')
+        FROM lineas l
+        ORDER BY l.orden
+    """), {**_parametros(carrito), "nota": nota}).rowcount
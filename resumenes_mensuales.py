@@ -0,0 +1,212 @@
+import os
+import sys
+import argparse
+from datetime import date
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+from database import engine
+import linea_negocio
+
+# ==============================================================================
+# 🧮 RESÚMENES MENSUALES PARA ESTADÍSTICAS (agg_ventas_mes / agg_movimientos_mes)
+# ==============================================================================
+# Ventas y movimientos ya agregados por mes × línea de negocio × categoría, con
+# la línea de negocio persistida en Variantes (linea_negocio.py). La página de
+# estadísticas lee unos cientos de filas en vez de recorrer toda la historia.
+#
+# Mantenimiento incremental: triggers en Ventas, DetalleVenta y Movimientos
+# anotan en `agg_meses_pendientes` el mes de cada fila tocada (una anulación de
+# hace tres meses marca ese mes), y refrescar() recalcula solo esos meses más el
+# actual. Recategorizar productos marca la reconstrucción completa (mes centinela).
+#
+#   python resumenes_mensuales.py             # cron: aplica lo pendiente
+#   python resumenes_mensuales.py --completo  # reconstruye toda la historia
+
+MES_TODOS = "1900-01-01"  # Centinela: reconstruir la tabla entera
+_CANDADO = 41041          # pg_try_advisory_xact_lock: un solo refresco a la vez
+
+# Si el SKU ya no existe en Variantes (LEFT JOIN vacío) se clasifica por su prefijo
+MACRO_VENTA = """CASE
+    WHEN var.linea_negocio = 'Pelucas' OR d.sku ILIKE 'WB-%' OR d.sku ILIKE 'WIG-%' OR d.descripcion ILIKE '[Pelucas]%' THEN 'Pelucas'
+    WHEN d.descripcion ILIKE '[Otros]%' OR d.sku IS NULL THEN 'Otros'
+    ELSE 'Lentes'
+END"""
+
+MACRO_MOVIMIENTO = """CASE
+    WHEN var.linea_negocio = 'Pelucas' OR m.sku ILIKE 'WB-%' OR m.sku ILIKE 'WIG-%' THEN 'Pelucas'
+    WHEN m.sku IS NULL THEN 'Otros'
+    ELSE 'Lentes'
+END"""
+
+# Consulta de llenado por tabla; :desde/:hasta acotan por rango de fecha (usa índices)
+LLENADO = {
+    "ventas": f"""
+        INSERT INTO agg_ventas_mes (mes, macro, categoria, cantidad, total)
+        SELECT DATE_TRUNC('month', v.fecha_venta)::DATE, {MACRO_VENTA}, COALESCE(prod.categoria, 'Otros'),
+               SUM(d.cantidad), SUM(d.subtotal)
+        FROM ventas v
+        JOIN detalleventa d ON v.id_venta = d.id_venta
+        LEFT JOIN variantes var ON d.sku = var.sku
+        LEFT JOIN productos prod ON var.id_producto = prod.id_producto
+        WHERE v.anulado = FALSE AND v.fecha_venta >= :desde AND v.fecha_venta < :hasta
+        GROUP BY 1, 2, 3
+    """,
+    "movimientos": f"""
+        INSERT INTO agg_movimientos_mes (mes, macro, categoria, neto)
+        SELECT DATE_TRUNC('month', m.fecha)::DATE, {MACRO_MOVIMIENTO}, COALESCE(prod.categoria, 'Otros'),
+               SUM(COALESCE(m.stock_nuevo, 0) - COALESCE(m.stock_anterior, 0))
+        FROM movimientos m
+        LEFT JOIN variantes var ON m.sku = var.sku
+        LEFT JOIN productos prod ON var.id_producto = prod.id_producto
+        WHERE m.fecha >= :desde AND m.fecha < :hasta
+        GROUP BY 1, 2, 3
+    """,
+}
+TABLAS = {"ventas": "agg_ventas_mes", "movimientos": "agg_movimientos_mes"}
+
+_tablas_listas = False
+
+
+def preparar_tablas(conn):
+    """Tablas, triggers y, si es la primera vez, la carga completa."""
+    global _tablas_listas
+    if _tablas_listas:
+        return
+    linea_negocio.preparar_columna(conn)
+    existia = conn.execute(text("SELECT to_regclass('agg_ventas_mes') IS NOT NULL")).scalar()
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS agg_ventas_mes (
+            mes DATE, macro VARCHAR(20), categoria VARCHAR(100),
+            cantidad BIGINT DEFAULT 0, total NUMERIC DEFAULT 0,
+            PRIMARY KEY (mes, macro, categoria)
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS agg_movimientos_mes (
+            mes DATE, macro VARCHAR(20), categoria VARCHAR(100),
+            neto BIGINT DEFAULT 0,
+            PRIMARY KEY (mes, macro, categoria)
+        )
+    """))
+    # El refresco de un mes es un rango de fechas: con estos índices no recorre la historia
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_ventas_fecha_venta ON Ventas (fecha_venta)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_movimientos_fecha ON Movimientos (fecha)"))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS agg_meses_pendientes (
+            tabla VARCHAR(20), mes DATE,
+            PRIMARY KEY (tabla, mes)
+        )
+    """))
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION fn_agg_marcar_mes() RETURNS trigger AS $$
+        DECLARE
+            f_nueva TIMESTAMP;
+            f_vieja TIMESTAMP;
+        BEGIN
+            IF TG_TABLE_NAME = 'detalleventa' THEN
+                IF TG_OP <> 'DELETE' THEN SELECT fecha_venta INTO f_nueva FROM ventas WHERE id_venta = NEW.id_venta; END IF;
+                IF TG_OP <> 'INSERT' THEN SELECT fecha_venta INTO f_vieja FROM ventas WHERE id_venta = OLD.id_venta; END IF;
+            ELSIF TG_TABLE_NAME = 'ventas' THEN
+                IF TG_OP <> 'DELETE' THEN f_nueva := NEW.fecha_venta; END IF;
+                IF TG_OP <> 'INSERT' THEN f_vieja := OLD.fecha_venta; END IF;
+            ELSE
+                IF TG_OP <> 'DELETE' THEN f_nueva := NEW.fecha; END IF;
+                IF TG_OP <> 'INSERT' THEN f_vieja := OLD.fecha; END IF;
+            END IF;
+            INSERT INTO agg_meses_pendientes (tabla, mes)
+            SELECT DISTINCT TG_ARGV[0], DATE_TRUNC('month', f)::DATE
+            FROM unnest(ARRAY[f_nueva, f_vieja]) AS f WHERE f IS NOT NULL
+            ON CONFLICT DO NOTHING;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """))
+    conn.execute(text(f"""
+        CREATE OR REPLACE FUNCTION fn_agg_reconstruir() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO agg_meses_pendientes (tabla, mes)
+            VALUES ('ventas', '{MES_TODOS}'), ('movimientos', '{MES_TODOS}')
+            ON CONFLICT DO NOTHING;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """))
+    triggers = {
+        "trg_agg_ventas": "AFTER INSERT OR DELETE OR UPDATE ON Ventas FOR EACH ROW EXECUTE FUNCTION fn_agg_marcar_mes('ventas')",
+        "trg_agg_detalleventa": "AFTER INSERT OR DELETE OR UPDATE ON DetalleVenta FOR EACH ROW EXECUTE FUNCTION fn_agg_marcar_mes('ventas')",
+        "trg_agg_movimientos": "AFTER INSERT OR DELETE OR UPDATE ON Movimientos FOR EACH ROW EXECUTE FUNCTION fn_agg_marcar_mes('movimientos')",
+        # La clasificación depende del producto: recategorizar cambia toda la historia.
+        # Por fila y con WHEN: guardar la ficha sin tocar la categoría no reconstruye nada
+        "trg_agg_productos_fila": ("AFTER UPDATE OF categoria, macro_categoria ON Productos FOR EACH ROW "
+                                   "WHEN (OLD.categoria IS DISTINCT FROM NEW.categoria OR OLD.macro_categoria IS DISTINCT FROM NEW.macro_categoria) "
+                                   "EXECUTE FUNCTION fn_agg_reconstruir()"),
+        "trg_agg_variantes_fila": ("AFTER UPDATE OF id_producto ON Variantes FOR EACH ROW "
+                                   "WHEN (OLD.id_producto IS DISTINCT FROM NEW.id_producto) EXECUTE FUNCTION fn_agg_reconstruir()"),
+    }
+    existentes = {r[0] for r in conn.execute(text("SELECT tgname FROM pg_trigger WHERE tgname LIKE 'trg_agg_%'"))}
+    # Versiones anteriores por sentencia: disparaban con cualquier UPDATE que nombrara la columna.
+    # Esas instalaciones agregaron sin el respaldo por prefijo de SKU: se reconstruye una vez
+    reconstruir = not existia
+    for viejo, tabla in (("trg_agg_productos", "Productos"), ("trg_agg_variantes", "Variantes")):
+        if viejo in existentes:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {viejo} ON {tabla}"))
+            reconstruir = True
+    for nombre, definicion in triggers.items():
+        if nombre not in existentes:
+            conn.execute(text(f"CREATE TRIGGER {nombre} {definicion}"))
+    if reconstruir:
+        conn.execute(text(f"INSERT INTO agg_meses_pendientes (tabla, mes) VALUES ('ventas', '{MES_TODOS}'), ('movimientos', '{MES_TODOS}') ON CONFLICT DO NOTHING"))
+    _tablas_listas = True
+
+
+def _recalcular(conn, tabla, mes=None):
+    """Recalcula un mes (fecha del día 1) o, sin `mes`, toda la tabla."""
+    if mes is None:
+        conn.execute(text(f"DELETE FROM {TABLAS[tabla]}"))
+        conn.execute(text(LLENADO[tabla]), {"desde": "-infinity", "hasta": "infinity"})
+    else:
+        desde = date.fromisoformat(mes)
+        hasta = date(desde.year + desde.month // 12, desde.month % 12 + 1, 1)
+        conn.execute(text(f"DELETE FROM {TABLAS[tabla]} WHERE mes = :m"), {"m": desde})
+        conn.execute(text(LLENADO[tabla]), {"desde": desde, "hasta": hasta})
+
+
+def refrescar(completo=False):
+    """
+    Aplica los meses pendientes (y siempre el mes en curso). Devuelve la lista de
+    (tabla, mes) recalculados, o None si otro proceso ya está refrescando.
+    """
+    with engine.begin() as conn:
+        preparar_tablas(conn)
+        if not conn.execute(text(f"SELECT pg_try_advisory_xact_lock({_CANDADO})")).scalar():
+            return None
+
+        pendientes = conn.execute(text("DELETE FROM agg_meses_pendientes RETURNING tabla, CAST(mes AS TEXT)")).fetchall()
+        mes_actual = conn.execute(text("SELECT CAST(DATE_TRUNC('month', NOW())::DATE AS TEXT)")).scalar()
+        por_tabla = {tabla: {mes_actual} for tabla in TABLAS}
+        for tabla, mes in pendientes:
+            por_tabla.setdefault(tabla, set()).add(mes)
+
+        hechos = []
+        for tabla, meses in por_tabla.items():
+            if completo or MES_TODOS in meses:
+                _recalcular(conn, tabla)
+                hechos.append((tabla, "todos"))
+                continue
+            for mes in sorted(meses):
+                _recalcular(conn, tabla, mes)
+                hechos.append((tabla, mes))
+        return hechos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresca los resúmenes mensuales de ventas y movimientos.")
+    parser.add_argument("--completo", action="store_true", help="Reconstruye toda la historia")
+    args = parser.parse_args()
+    hechos = refrescar(completo=args.completo)
+    if hechos is None:
+        print("⏳ Otro proceso está refrescando los resúmenes. Saliendo...")
+        sys.exit(0)
+    print(f"✅ Resúmenes actualizados: {', '.join(f'{t} {m}' for t, m in hechos)}")
@@ -6,40 +6,24 @@ load_dotenv()
 
 from database import engine
 from sqlalchemy import text
-from utils import get_google_service, crear_en_google, normalizar_telefono_maestro
+from utils import normalizar_telefono_maestro
+import contactos_google
 
 def sincronizar_con_diagnostico():
-    print("📥 1. Descargando agenda de Google...")
-    service = get_google_service()
-    if not service:
-        print("❌ No se pudo conectar a Google.")
+    print("📥 1. Actualizando el espejo local de la agenda de Google (syncToken)...")
+    procesados = contactos_google.sincronizar(forzar=True)
+    mapa_google = contactos_google.mapa_telefonos()
+    if not mapa_google:
+        print("❌ El espejo de Google Contacts está vacío. ¿Hay conexión con Google?")
         return
-
-    mapa_google = {}
-    request = service.people().connections().list(
-        resourceName='people/me',
-        personFields='names,phoneNumbers',
-        pageSize=1000
-    )
-    
-    while request is not None:
-        response = request.execute()
-        for person in response.get('connections', []):
-            resource_name = person.get('resourceName')
-            for phone in person.get('phoneNumbers', []):
-                val = phone.get('value', '')
-                norm = normalizar_telefono_maestro(val)
-                if norm:
-                    mapa_google[norm['db']] = resource_name
-                    mapa_google[norm['corto']] = resource_name
-        request = service.people().connections().list_next(request, response)
+    print(f"   {procesados} contactos nuevos o modificados desde la última sincronización.")
 
     print(f"✅ Agenda descargada. Buscando casos en la Base de Datos...\n")
 
     with engine.connect() as conn:
         # Traemos TODOS los clientes sin google_id para evaluar por qué se saltan
         clientes = conn.execute(text("""
-            SELECT c.nombre_corto, t.telefono, c.activo, t.es_principal
+            SELECT c.id_cliente, c.nombre_corto, t.telefono, c.activo, t.es_principal
             FROM clientes c 
             JOIN telefonoscliente t ON c.id_cliente = t.id_cliente
             WHERE c.google_id IS NULL
@@ -49,6 +33,8 @@ def sincronizar_con_diagnostico():
         print("ℹ️ No hay clientes con google_id en NULL en la base de datos.")
         return
 
+    vinculos = {}
+    por_crear = []
     for cli in clientes:
         # Diagnóstico de filtros de la base de datos
         if not cli.activo:
@@ -66,23 +52,28 @@ def sincronizar_con_diagnostico():
         tel_db = norm['db']
         tel_corto = norm['corto']
 
-        if tel_db in mapa_google or tel_corto in mapa_google:
-            g_id = mapa_google.get(tel_db) or mapa_google.get(tel_corto)
-            # Volvemos a enlazar por si acaso
-            with engine.begin() as conn_update:
-                conn_update.execute(text("""
-                    UPDATE clientes SET google_id = :gid 
-                    WHERE nombre_corto = :nom AND google_id IS NULL
-                """), {"gid": g_id, "nom": cli.nombre_corto})
+        if tel_db in mapa_google:
             # No se crea porque el número ya existe bajo otro contacto en Google
+            vinculos[cli.id_cliente] = mapa_google[tel_db]
             print(f"🔄 Vinculado: '{cli.nombre_corto}' ya existía en Google bajo el número {tel_corto}.")
         else:
-            # Creación limpia
-            exito = crear_en_google(cli.nombre_corto, "", norm['google'])
-            if exito:
-                print(f"✅ Creado con éxito: '{cli.nombre_corto}' ({norm['google']})")
+            por_crear.append({"id_cliente": cli.id_cliente, "nombre": cli.nombre_corto, "apellido": "", "telefono": norm['google']})
+
+    # Creación limpia, de a 200 contactos por llamada
+    if por_crear:
+        print(f"\n📤 Creando {len(por_crear)} contactos en Google en lotes...")
+        creados = contactos_google.crear_en_lote(por_crear)
+        for c in por_crear:
+            if c["id_cliente"] in creados:
+                print(f"✅ Creado con éxito: '{c['nombre']}' ({c['telefono']})")
             else:
-                print(f"❌ Error de API al intentar crear a '{cli.nombre_corto}'.")
+                print(f"❌ Error de API al intentar crear a '{c['nombre']}'.")
+        vinculos.update(creados)
+
+    # Un solo UPDATE para todos los google_id
+    with engine.begin() as conn_update:
+        total = contactos_google.vincular_clientes(conn_update, vinculos)
+    print(f"\n🏁 {total} clientes enlazados con su contacto de Google.")
 
 if __name__ == "__main__":
     sincronizar_con_diagnostico()
\ No newline at end of file
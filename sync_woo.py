@@ -4,6 +4,8 @@ from datetime import datetime
 from dotenv import load_dotenv
 from woocommerce import API
 from sqlalchemy import create_engine, text
+from woo_catalogo import recorrer_catalogo_woo
+from linea_negocio import preparar_columna, PELUCAS
 
 # 1. Cargar las llaves de seguridad
 load_dotenv()
@@ -31,43 +33,26 @@ def sincronizar_tienda_woo(engine, nombre_tienda, wcapi, stock_local_tienda):
     nombres_web = {}          # {sku: "Nombre Web (Solo para lectura humana)"}
     woo_skus_totales = set()  # Saco absoluto de todos los SKUs vivos en esta web
 
-    pagina = 1
-    while True:
-        resp = wcapi.get("products", params={"per_page": 100, "page": pagina})
-        items = resp.json()
-        if not items: 
-            break
-            
-        for p in items:
-            p_id = p["id"]
-            p_sku = p.get("sku", "").strip()
-            p_type = p.get("type")
-            p_title = p.get("name", "Producto sin título")
-            
-            if p_type == "variable":
-                if p_id not in mapa_variaciones:
-                    mapa_variaciones[p_id] = {}
-                v_pagina = 1
-                while True:
-                    v_resp = wcapi.get(f"products/{p_id}/variations", params={"per_page": 100, "page": v_pagina})
-                    v_items = v_resp.json()
-                    if not v_items: 
-                        break
-                    for v in v_items:
-                        v_sku = v.get("sku", "").strip()
-                        if v_sku: # IDENTIDAD BASADA ESTRICTAMENTE EN EL SKU
-                            mapa_variaciones[p_id][v_sku] = v["id"]
-                            woo_skus_totales.add(v_sku)
-                            
-                            opciones = [attr.get('option', '') for attr in v.get('attributes', [])]
-                            nombres_web[v_sku] = f"{p_title} ({' '.join(opciones)})".strip()
-                    v_pagina += 1
-            elif p_sku: # Producto Simple con SKU
-                mapa_simples[p_sku] = p_id
-                woo_skus_totales.add(p_sku)
-                nombres_web[p_sku] = p_title
-                
-        pagina += 1
+    try:
+        for paso in recorrer_catalogo_woo(wcapi):
+            for item in paso["items"]:
+                sku = item["sku"]
+                if item["tipo"] == "variable":
+                    mapa_variaciones.setdefault(item["id"], {})
+                elif not sku: # IDENTIDAD BASADA ESTRICTAMENTE EN EL SKU
+                    continue
+                elif item["tipo"] == "variacion":
+                    mapa_variaciones.setdefault(item["parent_id"], {})[sku] = item["id"]
+                    woo_skus_totales.add(sku)
+                    nombres_web[sku] = item["nombre"]
+                else: # Producto Simple con SKU
+                    mapa_simples[sku] = item["id"]
+                    woo_skus_totales.add(sku)
+                    nombres_web[sku] = item["nombre"]
+    except Exception as e:
+        # Un mapa incompleto marcaría SKUs sanos como FALTA_EN_WOO: mejor abortar esta tienda
+        print(f"❌ Error descargando el catálogo de {nombre_tienda}: {e}")
+        return
 
     print(f"🔗 Mapeo de {nombre_tienda} listo. SKUs totales detectados en la Web: {len(woo_skus_totales)}.")
 
@@ -195,13 +180,14 @@ def sync_inventario_completo():
                     fecha_deteccion TIMESTAMP DEFAULT NOW()
                 );
             """))
+            preparar_columna(conn)
 
         with engine.connect() as conn:
             query = text("""
                 SELECT v.sku, 
                        (COALESCE(v.stock_interno, 0) + COALESCE(v.stock_externo, 0)) AS stock_total,
                        COALESCE(v.stock_transito, 0) AS stock_transito,
-                       COALESCE(p.macro_categoria, 'Lentes') AS macro_categoria,
+                       v.linea_negocio,
                        CONCAT(COALESCE(p.marca, ''), ' ', COALESCE(p.modelo, ''), ' ', COALESCE(p.nombre, '')) AS nombre_ref
                 FROM Variantes v
                 JOIN Productos p ON v.id_producto = p.id_producto
@@ -218,7 +204,7 @@ def sync_inventario_completo():
                 "transito": r.stock_transito,
                 "nombre_ref": r.nombre_ref.strip()
             }
-            if r.macro_categoria == "Pelucas": stock_pelucas[sku] = item_data
+            if r.linea_negocio == PELUCAS: stock_pelucas[sku] = item_data
             else: stock_lentes[sku] = item_data
 
         print(f"📦 Reparto local listo -> LENTES: {len(stock_lentes)} SKUs | PELUCAS: {len(stock_pelucas)} SKUs.")
@@ -0,0 +1,157 @@
+import sys
+import pandas as pd
+from sqlalchemy import text
+from database import engine
+from version_datos import Sello, CacheVersionada
+
+# ==============================================================================
+# 🎯 TABLERO DE SEGUIMIENTO PAGINADO POR ETAPA (views/seguimiento.py)
+# ==============================================================================
+# El tablero cargaba todos los clientes activos, cada uno con su última venta,
+# su dirección principal y el resumen de ítems, y guardaba ese DataFrame en la
+# sesión de cada operador hasta que alguien pulsara "Recargar". Ahora cada
+# bandeja (etapa × tipo de envío) pide solo su página:
+#
+#   - El filtro va por Clientes (id_etapa, fecha_seguimiento) con índice parcial
+#     de activos; un trigger mantiene id_etapa al día cuando cambia `estado`.
+#   - La última venta y el resumen de ítems se calculan solo para las filas de
+#     la página, después del LIMIT.
+#   - Triggers en Clientes, Ventas, DetalleVenta, Direcciones y EtapasCliente
+#     suben el sello `sello_seguimiento` (version_datos.py). Las páginas se
+#     guardan por proceso y se descartan en cuanto cambia el sello.
+
+POR_PAGINA = 25
+MAX_EDAD = 60  # Red de seguridad si los triggers no existen (BD sin permisos o no PostgreSQL)
+
+# Dirección principal del cliente `c` (la misma regla para filtrar y para mostrar)
+PRINCIPAL = """
+    FROM Direcciones d2
+    WHERE d2.id_cliente = c.id_cliente AND d2.activo = TRUE
+    ORDER BY d2.es_principal DESC, d2.id_direccion DESC LIMIT 1
+"""
+
+# Columnas de Clientes que se ven o filtran en el tablero: el webhook reescribe `activo`
+# en casi cada mensaje, pero solo un cambio real invalida las páginas
+SELLO = Sello("sello_seguimiento", {
+    "Clientes": ["estado", "id_etapa", "fecha_seguimiento", "nombre_corto", "telefono", "activo"],
+    "Ventas": None, "DetalleVenta": None, "Direcciones": None, "EtapasCliente": None,
+}, obsoletos=[
+    ("trg_seguimiento_clientes", "Clientes"), ("trg_seguimiento_ventas", "Ventas"),
+    ("trg_seguimiento_detalleventa", "DetalleVenta"), ("trg_seguimiento_direcciones", "Direcciones"),
+    ("trg_seguimiento_etapas", "EtapasCliente"),
+], tabla_obsoleta="seguimiento_version")
+
+_cache = CacheVersionada(SELLO, MAX_EDAD, "SEGUIMIENTO")
+_preparado = False
+
+
+def _preparar(conn):
+    global _preparado
+    if _preparado:
+        return
+    conn.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_clientes_etapa_seguimiento
+        ON Clientes (id_etapa, fecha_seguimiento, id_cliente) WHERE activo = TRUE
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_ventas_cliente ON Ventas (id_cliente, id_venta DESC)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_direcciones_cliente ON Direcciones (id_cliente) WHERE activo = TRUE"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_detalleventa_venta ON DetalleVenta (id_venta)"))
+
+    # id_etapa es la llave del tablero: se deriva de `estado` aunque quien escriba solo cambie el texto
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION fn_cliente_etapa() RETURNS trigger AS $$
+        BEGIN
+            NEW.id_etapa := COALESCE(
+                (SELECT e.id_etapa FROM etapascliente e WHERE e.subgrupo = NEW.estado
+                 ORDER BY e.activo DESC, e.id_etapa LIMIT 1),
+                NEW.id_etapa);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """))
+    nueva = SELLO.preparar(conn)
+    if not conn.execute(text("SELECT 1 FROM pg_trigger WHERE tgname = 'trg_seguimiento_etapa'")).scalar():
+        conn.execute(text("CREATE TRIGGER trg_seguimiento_etapa BEFORE INSERT OR UPDATE OF estado ON Clientes FOR EACH ROW EXECUTE FUNCTION fn_cliente_etapa()"))
+    if nueva:
+        # Primera vez: alinear id_etapa con el estado de los clientes que ya existen
+        conn.execute(text("""
+            UPDATE Clientes c SET id_etapa = e.id_etapa
+            FROM (SELECT DISTINCT ON (subgrupo) subgrupo, id_etapa FROM EtapasCliente
+                  ORDER BY subgrupo, activo DESC, id_etapa) e
+            WHERE c.estado = e.subgrupo AND c.id_etapa IS DISTINCT FROM e.id_etapa
+        """))
+    _preparado = True
+
+
+def _consulta(tipo_envio, sin_direccion, con_envio):
+    filtros = ["c.activo = TRUE", "c.id_etapa = ANY(CAST(:etapas AS INT[]))"]
+    if sin_direccion:
+        filtros.append("NOT EXISTS (SELECT 1 FROM Direcciones d2 WHERE d2.id_cliente = c.id_cliente AND d2.activo = TRUE)")
+    elif tipo_envio:
+        filtros.append(f"(SELECT d2.tipo_envio {PRINCIPAL}) = :tipo")
+    envio = f"""LEFT JOIN LATERAL (
+            SELECT d2.id_direccion, d2.tipo_envio, d2.nombre_receptor, d2.telefono_receptor,
+                   d2.direccion_texto, d2.distrito, d2.referencia, d2.gps_link, d2.observacion,
+                   d2.dni_receptor, d2.agencia_nombre, d2.sede_entrega
+            {PRINCIPAL}
+        ) dir ON TRUE""" if con_envio else ""
+    columnas_envio = """,
+            dir.id_direccion, dir.tipo_envio, dir.nombre_receptor, dir.telefono_receptor,
+            dir.direccion_texto, dir.distrito, dir.referencia, dir.gps_link, dir.observacion,
+            dir.dni_receptor, dir.agencia_nombre, dir.sede_entrega""" if con_envio else ""
+    return f"""
+        WITH pagina AS (
+            SELECT c.id_cliente, c.nombre_corto, c.telefono, c.estado, c.fecha_seguimiento,
+                   COUNT(*) OVER () AS total
+            FROM Clientes c
+            WHERE {" AND ".join(filtros)}
+            ORDER BY c.fecha_seguimiento ASC, c.id_cliente
+            LIMIT :limite OFFSET :desde
+        )
+        SELECT
+            c.id_cliente, c.nombre_corto, c.telefono, c.estado, c.fecha_seguimiento, c.total,
+            v.id_venta, v.total_venta, v.clave_seguridad, v.fecha_venta, v.pendiente_pago,
+            (SELECT STRING_AGG(d.cantidad || 'x ' || d.descripcion, ', ')
+             FROM DetalleVenta d WHERE d.id_venta = v.id_venta) AS resumen_items{columnas_envio}
+        FROM pagina c
+        LEFT JOIN LATERAL (
+            SELECT v2.id_venta, v2.total_venta, v2.clave_seguridad, v2.fecha_venta, v2.pendiente_pago
+            FROM Ventas v2 WHERE v2.id_cliente = c.id_cliente ORDER BY v2.id_venta DESC LIMIT 1
+        ) v ON TRUE
+        {envio}
+        ORDER BY c.fecha_seguimiento ASC, c.id_cliente
+    """
+
+
+def pagina(etapas, numero=0, tipo_envio=None, sin_direccion=False, con_envio=True, por_pagina=POR_PAGINA):
+    """
+    Página `numero` (desde 0) de la bandeja: clientes activos con id_etapa en `etapas`, filtrados por
+    el tipo de envío de su dirección principal (o sin dirección). Devuelve (df, total).
+    El DataFrame es compartido entre sesiones: usar .copy() antes de modificarlo.
+    """
+    etapas = sorted({int(e) for e in etapas})
+    if not etapas:
+        return pd.DataFrame(), 0
+
+    if not _preparado:
+        try:
+            with engine.begin() as conn:
+                _preparar(conn)
+        except Exception as e:
+            print(f"⚠️ [SEGUIMIENTO] No se pudo preparar el tablero: {e}", file=sys.stderr)
+
+    def construir(_version):
+        with engine.connect() as conn:
+            df = pd.read_sql(text(_consulta(tipo_envio, sin_direccion, con_envio)), conn, params={
+                "etapas": etapas, "tipo": tipo_envio, "limite": por_pagina, "desde": int(numero) * por_pagina,
+            })
+        total = int(df['total'].iloc[0]) if not df.empty else 0
+        return df.drop(columns=['total']), total
+
+    clave = (tuple(etapas), int(numero), tipo_envio, sin_direccion, con_envio, por_pagina)
+    return _cache.obtener(clave, construir)
+
+
+def invalidar():
+    """Descarta las páginas de este proceso (los demás se enteran por el sello de la BD)."""
+    _cache.invalidar()
@@ -0,0 +1,96 @@
+import os
+import pandas as pd
+from sqlalchemy import text
+from database import engine
+
+import contactos_google
+import importacion_stock
+from trabajos import tarea
+from utils import normalizar_telefono_maestro, ejecutar_auditoria_bidireccional_woo
+
+# ==============================================================================
+# 📋 TAREAS QUE EJECUTA EL TRABAJADOR (trabajos.py)
+# ==============================================================================
+# Cada una reporta su avance con `trabajo.avanzar(...)`, que además corta el
+# trabajo si el operador lo canceló desde el panel.
+
+@tarea("vincular_google")
+def vincular_clientes_google(trabajo):
+    """Vincula con Google Contacts a los clientes activos sin google_id (los crea en lote si no existen)."""
+    with engine.connect() as conn:
+        df_sin_sync = pd.read_sql(text("""
+            SELECT c.id_cliente, c.nombre_corto,
+                   COALESCE(
+                       (SELECT telefono FROM telefonoscliente WHERE id_cliente = c.id_cliente AND es_principal = TRUE AND activo = TRUE LIMIT 1),
+                       c.telefono
+                   ) as tel_prin
+            FROM clientes c
+            WHERE c.activo=TRUE AND (c.google_id IS NULL OR TRIM(c.google_id) = '')
+        """), conn)
+
+    # Una sola sincronización y un solo cruce contra el espejo para todos los clientes
+    trabajo.avanzar(0, "Sincronizando el espejo de Google Contacts...", forzar=True)
+    contactos_google.sincronizar()
+    mapa_google = contactos_google.mapa_telefonos()
+
+    total = len(df_sin_sync)
+    detalles_omisiones = []
+    vinculos = {}
+    por_crear = []
+    for n, row in enumerate(df_sin_sync.itertuples(index=False), 1):
+        trabajo.avanzar(int(60 * n / max(total, 1)), f"Buscando en el espejo de Google: {n}/{total}")
+        id_cli, nombre, tel = int(row.id_cliente), row.nombre_corto, row.tel_prin
+
+        if pd.isna(tel) or str(tel).strip().lower() in ['nan', '']:
+            detalles_omisiones.append(f"⚠️ ID {id_cli} ({nombre}): Sin ningún teléfono en base de datos.")
+            continue
+        norm = normalizar_telefono_maestro(tel)
+        if not norm:
+            detalles_omisiones.append(f"⚠️ ID {id_cli} ({nombre}): Falló la normalización para el número '{tel}'.")
+            continue
+
+        if norm['db'] in mapa_google:
+            vinculos[id_cli] = mapa_google[norm['db']]
+        else:
+            por_crear.append({"id_cliente": id_cli, "nombre": nombre, "apellido": "", "telefono": norm.get('google', norm['db'])})
+
+    # Los que no están en Google se crean de a 200 por llamada
+    if por_crear:
+        trabajo.avanzar(65, f"Creando {len(por_crear)} contactos en Google...", forzar=True)
+        creados = contactos_google.crear_en_lote(por_crear)
+        vinculos.update(creados)
+        for c in por_crear:
+            if c["id_cliente"] not in creados:
+                detalles_omisiones.append(f"❌ ID {c['id_cliente']} ({c['nombre']}): Google no devolvió el contacto creado.")
+
+    trabajo.avanzar(95, "Guardando los google_id...", forzar=True)
+    with engine.begin() as conn:
+        vinculados = contactos_google.vincular_clientes(conn, vinculos)
+    return {"vinculados": vinculados, "omisiones": detalles_omisiones}
+
+
+@tarea("auditoria_woo")
+def auditoria_woo(trabajo, tienda_url):
+    """Auditoría bidireccional de SKUs; las discrepancias parciales se publican mientras llegan las páginas."""
+    # Las llaves de WooCommerce se leen aquí: nunca se guardan en la tabla de trabajos
+    wc_key = os.getenv("WC_KEY", "tu_ck_aqui")
+    wc_secret = os.getenv("WC_SECRET", "tu_cs_aqui")
+
+    parciales_falta_db = []
+    for paso in ejecutar_auditoria_bidireccional_woo(tienda_url, wc_key, wc_secret):
+        if paso["estado"] == "error":
+            raise RuntimeError(paso["msg"])
+        if paso["estado"] == "completado":
+            return paso
+        parciales_falta_db.extend(paso.get("nuevos_falta_db", []))
+        parcial = {"falta_db": parciales_falta_db, "pendientes_wp": paso.get("pendientes_wp")} if "pendientes_wp" in paso else None
+        trabajo.avanzar(paso.get("progreso"), paso.get("msg"), parcial)
+
+
+@tarea("importar_stock_externo")
+def importar_stock_externo(trabajo, filas):
+    """`filas`: [[sku, stock], ...] ya validadas. COPY a tabla de paso + un UPDATE (importacion_stock.py)."""
+    trabajo.avanzar(10, f"Cargando {len(filas)} líneas del proveedor...", forzar=True)
+    validas = pd.DataFrame(filas, columns=["sku", "stock"])
+    actualizadas = importacion_stock.aplicar_proveedor(validas)
+    return {"actualizadas": actualizadas, "leidas": len(filas)}
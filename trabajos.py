@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import importlib
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+from database import engine
+
+# ==============================================================================
+# 🧵 TRABAJOS EN SEGUNDO PLANO (tabla `trabajos` + proceso trabajador)
+# ==============================================================================
+# Las acciones largas del panel (vincular Google, auditoría Woo, importaciones)
+# ya no corren dentro del hilo de Streamlit: la vista encola un trabajo y
+# consulta su progreso; este proceso lo ejecuta aunque el operador cambie de
+# página o recargue, y puede correr varios a la vez.
+#
+#   python trabajos.py --hilos 3
+#
+# Cada tarea es una función registrada con @tarea("tipo") que recibe un
+# Contexto (progreso, cancelación, resultado parcial) y los parámetros del
+# trabajo como kwargs; lo que retorne se guarda como resultado (JSON).
+
+MODULOS_TAREAS = ["tareas_fondo"]
+SEGUNDOS_ENTRE_AVANCES = 1.0
+SEGUNDOS_LATIDO = 60     # El trabajador late mientras la tarea corre, aunque esta no reporte avances
+MINUTOS_SIN_LATIDO = 15  # Un trabajo "corriendo" sin latido en este tiempo es de un trabajador muerto
+
+TAREAS = {}
+_tabla_lista = False
+
+
+class Cancelado(Exception):
+    pass
+
+
+def tarea(tipo):
+    """Registra la función como ejecutora de los trabajos de ese tipo."""
+    def registrar(funcion):
+        TAREAS[tipo] = funcion
+        return funcion
+    return registrar
+
+
+def preparar_tabla(conn):
+    global _tabla_lista
+    if _tabla_lista:
+        return
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS trabajos (
+            id SERIAL PRIMARY KEY,
+            tipo VARCHAR(50),
+            parametros TEXT,
+            estado VARCHAR(20) DEFAULT 'pendiente',
+            progreso INT DEFAULT 0,
+            mensaje TEXT,
+            parcial TEXT,
+            resultado TEXT,
+            cancelar BOOLEAN DEFAULT FALSE,
+            creado TIMESTAMP DEFAULT NOW(),
+            iniciado TIMESTAMP,
+            terminado TIMESTAMP,
+            latido TIMESTAMP
+        )
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_trabajos_pendientes ON trabajos (estado, id)"))
+    _tabla_lista = True
+
+
+# ==============================================================================
+# 📮 LADO DEL PANEL: ENCOLAR, CONSULTAR, CANCELAR
+# ==============================================================================
+def encolar(tipo, **parametros):
+    """Crea el trabajo y devuelve su id. Los parámetros deben ser serializables a JSON."""
+    with engine.begin() as conn:
+        preparar_tabla(conn)
+        return conn.execute(text("""
+            INSERT INTO trabajos (tipo, parametros, mensaje) VALUES (:t, :p, 'En cola...') RETURNING id
+        """), {"t": tipo, "p": json.dumps(parametros, ensure_ascii=False, default=str)}).scalar()
+
+
+def consultar(id_trabajo):
+    """Dict con estado, progreso, mensaje, parcial y resultado (ya decodificados), o None."""
+    with engine.begin() as conn:
+        preparar_tabla(conn)
+        fila = conn.execute(text("SELECT * FROM trabajos WHERE id = :id"), {"id": id_trabajo}).mappings().fetchone()
+    if not fila:
+        return None
+    datos = dict(fila)
+    for campo in ("parametros", "parcial", "resultado"):
+        datos[campo] = json.loads(datos[campo]) if datos[campo] else None
+    return datos
+
+
+def ultimo(tipo, activos=False):
+    """Id del trabajo más reciente de ese tipo (solo pendientes/corriendo si `activos`)."""
+    filtro = "AND estado IN ('pendiente', 'corriendo')" if activos else ""
+    with engine.begin() as conn:
+        preparar_tabla(conn)
+        return conn.execute(text(f"SELECT MAX(id) FROM trabajos WHERE tipo = :t {filtro}"), {"t": tipo}).scalar()
+
+
+def cancelar(id_trabajo):
+    """Pide la cancelación: uno pendiente se cancela al instante; uno corriendo, en su próximo avance."""
+    with engine.begin() as conn:
+        preparar_tabla(conn)
+        conn.execute(text("""
+            UPDATE trabajos SET
+                cancelar = TRUE,
+                estado = CASE WHEN estado = 'pendiente' THEN 'cancelado' ELSE estado END,
+                terminado = CASE WHEN estado = 'pendiente' THEN NOW() ELSE terminado END
+            WHERE id = :id AND estado IN ('pendiente', 'corriendo')
+        """), {"id": id_trabajo})
+
+
+# ==============================================================================
+# ⚙️ LADO DEL TRABAJADOR
+# ==============================================================================
+class Contexto:
+    """Lo que ve una tarea de su trabajo: reportar avance, resultado parcial y saber si la cancelaron."""
+
+    def __init__(self, id_trabajo):
+        self.id = id_trabajo
+        self._ultimo_volcado = 0.0
+
+    def avanzar(self, progreso=None, mensaje=None, parcial=None, forzar=False):
+        """
+        Guarda el avance (como mucho una vez por segundo salvo `forzar`) y lanza
+        Cancelado si el operador pidió detenerlo.
+        """
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultimo_volcado < SEGUNDOS_ENTRE_AVANCES:
+            return
+        self._ultimo_volcado = ahora
+        with engine.begin() as conn:
+            cancelado = conn.execute(text("""
+                UPDATE trabajos SET
+                    progreso = COALESCE(:pr, progreso),
+                    mensaje = COALESCE(:m, mensaje),
+                    parcial = COALESCE(:pa, parcial),
+                    latido = NOW()
+                WHERE id = :id
+                RETURNING cancelar
+            """), {"id": self.id, "pr": progreso, "m": mensaje,
+                   "pa": json.dumps(parcial, ensure_ascii=False, default=str) if parcial is not None else None}).scalar()
+        if cancelado:
+            raise Cancelado()
+
+
+def _terminar(id_trabajo, estado, mensaje, resultado=None):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE trabajos SET estado = :e, mensaje = :m, resultado = :r, terminado = NOW(), latido = NOW(),
+                progreso = CASE WHEN :e = 'completado' THEN 100 ELSE progreso END
+            WHERE id = :id
+        """), {"id": id_trabajo, "e": estado, "m": mensaje[:2000],
+               "r": json.dumps(resultado, ensure_ascii=False, default=str) if resultado is not None else None})
+
+
+def _latir(id_trabajo, fin):
+    """Hilo del trabajador: renueva el latido hasta que `fin` se active (la tarea terminó)."""
+    while not fin.wait(SEGUNDOS_LATIDO):
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("UPDATE trabajos SET latido = NOW() WHERE id = :id AND estado = 'corriendo'"), {"id": id_trabajo})
+        except Exception as e:
+            print(f"⚠️ [TRABAJOS] #{id_trabajo} no pudo registrar su latido: {e}", file=sys.stderr)
+
+
+def reclamar_siguiente():
+    """Toma el pendiente más antiguo (SKIP LOCKED: varios trabajadores no chocan). Devuelve (id, tipo, parámetros) o None."""
+    with engine.begin() as conn:
+        preparar_tabla(conn)
+        # Los que quedaron "corriendo" de un trabajador que murió se marcan como error
+        conn.execute(text(f"""
+            UPDATE trabajos SET estado = 'error', mensaje = 'El trabajador se detuvo a mitad del trabajo.', terminado = NOW()
+            WHERE estado = 'corriendo' AND latido < NOW() - INTERVAL '{MINUTOS_SIN_LATIDO} minutes'
+        """))
+        fila = conn.execute(text("""
+            UPDATE trabajos SET estado = 'corriendo', iniciado = NOW(), latido = NOW(), mensaje = 'Iniciando...'
+            WHERE id = (
+                SELECT id FROM trabajos WHERE estado = 'pendiente' ORDER BY id
+                LIMIT 1 FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, tipo, parametros
+        """)).fetchone()
+    if not fila:
+        return None
+    return fila.id, fila.tipo, json.loads(fila.parametros or "{}")
+
+
+def ejecutar(id_trabajo, tipo, parametros):
+    funcion = TAREAS.get(tipo)
+    if not funcion:
+        _terminar(id_trabajo, "error", f"No hay ninguna tarea registrada para '{tipo}'.")
+        return
+    print(f"▶️ [TRABAJOS] #{id_trabajo} {tipo} iniciado.")
+    # Una llamada externa lenta (Google, Woo) puede pasar minutos sin avanzar(): el latido
+    # no depende de la tarea, así solo se da por caído si murió el proceso
+    fin = threading.Event()
+    threading.Thread(target=_latir, args=(id_trabajo, fin), daemon=True).start()
+    try:
+        resultado = funcion(Contexto(id_trabajo), **parametros)
+        _terminar(id_trabajo, "completado", "Completado.", resultado)
+        print(f"✅ [TRABAJOS] #{id_trabajo} {tipo} completado.")
+    except Cancelado:
+        _terminar(id_trabajo, "cancelado", "Cancelado por el operador.")
+        print(f"🛑 [TRABAJOS] #{id_trabajo} {tipo} cancelado.")
+    except Exception as e:
+        traceback.print_exc()
+        _terminar(id_trabajo, "error", f"{type(e).__name__}: {e}")
+        print(f"🔥 [TRABAJOS] #{id_trabajo} {tipo} falló: {e}", file=sys.stderr)
+    finally:
+        fin.set()
+
+
+def trabajar(hilos=2, espera=2.0):
+    """Bucle del trabajador: hasta `hilos` trabajos a la vez."""
+    for modulo in MODULOS_TAREAS:
+        importlib.import_module(modulo)
+    print(f"🧵 Trabajador listo con {hilos} hilos. Tareas: {', '.join(sorted(TAREAS))}")
+
+    en_curso = set()
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        while True:
+            en_curso = {f for f in en_curso if not f.done()}
+            siguiente = reclamar_siguiente() if len(en_curso) < hilos else None
+            if siguiente:
+                en_curso.add(pool.submit(ejecutar, *siguiente))
+            else:
+                time.sleep(espera)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trabajador de tareas en segundo plano del panel.")
+    parser.add_argument("--hilos", type=int, default=int(os.getenv("TRABAJOS_HILOS", "2")))
+    args = parser.parse_args()
+    # Ejecutado como script este módulo es __main__: las tareas se registran con
+    # `from trabajos import tarea`, así que el bucle debe correr sobre ese mismo módulo
+    import trabajos
+    try:
+        trabajos.trabajar(args.hilos)
+    except KeyboardInterrupt:
+        print("👋 Trabajador detenido.")
@@ -2,6 +2,7 @@ import streamlit as st
 import os
 import requests
 import pandas as pd
+import numpy as np
 from sqlalchemy import text
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
@@ -10,6 +11,17 @@ import json
 import base64
 from woocommerce import API
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from integraciones import waha, waha_estados, make
+import cache_waha
+import cache_imagenes
+import contactos_google
+import linea_negocio
+import trabajos
+import copys_ia
+import cliente_llm
+import hashlib
+from indice_productos import obtener_indice
 import random
 from datetime import datetime
 
@@ -80,8 +92,17 @@ def normalizar_telefono_maestro(entrada):
 # ==============================================================================
 # 🔍 2. FUNCIONES DE GOOGLE CONTACTS
 # ==============================================================================
+_google_local = threading.local()
+
 def get_google_service():
-    """Autenticación silenciosa con Google con impresión de errores"""
+    """
+    Autenticación silenciosa con Google con impresión de errores.
+    El cliente se construye una vez por hilo (httplib2 no es thread-safe) y se reutiliza;
+    las credenciales se refrescan solas al vencer el token.
+    """
+    service = getattr(_google_local, "service", None)
+    if service is not None:
+        return service
     try:
         creds_json = os.getenv("GOOGLE_CREDENTIALS_JSON")
         if not creds_json: 
@@ -89,82 +110,42 @@ def get_google_service():
             return None
         info = json.loads(creds_json)
         creds = Credentials.from_authorized_user_info(info, ['https://www.googleapis.com/auth/contacts'])
-        return build('people', 'v1', credentials=creds)
+        _google_local.service = build('people', 'v1', credentials=creds, cache_discovery=False)
+        return _google_local.service
     except Exception as e:
         print(f"❌ Error real en get_google_service: {e}") # <-- Esto nos dará la pista exacta
         return None
 
-def buscar_contacto_google(telefono):
-    """Busca un contacto en Google por número probando múltiples formatos y búsqueda exhaustiva."""
+def buscar_contacto_google(telefono, sincronizar=False):
+    """
+    Busca un contacto de Google por número en el espejo local (google_contactos).
+    Con `sincronizar=True` primero trae los cambios por syncToken (búsquedas sueltas);
+    los recorridos masivos sincronizan una vez y usan contactos_google.mapa_telefonos().
+    """
     datos = normalizar_telefono_maestro(telefono)
     if not datos: return {'encontrado': False}
-    
-    service = get_google_service()
-    if not service: return {'encontrado': False, 'error': 'No auth'}
 
-    # 1. BÚSQUEDA RÁPIDA (API nativa de Google)
+    if sincronizar:
+        contactos_google.sincronizar()
     try:
-        queries = [datos['google'], f"+{datos['db']}", datos['db'], datos['corto'], str(telefono)]
-        for q in queries:
-            results = service.people().searchContacts(
-                query=q, readMask='names,phoneNumbers,emailAddresses'
-            ).execute()
-            
-            if results.get('results'):
-                person = results['results'][0]['person']
-                names = person.get('names', [])
-                nombre_completo = names[0].get('displayName', 'Sin Nombre') if names else "Sin Nombre"
-                partes = nombre_completo.split()
-                return {
-                    'encontrado': True,
-                    'nombre_completo': nombre_completo,
-                    'nombre': partes[0] if partes else "",
-                    'apellido': " ".join(partes[1:]) if len(partes) > 1 else "",
-                    'google_id': person.get('resourceName'),
-                    'telefono_google': q
-                }
+        fila = contactos_google.buscar(datos['db'])
     except Exception as e:
-        print(f"Error Google Search Rápido: {e}")
+        print(f"Error leyendo el espejo de Google Contacts: {e}")
+        return {'encontrado': False, 'error': str(e)}
+    if not fila: return {'encontrado': False}
 
-    # 2. BÚSQUEDA EXHAUSTIVA (El arma secreta contra los duplicados)
-    print(f"Búsqueda rápida falló para {telefono}. Iniciando búsqueda exhaustiva...")
-    try:
-        request = service.people().connections().list(
-            resourceName='people/me',
-            pageSize=1000,
-            personFields='names,phoneNumbers'
-        )
-        
-        while request is not None:
-            response = request.execute()
-            for person in response.get('connections', []):
-                for phone in person.get('phoneNumbers', []):
-                    val = phone.get('value', '')
-                    # Quitamos todos los espacios y símbolos del número que nos da Google
-                    val_norm = "".join(filter(str.isdigit, val))
-                    
-                    # Si los 9 dígitos locales coinciden (sin importar el +51), es la misma persona!
-                    if datos['corto'] in val_norm or datos['db'] in val_norm:
-                        names = person.get('names', [])
-                        nombre_completo = names[0].get('displayName', 'Sin Nombre') if names else "Sin Nombre"
-                        partes = nombre_completo.split()
-                        print(f"✅ ¡Encontrado exhaustivamente!: {nombre_completo}")
-                        return {
-                            'encontrado': True,
-                            'nombre_completo': nombre_completo,
-                            'nombre': partes[0] if partes else "",
-                            'apellido': " ".join(partes[1:]) if len(partes) > 1 else "",
-                            'google_id': person.get('resourceName'),
-                            'telefono_google': val
-                        }
-            request = service.people().connections().list_next(request, response)
-    except Exception as e:
-        print(f"Error en búsqueda exhaustiva: {e}")
-
-    return {'encontrado': False}
+    partes = (fila.nombre_completo or "").split()
+    return {
+        'encontrado': True,
+        'nombre_completo': fila.nombre_completo,
+        'nombre': partes[0] if partes else "",
+        'apellido': " ".join(partes[1:]) if len(partes) > 1 else "",
+        'google_id': fila.resource_name,
+        'telefono_google': fila.telefono_google
+    }
 
 def crear_en_google(nombre, apellido, telefono, email=None):
-    """Crea un contacto en Google Contacts"""
+    """Crea un contacto en Google Contacts. Devuelve su resourceName (truthy) o False."""
     service = get_google_service()
     if not service: return False
     try:
@@ -173,45 +154,19 @@ def crear_en_google(nombre, apellido, telefono, email=None):
             "phoneNumbers": [{"value": telefono}],
         }
         if email: body["emailAddresses"] = [{"value": email}]
-        service.people().createContact(body=body).execute()
-        return True
+        persona = service.people().createContact(body=body, personFields=contactos_google.CAMPOS).execute()
+        contactos_google.registrar(persona)
+        return persona.get('resourceName') or True
     except: return False
 
 def actualizar_en_google(google_id, nombre, apellido, telefono):
+    """Actualiza un contacto de Google (lote de uno: etag y escritura van por el escritor en lote)."""
     if not google_id:
         return False
     try:
-        # Obtener el servicio de autenticación correcto
-        service = get_google_service()
-        if not service:
-            print("⚠️ No se pudo inicializar el servicio de Google.")
-            return False
-
-        # Forzar formato correcto del resourceName
-        resource_name = google_id if google_id.startswith('people/') else f"people/{google_id}"
-        
-        # 1. Obtener el 'etag' actual del contacto
-        contacto = service.people().get(
-            resourceName=resource_name,
-            personFields='metadata'
-        ).execute()
-        etag = contacto.get('etag')
-
-        # 2. Construir el cuerpo con los datos modificados
-        body = {
-            "etag": etag,
-            "names": [{"givenName": nombre, "familyName": apellido}],
-            "phoneNumbers": [{"value": telefono, "type": "mobile"}]
-        }
-
-        # 3. Enviar la actualización a la API
-        service.people().updateContact(
-            resourceName=resource_name,
-            updatePersonFields="names,phoneNumbers",
-            body=body
-        ).execute()
-        
-        return True
+        return bool(contactos_google.actualizar_en_lote([
+            {"google_id": str(google_id), "nombre": nombre, "apellido": apellido, "telefono": telefono}
+        ]))
     except Exception as e:
         print(f"❌ Error real en actualizar_en_google: {e}")
         return False
@@ -229,10 +184,7 @@ def marcar_chat_como_leido_waha(chat_id, session="default"):
         elif "@" not in chat_id_str: 
             chat_id = f"{chat_id_str}@c.us"
             
-        url = f"{WAHA_URL.rstrip('/')}/api/sendSeen"
-        headers = {"Content-Type": "application/json"}
-        if WAHA_KEY: headers["X-Api-Key"] = WAHA_KEY
-        requests.post(url, json={"session": session, "chatId": chat_id}, headers=headers, timeout=3)
+        waha.post("/api/sendSeen", json={"session": session, "chatId": chat_id}, timeout=3)
     except: pass
 
 def obtener_perfil_waha(telefono):
@@ -240,17 +192,13 @@ def obtener_perfil_waha(telefono):
     try:
         norm = normalizar_telefono_maestro(telefono)
         if not norm: return None
-        url = f"{WAHA_URL.rstrip('/')}/api/contacts/{norm['waha']}"
-        headers = {"Content-Type": "application/json"}
-        if WAHA_KEY: headers["X-Api-Key"] = WAHA_KEY
-        r = requests.get(url, headers=headers, timeout=5)
+        r = waha.get(f"/api/contacts/{norm['waha']}", endpoint="GET /api/contacts/{id}", timeout=5)
         if r.status_code == 200: return r.json()
     except: pass
     return None
 
 def enviar_mensaje_whatsapp(telefono, mensaje, url_imagen=None, session="default"):
     """Envía texto simple o imagen soportando LIDs"""
-    import requests
     if not WAHA_URL: return False
     
     try:
@@ -264,18 +212,15 @@ def enviar_mensaje_whatsapp(telefono, mensaje, url_imagen=None, session="default
             if not norm: return False
             chat_id = norm['waha']
             
-        headers = {"Content-Type": "application/json"}
-        if WAHA_KEY: headers["X-Api-Key"] = WAHA_KEY
-        
         if url_imagen:
-            url = f"{WAHA_URL.rstrip('/')}/api/sendImage"
+            ruta = "/api/sendImage"
             payload = {"session": session, "chatId": chat_id, "file": {"url": url_imagen}, "caption": mensaje}
         else:
-            url = f"{WAHA_URL.rstrip('/')}/api/sendText"
+            ruta = "/api/sendText"
             payload = {"session": session, "chatId": chat_id, "text": mensaje}
             
         # ⏳ Paciencia aumentada a 45s para imágenes pesadas
-        r = requests.post(url, json=payload, headers=headers, timeout=45)
+        r = waha.post(ruta, json=payload, timeout=45)
         return r.status_code in [200, 201]
     except Exception as e:
         print(f"⚠️ Error al enviar WSP (utils): {e}")
@@ -283,8 +228,6 @@ def enviar_mensaje_whatsapp(telefono, mensaje, url_imagen=None, session="default
 
 def enviar_mensaje_media(telefono, caption, archivo_bytes, nombre_archivo, mime_type, session="default"):
     """Envía archivos adjuntos (Campañas) soportando LIDs"""
-    import requests
-    import base64
     if not WAHA_URL: return False
     
     try:
@@ -301,10 +244,6 @@ def enviar_mensaje_media(telefono, caption, archivo_bytes, nombre_archivo, mime_
         b64_data = base64.b64encode(archivo_bytes).decode('utf-8')
         data_uri = f"data:{mime_type};base64,{b64_data}"
 
-        url = f"{WAHA_URL.rstrip('/')}/api/sendImage"
-        headers = {"Content-Type": "application/json"}
-        if WAHA_KEY: headers["X-Api-Key"] = WAHA_KEY
-
         payload = {
             "session": session,
             "chatId": chat_id,  # <--- Ahora usa la variable correcta
@@ -317,17 +256,37 @@ def enviar_mensaje_media(telefono, caption, archivo_bytes, nombre_archivo, mime_
         }
 
         # ⏳ Paciencia aumentada a 45s para procesar la subida del archivo
-        r = requests.post(url, json=payload, headers=headers, timeout=45)
+        r = waha.post("/api/sendImage", json=payload, timeout=45)
         return r.status_code in [200, 201]
     except Exception as e:
         print(f"Error media: {e}")
         return False
 
         
+# Sesiones de WAHA donde se busca un contacto cuando no se sabe cuál lo conoce
+SESIONES_WAHA = ["default", "principal"]
+
+def _consultar_sesiones(consulta, acepta_falsos=False):
+    """
+    Lanza `consulta(sesion)` en todas las sesiones a la vez (antes se probaban en serie).
+    Cada consulta devuelve (respondio, valor); respondio=False indica error de red/API.
+    Retorna (valor de la primera sesión —en orden— que lo conozca, hubo_error).
+    Con `acepta_falsos` un valor falso (p. ej. "no existe") también es una respuesta
+    válida; si ninguna sesión respondió, el valor es None.
+    """
+    with ThreadPoolExecutor(max_workers=len(SESIONES_WAHA)) as pool:
+        resultados = list(pool.map(consulta, SESIONES_WAHA))
+    for sesion, (respondio, valor) in zip(SESIONES_WAHA, resultados):
+        if respondio and (valor or acepta_falsos):
+            return valor, False
+    return None, any(not respondio for respondio, _ in resultados)
+
 # 🚀 FUNCION PARA VERIFICAR EL NUMERO WSP SI EXISTE
-def verificar_numero_waha(telefono):
+def verificar_numero_waha(telefono, usar_cache=True):
     """
-    Verifica si el número tiene WhatsApp activo usando WAHA.
+    Verifica si el número tiene WhatsApp activo usando WAHA (con caché persistente).
+    Con usar_cache=False consulta siempre a WAHA (verificación masiva explícita) y
+    refresca la caché con la respuesta.
     Retorna True (existe), False (no existe), o None (error de conexión).
     """
     if not WAHA_URL: return None
@@ -335,28 +294,29 @@ def verificar_numero_waha(telefono):
     try:
         norm = normalizar_telefono_maestro(telefono)
         if not norm: return False
+
+        if usar_cache:
+            encontrado, existe = cache_waha.obtener("existe", norm['db'])
+            if encontrado: return existe
         
-        url = f"{WAHA_URL.rstrip('/')}/api/contacts/check-exists"
-        headers = {"Content-Type": "application/json"}
-        if WAHA_KEY: headers["X-Api-Key"] = WAHA_KEY
-        
-        # Probamos en ambas sesiones por si acaso
-        for sesion in ['default', 'principal']:
+        def consulta(sesion):
             try:
                 # Usamos GET y params (como aprendimos del bot de marketing)
                 params = {"session": sesion, "phone": norm['db']}
-                r = requests.get(url, params=params, headers=headers, timeout=15)
-                
+                r = waha.get("/api/contacts/check-exists", params=params, timeout=15)
                 if r.status_code == 200:
-                    data = r.json()
-                    # Retornamos directamente lo que diga WAHA (True o False)
-                    return data.get('numberExists', False)
+                    return True, bool(r.json().get('numberExists', False))
             except Exception as e:
                 print(f"⚠️ WAHA Error en sesión '{sesion}': {e}")
-                continue # Si esta sesión falla, intenta con la siguiente
-                
-        # Si el bucle termina y fallaron todas las sesiones, hay error de conexión
-        return None
+            return False, None
+
+        # Vale lo que diga la primera sesión que respondió (True o False)
+        existe, _ = _consultar_sesiones(consulta, acepta_falsos=True)
+        if existe is None:
+            # Si fallaron todas las sesiones, hay error de conexión (no se guarda en caché)
+            return None
+        cache_waha.guardar("existe", norm['db'], existe)
+        return existe
         
     except Exception as e:
         print(f"🔥 Error general en verificar_numero_waha: {e}")
@@ -365,39 +325,98 @@ def verificar_numero_waha(telefono):
 def obtener_lid_de_waha(telefono):
     """
     Consulta a WAHA para obtener el código LID anónimo a partir de un número.
-    Busca automáticamente en todas las sesiones activas para evitar falsos negativos.
+    Busca en todas las sesiones a la vez para evitar falsos negativos (con caché persistente).
     """
     if not WAHA_URL or not telefono: return None
     try:
         norm = normalizar_telefono_maestro(telefono)
         if not norm: return None
+
+        encontrado, lid = cache_waha.obtener("lid", norm['db'])
+        if encontrado: return lid
         
         tel_safe = norm['waha'].replace('@', '%40')
-        headers = {"Content-Type": "application/json"}
-        if WAHA_KEY: headers["X-Api-Key"] = WAHA_KEY
 
-        # Definimos las sesiones donde queremos buscar
-        sesiones_a_probar = ["default", "principal"]
+        def consulta(sesion):
+            try:
+                r = waha.get(f"/api/{sesion}/lids/pn/{tel_safe}", endpoint="GET /api/{session}/lids/pn/{phone}", timeout=5)
+                if r.status_code == 200:
+                    return True, r.json().get('lid')
+                if r.status_code == 404:
+                    return True, None
+            except Exception as e:
+                print(f"⚠️ [WAHA LOG] Sesión '{sesion}' no respondió al buscar LID: {e}")
+            return False, None
 
-        for sesion in sesiones_a_probar:
-            url = f"{WAHA_URL.rstrip('/')}/api/{sesion}/lids/pn/{tel_safe}"
-            r = requests.get(url, headers=headers, timeout=5)
-            
-            if r.status_code == 200:
-                data = r.json()
-                lid_encontrado = data.get('lid')
-                
-                if lid_encontrado:
-                    print(f"✅ [WAHA LOG] LID recuperado con éxito desde la sesión '{sesion}' para {telefono}")
-                    return lid_encontrado
+        lid_encontrado, hubo_error = _consultar_sesiones(consulta)
 
-        # Si el bucle termina y no encontró nada en ninguna sesión
-        print(f"⚠️ [WAHA LOG] Privacidad estricta: Ninguna de tus sesiones conoce el LID oculto de {telefono}")
+        if lid_encontrado:
+            print(f"✅ [WAHA LOG] LID recuperado con éxito para {telefono}")
+            cache_waha.guardar("lid", norm['db'], lid_encontrado)
+            cache_waha.guardar("pn", lid_encontrado, norm['db'])
+            return lid_encontrado
+
+        # Solo es "privacidad estricta" si todas las sesiones respondieron
+        if not hubo_error:
+            print(f"⚠️ [WAHA LOG] Privacidad estricta: Ninguna de tus sesiones conoce el LID oculto de {telefono}")
+            cache_waha.guardar("lid", norm['db'], None)
         return None
         
     except Exception as e:
         print(f"🔥 [WAHA ERROR] Fallo interno al buscar LID: {e}")
     return None
+
+def resolver_telefono_api(lid, session):
+    """Traduce un LID anónimo (xxx@lid) al número real usando la sesión indicada de WAHA (con caché)."""
+    if not WAHA_URL or not lid: return None
+
+    # El LID -> teléfono es global; el "no lo conozco" depende de la sesión
+    encontrado, pn = cache_waha.obtener("pn", lid)
+    if encontrado and pn: return pn
+    encontrado, _ = cache_waha.obtener("pn", f"{session}|{lid}")
+    if encontrado: return None
+
+    try:
+        lid_safe = lid.replace('@', '%40')
+        r = waha.get(f"/api/{session}/lids/{lid_safe}", endpoint="GET /api/{session}/lids/{lid}", timeout=5)
+        if r.status_code == 200:
+            pn = r.json().get('pn')
+            if pn:
+                print(f"✨ API Resuelta: {lid} es {pn}")
+                telefono = pn.split('@')[0]
+                cache_waha.guardar("pn", lid, telefono)
+                cache_waha.guardar("lid", telefono, lid)
+                return telefono
+        if r.status_code in (200, 404):
+            cache_waha.guardar("pn", f"{session}|{lid}", None)
+    except Exception as e:
+        print(f"Error API WAHA LIDs: {e}")
+    return None
+
+def obtener_nombre_waha(contact_id, session):
+    """Consulta la API de WAHA para obtener el nombre configurado por el usuario en WhatsApp (con caché)"""
+    if not WAHA_URL or not contact_id: return None
+
+    encontrado, nombre = cache_waha.obtener("nombre", contact_id)
+    if encontrado and nombre: return nombre
+    encontrado, _ = cache_waha.obtener("nombre", f"{session}|{contact_id}")
+    if encontrado: return None
+
+    try:
+        params = {"contactId": contact_id, "session": session}
+        r = waha.get("/api/contacts/contact", params=params, timeout=5)
+        if r.status_code == 200:
+            data = r.json()
+            nombre = data.get('name') or data.get('pushname') or data.get('shortName')
+            if nombre:
+                print(f"✨ Nombre obtenido de API WAHA: {nombre}")
+                cache_waha.guardar("nombre", contact_id, nombre)
+                return nombre
+        if r.status_code in (200, 404):
+            cache_waha.guardar("nombre", f"{session}|{contact_id}", None)
+    except Exception as e:
+        print(f"Error API WAHA Contacts: {e}")
+    return None
 # ==============================================================================
 # 🤖 4. FUNCIONES DE INTELIGENCIA ARTIFICIAL
 # ==============================================================================
@@ -573,74 +592,40 @@ def seleccionar_producto_para_estado(prob_natural, prob_fantasia, prob_accesorio
     categoria_elegida = random.choices(categorias, weights=pesos_categoria, k=1)[0]
     
     with engine.connect() as conn:
-        # 2. INYECCIÓN DEL COALESCE: Prioriza foto del hijo (Variantes), si no hay, toma la del padre (Productos)
-        sql = text("""
-            SELECT 
-                v.sku, p.nombre, p.marca, p.modelo, p.categoria, 
-                COALESCE(p.macro_categoria, 'Lentes') AS macro_categoria, 
-                p.color_principal, g.nombre_grupo, g.descripcion AS descripcion_grupo, 
-                v.stock_interno, 
-                COALESCE(NULLIF(TRIM(v.url_imagen), ''), NULLIF(TRIM(p.url_imagen), '')) AS imagen
-            FROM Productos p
-            JOIN Variantes v ON p.id_producto = v.id_producto
-            LEFT JOIN Grupos_Productos g ON v.id_grupo = g.id_grupo
-            WHERE p.categoria = :cat AND COALESCE(p.macro_categoria, 'Lentes') = :macro
-              AND v.stock_interno > 0 
-              AND v.sku NOT IN (
-                  SELECT sku FROM Historial_Estados 
-                  WHERE fecha_publicacion > NOW() - INTERVAL '14 days'
-              )
-        """)
-        resultados = conn.execute(sql, {"cat": categoria_elegida, "macro": macro_objetivo}).fetchall()
-        
-    # Fallback de seguridad blindado con el mismo COALESCE de imagen
-    if not resultados:
-        with engine.connect() as conn:
-            fb_sql = text("""
-                SELECT v.sku, p.nombre, p.marca, p.modelo, p.categoria, 
-                       COALESCE(p.macro_categoria, 'Lentes') AS macro_categoria, 
-                       p.color_principal, g.nombre_grupo, g.descripcion AS descripcion_grupo, 
-                       v.stock_interno, 
-                       COALESCE(NULLIF(TRIM(v.url_imagen), ''), NULLIF(TRIM(p.url_imagen), '')) AS imagen
-                FROM Productos p
-                JOIN Variantes v ON p.id_producto = v.id_producto
-                LEFT JOIN Grupos_Productos g ON v.id_grupo = g.id_grupo
-                WHERE COALESCE(p.macro_categoria, 'Lentes') = :macro AND v.stock_interno > 0 
-                LIMIT 50
-            """)
-            resultados = conn.execute(fb_sql, {"macro": macro_objetivo}).fetchall()
-            
-        if not resultados:
-            return None 
-
-    opciones = []
-    pesos_stock = []
-    for row in resultados:
-        opciones.append(row)
-        pesos_stock.append(row.stock_interno) 
-        
-    producto_elegido = random.choices(opciones, weights=pesos_stock, k=1)[0]
-    
+        indice = obtener_indice(conn)
+        recientes = {r[0] for r in conn.execute(text("SELECT DISTINCT sku FROM Historial_Estados WHERE fecha_publicacion > NOW() - INTERVAL '14 days'"))}
+
+    # 2. Sorteo ponderado por stock dentro de la subcategoría, sin repetir lo publicado en 14 días
+    producto_elegido = indice.elegir_en_grupo((macro_objetivo.lower(), categoria_elegida.lower()), excluir=recientes, con_foto=False, por_stock=True)
+
+    # Fallback de seguridad: cualquier producto con stock de la línea de negocio
+    if not producto_elegido:
+        candidatos = [i for clave, g in indice.grupos.items() if clave[0] == macro_objetivo.lower() for i in g["todos"]]
+        if not candidatos:
+            return None
+        producto_elegido = random.choices(candidatos, weights=[i["stock_interno"] for i in candidatos], k=1)[0]
+
+    macro_elegida = producto_elegido['macro_categoria'] or 'Lentes'
     datos_producto = {
-        'categoria': producto_elegido.categoria,
-        'macro_categoria': producto_elegido.macro_categoria, # <-- Vital para que el generador inteligente sepa qué es
-        'marca': producto_elegido.marca,
-        'modelo': producto_elegido.modelo,
-        'nombre': producto_elegido.nombre,
-        'sku': producto_elegido.sku,
-        'color_principal': producto_elegido.color_principal
+        'categoria': producto_elegido['categoria'],
+        'macro_categoria': macro_elegida, # <-- Vital para que el generador inteligente sepa qué es
+        'marca': producto_elegido['marca'],
+        'modelo': producto_elegido['modelo'],
+        'nombre': producto_elegido['nombre'],
+        'sku': producto_elegido['sku'],
+        'color_principal': producto_elegido['color_principal']
     }
     nombre_final = generar_nombre_inteligente(datos_producto)
 
     return {
-        "sku": producto_elegido.sku,
+        "sku": producto_elegido['sku'],
         "nombre": nombre_final,
-        "macro_categoria": producto_elegido.macro_categoria,
-        "color_principal": producto_elegido.color_principal,
-        "grupo": producto_elegido.nombre_grupo,
-        "descripcion_grupo": producto_elegido.descripcion_grupo,
-        "stock": producto_elegido.stock_interno,
-        "imagen": producto_elegido.imagen # <-- Ahora sí despacha la foto resuelta exacta
+        "macro_categoria": macro_elegida,
+        "color_principal": producto_elegido['color_principal'],
+        "grupo": producto_elegido['nombre_grupo'],
+        "descripcion_grupo": producto_elegido['descripcion_grupo'],
+        "stock": producto_elegido['stock_interno'],
+        "imagen": producto_elegido['imagen'] # <-- Ahora sí despacha la foto resuelta exacta
     }
 
 # ==============================================================================
@@ -659,7 +644,7 @@ def generar_nombre_inteligente(row):
         txt = str(val).strip()
         return '' if txt.lower() == 'nan' else txt
 
-    macro = _get_str('macro_categoria')
+    macro = _get_str('linea_negocio') or _get_str('macro_categoria')
     categoria = _get_str('categoria')
     marca = _get_str('marca')
     modelo = _get_str('modelo')
@@ -667,8 +652,8 @@ def generar_nombre_inteligente(row):
     sku = _get_str('sku')
 
     # Fallback de rescate por si la consulta SQL omitió jalar la columna macro
-    if not macro:
-        macro = 'Pelucas' if sku.upper().startswith(('WB-', 'WIG-')) else 'Lentes'
+    if macro not in (linea_negocio.PELUCAS, linea_negocio.LENTES):
+        macro = linea_negocio.clasificar(macro, sku)
 
     # =====================================================================
     # 2. MOTOR DE PREFIJOS DINÁMICO POR LÍNEA DE NEGOCIO
@@ -721,6 +706,58 @@ def generar_nombre_inteligente(row):
     # Adosamos el código SKU final
     return f"{nombre_base} ({sku})".strip() if sku else nombre_base.strip()
 
+def generar_nombres_inteligentes(df):
+    """
+    Versión por columnas de generar_nombre_inteligente para tablas enteras (grilla de
+    inventario): mismas reglas y mismo resultado, pero con operaciones de texto de
+    pandas sobre cada columna en vez de un apply fila por fila. Devuelve una Series
+    alineada con df.index. bench_nombres.py verifica que ambas coincidan.
+    """
+    def _col(key):
+        if key not in df:
+            return pd.Series('', index=df.index, dtype='str')
+        val = df[key]
+        txt = val.astype(str).str.strip()
+        return txt.where(val.notna() & (txt.str.lower() != 'nan'), '')
+
+    categoria, marca, modelo, nombre, sku = (_col(k) for k in ('categoria', 'marca', 'modelo', 'nombre', 'sku'))
+    linea = _col('linea_negocio')
+    macro = linea.where(linea != '', _col('macro_categoria'))
+
+    # Misma regla que linea_negocio.clasificar() para lo que no venga ya clasificado
+    es_peluca = macro == linea_negocio.PELUCAS
+    sin_clasificar = ~macro.isin([linea_negocio.PELUCAS, linea_negocio.LENTES])
+    es_peluca |= sin_clasificar & (macro.str.lower().str.startswith('peluca') |
+                                   sku.str.upper().str.startswith(linea_negocio.PREFIJOS_PELUCA))
+
+    # Prefijos por línea de negocio (ver generar_nombre_inteligente)
+    cat_low = categoria.str.lower()
+    marca_generica = marca.str.lower().isin(['pelucat', 'genérico', 'generico', ''])
+    prefijo = pd.Series(np.select(
+        [es_peluca & cat_low.str.contains('natural', regex=False) & ~marca_generica,
+         es_peluca & cat_low.str.contains('natural', regex=False),
+         es_peluca & cat_low.str.contains('fantas|cosplay|lace', regex=True),
+         ~es_peluca & (categoria == 'Estilo Natural'),
+         ~es_peluca & (categoria == 'Estilo Fantasía')],
+        [marca, 'Peluca', 'Peluca', marca, 'Lente'],
+        default=''), index=df.index, dtype='str')
+
+    # Ensamblaje: un modelo que ya empieza con el prefijo lo absorbe
+    absorbe = np.char.startswith(modelo.str.lower().to_numpy(dtype=str), prefijo.str.lower().to_numpy(dtype=str))
+    con_prefijo, con_modelo = prefijo != '', modelo != ''
+    inicio = pd.Series(np.select(
+        [con_prefijo & con_modelo & absorbe, con_prefijo & con_modelo, con_prefijo],
+        [modelo, prefijo + ' ' + modelo, prefijo],
+        default=modelo), index=df.index, dtype='str')
+
+    con_inicio, con_nombre = inicio != '', nombre != ''
+    nombre_base = pd.Series(np.select(
+        [con_inicio & con_nombre, con_inicio, con_nombre],
+        [inicio + ' - ' + nombre, inicio, nombre],
+        default='Artículo sin título'), index=df.index, dtype='str')
+
+    return (nombre_base + (' (' + sku + ')').where(sku != '', '')).str.strip()
+
 def determinar_sesiones_para_estado(prob_lentes, prob_principal):
     """
     Determina qué sesiones de WhatsApp deben publicar el estado basándose
@@ -747,51 +784,33 @@ def buscar_producto_aleatorio_en_stock(conn, macro_categoria, subcategorias_perm
     if not subcategorias_permitidas:
         return None
 
-    lista_clean = [s.strip().lower() for s in subcategorias_permitidas]
-    lista_sql = ', '.join([f"'{s}'" for s in lista_clean])
-
-    query_principal = text(f"""
-        SELECT
-            p.id_producto, p.marca, p.modelo, p.nombre, p.categoria,
-            p.url_imagen, -- <--- De vuelta estrictamente a la foto del Padre
-            v.sku, v.precio
-        FROM Variantes v
-        JOIN Productos p ON v.id_producto = p.id_producto
-        WHERE TRIM(p.macro_categoria) ILIKE :macro
-          AND LOWER(TRIM(p.categoria)) IN ({lista_sql})
-          AND COALESCE(v.stock_interno, 0) > 0
-          AND p.url_imagen IS NOT NULL
-          AND TRIM(p.url_imagen) != ''
-        ORDER BY RANDOM()
-        LIMIT 1
-    """)
+    lista_clean = {s.strip().lower() for s in subcategorias_permitidas}
+    macro_clean = macro_categoria.strip().lower()
+    indice = obtener_indice(conn)
+    campos = ("id_producto", "marca", "modelo", "nombre", "categoria", "url_imagen", "sku", "precio")
 
-    row = conn.execute(query_principal, {"macro": f"%{macro_categoria.strip()}%"}).fetchone()
-    if row: return dict(row._mapping)
+    def al_azar(condicion):
+        grupos = [g["con_foto"] for clave, g in indice.grupos.items() if g["con_foto"] and condicion(clave)]
+        if not grupos:
+            return None
+        # Uniforme sobre los productos (no sobre los grupos), como el ORDER BY RANDOM() anterior
+        grupo = random.choices(grupos, weights=[len(g) for g in grupos], k=1)[0]
+        item = random.choice(grupo)
+        return {k: item[k] for k in campos}
+
+    producto = al_azar(lambda clave: macro_clean in clave[0] and clave[1] in lista_clean)
+    if producto: return producto
 
     # --- FALLBACK DE RESCATE ---
     if macro_categoria == 'Pelucas':
-        query_rescate = text("""
-            SELECT p.id_producto, p.marca, p.modelo, p.nombre, p.categoria,
-                   p.url_imagen, v.sku, v.precio
-            FROM Variantes v
-            JOIN Productos p ON v.id_producto = p.id_producto
-            WHERE p.macro_categoria ILIKE '%peluca%'
-              AND COALESCE(v.stock_interno, 0) > 0
-              AND p.url_imagen IS NOT NULL
-              AND TRIM(p.url_imagen) != ''
-            ORDER BY RANDOM()
-            LIMIT 1
-        """)
-
-        row_rescate = conn.execute(query_rescate).fetchone()
-        if row_rescate: return dict(row_rescate._mapping)
+        return al_azar(lambda clave: 'peluca' in clave[0])
 
     return None
 
-def obtener_festividad_cercana():
+def _festividad_cercana():
     """
     Calcula si hay una festividad comercial importante en los próximos 20 días en Perú.
+    Devuelve (nombre, días que faltan) o (None, None).
     """
     hoy = datetime.now().date()
     
@@ -817,27 +836,56 @@ def obtener_festividad_cercana():
 
         # Si estamos a 20 días o menos de la fecha clave, alertamos a la IA
         if 0 <= diferencia <= 20:
-            return f"🚨 CONTEXTO DE TEMPORADA OBLIGATORIO: Estamos a {diferencia} días de {fest['nombre']}. Adapta el tono de tu mensaje sutilmente a esta festividad para generar más deseo de compra."
+            return fest['nombre'], diferencia
             
-    return "" # Días normales sin festividades
+    return None, None # Días normales sin festividades
 
-def generar_texto_producto_ia(producto, es_estado=False, cliente_info=None):
+def obtener_festividad_cercana():
+    """Texto de contexto de temporada para el prompt (vacío en días normales)."""
+    nombre, diferencia = _festividad_cercana()
+    if not nombre:
+        return ""
+    return f"🚨 CONTEXTO DE TEMPORADA OBLIGATORIO: Estamos a {diferencia} días de {nombre}. Adapta el tono de tu mensaje sutilmente a esta festividad para generar más deseo de compra."
+
+# Prompts del panel: se releen como mucho una vez por minuto (antes, en cada copy)
+_prompts_campana = {"valor": ("", ""), "leido": 0.0}
+# Ollama es local y procesa de a pocos: nunca más de N redacciones simultáneas
+_semaforo_ollama = threading.BoundedSemaphore(int(os.getenv("OLLAMA_CONCURRENCIA", "2")))
+# El semáforo es por proceso: la pregeneración además toma este candado de la BD (un solo proceso a la vez)
+_CANDADO_PREGENERAR = 41043
+
+def _leer_prompts_campana():
+    import time
+    if time.monotonic() - _prompts_campana["leido"] < 60:
+        return _prompts_campana["valor"]
+    prompt_estado, prompt_dm = "", ""
+    try:
+        with engine.connect() as conn:
+            config = conn.execute(text("SELECT prompt_estado, prompt_dm FROM Configuracion_Campanas LIMIT 1")).fetchone()
+            if config:
+                prompt_estado = config.prompt_estado if 'prompt_estado' in config._mapping else ""
+                prompt_dm = config.prompt_dm if 'prompt_dm' in config._mapping else ""
+    except Exception as e:
+        pass # Fallback silencioso si las columnas aún no existen
+    _prompts_campana.update(valor=(prompt_estado or "", prompt_dm or ""), leido=time.monotonic())
+    return _prompts_campana["valor"]
+
+def _preparar_copy_producto(producto, es_estado=False):
     """
-    Genera copys persuasivos con IA local (Ollama).
-    Ahora incluye lectura de Prompts Dinámicos, Contexto de Festividades, 
-    Enfoques de Base de Datos y salida doble (WhatsApp + Meta).
+    Arma el prompt y el texto de reserva de un producto, más la llave con la que
+    su copy se guarda en el pool (sku, versión del prompt, modo, festividad).
     """
 
-    ollama_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
-    modelo_ia = os.getenv("OLLAMA_MODEL", "llama3.1")
-    url_ia = f"{ollama_url.rstrip('/')}/api/generate"
+    # Varios modelos separados por coma = prueba A/B (ver métricas en Diagnóstico)
+    modelos_ia = [m.strip() for m in os.getenv("OLLAMA_MODEL", "llama3.1").split(",") if m.strip()] or ["llama3.1"]
+    modelo_ia = random.choice(modelos_ia)
     
     # 1. Resolución de Línea de Negocio y Tienda
-    macro = producto.get('macro_categoria')
+    macro = producto.get('linea_negocio') or producto.get('macro_categoria')
     sku = str(producto.get('sku', '')).strip()
     
-    if not macro or str(macro).lower() in ['none', 'nan', '']:
-        macro = 'Pelucas' if sku.upper().startswith(('WB-', 'WIG-')) else 'Lentes'
+    if macro not in (linea_negocio.PELUCAS, linea_negocio.LENTES):
+        macro = linea_negocio.clasificar(None if str(macro).lower() in ['none', 'nan', ''] else macro, sku)
 
     if macro == 'Pelucas':
         tienda_actual = "pelucat.pe"
@@ -864,13 +912,10 @@ def generar_texto_producto_ia(producto, es_estado=False, cliente_info=None):
     enlace_compra = str(enlace_tienda).strip() if enlace_tienda and str(enlace_tienda).strip() != "" else f"https://{tienda_actual}/producto/{sku}"
     txt_precio = f"a solo S/ {precio}" if precio else ""
 
-    # 3. Contextos Adicionales (Festividades, CRM y Enfoque Psicológico DB)
+    # 3. Contextos Adicionales (Festividades y Enfoque Psicológico DB)
+    nombre_festividad, _ = _festividad_cercana()
     contexto_festividad = obtener_festividad_cercana()
     
-    notas_crm = ""
-    if cliente_info and cliente_info.get('etiquetas'):
-        notas_crm = f"\n    INTERESES REGISTRADOS DEL CLIENTE: '{cliente_info['etiquetas']}' (Haz una mención muy natural a esto)."
-
     # --- NUEVA CONEXIÓN DINÁMICA: Leemos la descripción que pusiste en el Panel ---
     enfoque_db = producto.get('enfoque_ia')
     if enfoque_db and str(enfoque_db).strip() != "":
@@ -880,16 +925,7 @@ def generar_texto_producto_ia(producto, es_estado=False, cliente_info=None):
     # -----------------------------------------------------------------------------
 
     # 4. Obtener el Prompt Personalizado desde la Base de Datos
-    prompt_personalizado_estado = ""
-    prompt_personalizado_dm = ""
-    try:
-        with engine.connect() as conn:
-            config = conn.execute(text("SELECT prompt_estado, prompt_dm FROM Configuracion_Campanas LIMIT 1")).fetchone()
-            if config:
-                prompt_personalizado_estado = config.prompt_estado if 'prompt_estado' in config._mapping else ""
-                prompt_personalizado_dm = config.prompt_dm if 'prompt_dm' in config._mapping else ""
-    except Exception as e:
-        pass # Fallback silencioso si las columnas aún no existen
+    prompt_personalizado_estado, prompt_personalizado_dm = _leer_prompts_campana()
 
 # 5. Bifurcación del Prompt (BLINDAJE JSON Y ANTI-CONFUSIÓN)
     regla_anti_confusion = f"""
@@ -930,7 +966,6 @@ def generar_texto_producto_ia(producto, es_estado=False, cliente_info=None):
         
         PRODUCTO: {titulo_prod} {txt_precio}
         ENLACE DE COMPRA: {enlace_compra}
-        {notas_crm}
         {contexto_festividad}
         ESTRATEGIA DE PERSUASIÓN: {enfoque}
         
@@ -943,113 +978,192 @@ def generar_texto_producto_ia(producto, es_estado=False, cliente_info=None):
         {{"mensaje": ["¡Atrae todas las miradas con el tono más vibrante de la temporada!", "El acabado de {titulo_prod} te dará un nivel de realismo increíble...", "Consíguelo hoy {txt_precio} pidiéndolo directamente aquí: {enlace_compra}", "{cross_selling}"]}}
         """
         texto_reserva = f"¡Mira el hermoso modelo que acaba de reingresar a nuestro almacén!\n\n⭐ **{titulo_prod}** {txt_precio}.\n\nPuedes revisar fotos reales y pedirlo directo aquí:\n👉 {enlace_compra}\n\n{cross_selling}"
-    # 6. Petición a Ollama
-    try:
-        # 🔴 CAMBIO 1: Aumentamos la paciencia de Python a 120 segundos
-        response = requests.post(url_ia, json={"model": modelo_ia, "prompt": prompt, "stream": False, "format": "json"}, timeout=120)
-        
-        if response.status_code == 200:
-            texto_crudo = response.json().get("response", "").strip()
-            
-            # 🔴 CAMBIO 2: Blindaje de lectura JSON para detectar si la IA alucina
-            try:
-                datos_json = json.loads(texto_crudo)
-            except json.JSONDecodeError:
-                print(f"   ⚠️ [Aviso IA] Ollama no devolvió un JSON válido. Texto recibido: {texto_crudo}")
-                return texto_reserva
-
-            if es_estado:
-                return {
-                    "estado_whatsapp": datos_json.get("estado_whatsapp", texto_reserva["estado_whatsapp"]),
-                    "post_facebook": datos_json.get("post_facebook", texto_reserva["post_facebook"])
-                }
-            else:
-                parrafos = datos_json.get("mensaje", [])
-                texto_final = "\n\n".join(parrafos) if isinstance(parrafos, list) else str(parrafos)
-                return texto_final.strip() if len(texto_final) > 12 else texto_reserva
-        else:
-            print(f"   ⚠️ [Aviso IA] Ollama respondió HTTP {response.status_code}. Revisa si el modelo '{modelo_ia}' existe.")
-            
-    except requests.exceptions.Timeout:
-        print(f"   ⚠️ [Aviso IA] TIMEOUT: Ollama tardó más de 120 segundos en redactar el mensaje.")
-    except requests.exceptions.ConnectionError:
-        print(f"   ⚠️ [Aviso IA] CONEXIÓN RECHAZADA: Ollama está apagado. (Ejecuta 'systemctl start ollama')")
-    except Exception as e:
-        print(f"   ⚠️ [Aviso IA] Error desconocido: {e}")
 
-    return texto_reserva
+    # 6. Llave del pool: cambia si cambian los modelos configurados, el prompt del panel o los datos
+    # del producto. El modelo sorteado para esta redacción no entra: cualquier copy del pool sirve
+    huella = json.dumps([sorted(modelos_ia), base_instruct, titulo_prod, txt_precio, enlace_compra, desc_grupo, enfoque, macro], ensure_ascii=False)
+    return {
+        "prompt": prompt, "reserva": texto_reserva, "modelo": modelo_ia, "es_estado": es_estado,
+        "sku": sku, "modo": "estado" if es_estado else "dm", "festividad": nombre_festividad or "",
+        "version": hashlib.md5(huella.encode("utf-8")).hexdigest()
+    }
+
+def _redactar_con_ollama(pedido):
+    """Pide el copy a Ollama (streaming + validación del JSON). Devuelve el copy listo o None si la IA falló."""
+    with _semaforo_ollama:
+        datos_json = cliente_llm.generar_json(pedido["modelo"], pedido["prompt"], pedido["modo"], timeout=120)
+    if datos_json is None:
+        return None
+
+    if pedido["es_estado"]:
+        return {"estado_whatsapp": datos_json["estado_whatsapp"], "post_facebook": datos_json["post_facebook"]}
+    texto_final = "\n\n".join(p.strip() for p in datos_json["mensaje"] if isinstance(p, str) and p.strip())
+    return texto_final if len(texto_final) > 12 else None
+
+def _redactar_y_guardar(pedido, usos=0):
+    copy = _redactar_con_ollama(pedido)
+    if copy is not None:
+        copys_ia.guardar_copy(pedido["sku"], pedido["version"], pedido["modo"], pedido["festividad"], copy, usos=usos)
+    return copy
+
+_redactando = set()  # Llaves del pool que ya tienen una redacción en segundo plano
+_lock_redactando = threading.Lock()
+
+def _redactar_en_fondo(pedido):
+    llave = (pedido["sku"], pedido["version"], pedido["modo"], pedido["festividad"])
+    with _lock_redactando:
+        if llave in _redactando:
+            return
+        _redactando.add(llave)
+
+    def trabajo():
+        try:
+            _redactar_y_guardar(pedido)
+        finally:
+            with _lock_redactando:
+                _redactando.discard(llave)
+
+    threading.Thread(target=trabajo, daemon=True).start()
+
+def generar_texto_producto_ia(producto, es_estado=False):
+    """
+    Genera copys persuasivos con IA local (Ollama).
+    Ahora incluye lectura de Prompts Dinámicos, Contexto de Festividades, 
+    Enfoques de Base de Datos y salida doble (WhatsApp + Meta).
+
+    Sirve del pool pregenerado (instantáneo). Si el pool está vacío se entrega al
+    momento el texto de reserva y el copy se redacta en segundo plano para la
+    próxima vez: un envío nunca espera a Ollama.
+    Los copys del pool son genéricos por producto: no llevan las etiquetas del cliente.
+    """
+    pedido = _preparar_copy_producto(producto, es_estado)
+
+    copy = copys_ia.tomar_copy(pedido["sku"], pedido["version"], pedido["modo"], pedido["festividad"])
+    if copy is not None:
+        return copy
+
+    print(f"   ⏳ [Aviso IA] Sin copy en el pool para {pedido['sku']}: se usa el texto de reserva y se redacta uno para la próxima vez.")
+    _redactar_en_fondo(pedido)
+    return pedido["reserva"]
+
+def pregenerar_copys_ia(cantidad=20, max_hilos=None, columnas=None):
+    """
+    Llena el pool de copys para los SKUs que el bot probablemente elegirá pronto
+    (muestreados con los mismos pesos del índice de selección). Pensado para el
+    tiempo muerto del bot y para el cron: la concurrencia contra Ollama la limita
+    el mismo semáforo que usan los envíos. Si otro proceso ya está pregenerando
+    no hace nada (pg_try_advisory_lock) y devuelve 0.
+    """
+    # Candado de sesión en una conexión en autocommit: no deja una transacción abierta
+    # (idle in transaction) durante los minutos que tarda la pregeneración
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn_candado:
+        if not conn_candado.execute(text(f"SELECT pg_try_advisory_lock({_CANDADO_PREGENERAR})")).scalar():
+            print("⏳ [COPYS IA] Otro proceso ya está pregenerando copys.")
+            return 0
+        try:
+            return _pregenerar(cantidad, max_hilos, columnas)
+        finally:
+            conn_candado.execute(text(f"SELECT pg_advisory_unlock({_CANDADO_PREGENERAR})"))
+
+def _pregenerar(cantidad, max_hilos, columnas):
+    columnas = columnas or ["prob_msg_principal", "prob_msg_default", "prob_est_principal", "prob_est_default"]
+    max_hilos = max_hilos or int(os.getenv("OLLAMA_CONCURRENCIA", "2"))
+
+    pedidos = []
+    indice = obtener_indice()
+    for item, columna in copys_ia.muestrear_skus_probables(indice, columnas, cantidad):
+        pedido = _preparar_copy_producto(indice.ficha_marketing(item), es_estado=('_msg_' not in columna))
+        pedidos += [pedido] * copys_ia.faltantes(pedido["sku"], pedido["version"], pedido["modo"], pedido["festividad"])
+
+    if not pedidos:
+        return 0
+    with ThreadPoolExecutor(max_workers=max_hilos) as pool:
+        generados = sum(1 for copy in pool.map(_redactar_y_guardar, pedidos) if copy is not None)
+    print(f"📝 [COPYS IA] {generados}/{len(pedidos)} copys pregenerados para {len({p['sku'] for p in pedidos})} SKUs.")
+    return generados
+# ==============================================================================
+# 🧵 PROGRESO DE TRABAJOS EN SEGUNDO PLANO (ver trabajos.py)
+# ==============================================================================
+try:
+    _fragmento_trabajo = st.fragment(run_every=2)
+except AttributeError:
+    _fragmento_trabajo = lambda f: f
+
+def _pintar_trabajo(tipo, id_trabajo, datos, mostrar_datos):
+    if datos['estado'] in ('pendiente', 'corriendo'):
+        c_barra, c_boton = st.columns([5, 1])
+        c_barra.progress(min(datos['progreso'] or 0, 100) / 100.0, text=f"⏳ Trabajo #{id_trabajo}: {datos['mensaje']}")
+        if datos['cancelar']:
+            c_boton.caption("Cancelando...")
+        elif c_boton.button("🛑 Cancelar", key=f"cancelar_{tipo}_{id_trabajo}"):
+            trabajos.cancelar(id_trabajo)
+    elif datos['estado'] == 'completado':
+        st.success(f"✅ Trabajo #{id_trabajo} completado ({datos['terminado']:%d/%m %H:%M}).")
+    elif datos['estado'] == 'cancelado':
+        st.warning(f"🛑 Trabajo #{id_trabajo} cancelado.")
+    else:
+        st.error(f"🔥 Trabajo #{id_trabajo} falló: {datos['mensaje']}")
+
+    if mostrar_datos:
+        mostrar_datos(datos)
+
+@_fragmento_trabajo
+def _panel_trabajo(tipo, mostrar_datos):
+    # Solo se monta con un trabajo en curso. Al terminar se recarga la página entera:
+    # los reportes de abajo se actualizan y el panel queda fijo, sin consultar cada 2 s
+    id_trabajo = trabajos.ultimo(tipo)
+    datos = trabajos.consultar(id_trabajo) if id_trabajo else None
+    if not datos or datos['estado'] not in ('pendiente', 'corriendo'):
+        st.rerun()
+    _pintar_trabajo(tipo, id_trabajo, datos, mostrar_datos)
+
+def render_trabajo(tipo, mostrar_datos=None):
+    """
+    Muestra el último trabajo de `tipo`; mientras está pendiente o corriendo se refresca
+    solo cada 2 s. `mostrar_datos(datos)` pinta el parcial o el resultado (datos de
+    trabajos.consultar).
+    """
+    id_trabajo = trabajos.ultimo(tipo)
+    if not id_trabajo:
+        return
+    datos = trabajos.consultar(id_trabajo)
+    if datos['estado'] in ('pendiente', 'corriendo'):
+        _panel_trabajo(tipo, mostrar_datos)
+    else:
+        _pintar_trabajo(tipo, id_trabajo, datos, mostrar_datos)
+
+def encolar_unico(tipo, **parametros):
+    """Encola el trabajo salvo que ya haya uno igual en curso. Devuelve True si lo encoló."""
+    if trabajos.ultimo(tipo, activos=True):
+        st.warning("⏳ Ya hay un trabajo de este tipo en curso; espera a que termine o cancélalo.")
+        return False
+    trabajos.encolar(tipo, **parametros)
+    return True
+
 # ==============================================================================
 # HERRAMIENTA DE SINCRONIZACIÓN MASIVA GOOGLE
 # ==============================================================================
+def _mostrar_vinculacion_google(datos):
+    resultado = datos['resultado']
+    if not resultado:
+        return
+    if resultado['omisiones']:
+        st.markdown("##### 🔍 Detalles del proceso:")
+        for msg in resultado['omisiones']:
+            st.warning(msg)
+    st.success(f"¡Sincronización completada! Se vincularon {resultado['vinculados']} clientes con éxito.")
+
+def render_vinculacion_google(etiqueta="🚀 Vincular Clientes Antiguos"):
+    """Botón que encola la vinculación masiva (tarea vincular_google) y el progreso del último trabajo."""
+    if st.button(etiqueta):
+        encolar_unico("vincular_google")
+    render_trabajo("vincular_google", _mostrar_vinculacion_google)
+
 def render_sincronizacion_masiva():
-    import time
     with st.expander("🔄 Sincronización Masiva con Google Contacts", expanded=False):
         st.info("💡 **Sincronización de Historial:** Esta herramienta busca todos los clientes activos que no están vinculados con Google Contacts para registrarlos y asociar su ID permanentemente.")
-        if st.button("🚀 Vincular Clientes Antiguos"):
-            with st.spinner("Sincronizando historial..."):
-                try:
-                    with engine.connect() as conn:
-                        df_sin_sync = pd.read_sql(text("""
-                            SELECT c.id_cliente, c.nombre_corto, 
-                                   (SELECT telefono FROM telefonoscliente WHERE id_cliente = c.id_cliente AND es_principal = TRUE AND activo = TRUE LIMIT 1) as tel_prin
-                            FROM clientes c 
-                            WHERE c.activo=TRUE AND (c.google_id IS NULL OR TRIM(c.google_id) = '')
-                        """), conn)
-                    
-                    if df_sin_sync.empty:
-                        st.success("¡Todos los clientes ya se encuentran vinculados o no hay clientes activos sin ID de Google!")
-                    else:
-                        cont = 0
-                        detalles_omisiones = []
-                        
-                        with engine.begin() as conn_tx:
-                            for idx, row in df_sin_sync.iterrows():
-                                id_cli = row['id_cliente']
-                                nombre = row['nombre_corto']
-                                tel = row['tel_prin']
-                                
-                                # Validación corregida para detectar valores nulos (NaN o vacíos)
-                                if pd.isna(tel) or str(tel).strip().lower() in ['nan', '']:
-                                    detalles_omisiones.append(f"⚠️ ID {id_cli} ({nombre}): No tiene teléfono principal asignado en el sistema.")
-                                    continue
-                                    
-                                norm = normalizar_telefono_maestro(tel)
-                                if not norm:
-                                    detalles_omisiones.append(f"⚠️ ID {id_cli} ({nombre}): Falló la normalización para el número '{tel}'.")
-                                    continue
-                                    
-                                tel_db = norm['db']
-                                tel_google = norm.get('google', tel_db)
-                                
-                                res_g = buscar_contacto_google(tel_db)
-                                g_id = None
-                                if res_g and res_g.get('encontrado'):
-                                    g_id = res_g['google_id']
-                                else:
-                                    if crear_en_google(nombre, "", tel_google):
-                                        res_g2 = buscar_contacto_google(tel_db)
-                                        if res_g2 and res_g2.get('encontrado'):
-                                            g_id = res_g2['google_id']
-                                        else:
-                                            detalles_omisiones.append(f"❌ ID {id_cli} ({nombre}): Se creó en Google pero buscar_contacto_google no recuperó el ID.")
-                                    else:
-                                        detalles_omisiones.append(f"❌ ID {id_cli} ({nombre}): La función crear_en_google devolvió False.")
-                                
-                                if g_id:
-                                    conn_tx.execute(text("UPDATE clientes SET google_id = :gid WHERE id_cliente = :id"), {"gid": g_id, "id": id_cli})
-                                    cont += 1
-                        
-                        if detalles_omisiones:
-                            st.markdown("##### 🔍 Detalles del proceso:")
-                            for msg in detalles_omisiones:
-                                st.warning(msg)
-                                
-                        st.success(f"¡Sincronización completada! Se vincularon {cont} clientes con éxito.")
-                        if cont > 0:
-                            time.sleep(2)
-                            st.rerun()
-                except Exception as e:
-                    st.error(f"Error en la sincronización masiva: {e}")
+        st.caption("Corre en segundo plano (trabajos.py): puedes cambiar de página mientras tanto.")
+        render_vinculacion_google()
 
 def obtener_historial_compras(telefono):
     """
@@ -1090,35 +1204,19 @@ def obtener_historial_compras(telefono):
 def subir_estado_whatsapp(session_name, texto, media_url=None, lista_contactos=None):
     """
     Sube un estado a WhatsApp. 
-    Convierte webp a JPEG y acepta una inyección de contactos directa 
-    (Bala de Plata) para evitar el problema de agenda vacía de NOWEB.
+    Convierte webp a JPEG (vía cache_imagenes, que guarda el resultado en disco) y acepta
+    una inyección de contactos directa (Bala de Plata) para evitar el problema de agenda vacía de NOWEB.
     """
-    import requests
-    import base64
-    from io import BytesIO
-    from PIL import Image
-    
-    url_estados = WAHA_URL.replace("3000", "3001")
-
     try:
         payload = {}
         if media_url:
             if media_url.lower().endswith('.mp4'):
-                endpoint = f"{url_estados}/api/{session_name}/status/video"
+                endpoint = f"/api/{session_name}/status/video"
                 payload = {"file": {"url": media_url}, "caption": texto if texto else ""}
             else:
-                endpoint = f"{url_estados}/api/{session_name}/status/image"
+                endpoint = f"/api/{session_name}/status/image"
                 try:
-                    resp_img = requests.get(media_url, timeout=15)
-                    resp_img.raise_for_status()
-                    
-                    img = Image.open(BytesIO(resp_img.content))
-                    if img.mode in ("RGBA", "P"):
-                        img = img.convert("RGB")
-                        
-                    buffer = BytesIO()
-                    img.save(buffer, format="JPEG", quality=90)
-                    img_b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+                    img_b64 = cache_imagenes.obtener_jpeg_b64(media_url)
                     
                     payload = {
                         "file": {
@@ -1132,21 +1230,17 @@ def subir_estado_whatsapp(session_name, texto, media_url=None, lista_contactos=N
                     print(f"⚠️ Error convirtiendo imagen: {e}")
                     payload = {"file": {"url": media_url}, "caption": texto if texto else ""}
         else:
-            endpoint = f"{url_estados}/api/{session_name}/status/text"
+            endpoint = f"/api/{session_name}/status/text"
             payload = {"text": texto}
 
         # 🔥 LA BALA DE PLATA: Inyectamos tu BD directamente a WAHA
         if lista_contactos and isinstance(lista_contactos, list):
             payload["contacts"] = lista_contactos
 
-        headers = {
-            "accept": "application/json",
-            "Content-Type": "application/json",
-            "X-Api-Key": WAHA_KEY  
-        }
-
         # ⏳ PACIENCIA EXTENDIDA A 120 SEGUNDOS POR LA ENCRIPTACIÓN MASIVA
-        response = requests.post(endpoint, json=payload, headers=headers, timeout=120)
+        tipo_estado = endpoint.rsplit('/', 1)[-1]
+        response = waha_estados.post(endpoint, json=payload, headers={"accept": "application/json"},
+                                     endpoint=f"POST /api/{{session}}/status/{tipo_estado}", timeout=120)
 
         if response.status_code in [200, 201]:
             return True, "Estado subido correctamente a WhatsApp."
@@ -1160,8 +1254,6 @@ def subir_estado_whatsapp(session_name, texto, media_url=None, lista_contactos=N
 
 def publicar_en_facebook_via_webhook(mensaje, url_imagen, webhook_url):
     """Sube el post a Facebook delegando la tarea a un Webhook de Make.com"""
-    import requests
-    
     if not webhook_url or "make.com" not in webhook_url:
          return False, "La URL del Webhook no parece válida."
 
@@ -1171,7 +1263,7 @@ def publicar_en_facebook_via_webhook(mensaje, url_imagen, webhook_url):
     }
     
     try:
-        response = requests.post(webhook_url, json=payload, timeout=10)
+        response = make.post(webhook_url, json=payload, endpoint="POST webhook Make.com", timeout=10)
         
         # Make.com devuelve 200 y el texto "Accepted" si todo va bien
         if response.status_code == 200:
@@ -1187,8 +1279,12 @@ def publicar_en_facebook_via_webhook(mensaje, url_imagen, webhook_url):
 def ejecutar_auditoria_bidireccional_woo(tienda_url, wc_key, wc_secret):
     """
     Sincroniza y audita SKUs entre la Base de Datos y WooCommerce en ambas direcciones.
-    Retorna un generador para actualizar la interfaz de Streamlit en tiempo real.
+    Retorna un generador para actualizar la interfaz de Streamlit en tiempo real:
+    recorre simples y variaciones con el mismo rastreador concurrente del sync de stock
+    y emite las discrepancias parciales a medida que llegan las páginas.
     """
+    from woo_catalogo import recorrer_catalogo_woo
+
     hora_inicio = datetime.now()
     yield {"estado": "inicio", "hora": hora_inicio.strftime("%H:%M:%S"), "progreso": 0, "msg": "Iniciando conexión con WooCommerce..."}
 
@@ -1202,66 +1298,74 @@ def ejecutar_auditoria_bidireccional_woo(tienda_url, wc_key, wc_secret):
             timeout=30
         )
 
-        # 2. Obtener SKUs de WordPress (Paginado para no saturar la memoria)
-        yield {"estado": "procesando", "progreso": 10, "msg": "Descargando catálogo de WordPress..."}
-        
-        wp_skus = set()
-        pagina = 1
-        while True:
-            # Traemos productos simples y padres
-            res = wcapi.get("products", params={"per_page": 100, "page": pagina})
-            if res.status_code != 200: break
-            
-            productos_wp = res.json()
-            if not productos_wp: break
-            
-            for p in productos_wp:
-                if p.get('sku'): wp_skus.add(str(p['sku']).strip())
-                # Si tiene variaciones, idealmente habría que iterarlas con wcapi.get(f"products/{p['id']}/variations")
-                # (Para este ejemplo asumimos que el SKU padre/simple basta o que tienes un endpoint custom)
-
-            pagina += 1
-            # Simulamos progreso de descarga WP (hasta un 40%)
-            progreso_actual = min(10 + (pagina * 5), 40)
-            yield {"estado": "procesando", "progreso": progreso_actual, "msg": f"Leyendo página {pagina} de WordPress..."}
-
-        # 3. Obtener SKUs de tu Base de Datos (PostgreSQL)
-        yield {"estado": "procesando", "progreso": 50, "msg": "Extrayendo inventario físico de la Base de Datos..."}
-        
+        # 2. Primero la Base de Datos (rápido): permite cruzar cada página apenas llega
+        yield {"estado": "procesando", "progreso": 5, "msg": "Extrayendo inventario físico de la Base de Datos..."}
+
         with engine.connect() as conn:
             # Traemos todos los SKUs activos
             query_db = text("SELECT sku FROM variantes WHERE sku IS NOT NULL AND TRIM(sku) != ''")
             db_skus = {str(row[0]).strip() for row in conn.execute(query_db).fetchall()}
 
+        # 3. Recorrer WordPress (simples + variaciones) cruzando en caliente
+        yield {"estado": "procesando", "progreso": 10, "msg": "Descargando catálogo de WordPress..."}
+
+        wp_skus = set()
+        faltan_en_db = set()
+        n_simples, n_variaciones = 0, 0
+
+        for paso in recorrer_catalogo_woo(wcapi):
+            nuevos_falta_db = []
+            for item in paso["items"]:
+                # Igual que el sync de stock: el padre variable no es un SKU vendible, sus variaciones sí
+                if item["tipo"] == "variable" or not item["sku"]:
+                    continue
+                if item["tipo"] == "variacion": n_variaciones += 1
+                else: n_simples += 1
+
+                sku = item["sku"]
+                wp_skus.add(sku)
+                if sku not in db_skus and sku not in faltan_en_db:
+                    faltan_en_db.add(sku)
+                    nuevos_falta_db.append({"sku": sku, "detalle": item["nombre"]})
+
+            # Progreso real según X-WP-Total (del 10% al 80%)
+            progreso_actual = 10 + int(70 * paso["paginas_hechas"] / max(paso["paginas_totales"], 1))
+            yield {
+                "estado": "procesando",
+                "progreso": min(progreso_actual, 80),
+                "msg": f"Página {paso['paginas_hechas']}/{paso['paginas_totales']} · {paso['productos_total']} productos y {paso['variaciones_total']} variaciones en la web...",
+                "nuevos_falta_db": nuevos_falta_db,
+                "pendientes_wp": len(db_skus - wp_skus)
+            }
+
         # 4. El Cruce de Datos (Magia de Conjuntos en Python)
-        yield {"estado": "procesando", "progreso": 70, "msg": "Cruzando información: DB vs WordPress..."}
-        
+        yield {"estado": "procesando", "progreso": 80, "msg": "Cruzando información: DB vs WordPress..."}
+
         faltan_en_wp = db_skus - wp_skus
-        faltan_en_db = wp_skus - db_skus
 
         # 5. Guardar Auditoría en PostgreSQL
         yield {"estado": "procesando", "progreso": 85, "msg": "Guardando reporte de discrepancias..."}
-        
+
         with engine.begin() as conn:
             # Limpiamos auditoría anterior de esta tienda
             conn.execute(text("DELETE FROM auditoria_skus_woo WHERE tienda = :t"), {"t": tienda_url})
-            
+
             # Insertar los que faltan en WP
-            for sku in faltan_en_wp:
+            if faltan_en_wp:
                 conn.execute(text("""
                     INSERT INTO auditoria_skus_woo (tienda, tipo_error, sku, detalle, fecha_deteccion) 
                     VALUES (:t, 'Falta en WP', :s, 'El SKU existe en local pero no está en la web', NOW())
-                """), {"t": tienda_url, "s": sku})
-                
+                """), [{"t": tienda_url, "s": sku} for sku in faltan_en_wp])
+
             # Insertar los que faltan en DB
-            for sku in faltan_en_db:
+            if faltan_en_db:
                 conn.execute(text("""
                     INSERT INTO auditoria_skus_woo (tienda, tipo_error, sku, detalle, fecha_deteccion) 
                     VALUES (:t, 'Falta en DB', :s, 'El SKU se vende en la web pero no existe en local', NOW())
-                """), {"t": tienda_url, "s": sku})
+                """), [{"t": tienda_url, "s": sku} for sku in faltan_en_db])
 
         # 6. Finalización
-        resumen = f"100% Inventario simple verificado. 100% Variaciones verificadas."
+        resumen = f"{n_simples} productos simples y {n_variaciones} variaciones verificados contra {len(db_skus)} SKUs locales."
         yield {
             "estado": "completado", 
             "progreso": 100, 
@@ -1272,4 +1376,4 @@ def ejecutar_auditoria_bidireccional_woo(tienda_url, wc_key, wc_secret):
         }
 
     except Exception as e:
-        yield {"estado": "error", "msg": str(e)}
\ No newline at end of file
+        yield {"estado": "error", "msg": str(e)}
@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# 1. Cargar entorno y base de datos
+ruta_env = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+load_dotenv(ruta_env)
+from database import engine
+
+import contactos_campana
+from woo_catalogo import LimitadorTasa
+
+# 2. Importar la verificación existente de WAHA
+try:
+    from utils import verificar_numero_waha
+except ImportError:
+    print("❌ Error: No se pudo importar verificar_numero_waha desde utils.py")
+    sys.exit(1)
+
+# ==============================================================================
+# 📇 VERIFICACIÓN MASIVA DE NÚMEROS EN WHATSAPP (FUERA DEL BOT)
+# ==============================================================================
+# Recorre telefonoscliente por lotes y guarda en contactos_campana si cada número
+# tiene WhatsApp, con vigencia (30 días si tiene, 7 si no). Así el bot ya no
+# consulta check-exists en el momento de enviar, y con CAMPANA_SOLO_VERIFICADOS=1
+# solo elige números confirmados.
+#
+# Un error de WAHA (timeout, sesión caída) no es un "no tiene WhatsApp": se anota
+# aparte y el número se reintenta en la siguiente corrida (tras 1 hora).
+#
+#   python verificar_numeros.py --lotes 10 --lote 100 --hilos 2 --por-segundo 0.5
+
+LOTE = 100
+HILOS = 2
+PETICIONES_POR_SEGUNDO = 0.5  # Ritmo prudente: check-exists también lo ve Meta
+
+
+def verificar_lote(pendientes, hilos, limitador):
+    """Verifica el lote con `hilos` consultas a la vez al ritmo del limitador. Devuelve (con, sin, errores)."""
+    def consultar(registro):
+        limitador.esperar()
+        try:
+            # Sin caché: se verifica porque el resultado guardado venció, no vale una respuesta vieja
+            return registro, verificar_numero_waha(registro.telefono, usar_cache=False)
+        except Exception as e:
+            print(f"  ❌ Error consultando {registro.telefono}: {e}")
+            return registro, None
+
+    conteo = {True: 0, False: 0, None: 0}
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        resultados = list(pool.map(consultar, pendientes))
+
+    # Un solo commit por lote en vez de uno por número
+    with engine.begin() as conn:
+        for registro, existe in resultados:
+            contactos_campana.guardar_verificacion(conn, registro.telefono, registro.id_cliente, existe)
+            conteo[existe] += 1
+    return conteo[True], conteo[False], conteo[None]
+
+
+def ejecutar_verificacion(max_lotes=None, lote=LOTE, hilos=HILOS, por_segundo=PETICIONES_POR_SEGUNDO):
+    print("📇 Iniciando verificación masiva de números en WhatsApp...")
+    limitador = LimitadorTasa(por_segundo)
+    totales = [0, 0, 0]
+    inicio = time.perf_counter()
+    n_lote = 0
+
+    while max_lotes is None or n_lote < max_lotes:
+        with engine.begin() as conn:
+            pendientes = contactos_campana.pendientes_de_verificar(conn, limite=lote)
+        if not pendientes:
+            print("✅ No quedan números pendientes de verificar.")
+            break
+
+        n_lote += 1
+        con, sin, errores = verificar_lote(pendientes, hilos, limitador)
+        totales = [totales[0] + con, totales[1] + sin, totales[2] + errores]
+        print(f"[Lote {n_lote}] ✅ {con} con WhatsApp | 🚫 {sin} sin WhatsApp | ⏳ {errores} errores de WAHA")
+
+        if errores == len(pendientes):
+            # WAHA no responde: seguir solo acumularía reintentos inútiles
+            print("🛑 Ninguna consulta del lote respondió. ¿WAHA está caído? Deteniendo...")
+            break
+
+    minutos = (time.perf_counter() - inicio) / 60
+    print("\n🏁 ======================================")
+    print("🏁 VERIFICACIÓN MASIVA TERMINADA")
+    print(f"🏁 Con WhatsApp: {totales[0]} | Sin WhatsApp: {totales[1]} | Errores: {totales[2]} | {minutos:.1f} min")
+    print("🏁 ======================================\n")
+    return totales
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica por lotes qué teléfonos de clientes tienen WhatsApp.")
+    parser.add_argument("--lotes", type=int, default=None, help="Máximo de lotes por corrida (por defecto, hasta terminar)")
+    parser.add_argument("--lote", type=int, default=LOTE)
+    parser.add_argument("--hilos", type=int, default=HILOS)
+    parser.add_argument("--por-segundo", type=float, default=PETICIONES_POR_SEGUNDO)
+    args = parser.parse_args()
+    ejecutar_verificacion(args.lotes, args.lote, args.hilos, args.por_segundo)
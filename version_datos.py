@@ -0,0 +1,139 @@
+import sys
+import time
+import threading
+from sqlalchemy import text
+from database import engine
+
+# ==============================================================================
+# 🔖 SELLOS DE VERSIÓN PARA LAS CACHÉS POR PROCESO
+# ==============================================================================
+# El índice de productos, la grilla de inventario y el tablero de seguimiento
+# guardan una foto por proceso y la descartan cuando cambian los datos. Antes
+# cada uno tenía una tabla de una fila que triggers por sentencia subían con
+# UPDATE: todas las escrituras de stock hacían cola en esas filas hasta el
+# COMMIT, y dos contadores tomados en orden cruzado (una venta y un guardado
+# de la grilla) podían acabar en deadlock.
+#
+# Ahora el sello es una SECUENCIA: nextval no bloquea filas ni espera a otras
+# transacciones. Los triggers son por fila, diferidos al COMMIT (CONSTRAINT
+# TRIGGER ... INITIALLY DEFERRED), y en UPDATE solo disparan si cambió alguna
+# columna que le importa a la caché (WHEN ... IS DISTINCT FROM ...). Así un
+# UPDATE que reescribe el mismo valor no invalida nada.
+#
+# nextval no es transaccional: entre el trigger diferido y el COMMIT hay un
+# instante en que el sello ya subió y los datos aún no se ven. Por eso una foto
+# con sello nunca vive más de VIDA_MAXIMA aunque el sello no cambie.
+
+VIDA_MAXIMA = 600
+
+
+class Sello:
+    """
+    Secuencia `nombre` que suben triggers en las tablas de `tablas`:
+    {tabla: None | [columnas] | "condición"}. Con None cualquier cambio de la fila
+    cuenta; con una lista, solo si cambió alguna de esas columnas; con un texto,
+    se usa tal cual como condición WHEN del UPDATE (puede usar OLD y NEW).
+    `obsoletos`: [(trigger, tabla)] del esquema anterior que se borran al preparar.
+    """
+
+    def __init__(self, nombre, tablas, obsoletos=(), tabla_obsoleta=None):
+        self.nombre = nombre
+        self.tablas = tablas
+        self.obsoletos = obsoletos
+        self.tabla_obsoleta = tabla_obsoleta
+        self._listo = False
+
+    def _condicion(self, regla):
+        if regla is None:
+            # Como texto: la fila puede tener columnas sin operador de igualdad (json)
+            return "OLD::text IS DISTINCT FROM NEW::text"
+        if isinstance(regla, str):
+            return regla
+        return f"({', '.join('OLD.' + c for c in regla)}) IS DISTINCT FROM ({', '.join('NEW.' + c for c in regla)})"
+
+    def preparar(self, conn):
+        """Crea secuencia y triggers si faltan. Devuelve True si la secuencia se creó ahora."""
+        if self._listo:
+            return False
+        nuevo = conn.execute(text("SELECT to_regclass(:s) IS NULL"), {"s": self.nombre}).scalar()
+        conn.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {self.nombre}"))
+        conn.execute(text("""
+            CREATE OR REPLACE FUNCTION fn_sello_datos() RETURNS trigger AS $$
+            BEGIN
+                PERFORM nextval(TG_ARGV[0]::regclass);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """))
+        existentes = {r[0] for r in conn.execute(text("SELECT tgname FROM pg_trigger WHERE NOT tgisinternal"))}
+        # Solo se borra lo que existe: DROP TRIGGER bloquea la tabla aunque lleve IF EXISTS
+        for trigger, tabla in self.obsoletos:
+            if trigger in existentes:
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger} ON {tabla}"))
+        if self.tabla_obsoleta and conn.execute(text("SELECT to_regclass(:t) IS NOT NULL"), {"t": self.tabla_obsoleta}).scalar():
+            conn.execute(text(f"DROP TABLE IF EXISTS {self.tabla_obsoleta}"))
+
+        for tabla, regla in self.tablas.items():
+            base = f"trg_{self.nombre}_{tabla.lower()}"
+            diferido = f"ON {tabla} DEFERRABLE INITIALLY DEFERRED FOR EACH ROW"
+            funcion = f"EXECUTE FUNCTION fn_sello_datos('{self.nombre}')"
+            if f"{base}_altas" not in existentes:
+                conn.execute(text(f"CREATE CONSTRAINT TRIGGER {base}_altas AFTER INSERT OR DELETE {diferido} {funcion}"))
+            if f"{base}_cambios" not in existentes:
+                conn.execute(text(f"CREATE CONSTRAINT TRIGGER {base}_cambios AFTER UPDATE {diferido} WHEN ({self._condicion(regla)}) {funcion}"))
+        self._listo = True
+        return bool(nuevo)
+
+    def leer(self, conn):
+        # last_value no toma candados: se lee aunque otra transacción esté escribiendo
+        return conn.execute(text(f"SELECT last_value FROM {self.nombre}")).scalar()
+
+
+class CacheVersionada:
+    """
+    Valores por clave compartidos por el proceso; se vacía entera cuando cambia el sello.
+    Sin sello (BD sin permisos o no PostgreSQL) cada valor dura `max_edad` segundos.
+    """
+
+    def __init__(self, sello, max_edad, etiqueta):
+        self.sello = sello
+        self.max_edad = max_edad
+        self.etiqueta = etiqueta
+        self._lock = threading.Lock()
+        self._valores = {}
+        self._version = None
+        self._cargado_en = 0.0
+
+    def version(self):
+        """Sello actual, o None si no se puede leer."""
+        try:
+            with engine.begin() as conn:
+                self.sello.preparar(conn)
+                return self.sello.leer(conn)
+        except Exception as e:
+            print(f"⚠️ [{self.etiqueta}] Sin sello de datos, se recarga cada {self.max_edad}s: {e}", file=sys.stderr)
+            return None
+
+    def obtener(self, clave, construir):
+        """Valor de `clave`; si la caché no está vigente (o no lo tiene) llama a `construir(version)`."""
+        version = self.version()
+        edad_maxima = VIDA_MAXIMA if version is not None else self.max_edad
+        with self._lock:
+            vigente = version == self._version and time.monotonic() - self._cargado_en < edad_maxima
+            if not vigente:
+                self._valores.clear()
+                self._version, self._cargado_en = version, time.monotonic()
+            elif clave in self._valores:
+                return self._valores[clave]
+
+        valor = construir(version)
+        with self._lock:
+            if self._version == version:
+                self._valores[clave] = valor
+        return valor
+
+    def invalidar(self):
+        """Descarta lo guardado en este proceso (los demás se enteran por el sello)."""
+        with self._lock:
+            self._valores.clear()
+            self._version, self._cargado_en = None, 0.0
@@ -3,6 +3,8 @@ import pandas as pd
 from sqlalchemy import text
 from streamlit import config
 from database import engine
+import contactos_campana
+import edicion_masiva
 import datetime
 
 def mostrar_indicador_suma(df, col_pri, col_len):
@@ -62,22 +64,12 @@ def render_campanas():
     opciones_frecuencia = ["cada 30 minutos", "cada hora", "cada 6 horas"]
 
     # --- LECTURA GLOBAL DE DATOS ---
-    with engine.connect() as conn:
+    with engine.begin() as conn:
         config = conn.execute(text("SELECT * FROM Configuracion_Campanas LIMIT 1")).fetchone()
         
-        # 1. Consultas de Mensajes DMs (⚠️ CORREGIDO: Sin doble resta de horas)
-        # Como los mensajes ya se guardan con hora peruana, solo pedimos "fecha::date"
-        env_principal = conn.execute(text("""
-            SELECT COUNT(*) FROM mensajes 
-            WHERE tipo = 'SALIENTE_BOT' AND session_name = 'principal' 
-              AND fecha::date = (NOW() - INTERVAL '5 hours')::date
-        """)).scalar() or 0
-        
-        env_lentes = conn.execute(text("""
-            SELECT COUNT(*) FROM mensajes 
-            WHERE tipo = 'SALIENTE_BOT' AND COALESCE(session_name, 'default') = 'default' 
-              AND fecha::date = (NOW() - INTERVAL '5 hours')::date
-        """)).scalar() or 0
+        # 1. Consultas de Mensajes DMs (por índice sobre contactos_campana, en hora peruana)
+        env_principal = contactos_campana.enviados_hoy(conn, 'principal')
+        env_lentes = contactos_campana.enviados_hoy(conn, 'default')
 
         # 2. Conteo Desglosado de Estados WSP hoy (Sí requiere resta porque se guardan en NOW() puro)
         query_est_hoy = text("""
@@ -98,25 +90,8 @@ def render_campanas():
         fb_counts = {str(row[0]): int(row[1]) for row in conn.execute(query_fb_hoy).fetchall()}
 
         # 4. Avance de Cobertura Base Clientes
-        query_avance = text("""
-            WITH enviados_recientes AS (
-                SELECT DISTINCT telefono FROM mensajes 
-                WHERE tipo = 'SALIENTE_BOT' AND fecha > (NOW() - INTERVAL '60 days')
-            )
-            SELECT 
-                SUM(CASE WHEN er.telefono IS NOT NULL THEN 1 ELSE 0 END) AS enviados_60d,
-                SUM(CASE WHEN er.telefono IS NULL THEN 1 ELSE 0 END) AS pendientes_60d
-            FROM Clientes c
-            JOIN telefonoscliente t ON c.id_cliente = t.id_cliente
-            LEFT JOIN enviados_recientes er ON t.telefono = er.telefono
-            WHERE c.activo = TRUE AND COALESCE(c.excluir_publicidad, FALSE) = FALSE
-              AND c.estado = 'Sin empezar'
-              AND t.activo = TRUE AND t.es_principal = TRUE AND length(t.telefono) > 6;
-        """)
-        row_avance = conn.execute(query_avance).fetchone()
+        a_enviados, b_pendientes = contactos_campana.resumen_cobertura(conn)
         
-    a_enviados = int(row_avance[0]) if row_avance and row_avance[0] else 0
-    b_pendientes = int(row_avance[1]) if row_avance and row_avance[1] else 0
     total_habilitados = a_enviados + b_pendientes
     c_porcentaje = (a_enviados / total_habilitados * 100.0) if total_habilitados > 0 else 0.0
 
@@ -207,20 +182,15 @@ def render_campanas():
         )
 
         if st.button("💾 Guardar Fechas Festivas", type="primary"):
+            # Las filas sin fecha o sin nombre se descartan (se borran si ya existían)
+            df_fest_ok = df_edit_fest[df_edit_fest['fecha'].notna() & df_edit_fest['nombre_evento'].notna()].copy()
+            df_fest_ok['descripcion'] = df_fest_ok['descripcion'].fillna("")
+            df_fest_ok['activo'] = df_fest_ok['activo'].fillna(False).astype(bool)
             with engine.begin() as conn_f:
-                conn_f.execute(text("DELETE FROM Festividades"))
-                for idx, row in df_edit_fest.iterrows():
-                    if pd.notna(row['fecha']) and pd.notna(row['nombre_evento']):
-                        conn_f.execute(text("""
-                            INSERT INTO Festividades (fecha, nombre_evento, descripcion, activo)
-                            VALUES (:f, :nom, :desc, :act)
-                        """), {
-                            "f": row['fecha'],
-                            "nom": row['nombre_evento'],
-                            "desc": row['descripcion'] if pd.notna(row['descripcion']) else "",
-                            "act": bool(row['activo'])
-                        })
-            st.success("✅ Calendario de eventos actualizado con éxito.")
+                res = edicion_masiva.sincronizar(conn_f, "Festividades", df_fest, df_fest_ok, "id", {
+                    "id": "INT", "fecha": "DATE", "nombre_evento": "TEXT", "descripcion": "TEXT", "activo": "BOOLEAN",
+                })
+            st.success(f"✅ Calendario actualizado: {res['insertadas']} nuevas, {res['actualizadas']} editadas, {res['borradas']} eliminadas.")
 
         st.write("")
         st.markdown("**📝 Descripciones de Subcategorías (Lectura IA)**")
@@ -240,11 +210,10 @@ def render_campanas():
             )
             
             if st.button("💾 Guardar Descripciones", type="primary"):
+                filas = edicion_masiva.cambiadas(df_desc, df_edit_desc, "id", ["descripcion_ia"]).fillna({"descripcion_ia": ""})
                 with engine.begin() as conn:
-                    for idx, row in df_edit_desc.iterrows():
-                        desc_val = row['descripcion_ia'] if pd.notna(row['descripcion_ia']) else ""
-                        conn.execute(text("UPDATE Subcategorias_Sistema SET descripcion_ia = :desc WHERE id = :id"), {"desc": desc_val, "id": row['id']})
-                st.success("✅ Descripciones de IA guardadas correctamente.")
+                    n = edicion_masiva.actualizar(conn, "Subcategorias_Sistema", filas, "id", {"id": "INT", "descripcion_ia": "TEXT"})
+                st.success(f"✅ Descripciones de IA guardadas ({n} subcategorías).")
 
     # ==========================================================================
     # PESTAÑA 2: MENSAJES DIRECTOS
@@ -292,10 +261,11 @@ def render_campanas():
             mostrar_indicador_suma(df_edit_msg, 'prob_msg_principal', 'prob_msg_default')
             
             if st.button("💾 Guardar Probabilidades (Mensajes)", type="primary"):
+                filas = edicion_masiva.cambiadas(df_prob_msg, df_edit_msg, "id", ["prob_msg_principal", "prob_msg_default"])
                 with engine.begin() as conn:
-                    for idx, row in df_edit_msg.iterrows():
-                        conn.execute(text("UPDATE Subcategorias_Sistema SET prob_msg_principal = :p1, prob_msg_default = :p2 WHERE id = :id"), {"p1": row['prob_msg_principal'], "p2": row['prob_msg_default'], "id": row['id']})
-                st.success("✅ Probabilidades de mensajes guardadas.")
+                    n = edicion_masiva.actualizar(conn, "Subcategorias_Sistema", filas, "id",
+                                                  {"id": "INT", "prob_msg_principal": "NUMERIC", "prob_msg_default": "NUMERIC"})
+                st.success(f"✅ Probabilidades de mensajes guardadas ({n} subcategorías).")
 
         st.divider()
         st.markdown("**🧠 Personalidad de IA para Mensajes**")
@@ -347,10 +317,11 @@ def render_campanas():
             mostrar_indicador_suma(df_edit_est, 'prob_est_principal', 'prob_est_default')
             
             if st.button("💾 Guardar Probabilidades (Estados)", type="primary"):
+                filas = edicion_masiva.cambiadas(df_prob_est, df_edit_est, "id", ["prob_est_principal", "prob_est_default"])
                 with engine.begin() as conn:
-                    for idx, row in df_edit_est.iterrows():
-                        conn.execute(text("UPDATE Subcategorias_Sistema SET prob_est_principal = :p1, prob_est_default = :p2 WHERE id = :id"), {"p1": row['prob_est_principal'], "p2": row['prob_est_default'], "id": row['id']})
-                st.success("✅ Probabilidades de estados guardadas.")
+                    n = edicion_masiva.actualizar(conn, "Subcategorias_Sistema", filas, "id",
+                                                  {"id": "INT", "prob_est_principal": "NUMERIC", "prob_est_default": "NUMERIC"})
+                st.success(f"✅ Probabilidades de estados guardadas ({n} subcategorías).")
 
         st.divider()
         st.markdown("**🧠 Personalidad de IA para Estados**")
@@ -416,14 +387,12 @@ def render_campanas():
             mostrar_indicador_suma_fb(df_edit_fb, 'prob_fb_general', 'prob_fb_pelucas', 'prob_fb_lentes')
             
             if st.button("💾 Guardar Probabilidades (Facebook)", type="primary"):
+                filas = edicion_masiva.cambiadas(df_prob_fb, df_edit_fb, "id", ["prob_fb_general", "prob_fb_pelucas", "prob_fb_lentes"])
                 with engine.begin() as conn:
-                    for idx, row in df_edit_fb.iterrows():
-                        conn.execute(text("""
-                            UPDATE Subcategorias_Sistema 
-                            SET prob_fb_general = :p1, prob_fb_pelucas = :p2, prob_fb_lentes = :p3 
-                            WHERE id = :id
-                        """), {"p1": row['prob_fb_general'], "p2": row['prob_fb_pelucas'], "p3": row['prob_fb_lentes'], "id": row['id']})
-                st.success("✅ Probabilidades de Facebook guardadas.")
+                    n = edicion_masiva.actualizar(conn, "Subcategorias_Sistema", filas, "id", {
+                        "id": "INT", "prob_fb_general": "NUMERIC", "prob_fb_pelucas": "NUMERIC", "prob_fb_lentes": "NUMERIC",
+                    })
+                st.success(f"✅ Probabilidades de Facebook guardadas ({n} subcategorías).")
 
         st.divider()
         # --- PERSONALIZACIÓN DE IA PARA FACEBOOK ---
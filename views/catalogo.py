@@ -5,6 +5,7 @@ import time
 from sqlalchemy import text
 from database import engine
 import utils
+import exportaciones
 
 def render_catalogo():
     st.subheader("🔧 Administración de Productos y Variantes")
@@ -279,10 +280,7 @@ def render_catalogo():
                             v.stock_interno, v.stock_externo, v.stock_transito, v.ubicacion,
                             v.url_imagen as url_imagen_variante,
                             p.marca, p.modelo, p.nombre as nombre_prod, 
-                            CASE 
-                                WHEN p.macro_categoria ILIKE 'peluca%' OR v.sku ILIKE 'WB-%' OR v.sku ILIKE 'WIG-%' THEN 'Pelucas'
-                                ELSE 'Lentes'
-                            END AS macro_categoria, 
+                            v.linea_negocio AS macro_categoria, 
                             p.categoria, p.diametro, p.color_principal, p.url_compra, p.url_tienda,
                             p.url_imagen as url_imagen_padre
                         FROM Variantes v 
@@ -568,37 +566,44 @@ def render_catalogo():
         if st.button("🚀 GENERAR FEED PRO", type="primary"):
             with st.spinner("Generando catálogo unificado..."):
                 try:
-                    with engine.connect() as conn:
-                        q_feed = text("""
-                            SELECT 
-                                v.sku, p.macro_categoria, p.categoria, p.marca, p.modelo, p.nombre, 
-                                COALESCE(NULLIF(TRIM(v.url_imagen), ''), NULLIF(TRIM(p.url_imagen), '')) AS url_imagen, 
-                                v.precio, (v.stock_interno + v.stock_externo) as stock_total 
-                            FROM Variantes v 
-                            JOIN Productos p ON v.id_producto = p.id_producto 
-                            WHERE (v.url_imagen IS NOT NULL AND v.url_imagen != '') 
-                               OR (p.url_imagen IS NOT NULL AND p.url_imagen != '')
-                        """)
-                        df_raw = pd.read_sql(q_feed, conn)
-
-                    if df_raw.empty: st.error("⚠️ No hay productos con imagen guardada.")
-                    else:
-                        df_feed = pd.DataFrame()
+                    q_feed = """
+                        SELECT 
+                            v.sku, p.macro_categoria, p.categoria, p.marca, p.modelo, p.nombre, 
+                            COALESCE(NULLIF(TRIM(v.url_imagen), ''), NULLIF(TRIM(p.url_imagen), '')) AS url_imagen, 
+                            v.precio, (v.stock_interno + v.stock_externo) as stock_total 
+                        FROM Variantes v 
+                        JOIN Productos p ON v.id_producto = p.id_producto 
+                        WHERE (v.url_imagen IS NOT NULL AND v.url_imagen != '') 
+                           OR (p.url_imagen IS NOT NULL AND p.url_imagen != '')
+                    """
+
+                    def armar_feed(df_raw):
+                        # Se aplica a cada trozo de la consulta (exportaciones.py), nunca al catálogo entero
+                        df_feed = pd.DataFrame(index=df_raw.index)
                         df_feed['id'] = df_raw['sku']
                         df_feed['title'] = (df_raw['marca'].fillna('') + " " + df_raw['modelo'].fillna('') + " - " + df_raw['nombre'].fillna('') + " (" + df_raw['sku'].fillna('') + ")").str.strip()
                         df_feed['description'] = desc_default + " " + df_feed['title']
-                        df_feed['availability'] = df_raw['stock_total'].apply(lambda x: 'in_stock' if x > 0 else 'out_of_stock')
+                        df_feed['availability'] = (df_raw['stock_total'] > 0).map({True: 'in_stock', False: 'out_of_stock'})
                         df_feed['condition'] = 'new'
                         df_feed['price'] = df_raw['precio'].astype(str) + ' PEN'
-                        df_feed['link'] = df_raw.apply(lambda r: f"https://pelucat.pe/producto/{r['sku']}" if r['macro_categoria'] == 'Pelucas' else f"https://kmlentes.pe/producto/{r['sku']}", axis=1)
+                        df_feed['link'] = ("https://pelucat.pe/producto/" + df_raw['sku']).where(df_raw['macro_categoria'] == 'Pelucas', "https://kmlentes.pe/producto/" + df_raw['sku'])
                         df_feed['image_link'] = df_raw['url_imagen']
                         df_feed['brand'] = df_raw['marca'].fillna('K&M')
                         df_feed['custom_label_0'] = df_raw['macro_categoria'].fillna('Lentes')
                         df_feed['product_type'] = df_raw['categoria'].fillna('General')
+                        return df_feed
 
-                        st.success(f"✅ Feed generado con {len(df_feed)} variantes.")
-                        st.dataframe(df_feed.head(3), use_container_width=True)
-                        csv = df_feed.to_csv(index=False).encode('utf-8')
-                        st.download_button("📥 DESCARGAR FEED META (CSV)", data=csv, file_name="feed_meta_unificado.csv", mime="text/csv")
+                    # Streaming a disco; se reutiliza mientras no cambie el inventario ni la descripción base
+                    ruta_feed, meta_feed = exportaciones.exportar(
+                        q_feed, formato="csv", transformar=armar_feed, extra=desc_default,
+                        version_datos=exportaciones.version("SELECT last_value FROM sello_inventario")
+                    )
+
+                    if meta_feed["filas"] == 0: st.error("⚠️ No hay productos con imagen guardada.")
+                    else:
+                        st.success(f"✅ Feed generado con {meta_feed['filas']} variantes.")
+                        st.dataframe(pd.read_csv(ruta_feed, nrows=3), use_container_width=True)
+                        with open(ruta_feed, "rb") as archivo:
+                            st.download_button("📥 DESCARGAR FEED META (CSV)", data=archivo, file_name="feed_meta_unificado.csv", mime=exportaciones.MIME["csv"])
 
                 except Exception as e: st.error(f"Error generando feed: {e}")
\ No newline at end of file
@@ -7,7 +7,6 @@ import threading
 import base64
 import zipfile
 import io
-import requests
 from datetime import datetime, timedelta
 
 from streamlit.config import cat
@@ -20,10 +19,13 @@ WAHA_KEY = os.getenv("WAHA_KEY")
 
 try:
     from utils import marcar_chat_como_leido_waha as marcar_leido_waha
-    from utils import normalizar_telefono_maestro, obtener_historial_compras
+    from utils import normalizar_telefono_maestro, obtener_historial_compras, resolver_telefono_api
 except ImportError:
     def marcar_leido_waha(*args): pass
     def normalizar_telefono_maestro(t): return {"db": "".join(filter(str.isdigit, str(t)))}
+    def resolver_telefono_api(lid, session): return None
+
+from integraciones import waha
 
 def mostrar_resumen_compras_chat(telefono_activo):
     st.markdown("##### 🛍️ Historial de Compras")
@@ -83,36 +85,6 @@ def mostrar_resumen_compras_chat(telefono_activo):
     except Exception as e:
         st.error(f"Error al obtener historial: {e}")
 
-# ==========================================
-# 📡 RESOLUTOR API PARA LIDs E INTENTO DE VERIFICACIÓN
-# ==========================================
-def resolver_telefono_api(lid, session):
-    if not WAHA_URL or not lid: return None
-    try:
-        lid_safe = lid.replace('@', '%40')
-        url = f"{WAHA_URL.rstrip('/')}/api/{session}/lids/{lid_safe}"
-        headers = {"Content-Type": "application/json"}
-        if WAHA_KEY: headers["X-Api-Key"] = WAHA_KEY
-        
-        r = requests.get(url, headers=headers, timeout=5)
-        if r.status_code == 200:
-            data = r.json()
-            pn = data.get('pn')
-            if pn:
-                pn_clean = pn.split('@')[0]
-                
-                # --- VERIFICACIÓN EXTRA SOLICITADA ---
-                url_check = f"{WAHA_URL.rstrip('/')}/api/contacts/check-exists"
-                params = {"session": session, "phone": pn_clean}
-                r_check = requests.get(url_check, params=params, headers=headers, timeout=5)
-                
-                if r_check.status_code == 200 and r_check.json().get('numberExists', False):
-                    return pn_clean
-                
-                return pn_clean # Fallback, lo devolvemos por si acaso WAHA dice que no existe
-    except: pass
-    return None
-
 def mandar_mensaje_api(telefono, texto, sesion):
     if not WAHA_URL: return False, "Falta WAHA_URL"
     try:
@@ -130,12 +102,8 @@ def mandar_mensaje_api(telefono, texto, sesion):
             if not telefono_final: return False, "Número inválido"
             chat_id = f"{telefono_final}@c.us"
 
-        url = f"{WAHA_URL.rstrip('/')}/api/sendText"
-        headers = {"Content-Type": "application/json"}
-        if WAHA_KEY: headers["X-Api-Key"] = WAHA_KEY
-        
         payload = {"session": sesion, "chatId": chat_id, "text": texto}
-        r = requests.post(url, json=payload, headers=headers, timeout=10)
+        r = waha.post("/api/sendText", json=payload, timeout=10)
         if r.status_code in [200, 201]: return True, ""
         return False, r.text
     except Exception as e:
@@ -2,8 +2,9 @@ import streamlit as st
 import pandas as pd
 from sqlalchemy import text
 from database import engine
-from utils import buscar_contacto_google, crear_en_google, normalizar_telefono_maestro, generar_nombre_ia, actualizar_en_google, obtener_lid_de_waha
+from utils import buscar_contacto_google, crear_en_google, normalizar_telefono_maestro, generar_nombre_ia, actualizar_en_google, obtener_lid_de_waha, render_vinculacion_google
 import time
+import edicion_masiva
 
 ESTADOS_CLIENTE_FALLBACK = [
     "Sin empezar", "Responder duda", "Interesado en venta", 
@@ -82,7 +83,7 @@ def render_clientes():
                             
                             # 2. Google Contacts (Solo si tenemos número de verdad)
                             if vincular_google and tel_db:
-                                res_g = buscar_contacto_google(tel_db)
+                                res_g = buscar_contacto_google(tel_db, sincronizar=True)
                                 if not (res_g and res_g.get('encontrado')):
                                     tel_google = norm.get('google', tel_db)
                                     res_g = buscar_contacto_google(tel_google)
@@ -191,18 +192,17 @@ def render_clientes():
         )
 
         if st.button("💾 Guardar Cambios Rápidos", type="primary"):
+            # Solo las filas que el operador tocó, en un único UPDATE
+            filas = edicion_masiva.cambiadas(df_view, edited_df, "id_cliente", ["nombre_corto", "nombre_ia", "estado", "excluir_publicidad"]).copy()
+            filas['id_etapa'] = filas['estado'].map(mapa_subgrupo_id)
+            filas['nombre_ia'] = filas['nombre_ia'].fillna("")
+            filas['excluir_publicidad'] = filas['excluir_publicidad'].astype(bool)
             with engine.begin() as conn:
-                for idx, row in edited_df.iterrows():
-                    id_etapa_val = mapa_subgrupo_id.get(row['estado'])
-                    nia_val = row['nombre_ia'] if pd.notna(row['nombre_ia']) else ""
-                    exc_val = bool(row['excluir_publicidad'])
-                    
-                    conn.execute(text("""
-                        UPDATE clientes 
-                        SET nombre_corto=:nc, nombre_ia=:nia, estado=:est, id_etapa=:id_etapa, excluir_publicidad=:exc 
-                        WHERE id_cliente=:id
-                    """), {"nc": row['nombre_corto'], "nia": nia_val, "est": row['estado'], "id_etapa": id_etapa_val, "exc": exc_val, "id": row['id_cliente']})
-            st.success("Cambios guardados.")
+                n = edicion_masiva.actualizar(conn, "clientes", filas, "id_cliente", {
+                    "id_cliente": "INT", "nombre_corto": "TEXT", "nombre_ia": "TEXT",
+                    "estado": "TEXT", "id_etapa": "INT", "excluir_publicidad": "BOOLEAN",
+                })
+            st.success(f"Cambios guardados ({n} clientes actualizados).")
             time.sleep(1)
             st.rerun()
 
@@ -697,75 +697,9 @@ def render_clientes():
         st.divider()
 
         st.markdown("#### 📱 Sincronización Masiva con Google Contacts")
-        st.caption("Busca clientes activos sin vincular y los asocia a Google.")
-        if st.button("🚀 Iniciar Sincronización Masiva"):
-            with st.spinner("Sincronizando historial..."):
-                try:
-                    with engine.connect() as conn:
-                        df_sin_sync = pd.read_sql(text("""
-                            SELECT c.id_cliente, c.nombre_corto, 
-                                   COALESCE(
-                                       (SELECT telefono FROM telefonoscliente WHERE id_cliente = c.id_cliente AND es_principal = TRUE AND activo = TRUE LIMIT 1),
-                                       c.telefono
-                                   ) as tel_prin
-                            FROM clientes c 
-                            WHERE c.activo=TRUE AND (c.google_id IS NULL OR TRIM(c.google_id) = '')
-                        """), conn)
-                    
-                    if df_sin_sync.empty:
-                        st.success("¡Todos los clientes ya se encuentran vinculados!")
-                    else:
-                        cont = 0
-                        detalles_omisiones = []
-                        with engine.begin() as conn_tx:
-                            for idx, row in df_sin_sync.iterrows():
-                                id_cli = row['id_cliente']
-                                nombre = row['nombre_corto']
-                                tel = row['tel_prin']
-                                
-                                if pd.isna(tel) or str(tel).strip().lower() in ['nan', '']:
-                                    detalles_omisiones.append(f"⚠️ ID {id_cli} ({nombre}): Sin ningún teléfono en base de datos.")
-                                    continue
-                                    
-                                norm = normalizar_telefono_maestro(tel)
-                                if not norm:
-                                    detalles_omisiones.append(f"⚠️ ID {id_cli} ({nombre}): Formato inválido para '{tel}'.")
-                                    continue
-                                    
-                                tel_db = norm['db']
-                                tel_google = norm.get('google', tel_db)
-                                
-                                res_g = buscar_contacto_google(tel_db)
-                                if not (res_g and res_g.get('encontrado')):
-                                    res_g = buscar_contacto_google(tel_google)
-                                
-                                g_id = None
-                                if res_g and res_g.get('encontrado'):
-                                    g_id = res_g['google_id']
-                                else:
-                                    if crear_en_google(nombre, "", tel_google):
-                                        res_g2 = buscar_contacto_google(tel_db)
-                                        if not (res_g2 and res_g2.get('encontrado')):
-                                            res_g2 = buscar_contacto_google(tel_google)
-                                            
-                                        if res_g2 and res_g2.get('encontrado'):
-                                            g_id = res_g2['google_id']
-                                
-                                if g_id:
-                                    conn_tx.execute(text("UPDATE clientes SET google_id = :gid WHERE id_cliente = :id"), {"gid": g_id, "id": id_cli})
-                                    cont += 1
-                        
-                        if detalles_omisiones:
-                            for msg in detalles_omisiones:
-                                st.warning(msg)
-                                
-                        st.success(f"¡Sincronización completada! Se vincularon {cont} clientes con éxito.")
-                        if cont > 0:
-                            time.sleep(1)
-                            st.rerun()
-                except Exception as e:
-                    st.error(f"Error en la sincronización masiva: {e}")
-                    
+        st.caption("Busca clientes activos sin vincular y los asocia a Google. Corre en segundo plano (trabajos.py): puedes cambiar de página mientras tanto.")
+        render_vinculacion_google("🚀 Iniciar Sincronización Masiva")
+
         st.divider()
 
         st.markdown("#### ♻️ Reactivar Clientes Bloqueados")
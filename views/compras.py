@@ -1,12 +1,14 @@
 import streamlit as st
 import pandas as pd
 import time
-import io
 from datetime import datetime, date
 from sqlalchemy import text
 from database import engine
 import threading
 from utils import sync_woo_background
+import importacion_stock
+import demanda_sku
+import exportaciones
 
 def render_compras():
     st.subheader("🚢 Gestión de Importaciones y Reposición")
@@ -36,7 +38,7 @@ def render_compras():
                 # Obtener Macrocategorías dinámicamente de la BD
                 with engine.connect() as conn:
                     try:
-                        res_mac = conn.execute(text("SELECT DISTINCT COALESCE(macro_categoria, 'Lentes') FROM Productos")).fetchall()
+                        res_mac = conn.execute(text("SELECT DISTINCT linea_negocio FROM Variantes")).fetchall()
                         macros_disp = sorted(list({r[0] for r in res_mac if r[0]}))
                     except:
                         macros_disp = ["Lentes", "Pelucas"]
@@ -57,6 +59,13 @@ def render_compras():
                     horizontal=True
                 )
 
+                # Punto de reorden: demanda durante la reposición + stock de seguridad (demanda_sku.py)
+                col_f5, col_f6, col_f7 = st.columns(3)
+                lead_time = col_f5.number_input("⏱️ Reposición (días):", min_value=1, max_value=365, value=45, help="Días desde que se hace el pedido hasta que llega.")
+                nivel_servicio = col_f6.selectbox("🎯 Nivel de servicio:", list(demanda_sku.Z_SERVICIO), index=1, help="Probabilidad de no quedarse sin stock mientras llega el pedido.")
+                cobertura = col_f7.number_input("📆 Cubrir tras la llegada (días):", min_value=0, max_value=365, value=90)
+                criterio = st.radio("Mostrar:", ["Stock bajo (umbral)", "Bajo punto de reorden"], horizontal=True)
+
             with c_acciones:
                 st.write("")
                 st.write("")
@@ -67,28 +76,45 @@ def render_compras():
         year_actual = datetime.now().year
         y1, y2, y3 = year_actual, year_actual - 1, year_actual - 2
 
-        def get_hist_sql(year):
-            return f"COALESCE(h.v{year}, 0)" if year <= 2025 else "0"
+        # 3. CONSULTA SOBRE LA DEMANDA PRECALCULADA (filtros en el servidor)
+        try:
+            # Completo una vez al día (o por cron); si no, solo los SKUs con ventas/anulaciones nuevas
+            demanda_sku.refrescar()
+        except Exception as e:
+            st.warning(f"⚠️ No se pudo refrescar la demanda por SKU: {e}")
+
+        filtros = ["(v.sku !~ '-[0-9]{4}$' OR v.sku LIKE '%-0000')"]  # Medidas: solo la variante base
+        if filtro_macro != "Todas":
+            filtros.append("v.linea_negocio = :macro")
+        if filtro_proveedor == "Con Proveedor":
+            filtros.append("v.stock_externo > 0")
+        elif filtro_proveedor == "Sin Proveedor":
+            filtros.append("COALESCE(v.stock_externo, 0) <= 0")
+        if filtro_enlace == "Con Link":
+            filtros.append("COALESCE(p.url_compra, '') <> ''")
+        elif filtro_enlace == "Sin Link":
+            filtros.append("COALESCE(p.url_compra, '') = ''")
+        if criterio == "Bajo punto de reorden":
+            filtros.append("r.disponible <= r.punto_reorden AND r.punto_reorden > 0")
+        else:
+            filtros.append("r.disponible <= :umbral")
 
-        # 3. CONSULTA HÍBRIDA
         with engine.connect() as conn:
             try:
-                hist_y3, hist_y2, hist_y1 = get_hist_sql(y3), get_hist_sql(y2), get_hist_sql(y1)
-
-                query_hybrid = text(f"""
-                    WITH VentasSQL AS (
-                        SELECT
-                            d.sku,
-                            SUM(CASE WHEN EXTRACT(YEAR FROM v.fecha_venta) = :y3 THEN d.cantidad ELSE 0 END) as sql_y3,
-                            SUM(CASE WHEN EXTRACT(YEAR FROM v.fecha_venta) = :y2 THEN d.cantidad ELSE 0 END) as sql_y2,
-                            SUM(CASE WHEN EXTRACT(YEAR FROM v.fecha_venta) = :y1 THEN d.cantidad ELSE 0 END) as sql_y1
-                        FROM DetalleVenta d
-                        JOIN Ventas v ON d.id_venta = v.id_venta
-                        GROUP BY d.sku
+                sql_demanda = f"""
+                    WITH r AS (
+                        SELECT v.sku,
+                               v.stock_interno + COALESCE(v.stock_transito, 0) AS disponible,
+                               COALESCE(d.demanda_diaria, 0) AS demanda_diaria,
+                               -- ROP = d·L + z·σ_mes·√(L/30)
+                               CEIL(COALESCE(d.demanda_diaria, 0) * :lead
+                                    + :z * COALESCE(d.desv_mensual, 0) * SQRT(:lead / 30.0)) AS punto_reorden
+                        FROM Variantes v
+                        LEFT JOIN demanda_sku d ON d.sku = v.sku
                     )
                     SELECT
                         v.sku,
-                        COALESCE(p.macro_categoria, 'Lentes') as macro_categoria,
+                        v.linea_negocio as macro_categoria,
                         p.marca || ' ' || p.modelo || ' - ' || COALESCE(p.nombre, '') || ' (' || v.medida || ')' as nombre,
                         v.stock_interno,
                         v.stock_externo,
@@ -96,54 +122,33 @@ def render_compras():
                         COALESCE(v.costo_compra, 0) as costo_compra,
                         p.importacion,
                         p.url_compra,
-                        ({hist_y3} + COALESCE(live.sql_y3, 0)) as venta_year_3,
-                        ({hist_y2} + COALESCE(live.sql_y2, 0)) as venta_year_2,
-                        ({hist_y1} + COALESCE(live.sql_y1, 0)) as venta_year_1
+                        COALESCE(d.u_anio_2, 0) as venta_year_3,
+                        COALESCE(d.u_anio_1, 0) as venta_year_2,
+                        COALESCE(d.u_anio_0, 0) as venta_year_1,
+                        COALESCE(d.u30, 0) as u30,
+                        COALESCE(d.u90, 0) as u90,
+                        COALESCE(d.estacionalidad, 1) as estacionalidad,
+                        COALESCE(d.u_anio_0 + d.u_anio_1 + d.u_anio_2, 0) as demanda_historica,
+                        GREATEST(COALESCE(d.u_anio_0 + d.u_anio_1 + d.u_anio_2, 0) - r.disponible, 0) as sugerencia_compra,
+                        r.punto_reorden,
+                        GREATEST(CEIL(r.punto_reorden + r.demanda_diaria * :cobertura - r.disponible), 0) as sugerencia_rop
                     FROM Variantes v
                     JOIN Productos p ON v.id_producto = p.id_producto
-                    LEFT JOIN HistorialAnual h ON v.sku = h.sku
-                    LEFT JOIN VentasSQL live ON v.sku = live.sku
-                    WHERE (v.stock_interno + COALESCE(v.stock_transito, 0)) <= :umbral
-                """)
-                
-                df_reco = pd.read_sql(query_hybrid, conn, params={"umbral": umbral_stock, "y1": y1, "y2": y2, "y3": y3})
-                
-                if not df_reco.empty:
-                    df_reco['demanda_historica'] = df_reco['venta_year_1'] + df_reco['venta_year_2'] + df_reco['venta_year_3']
-                    df_reco['sugerencia_compra'] = df_reco['demanda_historica'] - (df_reco['stock_interno'] + df_reco['stock_transito'])
-                    df_reco['sugerencia_compra'] = df_reco['sugerencia_compra'].clip(lower=0)
+                    JOIN r ON r.sku = v.sku
+                    LEFT JOIN demanda_sku d ON d.sku = v.sku
+                    WHERE {" AND ".join(filtros)}
+                    ORDER BY {"sugerencia_rop" if criterio == "Bajo punto de reorden" else "sugerencia_compra"} DESC
+                """
+                params_demanda = {
+                    "umbral": umbral_stock, "macro": filtro_macro, "lead": int(lead_time),
+                    "z": demanda_sku.Z_SERVICIO[nivel_servicio], "cobertura": int(cobertura)
+                }
 
+                df_reco = pd.read_sql(text(sql_demanda), conn, params=params_demanda)
             except Exception as e:
                 st.error(f"⚠️ Error en consulta: {e}")
                 df_reco = pd.DataFrame()
 
-        # 4. APLICACIÓN DE FILTROS
-        if not df_reco.empty:
-            df_reco['sku'] = df_reco['sku'].astype(str).str.strip()
-            
-            # Filtro Macrocategoría
-            if filtro_macro != "Todas":
-                df_reco = df_reco[df_reco['macro_categoria'] == filtro_macro]
-            
-            # Filtro Proveedor
-            if filtro_proveedor == "Con Proveedor":
-                df_reco = df_reco[df_reco['stock_externo'] > 0]
-            elif filtro_proveedor == "Sin Proveedor":
-                df_reco = df_reco[df_reco['stock_externo'] <= 0]
-            
-            # Filtro Enlace
-            if filtro_enlace == "Con Link":
-                df_reco = df_reco[df_reco['url_compra'].notna() & (df_reco['url_compra'] != '')]
-            elif filtro_enlace == "Sin Link":
-                df_reco = df_reco[df_reco['url_compra'].isna() | (df_reco['url_compra'] == '')]
-
-            patron_medida = r'-\d{4}$'
-            es_medida = df_reco['sku'].str.contains(patron_medida, regex=True, na=False)
-            es_base = df_reco['sku'].str.endswith('-0000', na=False)
-            df_reco = df_reco[~es_medida | es_base]
-            
-            df_reco = df_reco.sort_values(by='sugerencia_compra', ascending=False)
-
         # 5. VISUALIZACIÓN
         st.divider()
         col_res_txt, col_res_btn = st.columns([3, 1])
@@ -154,10 +159,13 @@ def render_compras():
 
         with col_res_btn:
             if not df_reco.empty:
-                buffer = io.BytesIO()
-                with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-                    df_reco.to_excel(writer, index=False, sheet_name='SugerenciaCompra')
-                st.download_button("📥 Descargar Excel", data=buffer.getvalue(), file_name=f"Compras_{date.today()}.xlsx", use_container_width=True)
+                # Streaming a disco; se regenera solo si cambió el inventario o la demanda (exportaciones.py)
+                ruta_xlsx, _ = exportaciones.exportar(
+                    sql_demanda, params_demanda, "xlsx", hoja="SugerenciaCompra",
+                    version_datos=exportaciones.version("SELECT (SELECT last_value FROM sello_inventario), (SELECT MAX(actualizado) FROM demanda_sku)")
+                )
+                with open(ruta_xlsx, "rb") as archivo:
+                    st.download_button("📥 Descargar Excel", data=archivo, file_name=f"Compras_{date.today()}.xlsx", mime=exportaciones.MIME["xlsx"], use_container_width=True)
 
         st.dataframe(
             df_reco,
@@ -176,6 +184,11 @@ def render_compras():
                 "venta_year_1": st.column_config.NumberColumn(str(y1), format="%d"),
                 "sugerencia_compra": st.column_config.NumberColumn("⚠️ Sugerido", format="%d"),
                 "demanda_historica": st.column_config.ProgressColumn("Demanda Hist.", format="%d", min_value=0, max_value=int(df_reco['demanda_historica'].max()) if not df_reco.empty else 10),
+                "u30": st.column_config.NumberColumn("30 días", format="%d"),
+                "u90": st.column_config.NumberColumn("90 días", format="%d"),
+                "estacionalidad": st.column_config.NumberColumn("Estac.", format="%.2f", help="Próximos 90 días del año pasado frente a un trimestre promedio (1 = neutro)."),
+                "punto_reorden": st.column_config.NumberColumn("Pto. Reorden", format="%d"),
+                "sugerencia_rop": st.column_config.NumberColumn("🎯 Sugerido (ROP)", format="%d"),
             },
             hide_index=True,
             use_container_width=True
@@ -287,43 +300,24 @@ def render_compras():
                 # Espacio para alinear el botón
                 col_btn.write("")
                 if col_btn.button(f"✅ Aceptar todo ({len(items_grupo)} items)", type="primary", use_container_width=True):
-                    with engine.connect() as conn:
-                        trans = conn.begin()
-                        try:
-                            for _, row in items_grupo.iterrows():
-                                # 1. Sumar al Stock Global Físico
-                                conn.execute(text("""
-                                    UPDATE Variantes
-                                    SET stock_interno = stock_interno + stock_transito, stock_transito = 0
-                                    WHERE sku = :s
-                                """), {"s": row['sku']})
-                                
-                                # 2. Asignar al nuevo estante físico (si el usuario eligió uno)
-                                if ubi_grupo != "Sin asignar" and row['pendiente'] > 0:
-                                    conn.execute(text("""
-                                        INSERT INTO Stock_Ubicaciones (sku, id_ubicacion, cantidad, fecha_actualizacion) 
-                                        VALUES (:sku, (SELECT id_ubicacion FROM Ubicaciones_Estandar WHERE nombre = :n), :cant, CURRENT_TIMESTAMP)
-                                        ON CONFLICT (sku, id_ubicacion) 
-                                        DO UPDATE SET 
-                                            cantidad = Stock_Ubicaciones.cantidad + :cant,
-                                            fecha_actualizacion = CURRENT_TIMESTAMP
-                                    """), {"sku": row['sku'], "n": ubi_grupo, "cant": row['pendiente']})
-                                
-                                # 3. Historial de Movimientos
-                                conn.execute(text("""
-                                    INSERT INTO Movimientos (sku, tipo_movimiento, cantidad, stock_anterior, stock_nuevo, nota)
-                                    VALUES (:s, 'RECEPCION_IMPORT', :c, :ant, :nue, :nota)
-                                """), {
-                                    "s": row['sku'], "c": row['pendiente'], "ant": row['stock_actual'],
-                                    "nue": row['stock_actual'] + row['pendiente'], "nota": f"Ingreso Grupal: {nota_seleccionada}"
-                                })
-                            trans.commit()
-                            st.success(f"✅ Pedido '{nota_seleccionada}' ingresado al inventario.")
-                            time.sleep(1.5)
-                            st.rerun()
-                        except Exception as e:
-                            trans.rollback()
-                            st.error(f"Error: {e}")
+                    # recibido/transito/ubicacion los toma recepcionar() de la BD al confirmar
+                    recepcion = pd.DataFrame({
+                        "sku": items_grupo['sku'],
+                        "recibido": 0,
+                        "transito": 0,
+                        "ubicacion": None,
+                        "estante": None if ubi_grupo == "Sin asignar" else ubi_grupo,
+                        "nota": f"Ingreso Grupal: {nota_seleccionada}",
+                    })
+                    try:
+                        # Stock global + estante + historial en pocas sentencias (importacion_stock.py)
+                        with engine.begin() as conn:
+                            importacion_stock.recepcionar(conn, recepcion, todo_en_transito=True)
+                        st.success(f"✅ Pedido '{nota_seleccionada}' ingresado al inventario.")
+                        time.sleep(1.5)
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Error: {e}")
 
             st.divider()
 
@@ -360,53 +354,35 @@ def render_compras():
             filas_ok = cambios[cambios["✅ Llegó?"] == True]
             if not filas_ok.empty:
                 if st.button(f"📥 Procesar {len(filas_ok)} items marcados", type="primary"):
-                    with engine.connect() as conn:
-                        trans = conn.begin()
-                        try:
-                            for _, row in filas_ok.iterrows():
-                                n_stk = row['stock_actual'] + row['Cant. Recibida']
-                                
-                                if row['Cant. Recibida'] == 0:
-                                    n_trans = 0
-                                    nota_mov = f"Cancelado/No llegó - Ref: {row['ultima_nota']}"
-                                else:
-                                    n_trans = max(0, row['pendiente'] - row['Cant. Recibida'])
-                                    nota_mov = f"Manual - Ref: {row['ultima_nota']}"
-                                
-                                # 1. Actualizar global y la ubi antigua
-                                conn.execute(text("UPDATE Variantes SET stock_interno=:nm, stock_transito=:nt, ubicacion=:u WHERE sku=:s"),
-                                             {"nm": n_stk, "nt": n_trans, "u": row['ubicacion_antigua'], "s": row['sku']})
-                                
-                                # 2. Insertar en el nuevo estante si se eligió
-                                if row['estante_destino'] != "Sin asignar" and row['Cant. Recibida'] > 0:
-                                    conn.execute(text("""
-                                        INSERT INTO Stock_Ubicaciones (sku, id_ubicacion, cantidad, fecha_actualizacion) 
-                                        VALUES (:sku, (SELECT id_ubicacion FROM Ubicaciones_Estandar WHERE nombre = :n), :cant, CURRENT_TIMESTAMP)
-                                        ON CONFLICT (sku, id_ubicacion) 
-                                        DO UPDATE SET 
-                                            cantidad = Stock_Ubicaciones.cantidad + :cant,
-                                            fecha_actualizacion = CURRENT_TIMESTAMP
-                                    """), {"sku": row['sku'], "n": row['estante_destino'], "cant": int(row['Cant. Recibida'])})
-                                
-                                # 3. Historial
-                                conn.execute(text("INSERT INTO Movimientos (sku, tipo_movimiento, cantidad, stock_anterior, stock_nuevo, nota) VALUES (:s,'RECEPCION_IMPORT',:c,:ant,:nue,:n)"),
-                                             {"s": row['sku'], "c": int(row['Cant. Recibida']), "ant": row['stock_actual'], "nue": n_stk, "n": nota_mov})
-                            
-                            trans.commit()
-
-                            skus_a_sincronizar = []
-                            try:
-                                skus_a_sincronizar = [row['sku'] for idx, row in filas_ok.iterrows() if row['Cant. Recibida'] > 0]
-                                if skus_a_sincronizar:
-                                    threading.Thread(target=sync_woo_background, args=(skus_a_sincronizar,)).start()
-                            except Exception as e:
-                                print(f"Error al sincronizar: {e}")
+                    recibido = filas_ok['Cant. Recibida'].fillna(0).astype(int)
+                    recepcion = pd.DataFrame({
+                        "sku": filas_ok['sku'],
+                        "recibido": recibido,
+                        # Si no llegó nada se cancela lo pendiente; si llegó parcial, el resto sigue en camino
+                        "transito": (filas_ok['pendiente'] - recibido).clip(lower=0).where(recibido > 0, 0),
+                        "ubicacion": filas_ok['ubicacion_antigua'],
+                        "estante": filas_ok['estante_destino'].where(filas_ok['estante_destino'] != "Sin asignar", None),
+                        "nota": [
+                            f"{'Manual' if r > 0 else 'Cancelado/No llegó'} - Ref: {n}"
+                            for r, n in zip(recibido, filas_ok['ultima_nota'])
+                        ],
+                    })
+                    try:
+                        with engine.begin() as conn:
+                            importacion_stock.recepcionar(conn, recepcion)
 
-                            st.success("✅ Items actualizados e ingresados a sus ubicaciones.")
-                            time.sleep(1.2)
-                            st.rerun()
+                        skus_a_sincronizar = []
+                        try:
+                            skus_a_sincronizar = recepcion.loc[recepcion['recibido'] > 0, 'sku'].tolist()
+                            if skus_a_sincronizar:
+                                threading.Thread(target=sync_woo_background, args=(skus_a_sincronizar,)).start()
                         except Exception as e:
-                            trans.rollback()
-                            st.error(f"Error: {e}")
+                            print(f"Error al sincronizar: {e}")
+
+                        st.success("✅ Items actualizados e ingresados a sus ubicaciones.")
+                        time.sleep(1.2)
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Error: {e}")
         else:
             st.info("🎉 No hay mercadería pendiente de llegada.")
\ No newline at end of file
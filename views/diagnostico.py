@@ -2,14 +2,17 @@ import streamlit as st
 import pandas as pd
 from sqlalchemy import text
 from database import engine
+import edicion_masiva
 import json
 import requests
 import os
 import re
 from datetime import datetime, timedelta
 
-# IMPORTANTE: Importamos el motor lógico desde utils para la auditoría WOO
-from utils import ejecutar_auditoria_bidireccional_woo
+# La auditoría WOO corre como trabajo en segundo plano (tareas_fondo.py)
+from utils import render_trabajo, encolar_unico
+import integraciones
+from integraciones import waha
 
 # Configuración API
 WAHA_URL = os.getenv("WAHA_URL")
@@ -17,17 +20,28 @@ WAHA_KEY = os.getenv("WAHA_KEY")
 # Intentamos adivinar la URL local del webhook, o usa la variable si existe
 WEBHOOK_INTERNAL_URL = os.getenv("WEBHOOK_URL", "https://kmlentes-webhook.up.railway.app/webhook")
 
-def get_headers():
-    h = {"Content-Type": "application/json"}
-    if WAHA_KEY: h["X-Api-Key"] = WAHA_KEY
-    return h
+def _mostrar_auditoria_woo(datos):
+    """Discrepancias parciales mientras corre la auditoría y el resumen al terminar."""
+    st.caption(f"🛒 Tienda: {datos['parametros'].get('tienda_url')} · 🕒 Inicio: {datos['iniciado'] or 'en cola'}")
+    parcial = datos['parcial']
+    if parcial and datos['estado'] == 'corriendo':
+        st.caption(f"🚨 {len(parcial['falta_db'])} SKUs web sin registro local hasta ahora · ⏳ {parcial['pendientes_wp']} SKUs locales aún no vistos en la web")
+        if parcial['falta_db']:
+            st.dataframe(pd.DataFrame(parcial['falta_db']), use_container_width=True, hide_index=True)
+
+    resultado = datos['resultado']
+    if resultado:
+        st.markdown(f"**Resumen:** {resultado['resumen']} (Fin: {resultado['hora_fin']})")
+        c_m1, c_m2 = st.columns(2)
+        c_m1.metric("⚠️ Sobrantes en Local (Faltan en WP)", resultado["err_wp"])
+        c_m2.metric("🚨 Sobrantes en Web (Faltan en DB)", resultado["err_db"])
 
 def render_diagnostico():
     st.title("🛠️ Centro de Diagnóstico")
     
-    # --- DECLARACIÓN ACTUALIZADA CON 7 TABS ---
-    tab_logs, tab_woo, tab_inspector, tab_simulador, tab_respuestas, tab_auditoria, tab_marketing = st.tabs([
-        "📡 Logs Webhook", "📡 Logs WOO", "🕵️ Inspector API", "🧪 Simulador (Test)", "🤖 Auto-Respuestas", "⚖️ Auditoría WOO", "📈 Logs Marketing"
+    # --- DECLARACIÓN ACTUALIZADA CON 8 TABS ---
+    tab_logs, tab_woo, tab_inspector, tab_simulador, tab_respuestas, tab_auditoria, tab_marketing, tab_latencias = st.tabs([
+        "📡 Logs Webhook", "📡 Logs WOO", "🕵️ Inspector API", "🧪 Simulador (Test)", "🤖 Auto-Respuestas", "⚖️ Auditoría WOO", "📈 Logs Marketing", "⏱️ Latencias HTTP"
     ])
     
     # ==========================================================================
@@ -138,31 +152,10 @@ def render_diagnostico():
         tienda_url = c1.selectbox("Tienda a auditar:", ["kmlentes.pe", "pelucat.pe"])
         
         if st.button("🚀 Iniciar Auditoría Bidireccional", type="primary"):
-            c_hora = st.empty()
-            c_progreso = st.progress(0)
-            c_estado = st.empty()
-            
-            wc_key = os.getenv("WC_KEY", "tu_ck_aqui") 
-            wc_secret = os.getenv("WC_SECRET", "tu_cs_aqui")
-            
-            for paso in ejecutar_auditoria_bidireccional_woo(tienda_url, wc_key, wc_secret):
-                if paso["estado"] == "inicio":
-                    c_hora.info(f"🕒 **Hora de inicio:** {paso['hora']}")
-                    c_estado.caption(paso["msg"])
-                elif paso["estado"] == "procesando":
-                    c_progreso.progress(paso["progreso"] / 100.0)
-                    c_estado.caption(paso["msg"])
-                elif paso["estado"] == "completado":
-                    c_progreso.progress(1.0)
-                    c_estado.success(f"✅ Sincronización Finalizada (Fin: {paso['hora_fin']})")
-                    st.markdown(f"**Resumen:** {paso['resumen']}")
-                    
-                    c_m1, c_m2 = st.columns(2)
-                    c_m1.metric("⚠️ Sobrantes en Local (Faltan en WP)", paso["err_wp"])
-                    c_m2.metric("🚨 Sobrantes en Web (Faltan en DB)", paso["err_db"])
-                elif paso["estado"] == "error":
-                    st.error(f"🔥 Ocurrió un error: {paso['msg']}")
-                    break
+            encolar_unico("auditoria_woo", tienda_url=tienda_url)
+
+        # La auditoría corre en el trabajador (trabajos.py): sobrevive a recargas y cambios de página
+        render_trabajo("auditoria_woo", _mostrar_auditoria_woo)
 
         st.divider()
         st.markdown("### 📋 Último Reporte de Discrepancias")
@@ -210,7 +203,7 @@ def render_diagnostico():
             if not chat_target:
                 with st.spinner("Buscando último chat activo..."):
                     try:
-                        r = requests.get(f"{WAHA_URL}/api/{session}/chats?limit=1", headers=get_headers())
+                        r = waha.get(f"/api/{session}/chats", params={"limit": 1}, endpoint="GET /api/{session}/chats")
                         data = r.json()
                         if data: chat_target = data[0]['id']
                     except: pass
@@ -218,8 +211,8 @@ def render_diagnostico():
             if chat_target:
                 st.write(f"📂 Analizando: `{chat_target}`")
                 try:
-                    url_msgs = f"{WAHA_URL}/api/{session}/chats/{chat_target}/messages?limit=5"
-                    r_msg = requests.get(url_msgs, headers=get_headers())
+                    r_msg = waha.get(f"/api/{session}/chats/{chat_target}/messages", params={"limit": 5},
+                                     endpoint="GET /api/{session}/chats/{chat}/messages")
                     if r_msg.status_code == 200:
                         mensajes = list(reversed(r_msg.json()))
                         for msg in mensajes:
@@ -314,19 +307,16 @@ def render_diagnostico():
             )
             
             if st.button("💾 Guardar Cambios en Respuestas", type="primary"):
+                # Filas sin frase clave se descartan (y se borran si ya existían); el resto se normaliza
+                validas = editado[editado['frase_clave'].notna() & (editado['frase_clave'].astype(str).str.strip() != "")].copy()
+                validas['frase_clave'] = validas['frase_clave'].astype(str).str.strip().str.lower()
+                for col in ("respuesta_nivel_1", "respuesta_nivel_2"):
+                    validas[col] = validas[col].where(validas[col].notna(), "").astype(str)
                 with engine.begin() as conn:
-                    conn.execute(text("DELETE FROM respuestas_automaticas"))
-                    for _, row in editado.iterrows():
-                        if pd.notna(row['frase_clave']) and str(row['frase_clave']).strip():
-                            f_clave = str(row['frase_clave']).strip().lower()
-                            r1 = str(row['respuesta_nivel_1']) if pd.notna(row['respuesta_nivel_1']) else ""
-                            r2 = str(row['respuesta_nivel_2']) if pd.notna(row['respuesta_nivel_2']) else ""
-                            
-                            conn.execute(text("""
-                                INSERT INTO respuestas_automaticas (frase_clave, respuesta_nivel_1, respuesta_nivel_2)
-                                VALUES (:f, :r1, :r2)
-                            """), {"f": f_clave, "r1": r1, "r2": r2})
-                st.success("✅ Respuestas actualizadas correctamente en la Base de Datos.")
+                    res = edicion_masiva.sincronizar(conn, "respuestas_automaticas", df_resp, validas, "id", {
+                        "id": "INT", "frase_clave": "TEXT", "respuesta_nivel_1": "TEXT", "respuesta_nivel_2": "TEXT",
+                    })
+                st.success(f"✅ Respuestas guardadas: {res['insertadas']} nuevas, {res['actualizadas']} editadas, {res['borradas']} eliminadas.")
                 st.rerun()
                 
         except Exception as e:
@@ -432,4 +422,88 @@ def render_diagnostico():
                 st.warning(f"Aún no hay registros de marketing generados para el filtro: {filtro_tiempo}")
 
         except Exception as e:
-            st.error(f"❌ Error leyendo la base de datos: {e}")
\ No newline at end of file
+            st.error(f"❌ Error leyendo la base de datos: {e}")
+
+    # ==========================================================================
+    # PESTAÑA 8: LATENCIAS DE INTEGRACIONES (WAHA, OLLAMA, MAKE.COM)
+    # ==========================================================================
+    with tab_latencias:
+        st.markdown("### ⏱️ Latencia por Endpoint")
+        st.info("Histogramas acumulados por el panel, el webhook y el bot de marketing (cada proceso los vuelca a la BD cada minuto).")
+
+        estados = []
+        for cliente in integraciones.CLIENTES:
+            icono = "🔴 Abierto (enfriando)" if cliente.circuito_abierto else "🟢 Cerrado"
+            estados.append({"Servicio": cliente.nombre, "Circuito (este proceso)": icono, "URL base": cliente.url_base or "(URL completa por llamada)"})
+        st.dataframe(pd.DataFrame(estados), hide_index=True, use_container_width=True)
+
+        if st.button("🔄 Refrescar Latencias", key="btn_ref_lat"):
+            st.rerun()
+
+        try:
+            # Lo medido por este proceso aún no volcado también cuenta
+            integraciones.volcar_metricas()
+            with engine.connect() as conn:
+                df_lat = pd.read_sql(text("SELECT servicio, endpoint, cubeta, conteo, errores, suma_seg FROM metricas_http"), conn)
+        except Exception:
+            df_lat = pd.DataFrame()
+
+        if df_lat.empty:
+            st.caption("Aún no hay mediciones registradas.")
+        else:
+            orden_cubetas = [integraciones.etiqueta_cubeta(i) for i in range(len(integraciones.CUBETAS) + 1)]
+            limites = integraciones.CUBETAS + [float("inf")]
+
+            def percentil(grupo, q):
+                conteos = grupo.set_index('cubeta')['conteo'].reindex(orden_cubetas, fill_value=0)
+                objetivo = q * conteos.sum()
+                for limite, acumulado in zip(limites, conteos.cumsum()):
+                    if acumulado >= objetivo:
+                        return f"≤ {limite:g}s" if limite != float("inf") else f"> {limites[-2]:g}s"
+                return "-"
+
+            resumen = []
+            for (servicio, endpoint), grupo in df_lat.groupby(['servicio', 'endpoint']):
+                llamadas = int(grupo['conteo'].sum())
+                resumen.append({
+                    "Servicio": servicio, "Endpoint": endpoint, "Llamadas": llamadas,
+                    "Errores %": round(100 * grupo['errores'].sum() / llamadas, 1) if llamadas else 0,
+                    "Media (ms)": round(1000 * grupo['suma_seg'].sum() / llamadas) if llamadas else 0,
+                    "p50": percentil(grupo, 0.5), "p95": percentil(grupo, 0.95)
+                })
+            df_resumen = pd.DataFrame(resumen).sort_values("Llamadas", ascending=False)
+            st.dataframe(df_resumen, hide_index=True, use_container_width=True)
+
+            opciones_ep = [f"{r['Servicio']} · {r['Endpoint']}" for _, r in df_resumen.iterrows()]
+            elegido = st.selectbox("Histograma de:", opciones_ep, key="sel_hist_lat")
+            if elegido:
+                servicio, endpoint = elegido.split(" · ", 1)
+                df_ep = df_lat[(df_lat['servicio'] == servicio) & (df_lat['endpoint'] == endpoint)]
+                hist = df_ep.set_index('cubeta')['conteo'].reindex(orden_cubetas, fill_value=0)
+                st.bar_chart(hist)
+
+        st.divider()
+        st.markdown("### 🧠 Modelos de IA (Ollama)")
+        st.caption("Para comparar modelos, pon varios separados por coma en OLLAMA_MODEL: el bot los alterna al azar.")
+        try:
+            with engine.connect() as conn:
+                df_llm = pd.read_sql(text("""
+                    SELECT modelo, modo, llamadas, fallos_red, fallos_formato, reparaciones,
+                           tokens, seg_generacion, seg_primer_token
+                    FROM metricas_llm ORDER BY modelo, modo
+                """), conn)
+        except Exception:
+            df_llm = pd.DataFrame()
+
+        if df_llm.empty:
+            st.caption("Aún no hay llamadas a Ollama registradas.")
+        else:
+            respondidas = (df_llm['llamadas'] - df_llm['fallos_red']).clip(lower=1)
+            st.dataframe(pd.DataFrame({
+                "Modelo": df_llm['modelo'], "Modo": df_llm['modo'], "Llamadas": df_llm['llamadas'],
+                "Caídas %": (100 * df_llm['fallos_red'] / df_llm['llamadas']).round(1),
+                "JSON inválido %": (100 * df_llm['fallos_formato'] / respondidas).round(1),
+                "Reparaciones": df_llm['reparaciones'],
+                "1er token (s)": (df_llm['seg_primer_token'] / respondidas).round(2),
+                "Tokens/s": (df_llm['tokens'] / df_llm['seg_generacion'].where(df_llm['seg_generacion'] > 0)).round(1),
+            }), hide_index=True, use_container_width=True)
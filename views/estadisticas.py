@@ -2,6 +2,7 @@ import streamlit as st
 import pandas as pd
 from sqlalchemy import text
 from database import engine
+import resumenes_mensuales
 
 try:
     with engine.begin() as conn:
@@ -19,24 +20,17 @@ def render_estadisticas():
     # ==========================================================================
     # 1. DATOS DE VENTAS 
     # ==========================================================================
+    # Resúmenes mensuales mantenidos por triggers (resumenes_mensuales.py): solo se recalculan los meses tocados
+    try:
+        resumenes_mensuales.refrescar()
+    except Exception as e:
+        st.caption(f"⚠️ No se pudieron refrescar los resúmenes mensuales: {e}")
+
     query_ventas = text("""
-        SELECT 
-            DATE_TRUNC('month', v.fecha_venta)::DATE AS "Mes",
-            CASE 
-                WHEN prod.macro_categoria ILIKE 'peluca%' OR var.sku ILIKE 'WB-%' OR var.sku ILIKE 'WIG-%' OR d.descripcion ILIKE '[Pelucas]%' THEN 'Pelucas'
-                WHEN d.descripcion ILIKE '[Otros]%' OR d.sku IS NULL THEN 'Otros'
-                ELSE 'Lentes'
-            END AS "Macrocategoría",
-            COALESCE(prod.categoria, 'Otros') AS "Categoría",
-            SUM(d.cantidad) AS "Cantidad",
-            SUM(d.subtotal) AS "Total"
-        FROM ventas v
-        JOIN detalleventa d ON v.id_venta = d.id_venta
-        LEFT JOIN variantes var ON d.sku = var.sku
-        LEFT JOIN productos prod ON var.id_producto = prod.id_producto
-        WHERE v.anulado = FALSE 
-        GROUP BY 1, 2, 3
-        ORDER BY 1 ASC;
+        SELECT mes AS "Mes", macro AS "Macrocategoría", categoria AS "Categoría",
+               cantidad AS "Cantidad", CAST(total AS FLOAT) AS "Total"
+        FROM agg_ventas_mes
+        ORDER BY mes ASC
     """)
     
     with engine.connect() as conn:
@@ -103,10 +97,7 @@ def render_estadisticas():
     st.subheader("📦 Almacén y Valorizado (Stock Actual)")
     query_stock = text("""
         SELECT 
-            CASE 
-                WHEN prod.macro_categoria ILIKE 'peluca%' OR var.sku ILIKE 'WB-%' OR var.sku ILIKE 'WIG-%' THEN 'Pelucas'
-                ELSE 'Lentes'
-            END AS "Macrocategoría",
+            var.linea_negocio AS "Macrocategoría",
             COALESCE(prod.categoria, 'Otros') AS "Categoría",
             SUM(var.stock_interno) AS "Stock"
         FROM variantes var
@@ -137,21 +128,9 @@ def render_estadisticas():
     st.subheader("📊 Evolución del Stock Histórico")
     
     query_mov = text("""
-        SELECT 
-            DATE_TRUNC('month', m.fecha)::DATE AS "Mes",
-            CASE 
-                WHEN prod.macro_categoria ILIKE 'peluca%' OR m.sku ILIKE 'WB-%' OR m.sku ILIKE 'WIG-%' THEN 'Pelucas'
-                WHEN m.sku IS NULL THEN 'Otros'
-                ELSE 'Lentes'
-            END AS "Macrocategoría",
-            COALESCE(prod.categoria, 'Otros') AS "Categoría",
-            SUM(COALESCE(m.stock_nuevo, 0) - COALESCE(m.stock_anterior, 0)) AS "Neto"
-        FROM movimientos m
-        LEFT JOIN variantes var ON m.sku = var.sku
-        LEFT JOIN productos prod ON var.id_producto = prod.id_producto
-        WHERE m.fecha IS NOT NULL
-        GROUP BY 1, 2, 3
-        ORDER BY 1 ASC;
+        SELECT mes AS "Mes", macro AS "Macrocategoría", categoria AS "Categoría", neto AS "Neto"
+        FROM agg_movimientos_mes
+        ORDER BY mes ASC
     """)
     with engine.connect() as conn:
         df_mov = pd.read_sql(query_mov, conn)
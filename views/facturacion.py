@@ -5,6 +5,7 @@ from sqlalchemy import text
 from database import engine
 # Importamos la función para actualizar Google (ya que actualizas datos del cliente aquí)
 from utils import actualizar_en_google
+import exportaciones
 
 def render_facturacion():
     st.subheader("🧾 Facturación Individual")
@@ -181,7 +182,7 @@ def render_reporte_mensual():
     st.subheader("📊 Reporte Mensual para Declaración")
     
     # Se agrega el filtro para excluir 'SIN_BOLETA'
-    query_reporte = text("""
+    sql_reporte = """
         SELECT 
             TO_CHAR(fecha_facturacion, 'YYYY-MM') AS "Mes",
             COUNT(id_venta) AS "Cant. Boletas",
@@ -192,24 +193,28 @@ def render_reporte_mensual():
           AND numero_boleta IS NOT NULL
         GROUP BY 1
         ORDER BY 1 DESC
-    """)
+    """
     
     with engine.connect() as conn:
-        df_reporte = pd.read_sql(query_reporte, conn)
+        df_reporte = pd.read_sql(text(sql_reporte), conn)
     
     if df_reporte.empty:
         st.warning("No hay datos facturados para generar reportes.")
     else:
         st.dataframe(df_reporte, use_container_width=True, hide_index=True)
         
-        # Opción para descargar en Excel/CSV
-        csv = df_reporte.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            label="📥 Descargar Reporte (CSV)",
-            data=csv,
-            file_name='reporte_mensual_facturacion.csv',
-            mime='text/csv',
+        # Opción para descargar en Excel/CSV (archivo en disco; la versión es el propio resumen ya leído)
+        ruta_reporte, _ = exportaciones.exportar(
+            sql_reporte, formato="csv",
+            version_datos=str(pd.util.hash_pandas_object(df_reporte, index=False).sum())
         )
+        with open(ruta_reporte, "rb") as archivo:
+            st.download_button(
+                label="📥 Descargar Reporte (CSV)",
+                data=archivo,
+                file_name='reporte_mensual_facturacion.csv',
+                mime=exportaciones.MIME["csv"],
+            )
 
         # --- DETALLE DEL MES SELECCIONADO ---
         mes_seleccionar = st.selectbox("Ver detalle de un mes específico:", df_reporte["Mes"].unique())
@@ -3,6 +3,7 @@ import pandas as pd
 import time
 from sqlalchemy import text
 from database import engine
+import edicion_masiva
 
 # =========================================================================
 # AUTO-CREACIÓN DE TABLA MAESTRA DE SUBCATEGORÍAS AL INICIAR
@@ -64,26 +65,16 @@ def render_opciones():
         
         if st.button("💾 Guardar Cambios de Etapas", type="primary"):
             try:
+                # Las filas quitadas de la grilla no se borran (los clientes pueden seguir apuntando a esa etapa)
+                tipos = {"id_etapa": "INT", "grupo": "TEXT", "subgrupo": "TEXT", "activo": "BOOLEAN"}
                 with engine.begin() as conn:
-                    for index, row in edited_df.iterrows():
-                        if pd.isna(row['id_etapa']):
-                            conn.execute(text("""
-                                INSERT INTO EtapasCliente (grupo, subgrupo, activo) 
-                                VALUES (:g, :s, :a)
-                            """), {"g": row['grupo'], "s": row['subgrupo'], "a": row['activo']})
-                        else:
-                            conn.execute(text("""
-                                UPDATE EtapasCliente 
-                                SET grupo = :g, subgrupo = :s, activo = :a 
-                                WHERE id_etapa = :id
-                            """), {
-                                "g": row['grupo'], 
-                                "s": row['subgrupo'], 
-                                "a": row['activo'], 
-                                "id": int(row['id_etapa'])
-                            })
+                    n_nuevas = edicion_masiva.insertar(conn, "EtapasCliente", edited_df[edited_df['id_etapa'].isna()],
+                                                       {c: t for c, t in tipos.items() if c != "id_etapa"})
+                    n_editadas = edicion_masiva.actualizar(conn, "EtapasCliente",
+                                                           edicion_masiva.cambiadas(df_etapas, edited_df, "id_etapa", ["grupo", "subgrupo", "activo"]),
+                                                           "id_etapa", tipos)
                             
-                st.success("✅ Estados y etapas guardados correctamente en la Base de Datos.")
+                st.success(f"✅ Estados y etapas guardados: {n_nuevas} nuevos, {n_editadas} editados.")
                 time.sleep(1)
                 st.rerun()
             except Exception as e:
@@ -4,6 +4,9 @@ import time
 from sqlalchemy import text
 from database import engine
 import utils
+import inventario_grilla
+import edicion_masiva
+import importacion_stock
 
 # =========================================================================
 # AUTO-CREACIÓN DE TABLA MAESTRA PREVENTIVA
@@ -32,6 +35,13 @@ except Exception:
     pass
 
 
+def _mostrar_importacion_stock(datos):
+    resultado = datos['resultado']
+    if not resultado:
+        return
+    st.success(f"✅ Se ha actualizado el stock externo de {resultado['actualizadas']} variantes ({resultado.get('leidas', 0)} líneas válidas en el archivo).")
+    # La grilla de inventario no necesita recargarse a mano: los UPDATE a Variantes suben sello_inventario
+
 def vista_productos():
     st.title("📦 Gestión de Productos e Inventario")
     
@@ -40,33 +50,8 @@ def vista_productos():
     # --- PESTAÑA 1: GESTIÓN DE INVENTARIO ---
     # ==============================================================================
     with tab_gestion:
-        if 'df_inventario' not in st.session_state:
-            with engine.connect() as conn:
-                q_inv = """
-                    SELECT 
-                        v.sku, v.id_producto, 
-                        CASE 
-                            WHEN p.macro_categoria ILIKE 'peluca%' OR v.sku ILIKE 'WB-%' OR v.sku ILIKE 'WIG-%' THEN 'Pelucas'
-                            ELSE 'Lentes'
-                        END AS macro_categoria, 
-                        p.categoria, p.marca, p.modelo, p.nombre,
-                        p.color_principal, p.diametro, v.medida, v.stock_interno,
-                        (SELECT COALESCE(SUM(cantidad), 0) FROM Stock_Ubicaciones su WHERE su.sku = v.sku) as stock_asignado,
-                        (SELECT STRING_AGG(u.nombre || ' (' || su.cantidad || ' un.)', ' | ') 
-                         FROM Stock_Ubicaciones su 
-                         JOIN Ubicaciones_Estandar u ON su.id_ubicacion = u.id_ubicacion 
-                         WHERE su.sku = v.sku AND su.cantidad > 0) as ubicacion_nueva,
-                        v.stock_externo, v.stock_transito, v.ubicacion as ubicacion_antigua, p.importacion,
-                        p.url_compra, 
-                        COALESCE(NULLIF(TRIM(v.url_imagen), ''), NULLIF(TRIM(p.url_imagen), '')) AS url_imagen
-                    FROM Variantes v
-                    JOIN Productos p ON v.id_producto = p.id_producto
-                    ORDER BY macro_categoria DESC, p.marca, p.modelo, v.sku ASC
-                """
-                st.session_state.df_inventario = pd.read_sql(text(q_inv), conn)
-
-        df_calc = st.session_state.df_inventario.copy()
-        df_calc['nombre_completo'] = df_calc.apply(utils.generar_nombre_inteligente, axis=1)
+        # Foto compartida por todo el proceso; se recarga sola cuando cambia el stock (inventario_grilla.py)
+        df_calc = inventario_grilla.obtener().copy()
 
         # REFACTOR 2: Columna visual delgada (EXCLUSIVAMENTE EMOJI)
         mapa_linea_corta = {'Pelucas': '💇‍♀️', 'Lentes': '👓'}
@@ -108,7 +93,7 @@ def vista_productos():
             with c_btn:
                 st.write("") 
                 if st.button("🔄 Recargar BD", use_container_width=True, type="primary"):
-                    if 'df_inventario' in st.session_state: del st.session_state['df_inventario']
+                    inventario_grilla.invalidar()
                     st.rerun()
 
             lineas_disp = ["Todas"] + sorted(df_calc['macro_categoria'].unique().tolist())
@@ -193,47 +178,26 @@ def vista_productos():
         if edited_rows:
             st.info(f"💾 Tienes cambios pendientes en {len(edited_rows)} filas...")
             if st.button("Confirmar Cambios en Inventario", type="primary"):
-                with engine.connect() as conn:
-                    trans = conn.begin()
-                    try:
-                        count_ubi, count_prod, count_transito = 0, 0, 0 
-                        for idx, updates in edited_rows.items():
-                            row_original = df_final.iloc[idx]
-                            sku_target = row_original['sku']
-                            id_prod_target = int(row_original['id_producto']) 
-                            
-                            if 'ubicacion_antigua' in updates:
-                                conn.execute(text("UPDATE Variantes SET ubicacion = :u WHERE sku = :s"), {"u": updates['ubicacion_antigua'], "s": sku_target})
-                                count_ubi += 1
-
-                            if 'stock_transito' in updates:
-                                conn.execute(text("UPDATE Variantes SET stock_transito = :st WHERE sku = :s"), {"st": updates['stock_transito'], "s": sku_target})
-                                count_transito += 1
-                            
-                            if 'importacion' in updates or 'url_compra' in updates or 'categoria' in updates:
-                                nuevo_imp = updates.get('importacion', row_original['importacion'])
-                                nueva_url = updates.get('url_compra', row_original['url_compra'])
-                                nueva_cat = updates.get('categoria', row_original['categoria'])
-                                
-                                imp_db = None if pd.isna(nuevo_imp) else str(nuevo_imp)
-                                url_db = None if pd.isna(nueva_url) else str(nueva_url)
-                                cat_db = None if pd.isna(nueva_cat) else str(nueva_cat)
-
-                                conn.execute(text("""
-                                    UPDATE Productos 
-                                    SET importacion = :imp, url_compra = :url, categoria = :cat 
-                                    WHERE id_producto = :idp
-                                """), {"imp": imp_db, "url": url_db, "cat": cat_db, "idp": id_prod_target})
-                                count_prod += 1
-                        
-                        trans.commit()
-                        st.success(f"✅ Guardado con éxito: {count_ubi} Ubicaciones, {count_transito} Stocks en Camino y {count_prod} Datos de Producto.")
-                        del st.session_state['df_inventario'] 
-                        time.sleep(1.5)
-                        st.rerun()
-                    except Exception as e:
-                        trans.rollback()
-                        st.error(f"Error al guardar: {e}")
+                try:
+                    # Un UPDATE por tabla con solo las filas que cambiaron (edicion_masiva.py)
+                    var_cambiadas = edicion_masiva.cambiadas(df_final, cambios_inv, "sku", ["ubicacion_antigua", "stock_transito"])
+                    prod_cambiados = edicion_masiva.cambiadas(df_final, cambios_inv, "sku", ["importacion", "url_compra", "categoria"])
+                    # Varias variantes del mismo producto: vale la última edición
+                    prod_cambiados = prod_cambiados.drop_duplicates("id_producto", keep="last")
+                    with engine.begin() as conn:
+                        count_var = edicion_masiva.actualizar(
+                            conn, "Variantes", var_cambiadas.rename(columns={"ubicacion_antigua": "ubicacion"}), "sku",
+                            {"sku": "TEXT", "ubicacion": "TEXT", "stock_transito": "INT"})
+                        count_prod = edicion_masiva.actualizar(
+                            conn, "Productos", prod_cambiados, "id_producto",
+                            {"id_producto": "INT", "importacion": "TEXT", "url_compra": "TEXT", "categoria": "TEXT"})
+                except Exception as e:
+                    st.error(f"Error al guardar: {e}")
+                else:
+                    st.success(f"✅ Guardado con éxito: {count_var} Variantes (ubicación / en camino) y {count_prod} Datos de Producto.")
+                    inventario_grilla.invalidar()
+                    time.sleep(1.5)
+                    st.rerun()
     # ==============================================================================
     # --- PESTAÑA 1B: IMPORTAR STOCK EXTERNO (CSV) ---
     # ==============================================================================
@@ -244,36 +208,34 @@ def vista_productos():
 
         if archivo_csv:
             try:
-                df_proveedor = pd.read_csv(archivo_csv)
-                df_proveedor.columns = df_proveedor.columns.str.strip().str.lower()
-
-                if 'sku' not in df_proveedor.columns or 'stock' not in df_proveedor.columns:
-                    st.error("❌ El archivo CSV debe contener exactamente las columnas 'sku' y 'stock'.")
-                else:
-                    st.dataframe(df_proveedor.head(), use_container_width=True)
-                    if st.button("🚀 Procesar y Actualizar Stock Externo", type="primary"):
-                        with engine.connect() as conn:
-                            trans = conn.begin()
-                            try:
-                                contador = 0
-                                for _, row in df_proveedor.iterrows():
-                                    sku_csv = str(row['sku']).strip()
-                                    try: stock_csv = int(row['stock'])
-                                    except ValueError: continue 
-
-                                    conn.execute(text("UPDATE Variantes SET stock_externo = :stk WHERE sku = :sku"), {"stk": stock_csv, "sku": sku_csv})
-                                    contador += 1
-                                trans.commit()
-                                st.balloons()
-                                st.success(f"✅ Se ha actualizado el stock externo de {contador} variantes.")
-                                if 'df_inventario' in st.session_state: del st.session_state['df_inventario']
-                                time.sleep(2)
-                                st.rerun()
-                            except Exception as e:
-                                trans.rollback()
-                                st.error(f"❌ Error en base de datos: {e}")
+                # Lectura por trozos + validación en pandas; la simulación no escribe nada (importacion_stock.py)
+                validas, rechazadas = importacion_stock.leer_csv_proveedor(archivo_csv)
+                cambios, no_encontrados = importacion_stock.vista_previa_proveedor(validas)
+
+                c_v, c_c, c_n, c_r = st.columns(4)
+                c_v.metric("Líneas válidas", len(validas))
+                c_c.metric("Cambiarán", len(cambios))
+                c_n.metric("SKU inexistentes", len(no_encontrados))
+                c_r.metric("Rechazadas", len(rechazadas))
+
+                if not cambios.empty:
+                    st.markdown("**🔍 Vista previa (simulación, aún no se guardó nada)**")
+                    st.dataframe(cambios.rename(columns={"actual": "Stock Ext. Actual", "nuevo": "Stock Ext. Nuevo"}), use_container_width=True, hide_index=True)
+                if no_encontrados:
+                    with st.expander(f"⚠️ {len(no_encontrados)} SKU del archivo no existen en el sistema"):
+                        st.write(", ".join(no_encontrados))
+                if not rechazadas.empty:
+                    with st.expander(f"❌ {len(rechazadas)} líneas rechazadas"):
+                        st.dataframe(rechazadas, use_container_width=True, hide_index=True)
+
+                if not cambios.empty and st.button("🚀 Aplicar Stock Externo", type="primary"):
+                    # Se aplica en el trabajador (trabajos.py): COPY a tabla de paso + un solo UPDATE
+                    utils.encolar_unico("importar_stock_externo", filas=validas.values.tolist())
+            except ValueError as e:
+                st.error(f"❌ {e}")
             except Exception as e:
                 st.error(f"❌ Error al leer archivo CSV: {e}")
+        utils.render_trabajo("importar_stock_externo", _mostrar_importacion_stock)
     # ==============================================================================
     # --- NUEVA PESTAÑA 3: CONTROL DE UBICACIONES Y AUDITORÍA ---
     # ==============================================================================
@@ -3,6 +3,8 @@ import pandas as pd
 import time
 from sqlalchemy import text
 from database import engine
+import edicion_masiva
+import tablero_seguimiento
 from datetime import datetime, timedelta
 
 # Lista de respaldo por seguridad si la base de datos está vacía
@@ -28,8 +30,7 @@ def render_seguimiento():
     
     # BOTÓN MANUAL DE RECARGA
     if c_refresh.button("🔄 Recargar Datos"):
-        if 'df_seguimiento_cache' in st.session_state:
-            del st.session_state['df_seguimiento_cache']
+        tablero_seguimiento.invalidar()
         st.rerun()
 
     # --- 1. CARGA DINÁMICA DE ETAPAS ---
@@ -41,89 +42,48 @@ def render_seguimiento():
             todos_los_estados = df_etapas['subgrupo'].tolist()
             mapa_subgrupo_id = dict(zip(df_etapas['subgrupo'], df_etapas['id_etapa']))
             
-            # Agrupar por bloques dinámicos mapeando las hileras de la DB
-            etapa_1_etapas = df_etapas[df_etapas['grupo'].str.lower() == 'etapa 1']['subgrupo'].tolist()
-            etapa_2_etapas = df_etapas[df_etapas['grupo'].str.lower() == 'etapa 2']['subgrupo'].tolist()
-            etapa_3_etapas = df_etapas[df_etapas['grupo'].str.lower() == 'etapa 3']['subgrupo'].tolist()
-            etapa_4_etapas = df_etapas[df_etapas['grupo'].str.lower() == 'etapa 4']['subgrupo'].tolist()
+            # Agrupar por bloques dinámicos mapeando las hileras de la DB (ids: el tablero filtra por id_etapa)
+            ids_etapa = {n: df_etapas.loc[df_etapas['grupo'].str.lower() == f'etapa {n}', 'id_etapa'].tolist() for n in (1, 2, 3, 4)}
         else:
             todos_los_estados = ESTADOS_FALLBACK
             mapa_subgrupo_id = {}
-            etapa_1_etapas, etapa_2_etapas, etapa_3_etapas, etapa_4_etapas = [], [], [], []
+            ids_etapa = {n: [] for n in (1, 2, 3, 4)}
     except Exception as e:
         todos_los_estados = ESTADOS_FALLBACK
         mapa_subgrupo_id = {}
-        etapa_1_etapas, etapa_2_etapas, etapa_3_etapas, etapa_4_etapas = [], [], [], []
-
-    # --- 2. CARGA DE DATOS CONTROLADA ---
-    if 'df_seguimiento_cache' not in st.session_state:
-        with engine.connect() as conn:
-            query_seg = text("""
-                SELECT 
-                    c.id_cliente, c.nombre_corto, c.telefono, c.estado, c.fecha_seguimiento, 
-                    
-                    -- Datos de Venta
-                    v.id_venta, v.total_venta, v.clave_seguridad, 
-                    v.fecha_venta, 
-                    v.pendiente_pago,
-                    (SELECT STRING_AGG(d.cantidad || 'x ' || d.descripcion, ', ') 
-                        FROM DetalleVenta d WHERE d.id_venta = v.id_venta) as resumen_items,
-
-                    -- Datos de Dirección
-                    dir.id_direccion, dir.tipo_envio, dir.nombre_receptor, dir.telefono_receptor, 
-                    dir.direccion_texto, dir.distrito, 
-                    dir.referencia, dir.gps_link, dir.observacion,
-                    dir.dni_receptor, dir.agencia_nombre, dir.sede_entrega
-
-                FROM Clientes c
-                LEFT JOIN LATERAL (
-                    SELECT * FROM Ventas v2 WHERE v2.id_cliente = c.id_cliente ORDER BY v2.id_venta DESC LIMIT 1
-                ) v ON TRUE
-                LEFT JOIN LATERAL (
-                    SELECT * FROM Direcciones d2 
-                    WHERE d2.id_cliente = c.id_cliente AND d2.activo = TRUE 
-                    ORDER BY d2.es_principal DESC, d2.id_direccion DESC LIMIT 1
-                ) dir ON TRUE
-                WHERE c.activo = TRUE 
-                ORDER BY c.fecha_seguimiento ASC
-            """)
-            df_loaded = pd.read_sql(query_seg, conn)
-            st.session_state['df_seguimiento_cache'] = df_loaded
-    
-    df_seg = st.session_state['df_seguimiento_cache']
-
-    # --- PARCHE DE SEGURIDAD PARA CACHÉ DESACTUALIZADO ---
-    if 'tipo_envio' not in df_seg.columns:
-        del st.session_state['df_seguimiento_cache']
-        st.rerun()
+        ids_etapa = {n: [] for n in (1, 2, 3, 4)}
+
+    # --- 2. CARGA POR BANDEJA (paginada en el servidor, tablero_seguimiento.py) ---
+    def cargar_bandeja(clave, etapas, **filtro):
+        llave = f"pag_seg_{clave}"
+        numero = st.session_state.get(llave, 1)
+        df, total = tablero_seguimiento.pagina(etapas, numero - 1, **filtro)
+        if df.empty and numero > 1:  # La bandeja se achicó: volver a la primera página
+            st.session_state[llave] = 1
+            df, total = tablero_seguimiento.pagina(etapas, 0, **filtro)
+        return df.copy(), total
+
+    def paginador(clave, total):
+        paginas = -(-total // tablero_seguimiento.POR_PAGINA)
+        if paginas > 1:
+            st.number_input(f"Página (de {paginas} · {total} clientes)", min_value=1, max_value=paginas, step=1, key=f"pag_seg_{clave}")
 
     # --- 3. FUNCIONES DE GUARDADO ---
-    def guardar_edicion_rapida(df_editado, tipo_tabla):
+    def guardar_edicion_rapida(df_original, df_editado):
         try:
+            # Se compara contra la página cargada de la BD: solo viajan las filas que cambiaron
+            cli = edicion_masiva.cambiadas(df_original, df_editado, "id_cliente", ["estado", "fecha_seguimiento"]).copy()
+            cli['id_etapa'] = cli['estado'].map(mapa_subgrupo_id)
+            ven = edicion_masiva.cambiadas(df_original, df_editado[df_editado['id_venta'].notna()], "id_venta", ["pendiente_pago"]).copy()
+            ven['pendiente_pago'] = ven['pendiente_pago'].fillna(0.0)
             with engine.begin() as conn:
-                for index, row in df_editado.iterrows():
-                    id_etapa_val = mapa_subgrupo_id.get(row['estado'])
-                    id_cliente_nativo = int(row['id_cliente'])
-                    id_etapa_nativo = int(id_etapa_val) if pd.notnull(id_etapa_val) else None
-                    
-                    conn.execute(text("""
-                        UPDATE Clientes 
-                        SET estado = :est, id_etapa = :id_etapa, fecha_seguimiento = :fec 
-                        WHERE id_cliente = :id
-                    """), {
-                        "est": row['estado'], "id_etapa": id_etapa_nativo,
-                        "fec": row['fecha_seguimiento'], "id": id_cliente_nativo
-                    })
-                    
-                    if pd.notnull(row['id_venta']):
-                        id_venta_nativo = int(row['id_venta'])
-                        pendiente_nativo = float(row['pendiente_pago']) if pd.notnull(row['pendiente_pago']) else 0.0
-                        conn.execute(text("UPDATE Ventas SET pendiente_pago = :pen WHERE id_venta = :idv"),
-                                        {"pen": pendiente_nativo, "idv": id_venta_nativo})
-            
-            if 'df_seguimiento_cache' in st.session_state:
-                del st.session_state['df_seguimiento_cache']
-            st.toast("✅ Cambios guardados correctamente", icon="💾")
+                n_cli = edicion_masiva.actualizar(conn, "Clientes", cli, "id_cliente", {
+                    "id_cliente": "INT", "estado": "TEXT", "id_etapa": "INT", "fecha_seguimiento": "TIMESTAMP",
+                })
+                n_ven = edicion_masiva.actualizar(conn, "Ventas", ven, "id_venta", {"id_venta": "INT", "pendiente_pago": "NUMERIC"})
+
+            tablero_seguimiento.invalidar()
+            st.toast(f"✅ Cambios guardados: {n_cli} clientes, {n_ven} cobros", icon="💾")
             time.sleep(1)
             st.rerun()
         except Exception as e:
@@ -168,42 +128,34 @@ def render_seguimiento():
                     """), {"e": datos['nuevo_estado'], "id_etapa": id_etapa_nativo, "id": int(id_cliente)})
                                 
             st.toast("✅ Datos de envío registrados correctamente.", icon="💾")
-            if 'df_seguimiento_cache' in st.session_state:
-                del st.session_state['df_seguimiento_cache']
+            tablero_seguimiento.invalidar()
             time.sleep(1)
             st.rerun()
         except Exception as e:
             st.error(f"Error guardando formulario: {e}")
 
-    # --- 4. RENDERIZADO Y FILTRADO INTELIGENTE ---
-    if not df_seg.empty:
-        df_etapa2 = df_seg[df_seg['estado'].isin(etapa_2_etapas)]
-        
-        # Separación Inicial: Con dirección vs Sin dirección registrada
-        df_por_registrar = df_etapa2[pd.isna(df_etapa2['id_direccion'])].copy()
-        df_con_direccion = df_etapa2[pd.notna(df_etapa2['id_direccion'])].copy()
-        
-        # Segmentación Etapa 2 por columna tipo_envio
-        df_moto = df_con_direccion[df_con_direccion['tipo_envio'] == 'MOTO'].copy()
-        df_agencia = df_con_direccion[df_con_direccion['tipo_envio'] == 'AGENCIA'].copy()
-        df_otros = df_con_direccion[df_con_direccion['tipo_envio'] == 'OTROS'].copy()
-        
-        # Segmentación Etapa 3 (En Ruta) por columna tipo_envio
-        df_ruta_general = df_seg[df_seg['estado'].isin(etapa_3_etapas)]
-        df_ruta_moto = df_ruta_general[df_ruta_general['tipo_envio'] == 'MOTO'].copy()
-        df_ruta_agencia = df_ruta_general[df_ruta_general['tipo_envio'] == 'AGENCIA'].copy()
-        df_ruta_otros = df_ruta_general[df_ruta_general['tipo_envio'] == 'OTROS'].copy()
-        
-        df_e1 = df_seg[df_seg['estado'].isin(etapa_1_etapas)].copy()
-        df_e4 = df_seg[df_seg['estado'].isin(etapa_4_etapas)].copy()
-
+    # --- 4. BANDEJAS (una página de cada una) ---
+    # Etapa 2 por tipo de envío de la dirección principal (o sin dirección); Etapa 3 = En Ruta
+    df_moto, t_moto = cargar_bandeja("moto", ids_etapa[2], tipo_envio="MOTO")
+    df_agencia, t_agencia = cargar_bandeja("agencia", ids_etapa[2], tipo_envio="AGENCIA")
+    df_otros, t_otros = cargar_bandeja("otros", ids_etapa[2], tipo_envio="OTROS")
+    df_por_registrar, t_por_registrar = cargar_bandeja("por_registrar", ids_etapa[2], sin_direccion=True)
+    df_ruta_moto, t_ruta_moto = cargar_bandeja("ruta_moto", ids_etapa[3], tipo_envio="MOTO")
+    df_ruta_agencia, t_ruta_agencia = cargar_bandeja("ruta_agencia", ids_etapa[3], tipo_envio="AGENCIA")
+    df_ruta_otros, t_ruta_otros = cargar_bandeja("ruta_otros", ids_etapa[3], tipo_envio="OTROS")
+    df_e1, t_e1 = cargar_bandeja("e1", ids_etapa[1], con_envio=False)
+    df_e4, t_e4 = cargar_bandeja("e4", ids_etapa[4], con_envio=False)
+    t_ruta = t_ruta_moto + t_ruta_agencia + t_ruta_otros
+
+    # --- 5. RENDERIZADO ---
+    if t_moto + t_agencia + t_otros + t_por_registrar + t_ruta + t_e1 + t_e4 > 0:
         # Métricas (5 Columnas)
         c1, c2, c3, c4, c5 = st.columns(5)
-        c1.metric("🛵 Moto / Interno", len(df_moto))
-        c2.metric("🏢 Agencia", len(df_agencia))
-        c3.metric("📦 Otros", len(df_otros))
-        c4.metric("📝 Por Registrar", len(df_por_registrar))
-        c5.metric("🚚 En Ruta Total", len(df_ruta_general))
+        c1.metric("🛵 Moto / Interno", t_moto)
+        c2.metric("🏢 Agencia", t_agencia)
+        c3.metric("📦 Otros", t_otros)
+        c4.metric("📝 Por Registrar", t_por_registrar)
+        c5.metric("🚚 En Ruta Total", t_ruta)
         
         st.divider()
         
@@ -252,7 +204,7 @@ def render_seguimiento():
                 df_view.insert(0, "Seleccionar", False)
 
                 event_moto = st.data_editor(
-                    df_view[cols_show], key="ed_moto", 
+                    df_view[cols_show], key=f"ed_moto_{st.session_state.get('pag_seg_moto', 1)}", 
                     column_config={
                         "Seleccionar": st.column_config.CheckboxColumn("👉", width="small"),
                         "estado": st.column_config.SelectboxColumn("Estado", options=todos_los_estados, width="medium"),
@@ -266,19 +218,21 @@ def render_seguimiento():
                     }, hide_index=True, use_container_width=True
                 )
                 
+                paginador("moto", t_moto)
                 c_btn1, c_btn2 = st.columns([1, 1])
                 if c_btn1.button("💾 Guardar Cambios Moto", type="primary"): 
                     df_save = df_moto.loc[event_moto.index].copy()
                     df_save['estado'] = event_moto['estado']
                     df_save['fecha_seguimiento'] = event_moto['fecha_seguimiento']
                     df_save['pendiente_pago'] = event_moto['pendiente_pago']
-                    guardar_edicion_rapida(df_save, "MOTO")
+                    guardar_edicion_rapida(df_moto, df_save)
 
                 if c_btn2.button("📋 Generar Lista Ruta"):
                     fecha_manana = (datetime.now() - timedelta(hours=5) + timedelta(days=1)).strftime("%d/%m/%Y")
                     texto_ruta = f"*Fecha {fecha_manana}*\n----------------\n\n"
                     count = 1
-                    df_rut = df_moto.loc[event_moto.index]
+                    # La lista de ruta lleva toda la bandeja, no solo la página a la vista
+                    df_rut, _ = tablero_seguimiento.pagina(ids_etapa[2], 0, tipo_envio="MOTO", por_pagina=t_moto)
                     for idx, row in df_rut.iterrows():
                         monto = float(row['pendiente_pago']) if row['pendiente_pago'] else 0.0
                         str_cobro = "Pagó todo" if monto <= 0 else f"S/ {monto:.2f}"
@@ -318,7 +272,7 @@ def render_seguimiento():
                 df_view_a.insert(0, "Seleccionar", False)
                 
                 event_agencia = st.data_editor(
-                    df_view_a[cols_show], key="ed_age", 
+                    df_view_a[cols_show], key=f"ed_age_{st.session_state.get('pag_seg_agencia', 1)}", 
                     column_config={
                         "Seleccionar": st.column_config.CheckboxColumn("👉", width="small"),
                         "estado": st.column_config.SelectboxColumn("Estado", options=todos_los_estados, width="medium"),
@@ -332,12 +286,13 @@ def render_seguimiento():
                     }, hide_index=True, use_container_width=True
                 )
                 
+                paginador("agencia", t_agencia)
                 if st.button("💾 Guardar Cambios Agencia", type="primary"): 
                     df_save_a = df_agencia.loc[event_agencia.index].copy()
                     df_save_a['estado'] = event_agencia['estado']
                     df_save_a['fecha_seguimiento'] = event_agencia['fecha_seguimiento'] 
                     df_save_a['pendiente_pago'] = event_agencia['pendiente_pago']
-                    guardar_edicion_rapida(df_save_a, "AGENCIA")
+                    guardar_edicion_rapida(df_agencia, df_save_a)
 
                 filas_sel_a = event_agencia[event_agencia["Seleccionar"] == True]
                 if not filas_sel_a.empty:
@@ -372,7 +327,7 @@ def render_seguimiento():
                 df_view_o.insert(0, "Seleccionar", False)
 
                 event_otros = st.data_editor(
-                    df_view_o[cols_show], key="ed_otros",
+                    df_view_o[cols_show], key=f"ed_otros_{st.session_state.get('pag_seg_otros', 1)}",
                     column_config={
                         "Seleccionar": st.column_config.CheckboxColumn("👉", width="small"),
                         "estado": st.column_config.SelectboxColumn("Estado", options=todos_los_estados, width="medium"),
@@ -386,12 +341,13 @@ def render_seguimiento():
                     }, hide_index=True, use_container_width=True
                 )
 
+                paginador("otros", t_otros)
                 if st.button("💾 Guardar Cambios Otros", type="primary"):
                     df_save_o = df_otros.loc[event_otros.index].copy()
                     df_save_o['estado'] = event_otros['estado']
                     df_save_o['fecha_seguimiento'] = event_otros['fecha_seguimiento']
                     df_save_o['pendiente_pago'] = event_otros['pendiente_pago']
-                    guardar_edicion_rapida(df_save_o, "OTROS")
+                    guardar_edicion_rapida(df_otros, df_save_o)
 
                 filas_sel_o = event_otros[event_otros["Seleccionar"] == True]
                 if not filas_sel_o.empty:
@@ -420,7 +376,7 @@ def render_seguimiento():
                 df_view_pr.insert(0, "Seleccionar", False)
 
                 event_pr = st.data_editor(
-                    df_view_pr[cols_show], key="ed_pr",
+                    df_view_pr[cols_show], key=f"ed_pr_{st.session_state.get('pag_seg_por_registrar', 1)}",
                     column_config={
                         "Seleccionar": st.column_config.CheckboxColumn("👉", width="small"),
                         "estado": st.column_config.SelectboxColumn("Estado", options=todos_los_estados, width="medium"),
@@ -434,12 +390,13 @@ def render_seguimiento():
                     }, hide_index=True, use_container_width=True
                 )
 
+                paginador("por_registrar", t_por_registrar)
                 if st.button("💾 Guardar Cambios Rápidos Pendientes", type="primary"):
                     df_save_pr = df_por_registrar.loc[event_pr.index].copy()
                     df_save_pr['estado'] = event_pr['estado']
                     df_save_pr['fecha_seguimiento'] = event_pr['fecha_seguimiento']
                     df_save_pr['pendiente_pago'] = event_pr['pendiente_pago']
-                    guardar_edicion_rapida(df_save_pr, "PR")
+                    guardar_edicion_rapida(df_por_registrar, df_save_pr)
 
                 filas_sel_pr = event_pr[event_pr["Seleccionar"] == True]
                 if not filas_sel_pr.empty:
@@ -486,7 +443,7 @@ def render_seguimiento():
         st.divider()
         st.markdown("### 🚚 En Ruta Logística")
         
-        if not df_ruta_general.empty:
+        if t_ruta > 0:
             tab_r_moto, tab_r_agencia, tab_r_otros = st.tabs([
                 "🛵 EN RUTA MOTORIZADO", "🏢 EN RUTA AGENCIA", "📦 EN RUTA OTROS"
             ])
@@ -499,7 +456,7 @@ def render_seguimiento():
                     df_view_rm.insert(0, "Seleccionar", False)
                     
                     event_rm = st.data_editor(
-                        df_view_rm[cols_show], key="ed_r_moto",
+                        df_view_rm[cols_show], key=f"ed_r_moto_{st.session_state.get('pag_seg_ruta_moto', 1)}",
                         column_config={
                             "Seleccionar": st.column_config.CheckboxColumn("👉", width="small"),
                             "estado": st.column_config.SelectboxColumn("Estado", options=todos_los_estados, width="medium"),
@@ -513,12 +470,13 @@ def render_seguimiento():
                         }, hide_index=True, use_container_width=True
                     )
                     
+                    paginador("ruta_moto", t_ruta_moto)
                     if st.button("💾 Guardar Ruta Moto", type="primary"):
                         df_save_rm = df_ruta_moto.loc[event_rm.index].copy()
                         df_save_rm['estado'] = event_rm['estado']
                         df_save_rm['fecha_seguimiento'] = event_rm['fecha_seguimiento']
                         df_save_rm['pendiente_pago'] = event_rm['pendiente_pago']
-                        guardar_edicion_rapida(df_save_rm, "R_MOTO")
+                        guardar_edicion_rapida(df_ruta_moto, df_save_rm)
                         
                     filas_sel_rm = event_rm[event_rm["Seleccionar"] == True]
                     if not filas_sel_rm.empty:
@@ -551,7 +509,7 @@ def render_seguimiento():
                     df_view_ra.insert(0, "Seleccionar", False)
                     
                     event_ra = st.data_editor(
-                        df_view_ra[cols_show], key="ed_r_age",
+                        df_view_ra[cols_show], key=f"ed_r_age_{st.session_state.get('pag_seg_ruta_agencia', 1)}",
                         column_config={
                             "Seleccionar": st.column_config.CheckboxColumn("👉", width="small"),
                             "estado": st.column_config.SelectboxColumn("Estado", options=todos_los_estados, width="medium"),
@@ -565,12 +523,13 @@ def render_seguimiento():
                         }, hide_index=True, use_container_width=True
                     )
                     
+                    paginador("ruta_agencia", t_ruta_agencia)
                     if st.button("💾 Guardar Ruta Agencia", type="primary"):
                         df_save_ra = df_ruta_agencia.loc[event_ra.index].copy()
                         df_save_ra['estado'] = event_ra['estado']
                         df_save_ra['fecha_seguimiento'] = event_ra['fecha_seguimiento']
                         df_save_ra['pendiente_pago'] = event_ra['pendiente_pago']
-                        guardar_edicion_rapida(df_save_ra, "R_AGENCIA")
+                        guardar_edicion_rapida(df_ruta_agencia, df_save_ra)
                         
                     filas_sel_ra = event_ra[event_ra["Seleccionar"] == True]
                     if not filas_sel_ra.empty:
@@ -604,7 +563,7 @@ def render_seguimiento():
                     df_view_ro.insert(0, "Seleccionar", False)
                     
                     event_ro = st.data_editor(
-                        df_view_ro[cols_show], key="ed_r_otros",
+                        df_view_ro[cols_show], key=f"ed_r_otros_{st.session_state.get('pag_seg_ruta_otros', 1)}",
                         column_config={
                             "Seleccionar": st.column_config.CheckboxColumn("👉", width="small"),
                             "estado": st.column_config.SelectboxColumn("Estado", options=todos_los_estados, width="medium"),
@@ -618,12 +577,13 @@ def render_seguimiento():
                         }, hide_index=True, use_container_width=True
                     )
                     
+                    paginador("ruta_otros", t_ruta_otros)
                     if st.button("💾 Guardar Ruta Otros", type="primary"):
                         df_save_ro = df_ruta_otros.loc[event_ro.index].copy()
                         df_save_ro['estado'] = event_ro['estado']
                         df_save_ro['fecha_seguimiento'] = event_ro['fecha_seguimiento']
                         df_save_ro['pendiente_pago'] = event_ro['pendiente_pago']
-                        guardar_edicion_rapida(df_save_ro, "R_OTROS")
+                        guardar_edicion_rapida(df_ruta_otros, df_save_ro)
                         
                     filas_sel_ro = event_ro[event_ro["Seleccionar"] == True]
                     if not filas_sel_ro.empty:
@@ -633,7 +593,7 @@ def render_seguimiento():
                             c1, c2 = st.columns(2)
                             n_nom = c1.text_input("Recibe", row_full_ro['nombre_receptor'])
                             n_tel = c2.text_input("Teléfono", row_full_ro['telefono_receptor'])
-                            n_obs = st.text_area("Observación / Lugar", row_full_o['observacion'])
+                            n_obs = st.text_area("Observación / Lugar", row_full_ro['observacion'])
                             col_st, col_btn = st.columns([2, 1])
                             idx_estado = todos_los_estados.index(row_full_ro['estado']) if row_full_ro['estado'] in todos_los_estados else 0
                             nuevo_estado = col_st.selectbox("Mover a Estado:", todos_los_estados, index=idx_estado, key="est_ro_ind")
@@ -647,27 +607,29 @@ def render_seguimiento():
 
         # --- OTRAS BANDEJAS EXPANDIBLES ---
         st.divider()
-        with st.expander(f"💬 Conversación / Cotizando ({len(df_e1)})"):
+        with st.expander(f"💬 Conversación / Cotizando ({t_e1})"):
             if not df_e1.empty:
                 cols_e1 = ["id_cliente", "estado", "nombre_corto", "telefono", "resumen_items", "fecha_seguimiento"]
-                event_e1 = st.data_editor(df_e1[cols_e1], key="ed_e1", column_config={"estado": st.column_config.SelectboxColumn("Estado", options=todos_los_estados), "id_cliente": None}, hide_index=True, use_container_width=True)
+                event_e1 = st.data_editor(df_e1[cols_e1], key=f"ed_e1_{st.session_state.get('pag_seg_e1', 1)}", column_config={"estado": st.column_config.SelectboxColumn("Estado", options=todos_los_estados), "id_cliente": None}, hide_index=True, use_container_width=True)
+                paginador("e1", t_e1)
                 if st.button("💾 Guardar Conversación"):
                     df_save_e1 = df_e1.loc[event_e1.index].copy()
                     df_save_e1['estado'] = event_e1['estado']
                     df_save_e1['fecha_seguimiento'] = event_e1['fecha_seguimiento']
-                    guardar_edicion_rapida(df_save_e1, "E1")
+                    guardar_edicion_rapida(df_e1, df_save_e1)
             else:
                 st.caption("Vacío.")
 
-        with st.expander(f"✨ Post-Venta ({len(df_e4)})"):
+        with st.expander(f"✨ Post-Venta ({t_e4})"):
             if not df_e4.empty:
                 cols_e4 = ["id_cliente", "estado", "nombre_corto", "telefono", "resumen_items", "fecha_seguimiento"]
-                event_e4 = st.data_editor(df_e4[cols_e4], key="ed_e4", column_config={"estado": st.column_config.SelectboxColumn("Estado", options=todos_los_estados), "id_cliente": None}, hide_index=True, use_container_width=True)
+                event_e4 = st.data_editor(df_e4[cols_e4], key=f"ed_e4_{st.session_state.get('pag_seg_e4', 1)}", column_config={"estado": st.column_config.SelectboxColumn("Estado", options=todos_los_estados), "id_cliente": None}, hide_index=True, use_container_width=True)
+                paginador("e4", t_e4)
                 if st.button("💾 Guardar Post-Venta"):
                     df_save_e4 = df_e4.loc[event_e4.index].copy()
                     df_save_e4['estado'] = event_e4['estado']
                     df_save_e4['fecha_seguimiento'] = event_e4['fecha_seguimiento']
-                    guardar_edicion_rapida(df_save_e4, "E4")
+                    guardar_edicion_rapida(df_e4, df_save_e4)
             else:
                 st.caption("Vacío.")
     else:
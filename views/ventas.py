@@ -7,6 +7,7 @@ from database import engine
 import os
 import threading
 from utils import sync_woo_background
+import registro_ventas
 
 # Asegurar que existan las columnas necesarias en la base de datos
 try:
@@ -445,21 +446,7 @@ def render_nueva_venta():
 
                 if st.button("✅ REGISTRAR VENTA", type="primary", use_container_width=True):
                     try:
-                        with engine.connect() as conn:
-                            trans = conn.begin()
-                            
-                            has_macro_col = False
-                            try:
-                                conn.execute(text("SELECT macro_categoria FROM DetalleVenta LIMIT 1"))
-                                has_macro_col = True
-                            except: pass
-
-                            has_ubi_col = False
-                            try:
-                                conn.execute(text("SELECT id_ubicacion FROM DetalleVenta LIMIT 1"))
-                                has_ubi_col = True
-                            except: pass
-
+                        with engine.begin() as conn:
                             if not usar_guardada and datos_nuevos:
                                 conn.execute(text("UPDATE Direcciones SET es_principal = FALSE WHERE id_cliente = :id"), {"id": id_cliente})
                                 
@@ -470,57 +457,13 @@ def render_nueva_venta():
                                 """), {"id": id_cliente, **datos_nuevos})
 
                             nota_full = f"{nota_venta} | Envío: {texto_direccion_final}"
-                            
-                            res_v = conn.execute(text("""
-                                INSERT INTO Ventas (id_cliente, tipo_envio, costo_envio, total_venta, nota, clave_seguridad, pendiente_pago)
-                                VALUES (:idc, :tipo, :costo, :total, :nota, :clave, :pendiente) RETURNING id_venta
-                            """), {"idc": id_cliente, "tipo": tipo_envio_ui, "costo": costo_envio, "total": total_final, "nota": nota_full, "clave": clave_agencia, "pendiente": restante})
-                            
-                            id_venta = res_v.fetchone()[0]
 
-                            for item in st.session_state.carrito:
-                                mac_val = item.get('macro_categoria', 'Otros')
-                                id_ubi = item.get('id_ubicacion')
-                                
-                                if pd.isna(id_ubi):
-                                    id_ubi = None
-                                else:
-                                    id_ubi = int(id_ubi)
-                                
-                                if has_macro_col and has_ubi_col:
-                                    conn.execute(text("""
-                                        INSERT INTO DetalleVenta (id_venta, sku, descripcion, cantidad, precio_unitario, subtotal, es_inventario, macro_categoria, id_ubicacion)
-                                        VALUES (:idv, :sku, :desc, :cant, :pu, :sub, :inv, :mac, :idu)
-                                    """), {"idv": id_venta, "sku": item['sku'], "desc": item['descripcion'], "cant": int(item['cantidad']), "pu": float(item['precio']), "sub": float(item['subtotal']), "inv": item['es_inventario'], "mac": mac_val, "idu": id_ubi})
-                                elif has_macro_col:
-                                    conn.execute(text("""
-                                        INSERT INTO DetalleVenta (id_venta, sku, descripcion, cantidad, precio_unitario, subtotal, es_inventario, macro_categoria)
-                                        VALUES (:idv, :sku, :desc, :cant, :pu, :sub, :inv, :mac)
-                                    """), {"idv": id_venta, "sku": item['sku'], "desc": item['descripcion'], "cant": int(item['cantidad']), "pu": float(item['precio']), "sub": float(item['subtotal']), "inv": item['es_inventario'], "mac": mac_val})
-                                else:
-                                    conn.execute(text("""
-                                        INSERT INTO DetalleVenta (id_venta, sku, descripcion, cantidad, precio_unitario, subtotal, es_inventario)
-                                        VALUES (:idv, :sku, :desc, :cant, :pu, :sub, :inv)
-                                    """), {"idv": id_venta, "sku": item['sku'], "desc": item['descripcion'], "cant": int(item['cantidad']), "pu": float(item['precio']), "sub": float(item['subtotal']), "inv": item['es_inventario']})
-                                
-                                if item['es_inventario']:
-                                    res_s = conn.execute(text("UPDATE Variantes SET stock_interno = stock_interno - :c WHERE sku=:s RETURNING stock_interno"),
-                                                         {"c": int(item['cantidad']), "s": item['sku']})
-                                    nuevo_s = res_s.scalar()
-                                    
-                                    if id_ubi is not None:
-                                        conn.execute(text("UPDATE Stock_Ubicaciones SET cantidad = cantidad - :c WHERE sku = :s AND id_ubicacion = :idu"),
-                                                     {"c": int(item['cantidad']), "s": item['sku'], "idu": id_ubi})
-                                    elif nuevo_s <= 0: 
-                                        conn.execute(text("UPDATE Variantes SET ubicacion = '' WHERE sku=:s"), {"s": item['sku']})
-                                    
-                                    nota_mov = f"Venta #{id_venta}" + (f" ({item['nombre_ubicacion']})" if item.get('nombre_ubicacion') else "")
-                                    conn.execute(text("""
-                                        INSERT INTO Movimientos (sku, tipo_movimiento, cantidad, stock_anterior, stock_nuevo, nota, id_cliente) 
-                                        VALUES (:sku, 'VENTA', :c, (SELECT stock_interno + :c FROM Variantes WHERE sku=:sku), :nue, :nota, :idc)
-                                    """), {"sku": item['sku'], "c": int(item['cantidad']), "nue": nuevo_s, "nota": nota_mov, "idc": id_cliente})
-                            
-                            trans.commit()
+                            # Cabecera, detalle, stock, estantes y Movimientos en una sola sentencia (registro_ventas.py)
+                            id_venta = registro_ventas.registrar_venta(conn, {
+                                "id_cliente": id_cliente, "tipo_envio": tipo_envio_ui, "costo_envio": costo_envio,
+                                "total_venta": total_final, "nota": nota_full, "clave_seguridad": clave_agencia,
+                                "pendiente_pago": restante
+                            }, st.session_state.carrito)
                         
                         skus_vendidos = [item["sku"] for item in st.session_state.carrito if item["sku"] is not None]
                         if skus_vendidos:
@@ -545,35 +488,9 @@ def render_nueva_venta():
                 
                 if st.button("📉 CONFIRMAR SALIDA", type="primary"):
                     try:
-                        with engine.connect() as conn:
-                            trans = conn.begin()
-                            items_procesados = 0
-                            for item in st.session_state.carrito:
-                                if item['es_inventario']:
-                                    id_ubi = item.get('id_ubicacion')
-                                    
-                                    if pd.isna(id_ubi):
-                                        id_ubi = None
-                                    else:
-                                        id_ubi = int(id_ubi)
-                                        
-                                    res_s = conn.execute(text("UPDATE Variantes SET stock_interno = stock_interno - :c WHERE sku=:s RETURNING stock_interno"),
-                                        {"c": int(item['cantidad']), "s": item['sku']})
-                                    nuevo_s = res_s.scalar()
-                                    
-                                    if id_ubi is not None:
-                                        conn.execute(text("UPDATE Stock_Ubicaciones SET cantidad = cantidad - :c WHERE sku = :sku AND id_ubicacion = :idu"),
-                                                     {"c": int(item['cantidad']), "sku": item['sku'], "idu": id_ubi})
-                                    elif nuevo_s <= 0: 
-                                        conn.execute(text("UPDATE Variantes SET ubicacion = '' WHERE sku=:s"), {"s": item['sku']})
-                                        
-                                    nota_completa = f"{motivo_salida}" + (f" - {detalle_motivo}" if detalle_motivo else "") + (f" (Estante: {item['nombre_ubicacion']})" if item.get('nombre_ubicacion') else "")
-                                    conn.execute(text("""
-                                            INSERT INTO Movimientos (sku, tipo_movimiento, cantidad, stock_anterior, stock_nuevo, nota)
-                                            VALUES (:sku, 'SALIDA', :c, :ant, :nue, :nota)
-                                        """), {"sku": item['sku'], "c": int(item['cantidad']), "ant": nuevo_s + int(item['cantidad']), "nue": nuevo_s, "nota": nota_completa})
-                                    items_procesados += 1
-                            trans.commit()
+                        nota_salida = f"{motivo_salida}" + (f" - {detalle_motivo}" if detalle_motivo else "")
+                        with engine.begin() as conn:
+                            items_procesados = registro_ventas.registrar_salida(conn, st.session_state.carrito, nota_salida)
 
                         skus_vendidos = [item["sku"] for item in st.session_state.carrito if item["sku"] is not None]
                         if skus_vendidos:
@@ -4,14 +4,12 @@ from flask import Flask, request, jsonify
 from sqlalchemy import text
 from database import engine
 import os
-import requests
 import sys
 import json
 import random
 from datetime import datetime
-import io
-from PIL import Image
 import threading
+from integraciones import waha
 
 app = Flask(__name__)
 
@@ -26,11 +24,13 @@ def log_error(msg):
 
 # 🛠️ CORRECCIÓN: Agregamos buscar_contacto_google a la importación
 try:
-    from utils import normalizar_telefono_maestro, crear_en_google, buscar_contacto_google
+    from utils import normalizar_telefono_maestro, crear_en_google, buscar_contacto_google, resolver_telefono_api, obtener_nombre_waha
 except ImportError:
     def normalizar_telefono_maestro(t): return {"db": "".join(filter(str.isdigit, str(t)))}
     def crear_en_google(n, a, t): return False
-    def buscar_contacto_google(t): return None
+    def buscar_contacto_google(t, sincronizar=False): return None
+    def resolver_telefono_api(lid, session): return None
+    def obtener_nombre_waha(contact_id, session): return None
 
 def aplicar_parche_db():
     try:
@@ -58,38 +58,35 @@ def aplicar_parche_db():
 
 aplicar_parche_db()
 
-# 🛠️ CORRECCIÓN: Ahora recibe id_cliente y guarda el vínculo en la BD
 def sync_google_fondo(id_cliente, nombre, telefono):
-    """Guarda el contacto en Google Contacts de forma asíncrona y lo vincula"""
-    if not telefono or "LID_" in str(telefono): 
+    """Vincula al cliente nuevo con su contacto de Google (lo crea si no existe) y trae sus nombres. Corre en un hilo aparte."""
+    if not telefono or "LID_" in str(telefono):
         return
 
     norm = normalizar_telefono_maestro(telefono)
-    if norm:
-        tel_google = norm.get('google', norm['db'])
-        exito = crear_en_google(nombre, "", tel_google)
-
-        if exito:
+    if not norm:
+        return
+    try:
+        res_g = buscar_contacto_google(norm['db'], sincronizar=True)
+        if not (res_g and res_g.get('encontrado')):
+            tel_google = norm.get('google', norm['db'])
+            if not crear_en_google(nombre, "", tel_google):
+                log_error(f"❌ Falló sincronización con Google para: {nombre}")
+                return
             log_info(f"✅ Sincronización Google exitosa para: {nombre} ({tel_google})")
-
-            # Buscar el contacto recién creado para obtener su ID y sus Nombres
+            # crear_en_google ya dejó el contacto en el espejo local
             res_g = buscar_contacto_google(norm['db'])
-            if res_g and res_g.get('encontrado'):
-                g_id = res_g['google_id']
-                g_nom = res_g.get('nombre', nombre)
-                g_ape = res_g.get('apellido', '')
-                try:
-                    with engine.begin() as conn:
-                        conn.execute(text("""
-                            UPDATE Clientes 
-                            SET google_id = :gid, nombre = :n, apellido = :a 
-                            WHERE id_cliente = :id
-                        """), {"gid": g_id, "n": g_nom, "a": g_ape, "id": id_cliente})
-                    log_info(f"🔗 Cliente {id_cliente} vinculado permanentemente con Google ID: {g_id}")
-                except Exception as e:
-                    log_error(f"❌ Error al guardar el Google ID en la BD: {e}")
-        else:
-            log_error(f"❌ Falló sincronización con Google para: {nombre}")
+
+        if res_g and res_g.get('encontrado'):
+            with engine.begin() as conn:
+                conn.execute(text("""
+                    UPDATE Clientes
+                    SET google_id = :gid, nombre = :n, apellido = :a
+                    WHERE id_cliente = :id AND google_id IS NULL
+                """), {"gid": res_g['google_id'], "n": res_g.get('nombre') or nombre, "a": res_g.get('apellido', ''), "id": id_cliente})
+            log_info(f"🔗 Cliente {id_cliente} vinculado permanentemente con Google ID: {res_g['google_id']}")
+    except Exception as e:
+        log_error(f"⚠️ Sync Google en segundo plano falló para {telefono}: {e}")
 
 def descargar_media_plus(media_url):
     try:
@@ -104,9 +101,8 @@ def descargar_media_plus(media_url):
                 path_real = media_url.split('/api/')[-1]
                 base = WAHA_URL.rstrip('/')
                 url_final = f"{base}/api/{path_real}"
-        headers = {}
-        if WAHA_KEY: headers["X-Api-Key"] = WAHA_KEY   
-        r = requests.get(url_final, headers=headers, timeout=10)
+        # Sesión compartida de WAHA (keep-alive, X-Api-Key, reintentos y latencias)
+        r = waha.get(url_final, endpoint="GET media", timeout=10)
         return r.content if r.status_code == 200 else None
     except: return None
 
@@ -115,6 +111,10 @@ def comprimir_imagen_waha(image_bytes, max_bytes=2097152):
         return image_bytes
 
     try:
+        # PIL solo hace falta para los archivos grandes: se importa aquí
+        import io
+        from PIL import Image
+
         img = Image.open(io.BytesIO(image_bytes))
         formato = img.format
 
@@ -202,44 +202,6 @@ def obtener_telefono_local(payload):
         return None
     except: return None
 
-def resolver_telefono_api(lid, session):
-    if not WAHA_URL or not lid: return None
-    try:
-        lid_safe = lid.replace('@', '%40')
-        url = f"{WAHA_URL.rstrip('/')}/api/{session}/lids/{lid_safe}"
-        headers = {"Content-Type": "application/json"}
-        if WAHA_KEY: headers["X-Api-Key"] = WAHA_KEY
-        r = requests.get(url, headers=headers, timeout=5)
-        if r.status_code == 200:
-            data = r.json()
-            pn = data.get('pn')
-            if pn:
-                log_info(f"✨ API Resuelta: {lid} es {pn}")
-                return pn.split('@')[0]
-    except Exception as e:
-        log_error(f"Error API WAHA LIDs: {e}")
-    return None
-
-def obtener_nombre_waha(contact_id, session):
-    """Consulta la API de WAHA para obtener el nombre configurado por el usuario en WhatsApp"""
-    if not WAHA_URL or not contact_id: return None
-    try:
-        url = f"{WAHA_URL.rstrip('/')}/api/contacts/contact"
-        params = {"contactId": contact_id, "session": session}
-        headers = {"Content-Type": "application/json"}
-        if WAHA_KEY: headers["X-Api-Key"] = WAHA_KEY
-
-        r = requests.get(url, params=params, headers=headers, timeout=5)
-        if r.status_code == 200:
-            data = r.json()
-            nombre = data.get('name') or data.get('pushname') or data.get('shortName')
-            if nombre:
-                log_info(f"✨ Nombre obtenido de API WAHA: {nombre}")
-                return nombre
-    except Exception as e:
-        log_error(f"Error API WAHA Contacts: {e}")
-    return None
-
 # ==============================================================================
 # 🚀 WEBHOOK PRINCIPAL V54 (Fix Vinculación y Extracción Nombres)
 # ==============================================================================
@@ -516,14 +478,14 @@ def recibir_mensaje():
 
                         # Matar al clon
                         conn.execute(text("UPDATE Clientes SET estado='Duplicado', activo=FALSE, whatsapp_internal_id=NULL WHERE id_cliente=:old"), {"old": cliente_lid.id_cliente})
-                        conn.execute(text("UPDATE Clientes SET activo=TRUE WHERE id_cliente=:new"), {"new": cliente_tel.id_cliente})
+                        conn.execute(text("UPDATE Clientes SET activo=TRUE WHERE id_cliente=:new AND activo IS NOT TRUE"), {"new": cliente_tel.id_cliente})
 
                         id_cliente_final = cliente_tel.id_cliente
 
                     # --- ESCENARIO 2: Solo existe el cliente por Teléfono ---
                     elif cliente_tel:
                         id_cliente_final = cliente_tel.id_cliente
-                        conn.execute(text("UPDATE Clientes SET activo=TRUE WHERE id_cliente = :id"), {"id": id_cliente_final})
+                        conn.execute(text("UPDATE Clientes SET activo=TRUE WHERE id_cliente = :id AND activo IS NOT TRUE"), {"id": id_cliente_final})
 
                         # Inyectar el LID y Alias nuevo al teléfono existente
                         if wspid_lid:
@@ -546,7 +508,7 @@ def recibir_mensaje():
                             """), {"n": telefono_num, "lid": wspid_lid, "alias": nombre_corto_final, "o": viejo_tel, "id": id_cliente_final})
                             conn.execute(text("UPDATE Clientes SET telefono=:n, activo=TRUE WHERE id_cliente=:id"), {"n": telefono_num, "id": id_cliente_final})
                         else:
-                            conn.execute(text("UPDATE Clientes SET activo=TRUE WHERE id_cliente=:id"), {"id": id_cliente_final})
+                            conn.execute(text("UPDATE Clientes SET activo=TRUE WHERE id_cliente=:id AND activo IS NOT TRUE"), {"id": id_cliente_final})
                             conn.execute(text("UPDATE telefonoscliente SET alias=:alias WHERE id_cliente=:id AND lid=:lid"), {"alias": nombre_corto_final, "id": id_cliente_final, "lid": wspid_lid})
 
                     # --- ESCENARIO 4: Prospecto 100% Nuevo ---
@@ -0,0 +1,279 @@
+import os
+import json
+import math
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# ==============================================================================
+# 🕸️ RASTREADOR CONCURRENTE DEL CATÁLOGO WOOCOMMERCE
+# ==============================================================================
+# Usado por la sincronización de stock (sync_woo.py), la auditoría bidireccional
+# del panel (utils.ejecutar_auditoria_bidireccional_woo) y las actualizaciones
+# masivas reanudables (forzar_index.py).
+
+POR_PAGINA = 100
+MAX_HILOS = 6
+
+
+def _pedir_pagina(wcapi, endpoint, pagina, intentos=3):
+    """
+    Descarga una página del endpoint y lee las cabeceras de paginación de WordPress.
+    Devuelve (items, total_registros, total_paginas). Reintenta ante 429/5xx.
+    """
+    resp = None
+    for intento in range(intentos):
+        # Orden fijo por id: con el orden por defecto (fecha) un producto creado o
+        # editado a mitad del recorrido desplaza las páginas y se saltan o repiten items
+        resp = wcapi.get(endpoint, params={"per_page": POR_PAGINA, "page": pagina, "orderby": "id", "order": "asc"})
+        if resp.status_code == 200:
+            items = resp.json() or []
+            total = int(resp.headers.get("X-WP-Total") or len(items))
+            total_paginas = int(resp.headers.get("X-WP-TotalPages") or 1)
+            return items, total, total_paginas
+        if resp.status_code == 429 or resp.status_code >= 500:
+            time.sleep(2 ** intento)
+            continue
+        break
+
+    codigo = resp.status_code if resp is not None else "?"
+    raise RuntimeError(f"WooCommerce respondió HTTP {codigo} en '{endpoint}' (página {pagina})")
+
+
+def _publicar_lote(wcapi, endpoint, datos, intentos=3):
+    """POST de un lote /batch con el mismo reintento ante 429/5xx. Devuelve el JSON de respuesta."""
+    resp = None
+    for intento in range(intentos):
+        resp = wcapi.post(endpoint, datos)
+        if resp.status_code in [200, 201]:
+            return resp.json() or {}
+        if resp.status_code == 429 or resp.status_code >= 500:
+            time.sleep(2 ** intento)
+            continue
+        break
+
+    codigo = resp.status_code if resp is not None else "?"
+    raise RuntimeError(f"WooCommerce respondió HTTP {codigo} en '{endpoint}'")
+
+
+def recorrer_catalogo_woo(wcapi, max_hilos=MAX_HILOS):
+    """
+    Recorre productos y variaciones en paralelo y emite cada página apenas llega.
+
+    Es un generador. Cada paso es un dict:
+        items:            [{"sku", "id", "parent_id", "tipo", "nombre"}]  (tipo: simple | variable | variacion)
+        productos_total:  X-WP-Total del listado de productos
+        variaciones_total: suma de variaciones declaradas por los padres vistos hasta ahora
+        paginas_hechas / paginas_totales: avance real (las de variaciones se suman al descubrir cada padre)
+    """
+    estado = {"paginas_hechas": 0, "paginas_totales": 0, "variaciones_total": 0}
+
+    with ThreadPoolExecutor(max_workers=max_hilos) as pool:
+        pendientes = {}
+
+        def encolar(endpoint, pagina, padre=None):
+            fut = pool.submit(_pedir_pagina, wcapi, endpoint, pagina)
+            pendientes[fut] = (endpoint, pagina, padre)
+
+        def normalizar(items, padre):
+            registros = []
+            for p in items:
+                sku = str(p.get("sku") or "").strip()
+                if padre:
+                    opciones = [attr.get("option", "") for attr in p.get("attributes", [])]
+                    registros.append({
+                        "sku": sku, "id": p["id"], "parent_id": padre["id"], "tipo": "variacion",
+                        "nombre": f"{padre['nombre']} ({' '.join(opciones)})".strip()
+                    })
+                    continue
+
+                tipo = "variable" if p.get("type") == "variable" else "simple"
+                registros.append({
+                    "sku": sku, "id": p["id"], "parent_id": 0, "tipo": tipo,
+                    "nombre": p.get("name", "Producto sin título")
+                })
+
+                if tipo == "variable":
+                    # El padre ya declara sus IDs de variación: así conocemos el total antes de pedirlas.
+                    # Con `variations: []` no hay nada que pedir; sin la clave, se expande por cabeceras
+                    ids_variaciones = p.get("variations")
+                    datos_padre = {"id": p["id"], "nombre": p.get("name", "Producto sin título"), "expandir": ids_variaciones is None}
+                    n_paginas = 1 if ids_variaciones is None else math.ceil(len(ids_variaciones) / POR_PAGINA)
+                    estado["variaciones_total"] += len(ids_variaciones or [])
+                    estado["paginas_totales"] += n_paginas
+                    for v_pagina in range(1, n_paginas + 1):
+                        encolar(f"products/{p['id']}/variations", v_pagina, datos_padre)
+            return registros
+
+        def paso(registros, productos_total):
+            estado["paginas_hechas"] += 1
+            return {
+                "items": registros,
+                "productos_total": productos_total,
+                "variaciones_total": estado["variaciones_total"],
+                "paginas_hechas": estado["paginas_hechas"],
+                "paginas_totales": estado["paginas_totales"],
+            }
+
+        try:
+            # 1. La primera página es síncrona: sus cabeceras dicen cuántas páginas quedan
+            items, productos_total, paginas_prod = _pedir_pagina(wcapi, "products", 1)
+            estado["paginas_totales"] += paginas_prod
+            for pagina in range(2, paginas_prod + 1):
+                encolar("products", pagina)
+            yield paso(normalizar(items, None), productos_total)
+
+            # 2. El resto llega en el orden en que responda el servidor
+            while pendientes:
+                hechos, _ = wait(list(pendientes), return_when=FIRST_COMPLETED)
+                for fut in hechos:
+                    endpoint, pagina, padre = pendientes.pop(fut)
+                    items, total, total_paginas = fut.result()
+
+                    if padre and padre.get("expandir") and pagina == 1:
+                        # Padre sin lista de variaciones: usamos las cabeceras de la primera página
+                        estado["variaciones_total"] += total
+                        estado["paginas_totales"] += total_paginas - 1
+                        for v_pagina in range(2, total_paginas + 1):
+                            encolar(endpoint, v_pagina, padre)
+
+                    yield paso(normalizar(items, padre), productos_total)
+        finally:
+            for fut in pendientes:
+                fut.cancel()
+
+
+# ==============================================================================
+# 🧱 ACTUALIZACIÓN MASIVA REANUDABLE (products/batch + checkpoint local)
+# ==============================================================================
+class LimitadorTasa:
+    """Espaciado mínimo entre peticiones, compartido por todos los hilos del trabajo."""
+
+    def __init__(self, peticiones_por_segundo):
+        self.intervalo = 1.0 / peticiones_por_segundo if peticiones_por_segundo else 0
+        self._lock = threading.Lock()
+        self._siguiente = 0.0
+
+    def esperar(self):
+        if not self.intervalo:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self._siguiente)
+            self._siguiente = turno + self.intervalo
+        time.sleep(max(0, turno - ahora))
+
+
+def _leer_estado(ruta):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _guardar_estado(ruta, estado):
+    # Escritura atómica: un corte a mitad de escritura no corrompe el checkpoint
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(estado, f, ensure_ascii=False, indent=2)
+    os.replace(temporal, ruta)
+
+
+def actualizar_catalogo_por_lotes(wcapi, parche, filtro=None, nombre_trabajo="masivo", archivo_estado=None,
+                                  max_hilos=3, peticiones_por_segundo=2, reiniciar=False):
+    """
+    Aplica `parche` (dict de campos Woo) a todos los productos que cumplan `filtro(producto)`.
+
+    - Una página de 100 productos = un POST a products/batch (en vez de un PUT por producto).
+    - Guarda en `archivo_estado` la última página completada de forma contigua; si el proceso
+      se corta (bloqueo, 429 persistente, Ctrl+C), la siguiente ejecución continúa desde ahí.
+    - `max_hilos` páginas en vuelo a la vez y como máximo `peticiones_por_segundo` peticiones.
+    Devuelve un resumen con páginas, productos revisados, actualizados y errores por ítem.
+    """
+    ruta = archivo_estado or os.path.join(os.path.dirname(os.path.abspath(__file__)), f".estado_{nombre_trabajo}.json")
+
+    estado = None if reiniciar else _leer_estado(ruta)
+    if not estado or estado.get("parche") != parche:
+        # Un parche distinto es otro trabajo: no reutilizamos un checkpoint ajeno
+        estado = {"parche": parche, "pagina_completada": 0, "revisados": 0, "actualizados": 0, "errores": []}
+
+    limitador = LimitadorTasa(peticiones_por_segundo)
+
+    def procesar_pagina(pagina):
+        limitador.esperar()
+        items, _, total_paginas = _pedir_pagina(wcapi, "products", pagina)
+        objetivo = [p for p in items if filtro is None or filtro(p)]
+
+        actualizados, errores = 0, []
+        if objetivo:
+            limitador.esperar()
+            respuesta = _publicar_lote(wcapi, "products/batch", {"update": [{"id": p["id"], **parche} for p in objetivo]})
+            for r in respuesta.get("update", []):
+                if r.get("error"):
+                    errores.append({"id": r.get("id"), "error": r["error"].get("message", str(r["error"]))})
+                else:
+                    actualizados += 1
+        return {"pagina": pagina, "total_paginas": total_paginas, "revisados": len(items), "actualizados": actualizados, "errores": errores}
+
+    pagina_inicial = estado["pagina_completada"] + 1
+    print(f"📌 Trabajo '{nombre_trabajo}': reanudando desde la página {pagina_inicial} (checkpoint: {ruta})")
+
+    completadas = {}
+    interrumpido = None
+
+    def avanzar_checkpoint():
+        # Solo avanzamos sobre páginas contiguas: una página fallida en medio se reintenta al reanudar
+        while estado["pagina_completada"] + 1 in completadas:
+            r = completadas.pop(estado["pagina_completada"] + 1)
+            estado["pagina_completada"] = r["pagina"]
+            estado["revisados"] += r["revisados"]
+            estado["actualizados"] += r["actualizados"]
+            estado["errores"].extend(r["errores"])
+        _guardar_estado(ruta, estado)
+
+    try:
+        # 1. La primera página es síncrona: sus cabeceras dicen cuántas quedan
+        primera = procesar_pagina(pagina_inicial)
+        total_paginas = primera["total_paginas"]
+        completadas[pagina_inicial] = primera
+        avanzar_checkpoint()
+        print(f"✅ Página {pagina_inicial}/{total_paginas} -> {primera['actualizados']} productos actualizados")
+
+        # 2. El resto en paralelo, limitado por hilos y por tasa
+        with ThreadPoolExecutor(max_workers=max_hilos) as pool:
+            pendientes = {pool.submit(procesar_pagina, pag): pag for pag in range(pagina_inicial + 1, total_paginas + 1)}
+            try:
+                for fut in _en_orden_de_llegada(pendientes):
+                    r = fut.result()
+                    completadas[r["pagina"]] = r
+                    avanzar_checkpoint()
+                    print(f"✅ Página {r['pagina']}/{total_paginas} -> {r['actualizados']} productos actualizados")
+            finally:
+                for fut in pendientes:
+                    fut.cancel()
+    except (Exception, KeyboardInterrupt) as e:
+        interrumpido = str(e) or type(e).__name__
+        _guardar_estado(ruta, estado)
+        print(f"⛔ Trabajo interrumpido en la página {estado['pagina_completada'] + 1}: {interrumpido}")
+
+    terminado = interrumpido is None
+    if terminado:
+        # Trabajo cerrado: la próxima ejecución empieza de cero
+        os.remove(ruta)
+
+    return {
+        "terminado": terminado,
+        "interrumpido": interrumpido,
+        "pagina_completada": estado["pagina_completada"],
+        "revisados": estado["revisados"],
+        "actualizados": estado["actualizados"],
+        "errores": estado["errores"],
+    }
+
+
+def _en_orden_de_llegada(futuros):
+    pendientes = set(futuros)
+    while pendientes:
+        hechos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+        yield from hechos
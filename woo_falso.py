@@ -0,0 +1,176 @@
+import math
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from flask import Flask, request, jsonify
+
+# ==============================================================================
+# 🧪 SERVIDOR WOOCOMMERCE FALSO (BENCHMARKS OFFLINE)
+# ==============================================================================
+# Imita lo justo de /wp-json/wc/v3 que usan sync_woo.py, utils.py y forzar_index.py:
+# listados paginados con X-WP-Total / X-WP-TotalPages, búsqueda por SKU, PUT
+# individuales y endpoints /batch. Permite inyectar latencia y respuestas 429.
+#
+#   python woo_falso.py --simples 2000 --variables 300 --variaciones 8 --latencia-ms 80 --prob-429 0.02
+
+PREFIJO = "/wp-json/wc/v3"
+
+
+def generar_catalogo(n_simples, n_variables, variaciones_por_padre, semilla=7):
+    """Catálogo sintético determinista: {id: producto} y {id_padre: {id: variacion}}."""
+    rnd = random.Random(semilla)
+    productos, variaciones = {}, {}
+    siguiente_id = 1000
+
+    for i in range(n_simples):
+        siguiente_id += 1
+        productos[siguiente_id] = {
+            "id": siguiente_id, "type": "simple", "sku": f"KM-S{i:05d}",
+            "name": f"Lente Sintético {i}", "stock_quantity": rnd.randint(0, 20),
+            "catalog_visibility": "visible", "manage_stock": True, "meta_data": []
+        }
+
+    for i in range(n_variables):
+        siguiente_id += 1
+        id_padre = siguiente_id
+        hijos = {}
+        for j in range(variaciones_por_padre):
+            siguiente_id += 1
+            hijos[siguiente_id] = {
+                "id": siguiente_id, "parent_id": id_padre, "type": "variation", "sku": f"WB-P{i:04d}-V{j:02d}",
+                "attributes": [{"name": "Tono", "option": f"Tono {j}"}],
+                "stock_quantity": rnd.randint(0, 20), "manage_stock": True
+            }
+        productos[id_padre] = {
+            "id": id_padre, "type": "variable", "sku": f"WB-P{i:04d}", "name": f"Peluca Sintética {i}",
+            "variations": list(hijos), "catalog_visibility": "visible", "meta_data": []
+        }
+        variaciones[id_padre] = hijos
+
+    return productos, variaciones
+
+
+def crear_app(productos, variaciones, latencia_ms=0, prob_429=0.0, semilla=7):
+    app = Flask(__name__)
+    lock = threading.Lock()
+    rnd = random.Random(semilla)
+    contador = Counter()
+    por_sku = {p["sku"]: p for p in productos.values()}
+    for hijos in variaciones.values():
+        por_sku.update({v["sku"]: v for v in hijos.values()})
+
+    @app.before_request
+    def simular_red():
+        if request.path.startswith("/__"):
+            return None
+        with lock:
+            contador[f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"] += 1
+            contador["_total"] += 1
+            limitado = rnd.random() < prob_429
+        if latencia_ms:
+            time.sleep(latencia_ms / 1000.0)
+        if limitado:
+            with lock:
+                contador["_429"] += 1
+            return jsonify({"code": "too_many_requests", "message": "Rate limit"}), 429
+        return None
+
+    def paginar(registros):
+        por_pagina = max(1, min(int(request.args.get("per_page", 10)), 100))
+        pagina = max(1, int(request.args.get("page", 1)))
+        total = len(registros)
+        inicio = (pagina - 1) * por_pagina
+        resp = jsonify(registros[inicio:inicio + por_pagina])
+        resp.headers["X-WP-Total"] = str(total)
+        resp.headers["X-WP-TotalPages"] = str(max(1, math.ceil(total / por_pagina)))
+        return resp
+
+    def aplicar(objetivo, cambios):
+        for campo, valor in cambios.items():
+            if campo != "id":
+                objetivo[campo] = valor
+        return objetivo
+
+    @app.route(f"{PREFIJO}/products", methods=["GET"])
+    def listar_productos():
+        sku = request.args.get("sku")
+        if sku is not None:
+            item = por_sku.get(sku)
+            return jsonify([item] if item else [])
+        return paginar(list(productos.values()))
+
+    @app.route(f"{PREFIJO}/products/<int:pid>", methods=["GET", "PUT"])
+    def producto(pid):
+        if pid not in productos:
+            return jsonify({"code": "woocommerce_rest_product_invalid_id"}), 404
+        if request.method == "PUT":
+            with lock:
+                aplicar(productos[pid], request.get_json(silent=True) or {})
+        return jsonify(productos[pid])
+
+    @app.route(f"{PREFIJO}/products/<int:pid>/variations", methods=["GET"])
+    def listar_variaciones(pid):
+        return paginar(list(variaciones.get(pid, {}).values()))
+
+    @app.route(f"{PREFIJO}/products/<int:pid>/variations/<int:vid>", methods=["GET", "PUT"])
+    def variacion(pid, vid):
+        hijos = variaciones.get(pid, {})
+        if vid not in hijos:
+            return jsonify({"code": "woocommerce_rest_product_variation_invalid_id"}), 404
+        if request.method == "PUT":
+            with lock:
+                aplicar(hijos[vid], request.get_json(silent=True) or {})
+        return jsonify(hijos[vid])
+
+    def lote(destino):
+        cambios = (request.get_json(silent=True) or {}).get("update", [])
+        if len(cambios) > 100:
+            return jsonify({"code": "rest_invalid_param", "message": "Máximo 100 objetos por lote"}), 400
+        salida = []
+        with lock:
+            for c in cambios:
+                if c.get("id") in destino:
+                    salida.append(aplicar(destino[c["id"]], c))
+                else:
+                    salida.append({"id": c.get("id"), "error": {"code": "invalid_id", "message": "ID inválido"}})
+        return jsonify({"update": salida})
+
+    @app.route(f"{PREFIJO}/products/batch", methods=["POST"])
+    def lote_productos():
+        return lote(productos)
+
+    @app.route(f"{PREFIJO}/products/<int:pid>/variations/batch", methods=["POST"])
+    def lote_variaciones(pid):
+        return lote(variaciones.get(pid, {}))
+
+    # --- Control del benchmark (no cuentan como peticiones Woo) ---
+    @app.route("/__stats", methods=["GET"])
+    def estadisticas():
+        with lock:
+            return jsonify(dict(contador))
+
+    @app.route("/__reset", methods=["POST"])
+    def reiniciar_contadores():
+        with lock:
+            contador.clear()
+        return jsonify({"ok": True})
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor WooCommerce falso para benchmarks offline.")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--simples", type=int, default=2000)
+    parser.add_argument("--variables", type=int, default=300)
+    parser.add_argument("--variaciones", type=int, default=8, help="Variaciones por producto variable")
+    parser.add_argument("--latencia-ms", type=int, default=50)
+    parser.add_argument("--prob-429", type=float, default=0.0)
+    args = parser.parse_args()
+
+    productos, variaciones = generar_catalogo(args.simples, args.variables, args.variaciones)
+    app = crear_app(productos, variaciones, latencia_ms=args.latencia_ms, prob_429=args.prob_429)
+    print(f"🧪 Woo falso en http://127.0.0.1:{args.puerto} · {len(productos)} productos · {sum(len(v) for v in variaciones.values())} variaciones")
+    app.run(host="127.0.0.1", port=args.puerto, threaded=True)